@@ -86,7 +86,7 @@ class ReportFixturesProvider(FixtureProvider):
             for app in apps
         }
 
-        report_data_cache = ReportDataCache()
+        report_data_cache = ReportDataCache(restore_user.domain)
         providers = [
             ReportFixturesProviderV1(report_data_cache),
             ReportFixturesProviderV2(report_data_cache)
@@ -146,13 +146,24 @@ report_fixture_generator = ReportFixturesProvider()
 
 
 class ReportDataCache(object):
-    def __init__(self):
+    """
+    Report rows for a restore. With ``MOBILE_UCR_SHARED_RESULTS`` the rows
+    are also shared with other users who get the same filter values (e.g.
+    everyone in a location) until the sync delay of the report passes or
+    the data source changes.
+    """
+    def __init__(self, domain=None):
         self.data_cache = {}
         self.total_row_cache = {}
+        self.share_results = bool(domain) and toggles.MOBILE_UCR_SHARED_RESULTS.enabled(domain)
 
-    def get_data(self, key, data_source):
+    def get_data(self, key, data_source, sync_delay=None):
         if key not in self.data_cache:
-            self.data_cache[key] = data_source.get_data()
+            if self.share_results:
+                timeout = int(float(sync_delay) * 3600) if sync_delay else None
+                self.data_cache[key] = data_source.get_shared_data(timeout=timeout)
+            else:
+                self.data_cache[key] = data_source.get_data()
         return self.data_cache[key]
 
 
@@ -463,7 +474,7 @@ def get_report_element(report_data_cache, report_config, data_source, deferred_f
 
     row_elements = []
     row_index = 0
-    rows = report_data_cache.get_data(report_config.uuid, data_source)
+    rows = report_data_cache.get_data(report_config.uuid, data_source, report_config.sync_delay)
     for row_index, row in enumerate(rows):
         row_elements.append(row_to_element(deferred_fields, filter_options_by_field, row, row_index))
         total_row_calculator.update_totals(row)
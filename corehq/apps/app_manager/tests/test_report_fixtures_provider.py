@@ -79,6 +79,16 @@ class ReportFixturesProviderTests(SimpleTestCase, TestXmlMixin):
         self._test_report_fixtures_provider(ReportFixturesProviderV2(cache), 'expected_v2_report', data_source)
         data_source.get_data.assert_called_once()
 
+    @flag_enabled('MOBILE_UCR_SHARED_RESULTS')
+    def test_shared_report_data(self):
+        data_source = self.get_data_source_mock()
+        data_source.get_shared_data.return_value = data_source.get_data.return_value
+        cache = ReportDataCache('test_domain')
+        self.assertEqual(cache.get_data('c0ffee', data_source, 1.5), data_source.get_data.return_value)
+        self.assertEqual(cache.get_data('c0ffee', data_source, 1.5), data_source.get_data.return_value)
+        data_source.get_shared_data.assert_called_once_with(timeout=5400)
+        data_source.get_data.assert_not_called()
+
     def test_v2_report_fixtures_provider_iterative_total_row(self):
         report_id = 'deadbeef'
         provider = ReportFixturesProviderV2()
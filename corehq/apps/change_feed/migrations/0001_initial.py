@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnpublishedChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('topic', models.CharField(max_length=255)),
+                ('document_id', models.CharField(max_length=255)),
+                ('change_metadata', jsonfield.fields.JSONField()),
+                ('date_created', models.DateTimeField(db_index=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from django.db import models
+
+from jsonfield.fields import JSONField
+
+from pillowtop.feed.interface import ChangeMeta
+
+
+class UnpublishedChange(models.Model):
+    """A change that could not be sent to Kafka
+
+    Stored by the pipelined `ChangeProducer` and re-sent by the
+    `republish_unpublished_changes` task.
+    """
+    id = models.BigAutoField(primary_key=True)
+    topic = models.CharField(max_length=255)
+    document_id = models.CharField(max_length=255)
+    change_metadata = JSONField()
+    date_created = models.DateTimeField(db_index=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(null=True)
+
+    class Meta(object):
+        app_label = 'change_feed'
+
+    @classmethod
+    def create(cls, topic, change_meta, error):
+        return cls.objects.create(
+            topic=topic,
+            document_id=change_meta.document_id,
+            change_metadata=change_meta.to_json(),
+            date_created=datetime.utcnow(),
+            error=str(error),
+        )
+
+    @property
+    def change_meta(self):
+        return ChangeMeta.wrap(self.change_metadata)
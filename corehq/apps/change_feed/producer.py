@@ -1,6 +1,8 @@
 import json
 import logging
+import threading
 import uuid
+from contextlib import contextmanager
 from functools import partial
 
 from django.conf import settings
@@ -8,6 +10,7 @@ from django.conf import settings
 from kafka import KafkaProducer
 
 from corehq.form_processor.exceptions import KafkaPublishingError
+from corehq.util.metrics import metrics_counter
 from dimagi.utils.logging import notify_exception
 
 CHANGE_PRE_SEND = 'PRE-SEND'
@@ -19,10 +22,29 @@ logger = logging.getLogger(KAFKA_AUDIT_LOGGER)
 
 
 class ChangeProducer(object):
-
-    def __init__(self, auto_flush=True):
+    """Send change metas to Kafka
+
+    :param auto_flush: Wait for each change to be acknowledged and raise
+    `KafkaPublishingError` if it could not be sent.
+    :param pipelined: Send changes without waiting for them to be
+    acknowledged even if `auto_flush` is true. The number of
+    unacknowledged changes is bounded; changes that can't be sent are
+    stored as `UnpublishedChange` to be re-sent later instead of raising
+    an error. Defaults to `settings.KAFKA_PIPELINED_PUBLISHING`.
+    """
+
+    def __init__(self, auto_flush=True, pipelined=None):
         self.auto_flush = auto_flush
+        self._pipelined = pipelined
         self._producer = None
+        self._local = threading.local()
+        self.in_flight = threading.BoundedSemaphore(settings.KAFKA_MAX_IN_FLIGHT_CHANGES)
+
+    @property
+    def pipelined(self):
+        if self._pipelined is None:
+            return settings.KAFKA_PIPELINED_PUBLISHING
+        return self._pipelined
 
     @property
     def producer(self):
@@ -35,7 +57,9 @@ class ChangeProducer(object):
             client_id="cchq-producer",
             retries=3,
             acks=1,
-            key_serializer=lambda key: str(key).encode()
+            key_serializer=lambda key: str(key).encode(),
+            # let changes sent in quick succession share a request
+            linger_ms=settings.KAFKA_PRODUCER_LINGER_MS if self.pipelined else 0,
         )
         return self._producer
 
@@ -49,9 +73,16 @@ class ChangeProducer(object):
         message = change_meta.to_json()
         message_json_dump = json.dumps(message).encode('utf-8')
         change_meta._transaction_id = uuid.uuid4().hex
+        batch = getattr(self._local, 'batch', None)
+        if batch is None and self.auto_flush and self.pipelined:
+            self._send_pipelined(topic, change_meta, message_json_dump, partition)
+            return
         try:
             _audit_log(CHANGE_PRE_SEND, change_meta)
             future = self.producer.send(topic, message_json_dump, key=change_meta.document_id, partition=partition)
+            if batch is not None:
+                batch.add(change_meta, future)
+                return
             if self.auto_flush:
                 future.get()
                 _audit_log(CHANGE_SENT, change_meta)
@@ -64,9 +95,95 @@ class ChangeProducer(object):
             on_error = partial(_on_error, change_meta)
             future.add_callback(on_success).add_errback(on_error)
 
+    def _send_pipelined(self, topic, change_meta, message_json_dump, partition):
+        if not self.in_flight.acquire(timeout=settings.KAFKA_IN_FLIGHT_TIMEOUT):
+            _store_unpublished_change(topic, change_meta, "Too many changes in flight")
+            return
+        try:
+            _audit_log(CHANGE_PRE_SEND, change_meta)
+            future = self.producer.send(topic, message_json_dump, key=change_meta.document_id, partition=partition)
+        except Exception as e:
+            self.in_flight.release()
+            _audit_log(CHANGE_ERROR, change_meta)
+            _store_unpublished_change(topic, change_meta, e)
+            return
+        on_success = partial(self._on_pipelined_success, change_meta)
+        on_error = partial(self._on_pipelined_error, topic, change_meta, threading.get_ident())
+        future.add_callback(on_success).add_errback(on_error)
+
+    def _on_pipelined_success(self, change_meta, record_metadata):
+        self.in_flight.release()
+        _audit_log(CHANGE_SENT, change_meta)
+
+    def _on_pipelined_error(self, topic, change_meta, sender_thread_id, exc_info):
+        from django.db import connections
+        self.in_flight.release()
+        _audit_log(CHANGE_ERROR, change_meta)
+        try:
+            _store_unpublished_change(topic, change_meta, exc_info)
+        finally:
+            if threading.get_ident() != sender_thread_id:
+                # called on the Kafka producer's I/O thread, which does
+                # not otherwise use the database
+                connections.close_all()
+
     def flush(self, timeout=None):
         self.producer.flush(timeout=timeout)
 
+    @contextmanager
+    def batch(self):
+        """Send changes on this thread without waiting for each one to be
+        acknowledged
+
+        All changes sent in the context are waited for when it exits.
+
+        :yields: `ChangeBatch`. Call its `flush()` method to wait for the
+        changes and handle failures. If it is not called, the batch is
+        flushed on exit and `KafkaPublishingError` is raised if any
+        change could not be sent.
+        """
+        assert getattr(self._local, 'batch', None) is None, "nested change batch"
+        batch = self._local.batch = ChangeBatch(self)
+        try:
+            yield batch
+        finally:
+            self._local.batch = None
+        if not batch.flushed:
+            failed = batch.flush()
+            if failed:
+                raise KafkaPublishingError(
+                    "Failed to send {} changes".format(len(failed)))
+
+
+class ChangeBatch(object):
+
+    def __init__(self, change_producer):
+        self.change_producer = change_producer
+        self.changes = []
+        self.flushed = False
+
+    def add(self, change_meta, future):
+        self.changes.append((change_meta, future))
+
+    def flush(self, timeout=None):
+        """Wait for all changes in the batch to be sent
+
+        :returns: List of change metas that could not be sent.
+        """
+        self.flushed = True
+        if self.changes:
+            self.change_producer.flush(timeout=timeout)
+        failed = []
+        for change_meta, future in self.changes:
+            try:
+                future.get()
+            except Exception:
+                _audit_log(CHANGE_ERROR, change_meta)
+                failed.append(change_meta)
+            else:
+                _audit_log(CHANGE_SENT, change_meta)
+        return failed
+
 
 def _on_success(change_meta, record_metadata):
     _audit_log(CHANGE_SENT, change_meta)
@@ -80,6 +197,19 @@ def _on_error(change_meta, exc_info):
     )
 
 
+def _store_unpublished_change(topic, change_meta, error):
+    """Store a change that could not be sent so it can be re-sent later"""
+    from corehq.apps.change_feed.models import UnpublishedChange
+    metrics_counter('commcare.change_feed.unpublished_changes', tags={'topic': topic})
+    try:
+        UnpublishedChange.create(topic, change_meta, error)
+    except Exception:
+        notify_exception(
+            None, 'Problem storing unpublished Kafka change',
+            details=change_meta.to_json(),
+        )
+
+
 def _audit_log(stage, change_meta):
     logger.debug(
         '%s,%s,%s,%s', stage,
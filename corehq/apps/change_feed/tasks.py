@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from celery.schedules import crontab
+from celery.task import periodic_task
+from django.conf import settings
+
+from corehq.apps.change_feed.models import UnpublishedChange
+from corehq.apps.change_feed.producer import ChangeProducer
+from corehq.form_processor.exceptions import KafkaPublishingError
+from corehq.util.metrics import metrics_gauge
+
+REPUBLISH_BATCH_SIZE = 1000
+
+# always wait for changes being re-sent to be acknowledged
+republishing_producer = ChangeProducer(pipelined=False)
+
+
+@periodic_task(
+    run_every=crontab(minute="*/5"),
+    queue=settings.CELERY_PERIODIC_QUEUE,
+)
+def republish_unpublished_changes():
+    """Re-send changes the pipelined producer could not send to Kafka"""
+    changes = UnpublishedChange.objects.order_by('id')[:REPUBLISH_BATCH_SIZE]
+    for change in changes:
+        change_meta = change.change_meta
+        change_meta.publish_timestamp = datetime.utcnow()
+        try:
+            republishing_producer.send_change(change.topic, change_meta)
+        except KafkaPublishingError as e:
+            change.attempts += 1
+            change.error = str(e)
+            change.save()
+            # Kafka is probably unavailable, try again later
+            break
+        change.delete()
+    metrics_gauge('commcare.change_feed.unpublished_changes.queue_size', UnpublishedChange.objects.count())
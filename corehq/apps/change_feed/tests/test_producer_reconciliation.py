@@ -1,6 +1,6 @@
 import uuid
 
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
 
 from kafka.future import Future
 from mock import Mock
@@ -12,6 +12,7 @@ from corehq.apps.change_feed import topics
 from corehq.apps.change_feed.management.commands.reconcile_producer_logs import (
     Reconciliation,
 )
+from corehq.apps.change_feed.models import UnpublishedChange
 from corehq.apps.change_feed.producer import (
     CHANGE_ERROR,
     CHANGE_PRE_SEND,
@@ -60,6 +61,30 @@ class TestKafkaAuditLogging(SimpleTestCase):
 
         self._check_logs(logs, meta.document_id, [CHANGE_PRE_SEND, CHANGE_ERROR])
 
+    def test_batch(self):
+        kafka_producer = ChangeProducer()
+        sent, failed = Mock(), Mock()
+        failed.get = Mock(side_effect=Exception())
+        kafka_producer.producer.send = Mock(side_effect=[sent, failed])
+        kafka_producer.producer.flush = Mock()
+
+        metas = [
+            ChangeMeta(document_id=uuid.uuid4().hex, data_source_type='dummy-type',
+                       data_source_name='dummy-name')
+            for i in range(2)
+        ]
+        with capture_log_output(KAFKA_AUDIT_LOGGER) as logs:
+            with kafka_producer.batch() as batch:
+                for meta in metas:
+                    kafka_producer.send_change(topics.CASE, meta)
+                sent.get.assert_not_called()
+                self.assertEqual(batch.flush(), [metas[1]])
+
+        kafka_producer.producer.flush.assert_called_once_with(timeout=None)
+        lines = logs.get_output().splitlines()
+        self.assertIn(CHANGE_SENT, lines[2])
+        self.assertIn(CHANGE_ERROR, lines[3])
+
     def _test_success(self, auto_flush):
         kafka_producer = ChangeProducer(auto_flush=auto_flush)
         with capture_log_output(KAFKA_AUDIT_LOGGER) as logs:
@@ -78,6 +103,49 @@ class TestKafkaAuditLogging(SimpleTestCase):
             self.assertIn(event, line)
 
 
+class TestPipelinedPublishing(TestCase):
+
+    def tearDown(self):
+        UnpublishedChange.objects.all().delete()
+        super(TestPipelinedPublishing, self).tearDown()
+
+    def test_error_stores_change(self):
+        kafka_producer = ChangeProducer(pipelined=True)
+        future = Future()
+        future.get = Mock()
+        kafka_producer.producer.send = Mock(return_value=future)
+
+        meta = ChangeMeta(
+            document_id=uuid.uuid4().hex, data_source_type='dummy-type', data_source_name='dummy-name'
+        )
+        with capture_log_output(KAFKA_AUDIT_LOGGER) as logs:
+            kafka_producer.send_change(topics.CASE, meta)
+            future.get.assert_not_called()
+            self.assertFalse(UnpublishedChange.objects.exists())
+            future.failure(Exception('boom'))
+
+        lines = logs.get_output().splitlines()
+        self.assertIn(CHANGE_PRE_SEND, lines[0])
+        self.assertIn(CHANGE_ERROR, lines[1])
+        [change] = UnpublishedChange.objects.all()
+        self.assertEqual(change.topic, topics.CASE)
+        self.assertEqual(change.change_meta.document_id, meta.document_id)
+
+    def test_in_flight_limit(self):
+        kafka_producer = ChangeProducer(pipelined=True)
+        kafka_producer.in_flight = Mock()
+        kafka_producer.in_flight.acquire.return_value = False
+        kafka_producer.producer.send = Mock()
+
+        meta = ChangeMeta(
+            document_id=uuid.uuid4().hex, data_source_type='dummy-type', data_source_name='dummy-name'
+        )
+        kafka_producer.send_change(topics.CASE, meta)
+
+        kafka_producer.producer.send.assert_not_called()
+        self.assertEqual(UnpublishedChange.objects.get().document_id, meta.document_id)
+
+
 def test_recon():
     recon = Reconciliation()
     rows = [
@@ -1,6 +1,6 @@
 from corehq.util.es.elasticsearch import ElasticsearchException
 
-from corehq.apps.es import CaseES, FormES, GroupES
+from corehq.apps.es import CaseES, FormES, GroupES, filters, forms
 from corehq.apps.es.sms import SMSES
 from corehq.elastic import ES_EXPORT_INSTANCE, get_es_new
 from corehq.util.es.interface import ElasticsearchInterface
@@ -27,6 +27,33 @@ def get_case_export_base_query(domain, case_type):
             .sort("opened_on"))
 
 
+def get_form_export_shared_base_query(domain, app_xmlns_pairs, include_errors):
+    """
+    Query for the forms of several form exports, see ``get_form_export_base_query``
+
+    :param app_xmlns_pairs: list of ``(app_id, xmlns)``, ``app_id`` may be empty
+    """
+    query = (FormES(es_instance_alias=ES_EXPORT_INSTANCE)
+             .domain(domain)
+             .filter(filters.OR(*[
+                 filters.AND(forms.xmlns(xmlns), forms.app(app_id))
+                 if app_id else forms.xmlns(xmlns)
+                 for app_id, xmlns in app_xmlns_pairs
+             ]))
+             .remove_default_filter('has_user'))
+    if include_errors:
+        query = query.remove_default_filter("is_xform_instance")
+        query = query.doc_type(["xforminstance", "xformarchived", "xformdeprecated", "xformduplicate"])
+    return query.sort("received_on")
+
+
+def get_case_export_shared_base_query(domain, case_types):
+    return (CaseES(es_instance_alias=ES_EXPORT_INSTANCE)
+            .domain(domain)
+            .case_type(list(case_types))
+            .sort("opened_on"))
+
+
 def get_sms_export_base_query(domain):
     return (SMSES(es_instance_alias=ES_EXPORT_INSTANCE)
             .domain(domain)
@@ -2,7 +2,7 @@ import contextlib
 import datetime
 import sys
 import time
-from collections import Counter
+from collections import Counter, OrderedDict, defaultdict
 
 from couchdbkit import ResourceConflict
 
@@ -16,7 +16,9 @@ from corehq.apps.export.const import MAX_EXPORTABLE_ROWS
 from corehq.apps.export.dbaccessors import get_properly_wrapped_export_instance
 from corehq.apps.export.esaccessors import (
     get_case_export_base_query,
+    get_case_export_shared_base_query,
     get_form_export_base_query,
+    get_form_export_shared_base_query,
     get_sms_export_base_query,
 )
 from corehq.apps.export.models.new import (
@@ -25,7 +27,11 @@ from corehq.apps.export.models.new import (
     SMSExportInstance,
 )
 from corehq.elastic import iter_es_docs_from_query
-from corehq.toggles import PAGINATED_EXPORTS
+from corehq.toggles import (
+    INCREMENTAL_SAVED_EXPORTS,
+    PAGINATED_EXPORTS,
+    SHARED_SCROLL_EXPORTS,
+)
 from corehq.util.metrics.load_counters import load_counter
 from corehq.util.files import TransientTempfile, safe_filename
 from soil.progress import TaskProgressManager
@@ -312,9 +318,12 @@ def get_export_file(export_instances, filters, temp_path, progress_tracker=None)
     """
     writer = get_export_writer(export_instances, temp_path)
     with writer.open(export_instances):
-        for export_instance in export_instances:
-            docs = get_export_documents(export_instance, filters)
-            write_export_instance(writer, export_instance, docs, progress_tracker)
+        if len(export_instances) > 1 and SHARED_SCROLL_EXPORTS.enabled(export_instances[0].domain):
+            write_export_instances(writer, export_instances, filters, progress_tracker)
+        else:
+            for export_instance in export_instances:
+                docs = get_export_documents(export_instance, filters)
+                write_export_instance(writer, export_instance, docs, progress_tracker)
 
     return ExportFile(writer.path, writer.format)
 
@@ -358,24 +367,7 @@ def write_export_instance(writer, export_instance, documents, progress_tracker=N
 
         for row_number, doc in enumerate(documents):
             total_bytes += sys.getsizeof(doc)
-            for table in export_instance.selected_tables:
-                try:
-                    rows = table.get_rows(
-                        doc,
-                        row_number,
-                        split_columns=export_instance.split_multiselects,
-                        transform_dates=export_instance.transform_dates,
-                    )
-                except Exception as e:
-                    notify_exception(None, "Error exporting doc", details={
-                        'domain': export_instance.domain,
-                        'export_instance_id': export_instance.get_id,
-                        'export_table': table.label,
-                        'doc_id': doc.get('_id'),
-                    })
-                    e.sentry_capture = False
-                    raise
-
+            for table, rows in get_export_rows(export_instance, doc, row_number):
                 for row in rows:
                     # It might be bad to write one row at a time from a performance perspective.
                     # Regardless, we should handle the batching of rows in the _Writer class, not here.
@@ -393,6 +385,146 @@ def write_export_instance(writer, export_instance, documents, progress_tracker=N
     _record_export_duration(end - start, export_instance)
 
 
+def write_export_instances(writer, export_instances, filters, progress_tracker=None):
+    """
+    Write rows to the given open _Writer for several export instances.
+    Form exports and case exports of the same domain are exported from a
+    single ES scroll, each document is written to the export instances it
+    belongs to.
+    """
+    for group in _group_by_shared_scroll(export_instances):
+        if len(group) == 1:
+            docs = get_export_documents(group[0], filters)
+            write_export_instance(writer, group[0], docs, progress_tracker)
+        else:
+            docs = iter_es_docs_from_query(_get_shared_export_query(group, filters))
+            _write_shared_export_instances(writer, group, docs, progress_tracker)
+
+
+def _group_by_shared_scroll(export_instances):
+    groups = OrderedDict()
+    for export_instance in export_instances:
+        if isinstance(export_instance, FormExportInstance):
+            key = ('form', export_instance.domain, export_instance.include_errors)
+        elif isinstance(export_instance, CaseExportInstance):
+            key = ('case', export_instance.domain)
+        else:
+            key = id(export_instance)
+        groups.setdefault(key, []).append(export_instance)
+    return list(groups.values())
+
+
+def _get_shared_export_query(export_instances, filters):
+    """
+    Return an ESQuery object for all the documents of a group of export
+    instances from ``_group_by_shared_scroll``
+    """
+    export_instance = export_instances[0]
+    if isinstance(export_instance, FormExportInstance):
+        query = get_form_export_shared_base_query(
+            export_instance.domain,
+            [(instance.app_id, instance.xmlns) for instance in export_instances],
+            export_instance.include_errors,
+        )
+    else:
+        query = get_case_export_shared_base_query(
+            export_instance.domain,
+            sorted({instance.case_type for instance in export_instances}),
+        )
+    for filter in filters:
+        query = query.filter(filter.to_es_filter())
+    return query
+
+
+def _get_shared_export_dispatcher(export_instances):
+    """
+    Return a function that gets the indices of the export instances a
+    document from ``_get_shared_export_query`` belongs to
+    """
+    indices_by_key = defaultdict(list)
+    if isinstance(export_instances[0], FormExportInstance):
+        for index, export_instance in enumerate(export_instances):
+            indices_by_key[export_instance.xmlns].append((index, export_instance.app_id))
+
+        def get_indices(doc):
+            return [
+                index for index, app_id in indices_by_key.get(doc.get('xmlns'), ())
+                if not app_id or doc.get('app_id') == app_id
+            ]
+    else:
+        for index, export_instance in enumerate(export_instances):
+            indices_by_key[export_instance.case_type].append(index)
+
+        def get_indices(doc):
+            return indices_by_key.get(doc.get('type'), ())
+
+    return get_indices
+
+
+def _write_shared_export_instances(writer, export_instances, documents, progress_tracker=None):
+    """
+    Like ``write_export_instance``, for several export instances that share
+    the given documents
+    """
+    get_indices = _get_shared_export_dispatcher(export_instances)
+    row_numbers = [0] * len(export_instances)
+    with TaskProgressManager(progress_tracker, src="export") as progress_manager:
+        if progress_tracker:
+            progress_manager.set_progress(0, documents.count)
+
+        start = _time_in_milliseconds()
+        total_bytes = 0
+        total_rows = 0
+        track_load = load_counter(export_instances[0].type, "export", export_instances[0].domain)
+
+        for doc_number, doc in enumerate(documents):
+            total_bytes += sys.getsizeof(doc)
+            for index in get_indices(doc):
+                export_instance = export_instances[index]
+                for table, rows in get_export_rows(export_instance, doc, row_numbers[index]):
+                    for row in rows:
+                        writer.write(table, row)
+                    total_rows += len(rows)
+                row_numbers[index] += 1
+
+            track_load()
+            if progress_tracker:
+                progress_manager.set_progress(doc_number + 1, documents.count)
+
+    end = _time_in_milliseconds()
+    tags = {'format': writer.format}
+    _record_datadog_export_duration(end - start, total_bytes, total_rows, tags)
+    for export_instance in export_instances:
+        _record_export_duration(end - start, export_instance)
+
+
+def get_export_rows(export_instance, doc, row_number):
+    """
+    Get the rows of a document for each selected table of an export
+    :returns: list of (TableConfiguration, list of ExportRows)
+    """
+    rows_by_table = []
+    for table in export_instance.selected_tables:
+        try:
+            rows = table.get_rows(
+                doc,
+                row_number,
+                split_columns=export_instance.split_multiselects,
+                transform_dates=export_instance.transform_dates,
+            )
+        except Exception as e:
+            notify_exception(None, "Error exporting doc", details={
+                'domain': export_instance.domain,
+                'export_instance_id': export_instance.get_id,
+                'export_table': table.label,
+                'doc_id': doc.get('_id'),
+            })
+            e.sentry_capture = False
+            raise
+        rows_by_table.append((table, rows))
+    return rows_by_table
+
+
 def _time_in_milliseconds():
     return int(time.time() * 1000)
 
@@ -442,6 +574,11 @@ def rebuild_export(export_instance, progress_tracker):
     """
     Rebuild the given daily saved ExportInstance
     """
+    if INCREMENTAL_SAVED_EXPORTS.enabled(export_instance.domain):
+        from corehq.apps.export.saved_export_pages import rebuild_export_from_pages
+        if rebuild_export_from_pages(export_instance, progress_tracker):
+            return
+
     filters = export_instance.get_filters()
     with TransientTempfile() as temp_path:
         export_file = get_export_file([export_instance], filters or [], temp_path, progress_tracker)
@@ -3,7 +3,7 @@ import multiprocessing
 
 from django.core.management.base import BaseCommand, CommandError
 
-from corehq.apps.export.multiprocess import rebuild_export_mutiprocess
+from corehq.apps.export.multiprocess import MAX_PAGE_BYTES, rebuild_export_mutiprocess
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +19,13 @@ class Command(BaseCommand):
             dest='page_size',
             default=100000,
         )
+        parser.add_argument(
+            '--page-megabytes',
+            type=int,
+            dest='page_megabytes',
+            default=MAX_PAGE_BYTES // (1024 * 1024),
+            help='Maximum size of the JSON of the documents of a page.'
+        )
         parser.add_argument(
             '--processes',
             type=int,
@@ -34,7 +41,8 @@ class Command(BaseCommand):
         export_id = options.pop('export_id')
         page_size = options.pop('page_size')
         processes = options.pop('processes')
+        page_bytes = options.pop('page_megabytes') * 1024 * 1024
 
-        rebuild_export_mutiprocess(export_id, processes, page_size)
+        rebuild_export_mutiprocess(export_id, processes, page_size, page_bytes)
 
         self.stdout.write(self.style.SUCCESS('Rebuild Complete'))
@@ -0,0 +1,30 @@
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('export', '0009_incrementalexport_incrementalexportcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SavedExportPage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('export_instance_id', models.CharField(db_index=True, max_length=126)),
+                ('config_hash', models.CharField(max_length=32)),
+                ('page_start', models.DateTimeField()),
+                ('doc_count', models.IntegerField()),
+                ('last_modified', models.DateTimeField(null=True)),
+                ('rows_doc_count', models.IntegerField()),
+                ('date_built', models.DateTimeField()),
+                ('blob_key', models.UUIDField(default=uuid.uuid4)),
+            ],
+            options={
+                'unique_together': {('export_instance_id', 'page_start')},
+            },
+        ),
+    ]
@@ -39,10 +39,12 @@ from .new import (
     StockFormExportColumn,
     StockItem,
     TableConfiguration,
+    TableRowExtractor,
     UserDefinedExportColumn,
 )
 
 from .incremental import (
     IncrementalExport,
-    IncrementalExportCheckpoint
+    IncrementalExportCheckpoint,
+    SavedExportPage,
 )
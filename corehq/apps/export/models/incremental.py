@@ -93,6 +93,35 @@ class IncrementalExportCheckpoint(models.Model):
         return f'{self.incremental_export.name}-{date_suffix}.csv'
 
 
+class SavedExportPage(models.Model):
+    """
+    The rows of the documents of one page (a week of documents) of a daily
+    saved export, see corehq.apps.export.saved_export_pages.
+
+    ``doc_count`` and ``last_modified`` are what ES reported for the page
+    when it was built, ``rows_doc_count`` is the number of documents the
+    rows are for.
+    """
+    export_instance_id = models.CharField(max_length=126, db_index=True)
+    config_hash = models.CharField(max_length=32)
+    page_start = models.DateTimeField()
+    doc_count = models.IntegerField()
+    last_modified = models.DateTimeField(null=True)
+    rows_doc_count = models.IntegerField()
+    date_built = models.DateTimeField()
+    blob_key = models.UUIDField(default=uuid4)
+
+    class Meta(object):
+        unique_together = ('export_instance_id', 'page_start')
+
+    def get_blob(self):
+        db = get_blob_db()
+        return db.get(key=str(self.blob_key), type_code=CODES.data_export)
+
+    def delete_blob(self):
+        get_blob_db().delete(key=str(self.blob_key))
+
+
 def generate_and_send_incremental_export(incremental_export, from_date):
     checkpoint = _generate_incremental_export(incremental_export, from_date)
     if checkpoint:
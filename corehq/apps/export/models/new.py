@@ -493,66 +493,18 @@ class TableConfiguration(DocumentSchema, ReadablePathMixin):
                         the data as a json-ready dict
         :return: List of ExportRows
         """
-        document_id = document.get('_id')
-
-        sub_documents = self._get_sub_documents(document, row_number, document_id=document_id)
-
-        domain = document.get('domain')
-
-        assert domain is not None, 'Form or Case must be associated with domain'
-        assert document_id is not None, 'Form or Case must have an id'
-
-        rows = []
-        for doc_row in sub_documents:
-            doc, row_index = doc_row.doc, doc_row.row
-
-            row_data = {} if as_json else []
-            col_index = 0
-            skip_excel_formatting = []
-            for col in self.selected_columns:
-                val = col.get_value(
-                    domain,
-                    document_id,
-                    doc,
-                    self.path,
-                    row_index=row_index,
-                    split_column=split_columns,
-                    transform_dates=transform_dates,
-                )
-                if as_json:
-                    for index, header in enumerate(col.get_headers(split_column=split_columns)):
-                        if isinstance(val, list):
-                            row_data[header] = "{}".format(val[index])
-                        else:
-                            row_data[header] = "{}".format(val)
-                elif isinstance(val, list):
-                    row_data.extend(val)
-
-                    # we never want to auto-format RowNumberColumn
-                    # (always treat as text)
-                    next_col_index = col_index + len(val)
-                    if isinstance(col, RowNumberColumn):
-                        skip_excel_formatting.extend(
-                            list(range(col_index, next_col_index))
-                        )
-                    col_index = next_col_index
-                else:
-                    row_data.append(val)
+        return self.get_row_extractor(split_columns, transform_dates).get_rows(
+            document, row_number, as_json=as_json
+        )
 
-                    # we never want to auto-format RowNumberColumn
-                    # (always treat as text)
-                    if isinstance(col, RowNumberColumn):
-                        skip_excel_formatting.append(col_index)
-                    col_index += 1
-            if as_json:
-                rows.append(row_data)
-            else:
-                rows.append(ExportRow(
-                    data=row_data,
-                    hyperlink_column_indices=self.get_hyperlink_column_indices(split_columns),
-                    skip_excel_formatting=skip_excel_formatting
-                ))
-        return rows
+    @memoized
+    def get_row_extractor(self, split_columns=False, transform_dates=False):
+        """
+        The selected columns compiled into a TableRowExtractor. Like
+        get_hyperlink_column_indices this assumes the columns of the table
+        don't change once it is exported.
+        """
+        return TableRowExtractor(self, split_columns=split_columns, transform_dates=transform_dates)
 
     def get_column(self, item_path, item_doc_type, column_transform):
         """
@@ -661,6 +613,152 @@ class TableConfiguration(DocumentSchema, ReadablePathMixin):
         return TableConfiguration._get_sub_documents_helper(document_id, path[1:], new_docs)
 
 
+class TableRowExtractor(object):
+    """
+    Gets the rows of a table for a document.
+
+    Most columns just look up a path in the document (or in the repeat group
+    the row is for). Those paths are resolved together with a PathPlan, which
+    walks each step that columns have in common once, instead of walking
+    the whole path for each column. Other columns get their values with
+    ExportColumn.get_value.
+    """
+
+    def __init__(self, table, split_columns=False, transform_dates=False):
+        self.table = table
+        self.split_columns = split_columns
+        self.transform_dates = transform_dates
+        self.columns = table.selected_columns
+
+        base_path = table.path
+        paths = []
+        # the position of the path of each column in the plan, None for other columns
+        self._path_indices = []
+        for column in self.columns:
+            if (type(column).get_value is ExportColumn.get_value
+                    and base_path == column.item.path[:len(base_path)]):
+                self._path_indices.append(len(paths))
+                paths.append([node.name for node in column.item.path[len(base_path):]])
+            else:
+                self._path_indices.append(None)
+        self._plan = PathPlan(paths)
+        self._headers = [column.get_headers(split_column=split_columns) for column in self.columns]
+        self._is_row_number = [isinstance(column, RowNumberColumn) for column in self.columns]
+
+    def get_rows(self, document, row_number, as_json=False):
+        """
+        See TableConfiguration.get_rows
+        """
+        document_id = document.get('_id')
+
+        sub_documents = self.table._get_sub_documents(document, row_number, document_id=document_id)
+
+        domain = document.get('domain')
+
+        assert domain is not None, 'Form or Case must be associated with domain'
+        assert document_id is not None, 'Form or Case must have an id'
+
+        rows = []
+        for doc_row in sub_documents:
+            doc, row_index = doc_row.doc, doc_row.row
+            path_values = self._plan.get_values(doc)
+
+            row_data = {} if as_json else []
+            col_index = 0
+            skip_excel_formatting = []
+            for col, path_index, headers, is_row_number in zip(
+                    self.columns, self._path_indices, self._headers, self._is_row_number):
+                if path_index is None:
+                    val = col.get_value(
+                        domain,
+                        document_id,
+                        doc,
+                        self.table.path,
+                        row_index=row_index,
+                        split_column=self.split_columns,
+                        transform_dates=self.transform_dates,
+                    )
+                else:
+                    val = col._transform(path_values[path_index], doc, self.transform_dates)
+                if as_json:
+                    for index, header in enumerate(headers):
+                        if isinstance(val, list):
+                            row_data[header] = "{}".format(val[index])
+                        else:
+                            row_data[header] = "{}".format(val)
+                elif isinstance(val, list):
+                    row_data.extend(val)
+
+                    # we never want to auto-format RowNumberColumn
+                    # (always treat as text)
+                    next_col_index = col_index + len(val)
+                    if is_row_number:
+                        skip_excel_formatting.extend(
+                            list(range(col_index, next_col_index))
+                        )
+                    col_index = next_col_index
+                else:
+                    row_data.append(val)
+
+                    # we never want to auto-format RowNumberColumn
+                    # (always treat as text)
+                    if is_row_number:
+                        skip_excel_formatting.append(col_index)
+                    col_index += 1
+            if as_json:
+                rows.append(row_data)
+            else:
+                rows.append(ExportRow(
+                    data=row_data,
+                    hyperlink_column_indices=self.table.get_hyperlink_column_indices(self.split_columns),
+                    skip_excel_formatting=skip_excel_formatting
+                ))
+        return rows
+
+
+class PathPlan(object):
+    """
+    Looks up many paths in a document in one pass.
+
+    The paths are merged into a tree, so a step that several paths have in
+    common (e.g. 'form' or a question group) is only looked up once. Each
+    path gets the same value as ``NestedDictGetter(path)(doc)``: None if any
+    step is missing or not a dict.
+
+    >>> PathPlan([['form', 'q1'], ['form', 'group', 'q2'], ['id']]).get_values(
+    ...     {'form': {'q1': 'a', 'group': 'b'}, 'id': 1})
+    ['a', None, 1]
+    """
+
+    def __init__(self, paths):
+        self.size = len(paths)
+        # name -> (child tree, indices of the paths that end at this step)
+        self._tree = {}
+        for index, path in enumerate(paths):
+            if not path:
+                # NestedDictGetter([]) always returns None
+                continue
+            tree = self._tree
+            for name in path[:-1]:
+                tree = tree.setdefault(name, ({}, []))[0]
+            tree.setdefault(path[-1], ({}, []))[1].append(index)
+
+    def get_values(self, doc):
+        values = [None] * self.size
+        if isinstance(doc, dict):
+            _walk_path_tree(self._tree, doc, values)
+        return values
+
+
+def _walk_path_tree(tree, doc, values):
+    for name, (children, indices) in tree.items():
+        value = doc.get(name)
+        for index in indices:
+            values[index] = value
+        if children and isinstance(value, dict):
+            _walk_path_tree(children, value, values)
+
+
 class DatePeriod(DocumentSchema):
     period_type = StringProperty(required=True)
     days = IntegerProperty()
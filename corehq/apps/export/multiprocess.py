@@ -10,12 +10,14 @@ You can also use the MultiprocessExporter class to have more control over the pr
 See the 'process_skipped_pages' management command for an example.
 
 The export works as follows:
-  * Dump raw docs from ES into files of size N docs
+  * Dump raw docs from ES into files of at most N docs or M bytes of JSON
   * Once each file is complete add it to a multiprocessing Queue
   * Pool of X processes listen to queue and process the dump file
-  * Results returned back to the main process
+    * Each process takes the next page as soon as it is done with its last one
+  * Results returned back to the main process as soon as they are done
     * Unsuccessful results can be retried
-  * Add successful pages to final ZIP archive
+    * Dumping waits while too many pages are waiting to be processed
+  * Add successful pages to final ZIP archive as they are returned
   * Add raw data dumps for unsuccessful pages to final ZIP archive
 """
 import gzip
@@ -29,7 +31,7 @@ import zipfile
 from collections import namedtuple
 from datetime import timedelta
 
-from six.moves.queue import Empty
+from six.moves.queue import Empty, Queue
 
 from couchexport.export import get_writer
 from couchexport.writers import ZippedExportWriter
@@ -49,6 +51,11 @@ TEMP_FILE_PREFIX = 'cchq_export_dump_'
 
 UNPROCESSED_PAGES_DIR = 'unprocessed'
 
+# Pages are also cut at this many bytes of JSON, so that pages of large
+# documents (e.g. with many repeat groups) don't take much longer to
+# process than the other pages
+MAX_PAGE_BYTES = 100 * 1024 * 1024
+
 logger = logging.getLogger(__name__)
 
 
@@ -86,6 +93,7 @@ class OutputPaginator(object):
         self.export_id = export_id
         self.page = start_page_count
         self.page_size = 0
+        self.page_bytes = 0
         self.file = None
 
     def __enter__(self):
@@ -109,17 +117,23 @@ class OutputPaginator(object):
     def next_page(self):
         self.page += 1
         self.page_size = 0
+        self.page_bytes = 0
         self._new_file()
 
     def write(self, doc):
+        line = '{}\n'.format(json.dumps(doc)).encode('utf-8')
         self.page_size += 1
-        self.file.write('{}\n'.format(json.dumps(doc)))
+        self.page_bytes += len(line)
+        self.file.write(line)
+
+    def is_full(self, page_size, page_bytes=None):
+        return self.page_size >= page_size or bool(page_bytes and self.page_bytes >= page_bytes)
 
     def get_result(self):
         return RetryResult(self.page, self.path, self.page_size, 0)
 
 
-def rebuild_export_mutiprocess(export_id, num_processes, page_size=100000):
+def rebuild_export_mutiprocess(export_id, num_processes, page_size=100000, page_bytes=MAX_PAGE_BYTES):
     assert num_processes > 0
 
     export_instance = get_properly_wrapped_export_instance(export_id)
@@ -129,20 +143,22 @@ def rebuild_export_mutiprocess(export_id, num_processes, page_size=100000):
     paginator = OutputPaginator(export_id)
 
     logger.info('Starting data dump of {} docs'.format(total_docs))
-    run_multiprocess_exporter(exporter, filters, paginator, page_size)
+    run_multiprocess_exporter(exporter, filters, paginator, page_size, page_bytes)
 
 
-def run_multiprocess_exporter(exporter, filters, paginator, page_size):
+def run_multiprocess_exporter(exporter, filters, paginator, page_size, page_bytes=MAX_PAGE_BYTES):
     def _log_page_dumped(paginator):
-        logger.info('  Dump page {} complete: {} docs'.format(paginator.page, paginator.page_size))
+        logger.info('  Dump page {} complete: {} docs, {} bytes'.format(
+            paginator.page, paginator.page_size, paginator.page_bytes))
 
     with exporter, paginator:
         for doc in get_export_documents(exporter.export_instance, filters):
             paginator.write(doc)
-            if paginator.page_size == page_size:
+            if paginator.is_full(page_size, page_bytes):
                 _log_page_dumped(paginator)
                 exporter.process_page(paginator.get_result())
                 paginator.next_page()
+                exporter.add_finished_pages()
         if paginator.page_size:
             _log_page_dumped(paginator)
             exporter.process_page(paginator.get_result())
@@ -225,13 +241,24 @@ class LoggingProgressTracker(object):
 
 
 class MultiprocessExporter(object):
-    """Helper class to manage multi-process exporting"""
+    """Helper class to manage multi-process exporting
+
+    Pages are processed in the order they are queued, by whichever process
+    is free first. Their results are handled in the order they finish.
+    """
 
-    def __init__(self, export_instance, total_docs, num_processes, existing_archive_path=None, keep_file=False):
+    def __init__(self, export_instance, total_docs, num_processes, existing_archive_path=None, keep_file=False,
+                 max_pending_pages=None):
         self.keep_file = keep_file
         self.export_instance = export_instance
         self.existing_archive_path = existing_archive_path
-        self.results = []
+        # page number -> QueuedResult of pages that haven't been returned
+        self.results = {}
+        # page numbers of returned pages, put by the pool's result thread
+        self.finished_pages = Queue()
+        # raw dumps waiting to be processed take up disk space
+        self.max_pending_pages = max_pending_pages or 2 * num_processes
+        self.final_zip = None
         self.progress_queue = multiprocessing.Queue()
         self.progress = multiprocessing.Process(target=_output_progress, args=(self.progress_queue, total_docs))
 
@@ -270,14 +297,41 @@ class MultiprocessExporter(object):
                            - page_size: number of docs in raw data dump
         """
         attempts = page_info.retry_count + 1
-        self.progress_queue.put(ProgressValue(page_info.page, 0, page_info.page_size))
-        args = self.export_instance, page_info.page, page_info.path, page_info.page_size, attempts
-        result = self.pool.apply_async(self.export_function, args=args)
-        self.results.append(QueuedResult(result, page_info.page, page_info.path, page_info.page_size, attempts))
+        page = page_info.page
+        self.progress_queue.put(ProgressValue(page, 0, page_info.page_size))
+        args = self.export_instance, page, page_info.path, page_info.page_size, attempts
+
+        def _finished(result_or_error):
+            self.finished_pages.put(page)
+
+        result = self.pool.apply_async(
+            self.export_function, args=args, callback=_finished, error_callback=_finished
+        )
+        self.results[page] = QueuedResult(result, page, page_info.path, page_info.page_size, attempts)
+
+    def add_finished_pages(self):
+        """
+        Add the pages that have been processed to the final export. Waits
+        for pages to finish while ``max_pending_pages`` pages are queued.
+        """
+        self._add_to_final_export(self._get_finished_results())
+        while len(self.results) >= self.max_pending_pages:
+            self._add_to_final_export(self._get_finished_results(timeout=5))
 
     def wait_till_completion(self):
-        results = self.get_results()
-        final_path = self.build_final_export(results)
+        unfinished_results = []
+        try:
+            while self.results:
+                self._add_to_final_export(self._get_finished_results(timeout=5))
+        except KeyboardInterrupt:
+            logger.error('Exiting before all results received.')
+            self.premature_exit = True
+            unfinished_results = list(self.results.values())
+        finally:
+            self.stop()
+
+        self._add_to_final_export(unfinished_results)
+        final_path = self._close_final_export()
         if self.premature_exit:
             logger.warning("\n------- PREMATURE EXIT --------\nResult written to %s\n", final_path)
         else:
@@ -287,33 +341,49 @@ class MultiprocessExporter(object):
         export_results = []
         try:
             while self.results:
-                queued_result = self.results[0]
                 try:
-                    export_results.append(queued_result.async_result.get(timeout=5))
-                    self.results.pop(0)
+                    export_results.extend(self._get_finished_results(retries_per_page, timeout=5))
                 except KeyboardInterrupt:
                     logger.error('Exiting before all results received.')
                     self.premature_exit = True
-                    export_results.extend(self.results)
+                    export_results.extend(self.results.values())
                     return export_results
-                except multiprocessing.TimeoutError:
-                    pass
-                except Exception:
-                    logger.exception(
-                        "Error getting results for page %s after %s tries",
-                        queued_result.page,
-                        queued_result.retry_count
-                    )
-                    self.results.pop(0)
-                    if queued_result.retry_count < retries_per_page:
-                        self.process_page(queued_result)
-                    else:
-                        export_results.append(queued_result)
         finally:
             self.stop()
 
         return export_results
 
+    def _get_finished_results(self, retries_per_page=3, timeout=None):
+        """
+        Get the results of the pages that have been returned, waiting up to
+        ``timeout`` seconds for one if there are none. Failed pages are
+        queued again until they have been tried ``retries_per_page`` times.
+        """
+        pages = []
+        try:
+            pages.append(self.finished_pages.get(timeout=timeout) if timeout else self.finished_pages.get_nowait())
+            while True:
+                pages.append(self.finished_pages.get_nowait())
+        except Empty:
+            pass
+
+        export_results = []
+        for page in pages:
+            queued_result = self.results.pop(page)
+            try:
+                export_results.append(queued_result.async_result.get())
+            except Exception:
+                logger.exception(
+                    "Error getting results for page %s after %s tries",
+                    queued_result.page,
+                    queued_result.retry_count
+                )
+                if queued_result.retry_count < retries_per_page:
+                    self.process_page(queued_result)
+                else:
+                    export_results.append(queued_result)
+        return export_results
+
     def stop(self):
         self._safe_terminate(self.pool)
         self._safe_terminate(self.progress)
@@ -342,28 +412,38 @@ class MultiprocessExporter(object):
             )
 
     def build_final_export(self, export_results):
+        self._add_to_final_export(export_results)
+        return self._close_final_export()
+
+    def _add_to_final_export(self, export_results):
+        if not export_results:
+            return
+        if self.final_zip is None:
+            self.final_zip = self._get_zipfile_for_final_archive()
         base_name = safe_filename(self.export_instance.name or 'Export')
-        final_zip = self._get_zipfile_for_final_archive()
-        with final_zip:
-            pages = len(export_results)
-            for result in export_results:
-                if not result.success:
-                    logger.error('  Error in page %s so not added to final output', result.page)
-                    if os.path.exists(result.path):
-                        raw_dump_path = result.path
-                        logger.info('    Adding raw dump of page %s to final output', result.page)
-                        destination = '{}/page_{}.json.gz'.format(UNPROCESSED_PAGES_DIR, result.page)
-                        final_zip.write(raw_dump_path, destination, zipfile.ZIP_STORED)
-                        os.remove(raw_dump_path)
-                    continue
-
-                logger.info('  Adding page {} of {} to final file'.format(result.page, pages))
-                if self.is_zip:
-                    _add_compressed_page_to_zip(final_zip, result.page, result.path)
-                else:
-                    final_zip.write(result.path, '{}_{}'.format(base_name, result.page))
-
-        return final_zip.filename
+        for result in export_results:
+            if not result.success:
+                logger.error('  Error in page %s so not added to final output', result.page)
+                if os.path.exists(result.path):
+                    raw_dump_path = result.path
+                    logger.info('    Adding raw dump of page %s to final output', result.page)
+                    destination = '{}/page_{}.json.gz'.format(UNPROCESSED_PAGES_DIR, result.page)
+                    self.final_zip.write(raw_dump_path, destination, zipfile.ZIP_STORED)
+                    os.remove(raw_dump_path)
+                continue
+
+            logger.info('  Adding page {} to final file'.format(result.page))
+            if self.is_zip:
+                _add_compressed_page_to_zip(self.final_zip, result.page, result.path)
+            else:
+                self.final_zip.write(result.path, '{}_{}'.format(base_name, result.page))
+            os.remove(result.path)
+
+    def _close_final_export(self):
+        if self.final_zip is None:
+            self.final_zip = self._get_zipfile_for_final_archive()
+        self.final_zip.close()
+        return self.final_zip.filename
 
     def upload(self, final_path):
         logger.info('Uploading final export')
@@ -0,0 +1,341 @@
+"""
+Incremental rebuilds of daily saved exports
+
+The documents of a form or case export are split into pages, one for each
+week of ``received_on`` (forms) or ``server_modified_on`` (cases). The rows
+of each page are saved in the blob db along with the number of documents
+in the page and when the last of them was modified, according to ES.
+
+When the export is rebuilt, a single aggregation query gets the current
+count and last modified date of each page. Only the pages for which those
+changed are exported from ES again, the export file is written from the
+saved rows of all pages. Each page is also regenerated once a week to pick
+up changes that don't change the documents (e.g. user or location names).
+"""
+import gzip
+import hashlib
+import json
+import pickle
+import sys
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from soil.progress import TaskProgressManager
+
+from corehq.apps.es import filters as es_filters
+from corehq.apps.es.aggregations import DateHistogram, MaxAggregation
+from corehq.apps.export.export import (
+    ExportFile,
+    _get_base_query,
+    _get_export_query,
+    _record_datadog_export_duration,
+    _record_export_duration,
+    _time_in_milliseconds,
+    get_export_rows,
+    get_export_writer,
+    save_export_payload,
+)
+from corehq.apps.export.filters import RangeExportFilter
+from corehq.apps.export.models import (
+    CaseExportInstance,
+    ExportRow,
+    FormExportInstance,
+    RowNumberColumn,
+    SavedExportPage,
+)
+from corehq.blobs import CODES, NotFound, get_blob_db
+from corehq.elastic import iter_es_docs_from_query
+from corehq.util.files import TransientTempfile
+from corehq.util.metrics import metrics_counter
+from corehq.util.metrics.load_counters import load_counter
+
+# the date field documents are split into pages by
+PAGE_DATE_FIELDS = {
+    FormExportInstance: 'received_on',
+    CaseExportInstance: 'server_modified_on',
+}
+PAGE_INTERVAL = 'week'
+PAGE_LENGTH = timedelta(weeks=1)
+
+# each page is regenerated once in this many days, on a different day for
+# consecutive pages so that only a fraction of the pages are due each day
+PAGE_REFRESH_DAYS = 7
+
+# saved pages are deleted after this many minutes, which cleans up
+# the pages of deleted exports
+PAGE_BLOB_TIMEOUT = 2 * PAGE_REFRESH_DAYS * 24 * 60
+
+# change this when the rows saved for a page change
+PAGE_FORMAT_VERSION = 1
+
+ExportPage = namedtuple('ExportPage', 'start doc_count last_modified')
+
+
+def rebuild_export_from_pages(export_instance, progress_tracker=None):
+    """
+    Rebuild a daily saved export, exporting only the pages whose documents
+    changed from ES.
+
+    :returns: False if the export can't be rebuilt from pages, in which case
+        nothing was done
+    """
+    date_field = PAGE_DATE_FIELDS.get(type(export_instance))
+    if date_field is None:
+        return False
+    filters = export_instance.get_filters() or []
+    pages = get_export_pages(export_instance, filters, date_field)
+    if pages is None:
+        return False
+
+    config_hash = get_export_config_hash(export_instance, filters)
+    saved_pages = {
+        page.page_start: page
+        for page in SavedExportPage.objects.filter(export_instance_id=export_instance.get_id)
+    }
+    today = datetime.utcnow().date()
+    page_writer = _PageWriter(export_instance, date_field, filters, config_hash)
+
+    start = _time_in_milliseconds()
+    with TransientTempfile() as temp_path:
+        writer = get_export_writer([export_instance], temp_path)
+        with writer.open([export_instance]), \
+                TaskProgressManager(progress_tracker, src="export") as progress_manager:
+            total_docs = sum(page.doc_count for page in pages)
+            if progress_tracker:
+                progress_manager.set_progress(0, total_docs)
+            for page in pages:
+                saved_page = saved_pages.pop(page.start, None)
+                if saved_page is not None and is_current(saved_page, page, config_hash, today):
+                    if page_writer.write_saved_page(writer, saved_page):
+                        continue
+                page_writer.write_new_page(writer, page, saved_page)
+                if progress_tracker:
+                    progress_manager.set_progress(page_writer.doc_offset, total_docs)
+
+        end = _time_in_milliseconds()
+        _record_datadog_export_duration(
+            end - start, page_writer.total_bytes, page_writer.total_rows, {'format': writer.format}
+        )
+        _record_export_duration(end - start, export_instance)
+        metrics_counter('commcare.export.saved_pages', page_writer.pages_built, tags={'rebuilt': 'yes'})
+        metrics_counter('commcare.export.saved_pages', page_writer.pages_reused, tags={'rebuilt': 'no'})
+
+        with ExportFile(writer.path, writer.format) as payload:
+            save_export_payload(export_instance, payload)
+
+    # pages that no longer have any documents
+    for saved_page in saved_pages.values():
+        saved_page.delete_blob()
+        saved_page.delete()
+    return True
+
+
+def get_export_pages(export_instance, filters, date_field):
+    """
+    Get the pages of an export that have documents, in order
+
+    :returns: list of ExportPage, or None if not all documents have a date
+    """
+    aggregation = DateHistogram('pages', date_field, PAGE_INTERVAL).aggregation(
+        MaxAggregation('last_modified', 'server_modified_on')
+    )
+    result = _get_export_query(export_instance, filters).size(0).aggregation(aggregation).run()
+    pages = [
+        ExportPage(
+            _from_timestamp(bucket.key),
+            bucket.doc_count,
+            _from_timestamp(bucket.last_modified.value),
+        )
+        for bucket in result.aggregations.pages.buckets_list
+        if bucket.doc_count
+    ]
+    if sum(page.doc_count for page in pages) != result.total:
+        return None
+    return pages
+
+
+def _from_timestamp(timestamp):
+    # ES returns dates as milliseconds since the epoch
+    if timestamp is None:
+        return None
+    return datetime.utcfromtimestamp(timestamp / 1000)
+
+
+def get_export_config_hash(export_instance, filters):
+    """
+    A hash of everything the rows of an export depend on, apart from the
+    documents. Date range filters are left out, since they are applied to
+    pages through their document counts.
+    """
+    config = {
+        'version': PAGE_FORMAT_VERSION,
+        'type': type(export_instance).__name__,
+        'query': _get_base_query(export_instance).raw_query,
+        'filters': [
+            export_filter.to_es_filter() for export_filter in filters
+            if not isinstance(export_filter, RangeExportFilter)
+        ],
+        'tables': [table.to_json() for table in export_instance.selected_tables],
+        'split_multiselects': export_instance.split_multiselects,
+        'transform_dates': export_instance.transform_dates,
+    }
+    return hashlib.md5(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def is_current(saved_page, page, config_hash, today):
+    """Whether the saved rows of a page can be used for an export"""
+    return (
+        saved_page.config_hash == config_hash
+        and saved_page.doc_count == page.doc_count
+        and saved_page.last_modified == page.last_modified
+        and saved_page.date_built.date() >= get_refresh_date(page.start, today)
+    )
+
+
+def get_refresh_date(page_start, today):
+    """The last date a page was due to be regenerated on"""
+    offset = (page_start.toordinal() // 7) % PAGE_REFRESH_DAYS
+    return today - timedelta(days=(today.toordinal() - offset) % PAGE_REFRESH_DAYS)
+
+
+class _PageWriter(object):
+    """
+    Writes the rows of pages to an export, from saved rows or from ES.
+
+    The number of the first document of each page is only known when the
+    export is written, so documents are numbered from 0 in each page and
+    the row numbers of the ``number`` columns are offset when they are
+    written.
+    """
+
+    def __init__(self, export_instance, date_field, filters, config_hash):
+        self.export_instance = export_instance
+        self.date_field = date_field
+        self.filters = filters
+        self.config_hash = config_hash
+        self.tables = export_instance.selected_tables
+        self.row_number_positions = [
+            get_row_number_positions(table, export_instance.split_multiselects) for table in self.tables
+        ]
+        self.doc_offset = 0
+        self.total_bytes = 0
+        self.total_rows = 0
+        self.pages_built = 0
+        self.pages_reused = 0
+
+    def write_saved_page(self, writer, saved_page):
+        """
+        :returns: False if the saved rows no longer exist
+        """
+        try:
+            blob = saved_page.get_blob()
+        except NotFound:
+            return False
+        with blob, gzip.GzipFile(fileobj=blob, mode='rb') as page_file:
+            self._write_rows(writer, _iter_saved_rows(page_file))
+        self.doc_offset += saved_page.rows_doc_count
+        self.pages_reused += 1
+        return True
+
+    def write_new_page(self, writer, page, saved_page):
+        """
+        Export a page from ES, save its rows and write them to the export
+
+        :param saved_page: the previously saved SavedExportPage for the page, if any
+        """
+        if saved_page is not None:
+            saved_page.delete_blob()
+            saved_page.delete()
+        with TransientTempfile() as page_path:
+            with gzip.open(page_path, 'wb') as page_file:
+                rows_doc_count = self._save_rows(page_file, page)
+            saved_page = SavedExportPage(
+                export_instance_id=self.export_instance.get_id,
+                config_hash=self.config_hash,
+                page_start=page.start,
+                doc_count=page.doc_count,
+                last_modified=page.last_modified,
+                rows_doc_count=rows_doc_count,
+                date_built=datetime.utcnow(),
+            )
+            with open(page_path, 'rb') as page_file:
+                get_blob_db().put(
+                    page_file,
+                    domain=self.export_instance.domain,
+                    parent_id=self.export_instance.get_id,
+                    type_code=CODES.data_export,
+                    key=str(saved_page.blob_key),
+                    timeout=PAGE_BLOB_TIMEOUT,
+                )
+            saved_page.save()
+            with gzip.open(page_path, 'rb') as page_file:
+                self._write_rows(writer, _iter_saved_rows(page_file))
+        self.doc_offset += rows_doc_count
+        self.pages_built += 1
+
+    def _save_rows(self, page_file, page):
+        query = _get_export_query(self.export_instance, self.filters).filter(
+            es_filters.date_range(self.date_field, gte=page.start, lt=page.start + PAGE_LENGTH)
+        )
+        track_load = load_counter(self.export_instance.type, "export", self.export_instance.domain)
+        doc_count = 0
+        for row_number, doc in enumerate(iter_es_docs_from_query(query)):
+            self.total_bytes += sys.getsizeof(doc)
+            for table_index, (table, rows) in enumerate(get_export_rows(self.export_instance, doc, row_number)):
+                for row in rows:
+                    pickle.dump(
+                        (table_index, row.data, row.hyperlink_column_indices, row.skip_excel_formatting),
+                        page_file,
+                        protocol=pickle.HIGHEST_PROTOCOL,
+                    )
+            doc_count += 1
+            track_load()
+        return doc_count
+
+    def _write_rows(self, writer, rows):
+        for table_index, data, hyperlink_column_indices, skip_excel_formatting in rows:
+            if self.doc_offset:
+                for position, has_parts in self.row_number_positions[table_index]:
+                    offset_row_number(data, position, has_parts, self.doc_offset)
+            writer.write(self.tables[table_index], ExportRow(
+                data=data,
+                hyperlink_column_indices=hyperlink_column_indices,
+                skip_excel_formatting=skip_excel_formatting,
+            ))
+            self.total_rows += 1
+
+
+def _iter_saved_rows(page_file):
+    while True:
+        try:
+            yield pickle.load(page_file)
+        except EOFError:
+            return
+
+
+def get_row_number_positions(table, split_columns):
+    """
+    The positions of the values of ``number`` columns in the rows of a table
+
+    :returns: list of ``(position, has_parts)``, ``has_parts`` is True if
+        the row number of a repeat table is followed by its parts
+    """
+    positions = []
+    position = 0
+    for column in table.selected_columns:
+        width = len(column.get_headers(split_column=split_columns))
+        if isinstance(column, RowNumberColumn):
+            positions.append((position, width > 1))
+        position += width
+    return positions
+
+
+def offset_row_number(data, position, has_parts, offset):
+    """
+    Add ``offset`` to the document number of a row number, e.g. with an
+    offset of 10 "0.2" becomes "10.2" and its parts ``0, 2`` become ``10, 2``
+    """
+    number, separator, rest = data[position].partition('.')
+    data[position] = str(int(number) + offset) + separator + rest
+    if has_parts:
+        data[position + 1] += offset
@@ -22,6 +22,8 @@ hqDefine('export/js/const', [], function () {
         CSV: 'csv',
         XLS: 'xls',
         XLSX: 'xlsx',
+        PARQUET: 'parquet',
+        ARROW: 'arrow',
     };
     var SHARING_OPTIONS = {
         PRIVATE: 'private',
@@ -23,6 +23,7 @@ from corehq.apps.export.const import (
 from corehq.apps.export.export import (
     ExportFile,
     _ExportWriter,
+    _get_shared_export_dispatcher,
     get_export_file,
     get_export_writer,
     write_export_instance,
@@ -940,6 +941,78 @@ class ExportTest(SimpleTestCase):
                         )
         self.assertTrue(export_save.called)
 
+    @flag_enabled('SHARED_SCROLL_EXPORTS')
+    @patch('corehq.apps.export.models.CaseExportInstance.save')
+    def test_shared_scroll_bulk_export(self, export_save):
+        from corehq.apps.export import export as export_module
+
+        def get_instance(case_type, label, path):
+            return CaseExportInstance(
+                export_format=Format.JSON,
+                domain=DOMAIN,
+                case_type=case_type,
+                tables=[TableConfiguration(
+                    label="My table",
+                    selected=True,
+                    path=MAIN_TABLE,
+                    columns=[
+                        ExportColumn(
+                            label=label,
+                            item=ExportItem(path=[PathNode(name=path)]),
+                            selected=True,
+                        )
+                    ]
+                )]
+            )
+
+        with TransientTempfile() as temp_path, \
+                patch.object(export_module, 'iter_es_docs_from_query',
+                             wraps=export_module.iter_es_docs_from_query) as iter_docs:
+            export_file = get_export_file(
+                [
+                    get_instance(DEFAULT_CASE_TYPE, "Foo column", "foo"),
+                    get_instance("some_other_type", "Bar column", "bar"),
+                ],
+                [],  # No filters
+                temp_path,
+            )
+            self.assertEqual(iter_docs.call_count, 1)
+
+            with export_file as export:
+                wb = load_workbook(export)
+                self.assertEqual(wb.get_sheet_names(), ["Export1-My table", "Export2-My table"])
+                self.assertEqual(
+                    [cell.value for cell in wb["Export1-My table"]["A"]],
+                    ["Foo column", "apple", "apple", "apple"],
+                )
+                self.assertEqual(
+                    [cell.value for cell in wb["Export2-My table"]["A"]],
+                    ["Bar column", "banana"],
+                )
+        self.assertEqual(export_save.call_count, 2)
+
+
+class SharedExportDispatcherTest(SimpleTestCase):
+
+    def test_form_exports(self):
+        get_indices = _get_shared_export_dispatcher([
+            FormExportInstance(domain=DOMAIN, app_id='app1', xmlns='xmlns1'),
+            FormExportInstance(domain=DOMAIN, app_id=None, xmlns='xmlns1'),
+            FormExportInstance(domain=DOMAIN, app_id='app2', xmlns='xmlns2'),
+        ])
+        self.assertEqual(get_indices({'xmlns': 'xmlns1', 'app_id': 'app1'}), [0, 1])
+        self.assertEqual(get_indices({'xmlns': 'xmlns1', 'app_id': 'app2'}), [1])
+        self.assertEqual(get_indices({'xmlns': 'xmlns2', 'app_id': 'app1'}), [])
+
+    def test_case_exports(self):
+        get_indices = _get_shared_export_dispatcher([
+            CaseExportInstance(domain=DOMAIN, case_type='a'),
+            CaseExportInstance(domain=DOMAIN, case_type='b'),
+            CaseExportInstance(domain=DOMAIN, case_type='a'),
+        ])
+        self.assertEqual(list(get_indices({'type': 'a'})), [0, 2])
+        self.assertEqual(list(get_indices({'type': 'c'})), [])
+
 
 class TableHeaderTest(SimpleTestCase):
 
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import zipfile
+
+from django.test import SimpleTestCase
+
+from mock import patch
+
+from couchexport.models import Format
+
+from corehq.apps.export.models import CaseExportInstance
+from corehq.apps.export.multiprocess import (
+    UNPROCESSED_PAGES_DIR,
+    MultiprocessExporter,
+    OutputPaginator,
+    RetryResult,
+    SuccessResult,
+)
+
+
+def _export_page(export_instance, page_number, dump_path, doc_count, attempts):
+    if page_number == 1 and attempts == 1:
+        raise Exception("failed first attempt")
+    if page_number == 2:
+        raise Exception("always fails")
+    fd, path = tempfile.mkstemp()
+    with os.fdopen(fd, 'w') as f:
+        f.write('page {}'.format(page_number))
+    return SuccessResult(page_number, path, doc_count)
+
+
+class OutputPaginatorTest(SimpleTestCase):
+
+    def test_page_size(self):
+        paginator = OutputPaginator('abc')
+        with paginator:
+            paginator.write({'_id': '1'})
+            self.assertFalse(paginator.is_full(2))
+            paginator.write({'_id': '2'})
+            self.assertTrue(paginator.is_full(2))
+
+    def test_page_bytes(self):
+        paginator = OutputPaginator('abc')
+        with paginator:
+            paginator.write({'_id': '1', 'form': {'repeat': ['x' * 100] * 10}})
+            self.assertGreater(paginator.page_bytes, 1000)
+            self.assertTrue(paginator.is_full(100, page_bytes=1000))
+            self.assertFalse(paginator.is_full(100))
+            paginator.next_page()
+            self.assertEqual((paginator.page, paginator.page_size, paginator.page_bytes), (1, 0, 0))
+
+
+class MultiprocessExporterTest(SimpleTestCase):
+
+    def _get_dump(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(lambda: os.path.exists(path) and os.remove(path))
+        return path
+
+    @patch.object(MultiprocessExporter, 'upload')
+    def test_pages_added_as_they_finish(self, upload):
+        export_instance = CaseExportInstance(name='Export', export_format=Format.UNZIPPED_CSV)
+        exporter = MultiprocessExporter(export_instance, 4, 2, max_pending_pages=2)
+        exporter.export_function = _export_page
+        with exporter:
+            for page in range(4):
+                exporter.process_page(RetryResult(page, self._get_dump(), 1, 0))
+                exporter.add_finished_pages()
+                self.assertLess(len(exporter.results), 2)
+        exporter.wait_till_completion()
+
+        final_path, = upload.call_args[0]
+        self.addCleanup(os.remove, final_path)
+        with zipfile.ZipFile(final_path) as final_zip:
+            self.assertEqual(
+                sorted(final_zip.namelist()),
+                ['Export_0', 'Export_1', 'Export_3', '{}/page_2.json.gz'.format(UNPROCESSED_PAGES_DIR)],
+            )
+            self.assertEqual(final_zip.read('Export_1'), b'page 1')
@@ -0,0 +1,184 @@
+import uuid
+from datetime import date, datetime, timedelta
+
+from django.test import SimpleTestCase, TestCase
+
+from couchexport.models import Format
+from pillowtop.es_utils import initialize_index_and_mapping
+
+from corehq.apps.domain.shortcuts import create_domain
+from corehq.apps.es.tests.utils import es_test
+from corehq.apps.export.models import (
+    CaseExportInstance,
+    ExportColumn,
+    ExportItem,
+    PathNode,
+    RowNumberColumn,
+    SavedExportPage,
+    TableConfiguration,
+)
+from corehq.apps.export.saved_export_pages import (
+    get_refresh_date,
+    get_row_number_positions,
+    offset_row_number,
+    rebuild_export_from_pages,
+)
+from corehq.apps.export.tests.util import DEFAULT_CASE_TYPE, new_case
+from corehq.elastic import get_es_new, send_to_elasticsearch
+from corehq.pillows.mappings.case_mapping import CASE_INDEX_INFO
+from corehq.util.elastic import ensure_index_deleted
+from corehq.util.es.interface import ElasticsearchInterface
+from corehq.util.test_utils import trap_extra_setup
+
+
+class RowNumberTest(SimpleTestCase):
+
+    def test_offset_row_number(self):
+        data = ['0', 'apple']
+        offset_row_number(data, 0, False, 10)
+        self.assertEqual(data, ['10', 'apple'])
+
+    def test_offset_repeat_row_number(self):
+        data = ['apple', '3.1', 3, 1]
+        offset_row_number(data, 1, True, 10)
+        self.assertEqual(data, ['apple', '13.1', 13, 1])
+
+    def test_row_number_positions(self):
+        table = TableConfiguration(
+            path=[PathNode(name='form', is_repeat=False), PathNode(name='repeat', is_repeat=True)],
+            columns=[
+                ExportColumn(item=ExportItem(path=[PathNode(name='foo')]), selected=True),
+                RowNumberColumn(item=ExportItem(path=[PathNode(name='number')]), repeat=1, selected=True),
+                ExportColumn(item=ExportItem(path=[PathNode(name='bar')]), selected=True),
+            ]
+        )
+        self.assertEqual(get_row_number_positions(table, False), [(1, True)])
+
+
+class RefreshDateTest(SimpleTestCase):
+
+    def test_refresh_date_is_in_last_week(self):
+        today = date(2020, 6, 10)
+        for week in range(20):
+            refresh_date = get_refresh_date(datetime(2020, 1, 6) + timedelta(weeks=week), today)
+            self.assertTrue(today - timedelta(days=7) < refresh_date <= today)
+
+    def test_pages_are_refreshed_on_different_days(self):
+        today = date(2020, 6, 10)
+        refresh_dates = {
+            get_refresh_date(datetime(2020, 1, 6) + timedelta(weeks=week), today)
+            for week in range(7)
+        }
+        self.assertEqual(len(refresh_dates), 7)
+
+
+@es_test
+class RebuildExportFromPagesTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with trap_extra_setup(ConnectionError, msg="cannot connect to elasicsearch"):
+            cls.es = get_es_new()
+            initialize_index_and_mapping(cls.es, CASE_INDEX_INFO)
+        cls.domain = uuid.uuid4().hex
+        create_domain(cls.domain)
+        cls.now = datetime.utcnow()
+        cls._send_cases([
+            new_case(domain=cls.domain, foo="apple", server_modified_on=cls.now - timedelta(weeks=3)),
+            new_case(domain=cls.domain, foo="orange", server_modified_on=cls.now - timedelta(weeks=2)),
+            new_case(domain=cls.domain, foo="pear", server_modified_on=cls.now - timedelta(weeks=2)),
+        ])
+
+    @classmethod
+    def tearDownClass(cls):
+        ensure_index_deleted(CASE_INDEX_INFO.index)
+        super().tearDownClass()
+
+    @classmethod
+    def _send_cases(cls, cases):
+        for case in cases:
+            send_to_elasticsearch('cases', case.to_json())
+        cls.es.indices.refresh(CASE_INDEX_INFO.index)
+
+    def setUp(self):
+        super().setUp()
+        self.export_instance = CaseExportInstance(
+            export_format=Format.UNZIPPED_CSV,
+            domain=self.domain,
+            case_type=DEFAULT_CASE_TYPE,
+            tables=[TableConfiguration(
+                label="My table",
+                selected=True,
+                path=[],
+                columns=[
+                    RowNumberColumn(
+                        label="number",
+                        item=ExportItem(path=[PathNode(name='number')]),
+                        selected=True,
+                    ),
+                    ExportColumn(
+                        label="Foo column",
+                        item=ExportItem(path=[PathNode(name="foo")]),
+                        selected=True,
+                    ),
+                ]
+            )]
+        )
+        self.export_instance.save()
+        self.addCleanup(self.export_instance.delete)
+
+    def tearDown(self):
+        for page in SavedExportPage.objects.filter(export_instance_id=self.export_instance.get_id):
+            page.delete_blob()
+            page.delete()
+        super().tearDown()
+
+    def _get_rows(self):
+        data = self.export_instance.get_payload().decode('utf-8-sig')
+        return [line.split(',') for line in data.splitlines()]
+
+    def _get_pages(self):
+        return list(SavedExportPage.objects.filter(
+            export_instance_id=self.export_instance.get_id
+        ).order_by('page_start'))
+
+    def test_rebuild(self):
+        self.assertTrue(rebuild_export_from_pages(self.export_instance))
+        rows = self._get_rows()
+        self.assertEqual(rows[0], ['number', 'Foo column'])
+        self.assertEqual(sorted(row[0] for row in rows[1:]), ['0', '1', '2'])
+        self.assertEqual(sorted(row[1] for row in rows[1:]), ['apple', 'orange', 'pear'])
+        self.assertEqual([page.rows_doc_count for page in self._get_pages()], [1, 2])
+
+    def test_unchanged_pages_are_reused(self):
+        rebuild_export_from_pages(self.export_instance)
+        old_page, = [page for page in self._get_pages() if page.rows_doc_count == 1]
+
+        case = new_case(domain=self.domain, foo="banana", server_modified_on=self.now)
+        self._send_cases([case])
+        self.addCleanup(self._delete_case, case.case_id)
+        rebuild_export_from_pages(self.export_instance)
+
+        pages = self._get_pages()
+        self.assertEqual(len(pages), 3)
+        self.assertIn(old_page.blob_key, [page.blob_key for page in pages])
+        rows = self._get_rows()
+        self.assertEqual(sorted(row[0] for row in rows[1:]), ['0', '1', '2', '3'])
+        self.assertEqual(sorted(row[1] for row in rows[1:]), ['apple', 'banana', 'orange', 'pear'])
+
+    def test_changed_config_rebuilds_pages(self):
+        rebuild_export_from_pages(self.export_instance)
+        old_keys = {page.blob_key for page in self._get_pages()}
+
+        self.export_instance.split_multiselects = not self.export_instance.split_multiselects
+        rebuild_export_from_pages(self.export_instance)
+
+        new_keys = {page.blob_key for page in self._get_pages()}
+        self.assertEqual(len(new_keys), 2)
+        self.assertFalse(old_keys & new_keys)
+
+    def _delete_case(self, case_id):
+        interface = ElasticsearchInterface(self.es)
+        interface.delete_doc(CASE_INDEX_INFO.index, CASE_INDEX_INFO.type, case_id)
+        self.es.indices.refresh(CASE_INDEX_INFO.index)
@@ -1,15 +1,19 @@
 from django.test import SimpleTestCase
 
-from corehq.apps.export.const import USERNAME_TRANSFORM
+from corehq.apps.export.const import EMPTY_VALUE, MISSING_VALUE, USERNAME_TRANSFORM
 from corehq.apps.export.models import (
     DocRow,
     ExportColumn,
     ExportRow,
+    MultipleChoiceItem,
+    Option,
     PathNode,
     RowNumberColumn,
     ScalarItem,
+    SplitExportColumn,
     TableConfiguration,
 )
+from corehq.apps.export.models.new import PathPlan
 
 
 class TableConfigurationTest(SimpleTestCase):
@@ -336,3 +340,68 @@ class TableConfigurationGetRowsTest(SimpleTestCase):
         self.assertEqual(
             [row.data for row in table_configuration.get_rows(submission, 0)], []
         )
+
+
+class PathPlanTest(SimpleTestCase):
+
+    def test_get_values(self):
+        plan = PathPlan([['form', 'q1'], ['form', 'group', 'q2'], ['form', 'group'], ['form', 'q1', 'x'], []])
+        self.assertEqual(
+            plan.get_values({'form': {'q1': 'a', 'group': {'q2': 'b'}}}),
+            ['a', 'b', {'q2': 'b'}, None, None],
+        )
+        self.assertEqual(plan.get_values({'form': ['a']}), [None] * 5)
+        self.assertEqual(plan.get_values('not a dict'), [None] * 5)
+
+
+class TableRowExtractorTest(SimpleTestCase):
+
+    def _column(self, *names):
+        return ExportColumn(item=ScalarItem(path=[PathNode(name=name) for name in names]), selected=True)
+
+    def test_same_as_column_values(self):
+        table_configuration = TableConfiguration(
+            path=[PathNode(name='form'), PathNode(name='repeat', is_repeat=True)],
+            columns=[
+                RowNumberColumn(selected=True),
+                self._column('form', 'repeat', 'q1'),
+                self._column('form', 'repeat', 'group', 'q2'),
+                self._column('form', 'repeat', 'group', 'q3'),
+                self._column('form', 'repeat', 'missing', 'q4'),
+                SplitExportColumn(
+                    item=MultipleChoiceItem(
+                        path=[PathNode(name='form'), PathNode(name='repeat', is_repeat=True), PathNode(name='mc')],
+                        options=[Option(value='a'), Option(value='b')],
+                    ),
+                    selected=True,
+                ),
+            ]
+        )
+        submission = {
+            'domain': 'my-domain',
+            '_id': '1234',
+            'form': {
+                'repeat': [
+                    {'q1': {'#text': 'text', 'id': '1'}, 'group': {'q2': 'foo', 'q3': ['x', 'y']}, 'mc': 'a c'},
+                    {'q1': 'bar', 'group': 'not a group'},
+                ]
+            }
+        }
+        self.assertEqual(
+            [row.data for row in table_configuration.get_rows(submission, 0, split_columns=True)],
+            [
+                ['0.0', 0, 0, 'text', 'foo', 'x y', MISSING_VALUE, 1, EMPTY_VALUE, 'c'],
+                ['0.1', 0, 1, 'bar', MISSING_VALUE, MISSING_VALUE, MISSING_VALUE,
+                 MISSING_VALUE, MISSING_VALUE, MISSING_VALUE],
+            ]
+        )
+        for doc_row in table_configuration._get_sub_documents(submission, 0):
+            expected = []
+            for column in table_configuration.selected_columns:
+                value = column.get_value(
+                    'my-domain', '1234', doc_row.doc, table_configuration.path,
+                    row_index=doc_row.row, split_column=True,
+                )
+                expected.extend(value if isinstance(value, list) else [value])
+            self.assertIn(expected, [row.data for row in table_configuration.get_rows(
+                submission, 0, split_columns=True)])
@@ -7,12 +7,14 @@ from casexml.apps.phone.fixtures import FixtureProvider
 from casexml.apps.phone.utils import (
     GLOBAL_USER_ID,
     get_or_cache_global_fixture,
+    get_or_cache_shared_fixture,
 )
 
 from corehq.apps.fixtures.dbaccessors import iter_fixture_items_for_data_type
 from corehq.apps.fixtures.models import FIXTURE_BUCKET, FixtureDataType
 from corehq.apps.products.fixtures import product_fixture_generator_json
 from corehq.apps.programs.fixtures import program_fixture_generator_json
+from corehq.toggles import SHARED_USER_FIXTURE_CACHE
 
 from .utils import get_index_schema_node
 
@@ -64,7 +66,7 @@ class ItemListsProvider(FixtureProvider):
         if global_types:
             items.extend(self.get_global_items(global_types, restore_state))
         if user_types:
-            items.extend(self.get_user_items(user_types, restore_user))
+            items.extend(self.get_user_items(user_types, restore_state))
         return items
 
     def get_global_items(self, global_types, restore_state):
@@ -80,7 +82,15 @@ class ItemListsProvider(FixtureProvider):
 
         return self._get_fixtures(global_types, get_items_by_type, GLOBAL_USER_ID)
 
-    def get_user_items(self, user_types, restore_user):
+    def get_user_items(self, user_types, restore_state):
+        """Get fixtures for user-owned lookup tables
+
+        Users owning the same items (for example through the same group
+        or location) get the same fixtures, so with SHARED_USER_FIXTURE_CACHE
+        the serialized fixtures are shared between them, keyed by the item
+        and table versions.
+        """
+        restore_user = restore_state.restore_user
         items_by_type = defaultdict(list)
         for item in restore_user.get_fixture_data_items():
             data_type = user_types.get(item.data_type_id)
@@ -92,7 +102,15 @@ class ItemListsProvider(FixtureProvider):
             return sorted(items_by_type.get(data_type, []),
                           key=attrgetter('sort_key'))
 
-        return self._get_fixtures(user_types, get_items_by_type, restore_user.user_id)
+        if not SHARED_USER_FIXTURE_CACHE.enabled(restore_user.domain):
+            return self._get_fixtures(user_types, get_items_by_type, restore_user.user_id)
+
+        content_key = sorted(
+            [data_type._id, data_type._rev, sorted((item._id, item._rev) for item in items_by_type[data_type])]
+            for data_type in user_types.values()
+        )
+        data_fn = partial(self._get_fixtures, user_types, get_items_by_type, GLOBAL_USER_ID)
+        return get_or_cache_shared_fixture(restore_state, FIXTURE_BUCKET, content_key, data_fn)
 
     def _set_cached_type(self, item, data_type):
         # set the cached version used by the object so that it doesn't
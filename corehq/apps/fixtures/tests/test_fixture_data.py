@@ -5,6 +5,7 @@ from django.test import TestCase
 from casexml.apps.case.tests.util import check_xml_line_by_line
 from casexml.apps.phone.tests.utils import \
     call_fixture_generator as call_fixture_generator_raw
+from casexml.apps.phone.utils import get_cached_items_with_count
 
 from corehq.apps.fixtures import fixturegenerators
 from corehq.apps.fixtures.dbaccessors import (
@@ -24,11 +25,19 @@ from corehq.apps.fixtures.models import (
 from corehq.apps.users.dbaccessors.all_commcare_users import delete_all_users
 from corehq.apps.users.models import CommCareUser
 from corehq.blobs import get_blob_db
+from corehq.util.test_utils import flag_enabled
 
 
 def call_fixture_generator(user):
-    return [ElementTree.fromstring(f) if isinstance(f, bytes) else f
-            for f in call_fixture_generator_raw(fixturegenerators.item_lists, user)]
+    fixtures = []
+    for f in call_fixture_generator_raw(fixturegenerators.item_lists, user):
+        if isinstance(f, bytes):
+            # cached fixtures may contain several elements
+            xml, num = get_cached_items_with_count(f)
+            fixtures.extend(ElementTree.fromstring(b'<f>' + xml + b'</f>'))
+        else:
+            fixtures.append(f)
+    return fixtures
 
 
 class FixtureDataTest(TestCase):
@@ -310,6 +319,25 @@ class FixtureDataTest(TestCase):
         fixtures = call_fixture_generator(sammy)
         self.assertEqual({item.attrib['user_id'] for item in fixtures}, {sammy.user_id})
 
+    @flag_enabled('SHARED_USER_FIXTURE_CACHE')
+    def test_shared_user_fixture_user_id(self):
+        sammy = CommCareUser.create(self.domain, 'sammy', '***', None, None)
+        FixtureOwnership(
+            domain=self.domain,
+            owner_id=sammy.get_id,
+            owner_type='user',
+            data_item_id=self.data_item.get_id
+        ).save()
+
+        frank_fixture, = call_fixture_generator(self.user.to_ota_restore_user())
+        sammy_fixture, = call_fixture_generator(sammy.to_ota_restore_user())
+        self.assertEqual(frank_fixture.attrib['user_id'], self.user.user_id)
+        self.assertEqual(sammy_fixture.attrib['user_id'], sammy.user_id)
+        self.assertEqual(
+            ElementTree.tostring(frank_fixture[0]),
+            ElementTree.tostring(sammy_fixture[0]),
+        )
+
     def make_data_type(self, name, is_global):
         data_type = FixtureDataType(
             domain=self.domain,
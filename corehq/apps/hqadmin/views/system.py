@@ -14,6 +14,7 @@ from requests.exceptions import HTTPError
 
 from couchforms.models import XFormInstance
 from dimagi.utils.couch.database import is_bigcouch
+from casexml.apps.phone.restore_profile import get_slowest_restores
 from pillowtop.exceptions import PillowNotFoundError
 from pillowtop.utils import (
     get_all_pillows_json,
@@ -282,3 +283,18 @@ class GlobalThresholds(BaseAdminSectionView):
         return get_project_limits_context([
             ('Submission Rate Limits', global_submission_rate_limiter),
         ])
+
+
+@method_decorator(require_superuser, name='dispatch')
+class SlowestRestoresView(BaseAdminSectionView):
+    urlname = 'slowest_restores'
+    page_title = ugettext_lazy("Slowest Restores")
+    template_name = 'hqadmin/slowest_restores.html'
+
+    @property
+    def page_context(self):
+        domain = self.request.GET.get('domain', '').strip()
+        return {
+            'restore_domain': domain,
+            'profiles': get_slowest_restores(domain) if domain else [],
+        }
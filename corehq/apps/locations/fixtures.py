@@ -9,6 +9,7 @@ from django_cte import With
 from django_cte.raw import raw_cte_sql
 
 from casexml.apps.phone.fixtures import FixtureProvider
+from casexml.apps.phone.utils import GLOBAL_USER_ID, get_or_cache_shared_fixture
 
 from corehq import toggles
 from corehq.apps.app_manager.const import (
@@ -26,6 +27,9 @@ from corehq.apps.locations.models import (
 )
 
 
+LOCATION_FIXTURE_BUCKET = 'location-fixtures'
+
+
 class LocationSet(object):
     """
     Very simple class for keeping track of a set of locations
@@ -123,8 +127,41 @@ class LocationFixtureProvider(FixtureProvider):
             return []
 
         data_fields = _get_location_data_fields(restore_user.domain)
+        if toggles.SHARED_USER_FIXTURE_CACHE.enabled(restore_user.domain):
+            return self._get_shared_xml_nodes(restore_state, locations_queryset, data_fields)
         return self.serializer.get_xml_nodes(self.id, restore_user, locations_queryset, data_fields)
 
+    def _get_shared_xml_nodes(self, restore_state, locations_queryset, data_fields):
+        """Get fixture shared by all users syncing the same set of locations"""
+        domain = restore_state.restore_user.domain
+        content_key = [
+            self.id,
+            self.serializer.__class__.__name__,
+            sorted(locations_queryset.values_list('location_id', 'last_modified')),
+            list(LocationType.objects.filter(domain=domain).order_by('pk').values_list('code', 'last_modified')),
+            [field.slug for field in data_fields],
+        ]
+
+        def data_fn():
+            return self.serializer.get_xml_nodes(
+                self.id, _GlobalRestoreUser(restore_state.restore_user), locations_queryset, data_fields)
+
+        return get_or_cache_shared_fixture(restore_state, LOCATION_FIXTURE_BUCKET, content_key, data_fn)
+
+
+class _GlobalRestoreUser(object):
+    """Restore user proxy used to generate fixtures shared between users"""
+
+    def __init__(self, restore_user):
+        self._restore_user = restore_user
+
+    @property
+    def user_id(self):
+        return GLOBAL_USER_ID
+
+    def __getattr__(self, name):
+        return getattr(self._restore_user, name)
+
 
 class HierarchicalLocationSerializer(object):
 
@@ -1,10 +1,14 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 
 from casexml.apps.phone.models import OTARestoreCommCareUser, OTARestoreWebUser
 
 from corehq.apps.domain.models import Domain
 from corehq.apps.locations.tests.util import LocationHierarchyTestCase
-from corehq.apps.ota.utils import get_restore_user, is_permitted_to_restore
+from corehq.apps.ota.utils import (
+    accepts_gzip,
+    get_restore_user,
+    is_permitted_to_restore,
+)
 from corehq.apps.users.dbaccessors.all_commcare_users import delete_all_users
 from corehq.apps.users.models import CommCareUser, WebUser
 from corehq.apps.users.util import format_username
@@ -308,3 +312,14 @@ class GetRestoreUserTest(TestCase):
             self.other_commcare_user
         )
         self.assertEqual(user.user_id, self.other_commcare_user._id)
+
+
+class AcceptsGzipTest(SimpleTestCase):
+
+    def test_accepts_gzip(self):
+        for header in ['gzip', 'deflate, gzip', 'GZIP;q=0.5', 'x-gzip', '*', 'br;q=1, *;q=0.1']:
+            self.assertTrue(accepts_gzip(header), header)
+
+    def test_does_not_accept_gzip(self):
+        for header in ['', 'identity', 'deflate', 'gzip;q=0', 'gzip; q=0.0, deflate', '*, gzip;q=0', 'gzip;q=x']:
+            self.assertFalse(accepts_gzip(header), header)
@@ -200,3 +200,26 @@ def handle_401_response(f):
 
         return response
     return _inner
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Whether the value of an Accept-Encoding header accepts gzip. Codings
+    with a q-value of 0 (e.g. "gzip;q=0") are not acceptable.
+    """
+    qvalues = {}
+    for coding in accept_encoding.split(','):
+        name, *params = coding.split(';')
+        qvalue = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0
+        qvalues[name.strip().lower()] = qvalue
+    for name in ('gzip', 'x-gzip', '*'):
+        if name in qvalues:
+            return qvalues[name] > 0
+    return False
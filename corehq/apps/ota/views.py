@@ -9,6 +9,7 @@ from django.http import (
     HttpResponseBadRequest,
     JsonResponse,
 )
+from django.utils.cache import patch_vary_headers
 from django.utils.translation import ugettext as _
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_GET, require_POST
@@ -57,6 +58,7 @@ from custom.icds_core.view_utils import check_authorization
 
 from .models import DeviceLogRequest, MobileRecoveryMeasure, SerialIdBucket
 from .utils import (
+    accepts_gzip,
     demo_user_restore_response,
     get_restore_user,
     handle_401_response,
@@ -81,8 +83,10 @@ def restore(request, domain, app_id=None):
     if rate_limit_restore(domain):
         return HttpTooManyRequests()
 
+    accept_gzip = accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
     response, timing_context = get_restore_response(
-        domain, request.couch_user, app_id, **get_restore_params(request))
+        domain, request.couch_user, app_id, accept_gzip=accept_gzip, **get_restore_params(request))
+    patch_vary_headers(response, ['Accept-Encoding'])
     return response
 
 
@@ -183,7 +187,7 @@ def get_restore_response(domain, couch_user, app_id=None, since=None, version='1
                          cache_timeout=None, overwrite_cache=False,
                          as_user=None, device_id=None, user_id=None,
                          openrosa_version=None, case_sync=None,
-                         skip_fixtures=False):
+                         skip_fixtures=False, accept_gzip=False):
     """
     :param domain: Domain being restored from
     :param couch_user: User performing restore
@@ -201,6 +205,7 @@ def get_restore_response(domain, couch_user, app_id=None, since=None, version='1
     :param openrosa_version:
     :param case_sync: Override default case sync algorithm
     :param skip_fixtures: Do not include fixtures in sync payload
+    :param accept_gzip: The client accepts gzip content encoding
     :return: Tuple of (http response, timing context or None)
     """
 
@@ -264,6 +269,7 @@ def get_restore_response(domain, couch_user, app_id=None, since=None, version='1
             app=app,
             device_id=device_id,
             openrosa_version=openrosa_version,
+            accept_gzip=accept_gzip,
         ),
         cache_settings=RestoreCacheSettings(
             force_cache=force_cache or async_restore_enabled,
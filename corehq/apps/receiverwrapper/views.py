@@ -1,6 +1,7 @@
 import os
+from xml.etree import cElementTree as ElementTree
 
-from django.http import HttpResponseBadRequest, HttpResponseForbidden
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
@@ -11,7 +12,7 @@ from corehq.apps.users.decorators import require_permission
 from corehq.apps.users.models import Permissions
 from couchforms import openrosa_response
 from couchforms.const import MAGIC_PROPERTY
-from couchforms.exceptions import BadSubmissionRequest
+from couchforms.exceptions import BadSubmissionRequest, BulkSubmissionTooLarge
 from couchforms.getters import MultimediaBug
 from dimagi.utils.decorators.profile import profile_dump
 from dimagi.utils.logging import notify_exception
@@ -47,7 +48,7 @@ from corehq.apps.receiverwrapper.util import (
 )
 from corehq.form_processor.exceptions import XFormLockError
 from corehq.form_processor.interfaces.dbaccessors import CaseAccessors
-from corehq.form_processor.submission_post import SubmissionPost
+from corehq.form_processor.submission_post import BulkSubmissionPost, SubmissionPost
 from corehq.form_processor.utils import (
     convert_xform_to_json,
     should_use_sql_backend,
@@ -60,6 +61,8 @@ from tastypie.http import HttpTooManyRequests
 PROFILE_PROBABILITY = float(os.getenv('COMMCARE_PROFILE_SUBMISSION_PROBABILITY', 0))
 PROFILE_LIMIT = os.getenv('COMMCARE_PROFILE_SUBMISSION_LIMIT')
 PROFILE_LIMIT = int(PROFILE_LIMIT) if PROFILE_LIMIT is not None else 1
+BULK_SUBMISSION_MAX_FORMS = 1000
+BULK_SUBMISSION_MAX_BYTES = 100 * 1024 * 1024
 
 
 @profile_dump('commcare_receiverwapper_process_form.prof', probability=PROFILE_PROBABILITY, limit=PROFILE_LIMIT)
@@ -148,6 +151,74 @@ def _process_form(request, domain, app_id, user_id, authenticated,
     return response
 
 
+def _process_bulk_forms(request, domain, app_id, user_id):
+    if not toggles.BULK_FORM_SUBMISSION.enabled(domain):
+        return HttpResponseForbidden('Bulk submissions are not enabled for this project')
+
+    # checked again for each form, this only avoids reading the forms
+    if rate_limit_submission(domain):
+        return HttpTooManyRequests()
+
+    metric_tags = {
+        'backend': 'sql' if should_use_sql_backend(domain) else 'couch',
+        'domain': domain,
+        'bulk': True,
+    }
+
+    try:
+        instances = couchforms.get_bulk_instances(
+            request, BULK_SUBMISSION_MAX_FORMS, BULK_SUBMISSION_MAX_BYTES)
+    except BadSubmissionRequest as e:
+        status = 413 if isinstance(e, BulkSubmissionTooLarge) else 400
+        response = HttpResponse(e.message, status=status)
+        _record_metrics(metric_tags, 'known_failures', response)
+        return response
+
+    app_id, build_id = get_app_and_build_ids(domain, app_id)
+    results = BulkSubmissionPost(
+        instances,
+        domain=domain,
+        app_id=app_id,
+        build_id=build_id,
+        auth_context=AuthContext(
+            domain=domain,
+            user_id=user_id,
+            authenticated=True,
+        ),
+        location=couchforms.get_location(request),
+        received_on=couchforms.get_received_on(request),
+        date_header=couchforms.get_date_header(request),
+        path=couchforms.get_path(request),
+        submit_ip=couchforms.get_submit_ip(request),
+        openrosa_headers=couchforms.get_openrosa_headers(request),
+    ).run()
+
+    for result in results:
+        _record_metrics(dict(metric_tags), result.submission_type, result.response, xform=result.xform)
+    return _get_bulk_response(results)
+
+
+def _get_bulk_response(results):
+    """Wrap the response of each form in a <submission> element"""
+    root = ElementTree.Element('submissions')
+    for result in results:
+        element = ElementTree.SubElement(root, 'submission', {
+            'name': result.name,
+            'status': str(result.response.status_code),
+        })
+        if result.response.has_header('X-CommCareHQ-FormID'):
+            element.set('form_id', result.response['X-CommCareHQ-FormID'])
+        content = result.response.content
+        try:
+            element.append(ElementTree.fromstring(content))
+        except ElementTree.ParseError:
+            element.text = content.decode('utf-8', 'replace')
+    return HttpResponse(
+        ElementTree.tostring(root, encoding='utf-8'),
+        content_type="text/xml; charset=utf-8",
+    )
+
+
 def _submission_error(request, message, metric_tags,
         domain, app_id, user_id, authenticated, meta=None, status=400,
         notify=True):
@@ -358,3 +429,53 @@ def secure_post(request, domain, app_id=None):
         )
 
     return decorated_view(request, domain, app_id=app_id)
+
+
+@handle_401_response
+@login_or_basic_ex(allow_cc_users=True)
+@two_factor_exempt
+@require_permission(Permissions.edit_data)
+def _bulk_post_basic(request, domain, app_id=None):
+    """only ever called from bulk post"""
+    return _process_bulk_forms(request, domain, app_id, request.couch_user.get_id)
+
+
+@login_or_api_key_ex()
+@require_permission(Permissions.edit_data)
+@require_permission(Permissions.access_api)
+def _bulk_post_api_key(request, domain, app_id=None):
+    """only ever called from bulk post"""
+    return _process_bulk_forms(request, domain, app_id, request.couch_user.get_id)
+
+
+@waf_allow('XSS_BODY')
+@location_safe
+@csrf_exempt
+@require_POST
+@check_domain_migration
+def bulk_post(request, domain, app_id=None):
+    """Submit many forms in one request
+
+    The body is multipart/form-data with one file per form or a tar
+    archive (optionally compressed) of .xml files. The response contains
+    one <submission> element per form wrapping that form's OpenRosa
+    response.
+    """
+    authtype_map = {
+        BASIC: _bulk_post_basic,
+        API_KEY: _bulk_post_api_key,
+    }
+
+    if request.GET.get('authtype'):
+        authtype = request.GET['authtype']
+    else:
+        authtype = determine_authtype_from_request(request, default=BASIC)
+
+    try:
+        decorated_view = authtype_map[authtype]
+    except KeyError:
+        return HttpResponseBadRequest(
+            'authtype must be one of: {0}'.format(','.join(authtype_map))
+        )
+
+    return decorated_view(request, domain, app_id=app_id)
@@ -164,6 +164,9 @@ class SqlData(ReportDataSource):
     table_name = None
     """The name of the table to run the query against."""
 
+    use_read_replica = True
+    """Whether queries can run against a read replica of the engine's database."""
+
     @property
     def engine_id(self):
         """
@@ -289,7 +292,7 @@ class SqlData(ReportDataSource):
             )
 
         qc = self.query_context(start=start, limit=limit)
-        session_helper = connection_manager.get_session_helper(self.engine_id, readonly=True)
+        session_helper = connection_manager.get_session_helper(self.engine_id, readonly=self.use_read_replica)
         with session_helper.session_context() as session:
             return qc.resolve(session.connection(), self.filter_values)
 
@@ -299,7 +302,7 @@ class SqlData(ReportDataSource):
 
     def get_sql_queries(self):
         qc = self.query_context()
-        session_helper = connection_manager.get_session_helper(self.engine_id, readonly=True)
+        session_helper = connection_manager.get_session_helper(self.engine_id, readonly=self.use_read_replica)
         with session_helper.session_context() as session:
             return qc.get_query_strings(session.connection())
 
@@ -4,6 +4,8 @@ from memoized import memoized
 
 from dimagi.utils.logging import notify_exception
 
+from corehq.toggles import UCR_BULK_EVALUATION
+from corehq.util.metrics import metrics_counter
 from corehq.util.soft_assert import soft_assert
 from corehq.util.test_utils import unit_testing_only
 from corehq.util.view_utils import absolute_reverse
@@ -52,6 +54,62 @@ class IndicatorAdapter(object):
         """
         raise NotImplementedError
 
+    def best_effort_bulk_save(self, docs):
+        """
+        Like best_effort_save, but saves the rows of all documents together.
+
+        If saving them together fails the documents are saved one by one,
+        so that errors are handled for the documents that caused them.
+        """
+        from corehq.apps.userreports.related_docs import get_evaluation_contexts
+        docs = list(docs)
+        eval_contexts = get_evaluation_contexts(self.config.domain, [self.config], docs)
+        if self.config.compiled is not None and UCR_BULK_EVALUATION.enabled(self.config.domain):
+            if self._bulk_save_columns(docs, eval_contexts):
+                return
+            for eval_context in eval_contexts.values():
+                eval_context.reset_iteration()
+
+        rows_by_doc = []
+        for doc in docs:
+            try:
+                rows_by_doc.append((doc, self.get_all_values(doc, eval_contexts[doc['_id']])))
+            except Exception as e:
+                self.handle_exception(doc, e)
+
+        try:
+            self.save_rows([row for doc, rows in rows_by_doc for row in rows])
+        except Exception:
+            for doc, rows in rows_by_doc:
+                self._best_effort_save_rows(rows, doc)
+
+    def _bulk_save_columns(self, docs, eval_contexts):
+        """
+        Evaluate and save the rows of all documents column by column
+
+        :returns: False if that failed and the documents should be saved row by row
+        """
+        try:
+            columns, errors = self.config.get_bulk_values(docs, eval_contexts)
+            self.save_columns(columns)
+        except Exception:
+            from corehq.util.cache_utils import is_rate_limited
+            metrics_counter('commcare.ucr.bulk_save_columns.fallback', tags={'domain': self.config.domain})
+            if not is_rate_limited('{}.{}.bulk_save_columns'.format(self.config.domain, self.config.table_id)):
+                notify_exception(
+                    None,
+                    'error saving UCR documents column by column',
+                    details={
+                        'domain': self.config.domain,
+                        'table': '{} ({})'.format(self.config.display_name, self.config._id),
+                        'doc_count': len(docs),
+                    }
+                )
+            return False
+        for doc, exception in errors:
+            self.handle_exception(doc, exception)
+        return True
+
     def handle_exception(self, doc, exception):
         from corehq.util.cache_utils import is_rate_limited
         ex_clss = exception.__class__
@@ -92,6 +150,18 @@ class IndicatorAdapter(object):
         "Gets all the values from a document to save"
         return self.config.get_all_values(doc, eval_context)
 
+    def save_columns(self, columns):
+        """
+        Like save_rows, but takes the values column by column
+
+        :param columns: OrderedDict of ``Column`` -> list of values
+        """
+        from corehq.apps.userreports.indicators import ColumnValue
+        self.save_rows([
+            [ColumnValue(column, value) for column, value in zip(columns, values)]
+            for values in zip(*columns.values())
+        ])
+
     def bulk_delete(self, docs, use_shard_col=True):
         for doc in docs:
             self.delete(doc, use_shard_col)
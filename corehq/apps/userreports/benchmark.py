@@ -0,0 +1,604 @@
+"""
+Benchmark how fast data sources evaluate documents.
+
+Documents are generated from the shape of a data source: the properties its
+filter and indicators read, the values its filter matches and the related
+documents it looks up. Everything runs in memory, related documents are
+looked up from the generated documents, so no database is needed.
+
+See the ``benchmark_data_sources`` management command.
+"""
+import glob
+import json
+import os
+import random
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from dimagi.utils.parsing import json_format_datetime
+
+from corehq.apps.userreports.expressions.compiler import CompiledDataSource
+from corehq.apps.userreports.models import (
+    DataSourceConfiguration,
+    StaticDataSourceConfiguration,
+)
+from corehq.apps.userreports.related_docs import RelatedDocuments
+from corehq.apps.userreports.specs import EvaluationContext
+
+EXAMPLE_DATA_SOURCES = os.path.join(os.path.dirname(__file__), 'examples', '*', '*data-source*.json')
+
+# results are only compared to earlier results with the same values for these
+HISTORY_KEYS = ('data_source', 'compiled', 'docs', 'settings')
+
+FILTER_TYPES = ('and', 'or', 'not', 'boolean_expression', 'property_match', 'named')
+
+# the date the dates of generated documents are counted from
+START_DATE = datetime(2020, 1, 1)
+
+
+class InMemoryRelatedDocuments(RelatedDocuments):
+    """
+    Related documents and subcases looked up from a fixed set of documents
+    instead of the database. Documents that are not in the set don't exist.
+    """
+
+    def __init__(self, domain, docs):
+        super(InMemoryRelatedDocuments, self).__init__(domain)
+        for doc in docs:
+            if doc.get('domain') != domain:
+                continue
+            self._docs[(doc['doc_type'], doc['_id'])] = doc
+            for index in doc.get('indices') or []:
+                self._subcases.setdefault(index['referenced_id'], []).append(doc)
+
+    def get_document(self, doc_type, doc_id):
+        return True, self._docs.get((doc_type, doc_id))
+
+    def get_subcases(self, case_id):
+        return True, self._subcases.get(case_id, [])
+
+    def fetch(self):
+        return False
+
+
+class DocumentShape(object):
+    """
+    What a data source reads from one kind of document.
+
+    ``properties`` maps property paths to the datatype (or list of choices)
+    of their values, ``values`` maps paths to the values the data source
+    filter matches and ``related`` maps paths to the doc type of the related
+    document whose ID they hold. ``items`` is ``(path, DocumentShape)`` for
+    data sources with a base item expression.
+    """
+
+    def __init__(self):
+        self.properties = {}
+        self.values = {}
+        self.related = {}
+        self.items = None
+
+    def add_property(self, path, datatype=None):
+        if self.properties.get(path) is None:
+            self.properties[path] = datatype
+
+    def merge(self, other, prefix):
+        for path, datatype in other.properties.items():
+            self.add_property(prefix + path, datatype)
+        self.values.update((prefix + path, value) for path, value in other.values.items())
+        self.related.update((prefix + path, doc_type) for path, doc_type in other.related.items())
+
+
+class DataSourceShape(object):
+    """
+    The shape of the documents of a data source and of the related
+    documents it looks up, by doc type
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.doc = DocumentShape()
+        self.related = defaultdict(DocumentShape)
+        self._named = set()
+
+        self._add_filter(self.doc, config.configured_filter, match=True)
+        item_shape = self.doc
+        if config.base_item_expression:
+            path = self._get_path(config.base_item_expression)
+            if path:
+                item_shape = DocumentShape()
+                self.doc.items = (path, item_shape)
+            else:
+                self._add_expression(self.doc, config.base_item_expression)
+        for indicator in config.configured_indicators:
+            self._add_indicator(item_shape, indicator)
+
+    def _add_indicator(self, shape, spec):
+        indicator_type = spec.get('type')
+        if indicator_type in ('raw', 'choice_list'):
+            path = self._get_property_path(spec)
+            if path:
+                shape.add_property(path, spec.get('choices') or spec.get('datatype'))
+        elif indicator_type == 'expression':
+            self._add_expression(shape, spec.get('expression'), spec.get('datatype'))
+        elif indicator_type == 'boolean':
+            self._add_filter(shape, spec.get('filter'), match=False)
+        else:
+            self._add_expression(shape, {key: value for key, value in spec.items() if key != 'type'})
+
+    def _add_filter(self, shape, spec, match):
+        """
+        :param match: whether generated documents should match the filter
+        """
+        if not isinstance(spec, dict):
+            return
+        filter_type = spec.get('type')
+        if filter_type == 'and':
+            for filter_spec in spec.get('filters', []):
+                self._add_filter(shape, filter_spec, match)
+        elif filter_type == 'or':
+            for i, filter_spec in enumerate(spec.get('filters', [])):
+                self._add_filter(shape, filter_spec, match and i == 0)
+        elif filter_type == 'not':
+            self._add_filter(shape, spec.get('filter'), match=False)
+        elif filter_type == 'named':
+            with self._resolving(spec) as named_spec:
+                self._add_filter(shape, named_spec, match)
+        elif filter_type in ('boolean_expression', 'property_match'):
+            if filter_type == 'property_match':
+                path = self._get_property_path(spec)
+            else:
+                path = self._get_path(spec.get('expression'))
+                self._add_expression(shape, spec.get('expression'))
+            value = spec.get('property_value')
+            if isinstance(value, list) and spec.get('operator') == 'in':
+                value = value[0] if value else None
+            if path and match and spec.get('operator', 'eq') in ('eq', 'in') and not isinstance(value, dict):
+                shape.values[path] = value
+            elif path:
+                shape.add_property(path)
+            self._add_expression(shape, value)
+        else:
+            self._add_expression(shape, spec)
+
+    def _add_expression(self, shape, spec, datatype=None):
+        if isinstance(spec, list):
+            for value in spec:
+                self._add_expression(shape, value)
+            return
+        if not isinstance(spec, dict):
+            return
+
+        expression_type = spec.get('type')
+        if expression_type in ('property_name', 'property_path'):
+            path = self._get_path(spec)
+            if path:
+                shape.add_property(path, spec.get('datatype') or datatype)
+        elif expression_type == 'named':
+            with self._resolving(spec) as named_spec:
+                self._add_expression(shape, named_spec, datatype)
+        elif expression_type == 'root_doc':
+            self._add_expression(self.doc, spec.get('expression'), datatype)
+        elif expression_type == 'related_doc':
+            doc_type = spec.get('related_doc_type')
+            path = self._get_path(spec.get('doc_id_expression'))
+            if path:
+                shape.related[path] = doc_type
+            else:
+                self._add_expression(shape, spec.get('doc_id_expression'))
+            self._add_expression(self.related[doc_type], spec.get('value_expression'), datatype)
+        elif expression_type == 'nested' and self._get_path(spec.get('argument_expression')):
+            nested_shape = DocumentShape()
+            self._add_expression(nested_shape, spec.get('value_expression'), datatype)
+            shape.merge(nested_shape, prefix=self._get_path(spec.get('argument_expression')))
+        elif expression_type in FILTER_TYPES:
+            self._add_filter(shape, spec, match=False)
+        else:
+            for value in spec.values():
+                self._add_expression(shape, value)
+
+    def _get_path(self, spec):
+        """The property path an expression reads, if it only reads a property"""
+        if not isinstance(spec, dict):
+            return None
+        expression_type = spec.get('type')
+        if expression_type in ('property_name', 'property_path'):
+            return self._get_property_path(spec)
+        if expression_type == 'named':
+            with self._resolving(spec) as named_spec:
+                return self._get_path(named_spec)
+        if expression_type == 'nested':
+            argument_path = self._get_path(spec.get('argument_expression'))
+            value_path = self._get_path(spec.get('value_expression'))
+            if argument_path and value_path:
+                return argument_path + value_path
+        if expression_type == 'array_index':
+            array_path = self._get_path(spec.get('array_expression'))
+            index = spec.get('index_expression')
+            if isinstance(index, dict) and index.get('type') == 'constant':
+                index = index.get('constant')
+            if array_path and isinstance(index, int):
+                return array_path + (index,)
+        return None
+
+    @staticmethod
+    def _get_property_path(spec):
+        # the property name can also be an expression
+        if isinstance(spec.get('property_name'), str) and spec['property_name']:
+            return (spec['property_name'],)
+        if spec.get('property_path') and all(isinstance(key, str) for key in spec['property_path']):
+            return tuple(spec['property_path'])
+        return None
+
+    @contextmanager
+    def _resolving(self, spec):
+        # the named expression or filter, or None if it is (recursively) being resolved already
+        name = spec.get('name')
+        if name in self._named:
+            yield None
+            return
+        self._named.add(name)
+        try:
+            yield self.config.named_expressions.get(name) or self.config.named_filters.get(name)
+        finally:
+            self._named.discard(name)
+
+
+class DocumentGenerator(object):
+    """
+    Generates documents with the shape of a data source.
+
+    :param repeat_size: the number of items of the base item expression
+    :param related_count: the number of documents of each related doc type
+    :param extra_properties: the number of properties that aren't read by
+        the data source added to each document
+    :param cardinality: the number of distinct values of string properties
+    """
+
+    def __init__(self, config, seed=0, repeat_size=3, related_count=10, extra_properties=10, cardinality=20):
+        self.config = config
+        self.shape = DataSourceShape(config)
+        self.random = random.Random(seed)
+        self.repeat_size = repeat_size
+        self.related_count = related_count
+        self.extra_properties = extra_properties
+        self.cardinality = cardinality
+        self._related_ids = {
+            doc_type: [uuid.UUID(int=self.random.getrandbits(128)).hex for i in range(related_count)]
+            for doc_type in self.shape.related
+        }
+
+    @property
+    def settings(self):
+        return {
+            'repeat_size': self.repeat_size,
+            'related_count': self.related_count,
+            'extra_properties': self.extra_properties,
+            'cardinality': self.cardinality,
+        }
+
+    def get_related_docs(self):
+        return [
+            self._make_doc(doc_type, self.shape.related[doc_type], doc_id)
+            for doc_type, doc_ids in self._related_ids.items()
+            for doc_id in doc_ids
+        ]
+
+    def get_docs(self, count):
+        return [
+            self._make_doc(self.config.referenced_doc_type, self.shape.doc, self._new_id())
+            for i in range(count)
+        ]
+
+    def _new_id(self):
+        return uuid.UUID(int=self.random.getrandbits(128)).hex
+
+    def _make_doc(self, doc_type, shape, doc_id):
+        doc = {
+            '_id': doc_id,
+            'domain': self.config.domain,
+            'doc_type': doc_type,
+        }
+        if doc_type == 'CommCareCase':
+            properties = doc
+            doc.update({
+                'type': self._string(),
+                'name': self._string(),
+                'owner_id': self._string(),
+                'user_id': self._string(),
+                'opened_on': self._datetime(),
+                'modified_on': self._datetime(),
+                'server_modified_on': self._datetime(),
+                'closed': False,
+                'indices': [],
+            })
+        elif doc_type == 'XFormInstance':
+            properties = {
+                '@xmlns': 'http://openrosa.org/formdesigner/{}'.format(self._string()),
+                'meta': {
+                    'instanceID': doc_id,
+                    'userID': self._string(),
+                    'username': self._string(),
+                    'deviceID': self._string(),
+                    'timeStart': self._datetime(),
+                    'timeEnd': self._datetime(),
+                },
+            }
+            doc.update({
+                'xmlns': properties['@xmlns'],
+                'received_on': self._datetime(),
+                'form': properties,
+            })
+        else:
+            properties = doc
+        for i in range(self.extra_properties):
+            properties['property_{}'.format(i)] = self._string()
+        self._fill(doc, shape)
+        if shape.items:
+            path, item_shape = shape.items
+            items = []
+            for i in range(self.repeat_size):
+                item = {}
+                self._fill(item, item_shape)
+                items.append(item)
+            _set_path(doc, path, items)
+        return doc
+
+    def _fill(self, doc, shape):
+        # set deeper paths first so a property holding a value doesn't hide its sub-properties
+        for path, datatype in sorted(shape.properties.items(), key=lambda item: -len(item[0])):
+            _set_path(doc, path, self._value(datatype), overwrite=False)
+        for path, doc_type in shape.related.items():
+            _set_path(doc, path, self.random.choice(self._related_ids[doc_type]))
+        for path, value in shape.values.items():
+            _set_path(doc, path, value)
+
+    def _value(self, datatype):
+        if isinstance(datatype, list):
+            return ' '.join(self.random.sample(datatype, self.random.randint(1, len(datatype))))
+        if datatype == 'date':
+            return (START_DATE + timedelta(days=self.random.randrange(365))).date().isoformat()
+        if datatype == 'datetime':
+            return self._datetime()
+        if datatype in ('integer', 'small_integer'):
+            return str(self.random.randrange(100))
+        if datatype == 'decimal':
+            return '{:.2f}'.format(self.random.uniform(0, 100))
+        if datatype == 'array':
+            return [self._string() for i in range(self.random.randint(1, 3))]
+        return self._string()
+
+    def _string(self):
+        return 'value-{}'.format(self.random.randrange(self.cardinality))
+
+    def _datetime(self):
+        return json_format_datetime(START_DATE + timedelta(seconds=self.random.randrange(365 * 24 * 60 * 60)))
+
+
+def _set_path(doc, path, value, overwrite=True):
+    container = doc
+    for key, next_key in zip(path, path[1:]):
+        child = _get_child(container, key)
+        if child is None:
+            child = [] if isinstance(next_key, int) else {}
+            if not _put_child(container, key, child):
+                return
+        elif not isinstance(child, (dict, list)):
+            return
+        container = child
+    if overwrite or _get_child(container, path[-1]) is None:
+        _put_child(container, path[-1], value)
+
+
+def _get_child(container, key):
+    if isinstance(container, dict):
+        return container.get(key)
+    if isinstance(key, int) and key < len(container):
+        return container[key]
+    return None
+
+
+def _put_child(container, key, value):
+    if isinstance(container, dict):
+        container[key] = value
+        return True
+    if not isinstance(key, int):
+        return False
+    container.extend({} for i in range(key + 1 - len(container)))
+    container[key] = value
+    return True
+
+
+class BenchmarkResult(object):
+
+    def __init__(self, config, compiled, docs, rows, errors, seconds, peak_memory, indicator_costs, settings):
+        self.data_source = '{}:{}'.format(config.domain, config.table_id)
+        self.compiled = compiled
+        self.docs = docs
+        self.rows = rows
+        self.errors = errors
+        self.seconds = seconds
+        self.peak_memory = peak_memory
+        self.indicator_costs = indicator_costs
+        self.settings = settings
+        self.timestamp = datetime.utcnow()
+
+    @property
+    def docs_per_second(self):
+        return self.docs / self.seconds if self.seconds else 0
+
+    def to_json(self):
+        return {
+            'data_source': self.data_source,
+            'compiled': self.compiled,
+            'timestamp': json_format_datetime(self.timestamp),
+            'docs': self.docs,
+            'rows': self.rows,
+            'errors': len(self.errors),
+            'docs_per_second': self.docs_per_second,
+            'peak_memory': self.peak_memory,
+            'indicator_costs': self.indicator_costs,
+            'settings': self.settings,
+        }
+
+
+class _Evaluator(object):
+    # evaluates documents like DataSourceConfiguration.get_all_values but
+    # without toggle lookups or saving validation errors
+
+    def __init__(self, config, compiled):
+        self.config = config
+        indicators = config.indicators.indicators
+        if compiled:
+            compiled_data_source = CompiledDataSource(config)
+            self.filter = compiled_data_source.filter
+            self.indicators = compiled_data_source
+            getters = [getter for column, getter in compiled_data_source.indicator_getters]
+        else:
+            self.filter = config._get_main_filter()
+            self.indicators = config.indicators
+            getters = [indicator.get_values for indicator in indicators]
+        self.indicator_getters = [
+            (', '.join(column.id for column in indicator.get_columns()), getter)
+            for indicator, getter in zip(indicators, getters)
+        ]
+
+    def get_items(self, doc, context):
+        if not self.filter(doc, context):
+            return []
+        if not self.config.base_item_expression:
+            return [doc]
+        result = self.config.parsed_expression(doc, context)
+        if result is None:
+            return []
+        return result if isinstance(result, list) else [result]
+
+    def evaluate(self, docs, related_docs):
+        rows = 0
+        errors = []
+        for doc in docs:
+            context = EvaluationContext(doc, related_docs=related_docs)
+            try:
+                for item in self.get_items(doc, context):
+                    self.indicators.get_values(item, context)
+                    context.increment_iteration()
+                    rows += 1
+            except Exception as e:
+                errors.append((doc['_id'], e))
+        return rows, errors
+
+    def get_indicator_costs(self, docs, related_docs):
+        """
+        :returns: OrderedDict of indicator columns -> microseconds per row.
+        Named expressions shared by indicators count towards the first one.
+        """
+        seconds = OrderedDict((name, 0) for name, getter in self.indicator_getters)
+        rows = 0
+        for doc in docs:
+            context = EvaluationContext(doc, related_docs=related_docs)
+            try:
+                items = self.get_items(doc, context)
+            except Exception:
+                continue
+            for item in items:
+                for name, getter in self.indicator_getters:
+                    start = time.perf_counter()
+                    try:
+                        getter(item, context)
+                    except Exception:
+                        pass
+                    seconds[name] += time.perf_counter() - start
+                context.increment_iteration()
+                rows += 1
+        return OrderedDict(
+            (name, round(total * 10 ** 6 / rows, 2) if rows else None)
+            for name, total in seconds.items()
+        )
+
+
+def benchmark_data_source(config, docs, related_docs=(), compiled=False, repeat=3, measure_memory=True,
+                          settings=None):
+    """
+    Evaluate ``docs`` with a data source and measure how long that takes.
+
+    :param related_docs: the documents related documents are looked up from
+    :param repeat: the number of times the documents are evaluated, the
+        fastest run counts
+    :param measure_memory: also evaluate the documents while tracing memory
+        allocations (which is slow) to get the peak memory used
+    :param settings: how the documents were generated, for the record
+    :returns: BenchmarkResult
+    """
+    related_docs = InMemoryRelatedDocuments(config.domain, related_docs)
+    evaluator = _Evaluator(config, compiled)
+    # the first run also builds memoized specs and caches, which isn't timed
+    rows, errors = evaluator.evaluate(docs, related_docs)
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        evaluator.evaluate(docs, related_docs)
+        timings.append(time.perf_counter() - start)
+
+    peak_memory = None
+    if measure_memory:
+        tracemalloc.start()
+        try:
+            evaluator.evaluate(docs, related_docs)
+            current, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return BenchmarkResult(
+        config, compiled, len(docs), rows, errors, min(timings), peak_memory,
+        evaluator.get_indicator_costs(docs, related_docs), settings,
+    )
+
+
+def get_data_sources(paths=(), include_static=False):
+    """
+    Load data sources from JSON files (or globs) of data sources or static
+    data sources. Defaults to the example data sources.
+    """
+    if not paths and not include_static:
+        paths = [EXAMPLE_DATA_SOURCES]
+    data_sources = []
+    for path_or_glob in paths:
+        for path in sorted(glob.glob(path_or_glob)):
+            with open(path, encoding='utf-8') as f:
+                doc = json.load(f)
+            if 'config' in doc and 'domains' in doc:
+                static_config = StaticDataSourceConfiguration.wrap(doc)
+                data_sources.append(
+                    StaticDataSourceConfiguration._get_datasource_config(static_config, static_config.domains[0])
+                )
+            else:
+                data_sources.append(DataSourceConfiguration.wrap(doc))
+    if include_static:
+        table_ids = set()
+        for config in StaticDataSourceConfiguration.all():
+            if config.table_id not in table_ids:
+                table_ids.add(config.table_id)
+                data_sources.append(config)
+    return data_sources
+
+
+def record_result(history_path, result):
+    """
+    Append a result to a history file and return the last result recorded
+    for the same data source with the same settings, if any
+    """
+    previous = None
+    result_json = result.to_json()
+    if os.path.exists(history_path):
+        with open(history_path, encoding='utf-8') as f:
+            for line in f:
+                recorded = json.loads(line)
+                if all(recorded.get(key) == result_json[key] for key in HISTORY_KEYS):
+                    previous = recorded
+    with open(history_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(result_json) + '\n')
+    return previous
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import uuid
+
+from django.core.cache import cache
+
+from dimagi.utils.couch import get_redis_lock, release_lock
+
+from corehq.apps.userreports.const import (
+    UCR_REPORT_CACHE_MAX_ROWS,
+    UCR_REPORT_CACHE_TIMEOUT,
+)
+
+DATA_SOURCE_VERSION_KEY = 'ucr-data-source-version:{}'
+REPORT_RESULT_KEY = 'ucr-report-result:{}:{}:{}'
+
+# data source versions outlive any cached results that depend on them
+DATA_SOURCE_VERSION_TIMEOUT = 7 * 24 * 60 * 60
+
+# how long a query for a shared result can hold up other requests for it
+REPORT_QUERY_LOCK_TIMEOUT = 2 * 60
+
+
+def get_data_source_version(config_id):
+    """
+    Get a token that changes whenever the data in the data source table changes.
+    """
+    key = DATA_SOURCE_VERSION_KEY.format(config_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, DATA_SOURCE_VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def bump_data_source_version(config_id):
+    """
+    Invalidate all cached report results for a data source.
+
+    Called after rows are saved or deleted and when the table is (re)built or dropped.
+    """
+    cache.set(DATA_SOURCE_VERSION_KEY.format(config_id), uuid.uuid4().hex, DATA_SOURCE_VERSION_TIMEOUT)
+
+
+def get_cached_report_result(config_id, query_key, get_result, timeout=None, wait_for_result=False):
+    """
+    Get a report query result from the cache or compute and cache it.
+
+    :param query_key: JSON-able description of everything the result depends on
+        other than the data in the table (columns, filters, filter values, etc.)
+    :param get_result: function that runs the query
+    :param timeout: how long to cache the result for, defaults to ``UCR_REPORT_CACHE_TIMEOUT``
+    :param wait_for_result: if the result is being computed by another request,
+        wait for it instead of running the same query concurrently
+    :returns: tuple of (result, cached)
+    """
+    version = get_data_source_version(config_id)
+    if version is None:
+        # no cache available
+        return get_result(), False
+
+    query_hash = hashlib.md5(
+        json.dumps(query_key, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+    key = REPORT_RESULT_KEY.format(config_id, version, query_hash)
+    result = cache.get(key)
+    if result is not None:
+        return result, True
+
+    if not wait_for_result:
+        return _cache_result(key, get_result(), timeout), False
+
+    lock = get_redis_lock(key + ':lock', timeout=REPORT_QUERY_LOCK_TIMEOUT, name='ucr_report_result')
+    if lock.acquire(blocking=False):
+        try:
+            # another request may have cached it since it was checked
+            result = cache.get(key)
+            if result is not None:
+                return result, True
+            return _cache_result(key, get_result(), timeout), False
+        finally:
+            release_lock(lock, True)
+
+    # wait for the request that is running the query to finish
+    if lock.acquire(blocking_timeout=REPORT_QUERY_LOCK_TIMEOUT):
+        release_lock(lock, True)
+    result = cache.get(key)
+    if result is not None:
+        return result, True
+    # the result was too big to cache or the query failed
+    return _cache_result(key, get_result(), timeout), False
+
+
+def _cache_result(key, result, timeout):
+    if not isinstance(result, list) or len(result) <= UCR_REPORT_CACHE_MAX_ROWS:
+        cache.set(key, result, timeout or UCR_REPORT_CACHE_TIMEOUT)
+    return result
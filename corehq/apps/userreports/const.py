@@ -51,6 +51,17 @@ ASYNC_INDICATOR_QUEUE_TIME = timedelta(minutes=5)
 ASYNC_INDICATOR_CHUNK_SIZE = getattr(settings, 'ASYNC_INDICATOR_CHUNK_SIZE', 100)
 ASYNC_INDICATOR_MAX_RETRIES = 20
 
+# save rows with COPY when there are at least this many
+UCR_COPY_MIN_ROWS = getattr(settings, 'UCR_COPY_MIN_ROWS', 100)
+
+# split each shard into this many primary key ranges for partitioned rebuilds
+UCR_REBUILD_PARTITIONS_PER_SHARD = getattr(settings, 'UCR_REBUILD_PARTITIONS_PER_SHARD', 4)
+
+# report query results are cached for this long (in seconds) unless the data source changes
+UCR_REPORT_CACHE_TIMEOUT = getattr(settings, 'UCR_REPORT_CACHE_TIMEOUT', 60 * 60)
+# results with more rows than this are not cached
+UCR_REPORT_CACHE_MAX_ROWS = getattr(settings, 'UCR_REPORT_CACHE_MAX_ROWS', 5000)
+
 XFORM_CACHE_KEY_PREFIX = 'xform_to_json_cache'
 
 NAMED_EXPRESSION_PREFIX = 'NamedExpression'
@@ -72,3 +83,11 @@ AGGGREGATION_TYPE_SIMPLE = 'simple'
 AGGGREGATION_TYPE_YEAR = 'year'
 AGGGREGATION_TYPE_NONZERO_SUM = 'nonzero_sum'
 AGGGREGATION_TYPE_ARRAY_AGG_LAST_VALUE = 'array_agg_last_value'
+
+# aggregations that can be stored in rollup tables
+ROLLUP_AGGREGATION_TYPES = [
+    AGGGREGATION_TYPE_COUNT,
+    AGGGREGATION_TYPE_SUM,
+    AGGGREGATION_TYPE_MIN,
+    AGGGREGATION_TYPE_MAX,
+]
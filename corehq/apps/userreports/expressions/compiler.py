@@ -0,0 +1,435 @@
+"""
+Compiles the filter and indicators of a data source into plain Python
+closures.
+
+Evaluating the expression specs built by ``ExpressionFactory`` walks a tree
+of JsonObject instances for every indicator of every document. The compiled
+version of a data source:
+
+- calls closures instead of spec instances, with property lookups and
+  datatype transforms resolved once at compile time
+- folds constant sub-expressions and filters
+- evaluates sub-expressions that appear more than once in the data source
+  (named expressions included) once per item
+- can return the values of many items column by column, with the datatype
+  transforms applied to whole columns
+
+Expression and filter types that the compiler does not know about are built
+by the regular factories and called as they are, so compiled data sources
+return the same rows as interpreted ones.
+"""
+import json
+from collections import Counter, OrderedDict
+from itertools import count
+
+from dimagi.utils.web import json_handler
+
+from corehq.apps.userreports.expressions.factory import (
+    ExpressionFactory,
+    _convert_constant_to_expression_spec,
+    _is_literal,
+)
+from corehq.apps.userreports.expressions.getters import (
+    TransformedGetter,
+    safe_recursive_lookup,
+    transform_from_datatype,
+    transform_values_from_datatype,
+)
+from corehq.apps.userreports.expressions.specs import (
+    ArrayIndexExpressionSpec,
+    CoalesceExpressionSpec,
+    ConditionalExpressionSpec,
+    ConstantGetterSpec,
+    NestedExpressionSpec,
+    PropertyNameGetterSpec,
+    PropertyPathGetterSpec,
+    RootDocExpressionSpec,
+    SwitchExpressionSpec,
+)
+from corehq.apps.userreports.filters.factory import FilterFactory
+from corehq.apps.userreports.filters.specs import (
+    BooleanExpressionFilterSpec,
+    NamedFilterSpec,
+    NotFilterSpec,
+)
+from corehq.apps.userreports.indicators import (
+    BooleanIndicator,
+    ColumnValue,
+    RawIndicator,
+)
+from corehq.apps.userreports.indicators.specs import (
+    BooleanIndicatorSpec,
+    ExpressionIndicatorSpec,
+)
+from corehq.apps.userreports.operators import get_operator
+from corehq.apps.userreports.transforms.factory import TransformFactory
+
+# expressions that are cheaper to evaluate again than to look up in a cache
+_CHEAP_EXPRESSION_TYPES = {'constant', 'identity', 'property_name', 'property_path', 'base_iteration_number'}
+
+_compiler_ids = count()
+
+
+class Constant(object):
+
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self, item, context=None):
+        return self.value
+
+
+class SharedExpression(object):
+    """An expression that is evaluated once per item
+
+    Values are cached by the id of the item. The item is kept in the cache
+    with its value, so that the id of a temporary item (e.g. the result of
+    a nested expression) can't be reused for another item while its value
+    is cached, and is checked to be the same item before the value is used.
+    """
+
+    def __init__(self, key, expression):
+        self.key = key
+        self.expression = expression
+
+    def __call__(self, item, context=None):
+        if context is None:
+            return self.expression(item, context)
+        key = (self.key, id(item))
+        if context.exists_in_cache(key):
+            cached_item, value = context.get_cache_value(key)
+            if cached_item is item:
+                return value
+        value = self.expression(item, context)
+        context.set_iteration_cache_value(key, (item, value))
+        return value
+
+
+class CompiledDataSource(object):
+    """
+    The main filter and the indicators of a data source, compiled.
+
+    ``filter`` and ``get_values`` are drop-in replacements for
+    ``DataSourceConfiguration.filter`` and ``indicators.get_values``.
+    """
+
+    def __init__(self, config):
+        # build the interpreted versions first so that invalid specs raise the usual errors
+        config._get_main_filter()
+        indicators = config.indicators.indicators
+
+        compiler = DataSourceCompiler(config)
+        self.filter = compiler.compile_filter(config.get_main_filter_spec())
+        self._indicators = [_compile_indicator(compiler, indicator) for indicator in indicators]
+        self._getters = [
+            (column, getter if datatype is None else TransformedGetter(getter, transform_from_datatype(datatype)))
+            for column, getter, datatype, indicator in self._indicators
+        ]
+        self.columns = [column for indicator in indicators for column in indicator.get_columns()]
+        self._column_transforms = [
+            transform_values_from_datatype(datatype)
+            for column, getter, datatype, indicator in self._indicators
+            for _ in ([column] if column is not None else indicator.get_columns())
+        ]
+
+    def get_values(self, item, context=None):
+        values = []
+        for column, getter in self._getters:
+            if column is None:
+                values.extend(getter(item, context))
+            else:
+                values.append(ColumnValue(column, getter(item, context)))
+        return values
+
+    @property
+    def indicator_getters(self):
+        """``(column, getter)`` for each indicator, ``column`` is None for
+        indicators whose getter returns a list of ``ColumnValue``"""
+        return self._getters
+
+    def get_raw_values(self, item, context=None):
+        """
+        The values of all ``columns`` for an item, before the datatype
+        transforms. Use ``transform_columns`` to get the final values.
+        """
+        values = []
+        for column, getter, datatype, indicator in self._indicators:
+            if column is None:
+                values_by_id = {value.column.id: value.value for value in getter(item, context)}
+                values.extend(values_by_id.get(column_.id) for column_ in indicator.get_columns())
+            else:
+                values.append(getter(item, context))
+        return values
+
+    def transform_columns(self, raw_rows):
+        """
+        Transform rows from ``get_raw_values`` into columns of final values.
+
+        :returns: OrderedDict of ``Column`` -> list of values
+        """
+        raw_columns = list(zip(*raw_rows)) or [()] * len(self.columns)
+        return OrderedDict(
+            (column, transform(list(values)))
+            for column, transform, values in zip(self.columns, self._column_transforms, raw_columns)
+        )
+
+
+def _compile_indicator(compiler, indicator):
+    """
+    :returns: ``(column, getter, datatype, indicator)`` where ``getter`` returns
+    the value before the transform for ``datatype``. ``column`` and ``datatype``
+    are None for indicators that are not compiled, their ``getter`` is
+    ``get_values``.
+    """
+    spec = indicator.wrapped_spec
+    if isinstance(indicator, RawIndicator) and isinstance(spec, ExpressionIndicatorSpec):
+        getter = compiler.compile_expression(spec.expression)
+        if spec.transform:
+            getter = TransformedGetter(
+                getter, TransformFactory.get_transform(spec.transform).get_transform_function())
+        return indicator.column, getter, spec.datatype, indicator
+    if isinstance(indicator, BooleanIndicator) and isinstance(spec, BooleanIndicatorSpec):
+        filter_fn = compiler.compile_filter(spec.filter)
+        if isinstance(filter_fn, Constant):
+            return indicator.column, Constant(1 if filter_fn.value else 0), None, indicator
+        return indicator.column, lambda item, context=None: 1 if filter_fn(item, context) else 0, None, indicator
+    return None, indicator.get_values, None, indicator
+
+
+class DataSourceCompiler(object):
+
+    def __init__(self, config):
+        self.config = config
+        self.factory_context = config.get_factory_context()
+        self._id = next(_compiler_ids)
+        self._expressions = {}
+        self._filters = {}
+        self._use_counts = Counter()
+        specs = [config.get_main_filter_spec()] + list(config.configured_indicators)
+        specs.extend(config.named_expressions.values())
+        specs.extend(config.named_filters.values())
+        for spec in specs:
+            self._count_uses(spec)
+
+    def _count_uses(self, spec):
+        if isinstance(spec, dict):
+            if 'type' in spec:
+                self._use_counts[_spec_key(spec)] += 1
+            for value in spec.values():
+                self._count_uses(value)
+        elif isinstance(spec, list):
+            for value in spec:
+                self._count_uses(value)
+
+    def compile_expression(self, spec):
+        if _is_literal(spec):
+            spec = _convert_constant_to_expression_spec(spec)
+        key = _spec_key(spec)
+        if key not in self._expressions:
+            expression = self._compile_expression(spec)
+            if (self._use_counts[key] > 1
+                    and spec.get('type') not in _CHEAP_EXPRESSION_TYPES
+                    and not isinstance(expression, Constant)):
+                expression = SharedExpression((self._id, key), expression)
+            self._expressions[key] = expression
+        return self._expressions[key]
+
+    def compile_filter(self, spec):
+        key = _spec_key(spec)
+        if key not in self._filters:
+            self._filters[key] = self._compile_filter(spec)
+        return self._filters[key]
+
+    def _compile_expression(self, spec):
+        compile_fn = getattr(self, '_compile_{}_expression'.format(spec.get('type')), None)
+        if compile_fn is None:
+            return ExpressionFactory.from_spec(spec, self.factory_context)
+        return compile_fn(spec)
+
+    def _compile_filter(self, spec):
+        compile_fn = getattr(self, '_compile_{}_filter'.format(spec.get('type')), None)
+        if compile_fn is None:
+            return FilterFactory.from_spec(spec, self.factory_context)
+        return compile_fn(spec)
+
+    def _compile_constant_expression(self, spec):
+        return Constant(ConstantGetterSpec.wrap(spec).constant)
+
+    def _compile_identity_expression(self, spec):
+        return lambda item, context=None: item
+
+    def _compile_property_name_expression(self, spec):
+        wrapped = PropertyNameGetterSpec.wrap(spec)
+        name = self.compile_expression(wrapped.property_name)
+        transform = transform_from_datatype(wrapped.datatype) if wrapped.datatype else None
+        if isinstance(name, Constant):
+            property_name = name.value
+
+            def get_property(item, context=None):
+                return item.get(property_name) if isinstance(item, dict) else None
+        else:
+            def get_property(item, context=None):
+                return item.get(name(item, context)) if isinstance(item, dict) else None
+        return TransformedGetter(get_property, transform) if transform else get_property
+
+    def _compile_property_path_expression(self, spec):
+        wrapped = PropertyPathGetterSpec.wrap(spec)
+        property_path = list(wrapped.property_path)
+        transform = transform_from_datatype(wrapped.datatype) if wrapped.datatype else None
+
+        def get_path(item, context=None):
+            return safe_recursive_lookup(item, property_path)
+        return TransformedGetter(get_path, transform) if transform else get_path
+
+    def _compile_named_expression(self, spec):
+        name = spec.get('name')
+        if name not in self.config.named_expressions:
+            return ExpressionFactory.from_spec(spec, self.factory_context)
+        # like NamedExpressionSpec, named expressions are always evaluated once per item
+        return SharedExpression(
+            (self._id, 'named', name),
+            self.compile_expression(self.config.named_expressions[name]),
+        )
+
+    def _compile_root_doc_expression(self, spec):
+        wrapped = RootDocExpressionSpec.wrap(spec)
+        expression = self.compile_expression(wrapped.expression)
+
+        def root_doc(item, context=None):
+            if context is None:
+                return None
+            return expression(context.root_doc, context)
+        return root_doc
+
+    def _compile_conditional_expression(self, spec):
+        wrapped = ConditionalExpressionSpec.wrap(spec)
+        test = self.compile_filter(wrapped.test)
+        if_true = self.compile_expression(wrapped.expression_if_true)
+        if_false = self.compile_expression(wrapped.expression_if_false)
+        if isinstance(test, Constant):
+            return if_true if test.value else if_false
+
+        def conditional(item, context=None):
+            if test(item, context):
+                return if_true(item, context)
+            return if_false(item, context)
+        return conditional
+
+    def _compile_switch_expression(self, spec):
+        wrapped = SwitchExpressionSpec.wrap(spec)
+        switch_on = self.compile_expression(wrapped.switch_on)
+        cases = [(value, self.compile_expression(wrapped.cases[value])) for value in wrapped.cases]
+        default = self.compile_expression(wrapped.default)
+        if isinstance(switch_on, Constant):
+            return _switch_case(switch_on.value, cases, default)
+
+        def switch(item, context=None):
+            return _switch_case(switch_on(item, context), cases, default)(item, context)
+        return switch
+
+    def _compile_nested_expression(self, spec):
+        wrapped = NestedExpressionSpec.wrap(spec)
+        argument = self.compile_expression(wrapped.argument_expression)
+        value = self.compile_expression(wrapped.value_expression)
+
+        def nested(item, context=None):
+            return value(argument(item, context), context)
+        return nested
+
+    def _compile_array_index_expression(self, spec):
+        wrapped = ArrayIndexExpressionSpec.wrap(spec)
+        # reuse the spec's own evaluation with compiled arguments
+        wrapped.configure(
+            self.compile_expression(wrapped.array_expression),
+            self.compile_expression(wrapped.index_expression),
+        )
+        return wrapped
+
+    def _compile_coalesce_expression(self, spec):
+        wrapped = CoalesceExpressionSpec.wrap(spec)
+        expression = self.compile_expression(wrapped.expression)
+        default = self.compile_expression(wrapped.default_expression)
+        if isinstance(expression, Constant):
+            return default if expression.value is None or expression.value == '' else expression
+
+        def coalesce(item, context=None):
+            value = expression(item, context)
+            if value is None or value == '':
+                return default(item, context)
+            return value
+        return coalesce
+
+    def _compile_boolean_expression_filter(self, spec):
+        wrapped = BooleanExpressionFilterSpec.wrap(spec)
+        expression = self.compile_expression(wrapped.expression)
+        operator = get_operator(wrapped.operator)
+        reference = self.compile_expression(wrapped.property_value)
+        if isinstance(expression, Constant) and isinstance(reference, Constant):
+            return Constant(operator(expression.value, reference.value))
+        if isinstance(reference, Constant):
+            reference_value = reference.value
+
+            def boolean_expression(item, context=None):
+                return operator(expression(item, context), reference_value)
+        else:
+            def boolean_expression(item, context=None):
+                return operator(expression(item, context), reference(item, context))
+        return boolean_expression
+
+    def _compile_and_filter(self, spec):
+        filters = self._compile_filter_list(spec)
+        if filters is None:
+            return FilterFactory.from_spec(spec, self.factory_context)
+        if any(isinstance(f, Constant) and not f.value for f in filters):
+            return Constant(False)
+        filters = [f for f in filters if not isinstance(f, Constant)]
+        if not filters:
+            return Constant(True)
+        if len(filters) == 1:
+            only = filters[0]
+            return lambda item, context=None: bool(only(item, context))
+        return lambda item, context=None: all(f(item, context) for f in filters)
+
+    def _compile_or_filter(self, spec):
+        filters = self._compile_filter_list(spec)
+        if filters is None:
+            return FilterFactory.from_spec(spec, self.factory_context)
+        if any(isinstance(f, Constant) and f.value for f in filters):
+            return Constant(True)
+        filters = [f for f in filters if not isinstance(f, Constant)]
+        if not filters:
+            return Constant(False)
+        if len(filters) == 1:
+            only = filters[0]
+            return lambda item, context=None: bool(only(item, context))
+        return lambda item, context=None: any(f(item, context) for f in filters)
+
+    def _compile_filter_list(self, spec):
+        if not isinstance(spec.get('filters'), list) or not spec['filters']:
+            # let the factory raise the appropriate error
+            return None
+        return [self.compile_filter(subspec) for subspec in spec['filters']]
+
+    def _compile_not_filter(self, spec):
+        wrapped = NotFilterSpec.wrap(spec)
+        filter_fn = self.compile_filter(wrapped.filter)
+        if isinstance(filter_fn, Constant):
+            return Constant(not filter_fn.value)
+        return lambda item, context=None: not filter_fn(item, context)
+
+    def _compile_named_filter(self, spec):
+        wrapped = NamedFilterSpec.wrap(spec)
+        if wrapped.name not in self.config.named_filters:
+            return FilterFactory.from_spec(spec, self.factory_context)
+        return self.compile_filter(self.config.named_filters[wrapped.name])
+
+
+def _switch_case(value, cases, default):
+    for case_value, expression in cases:
+        if value == case_value:
+            return expression
+    return default
+
+
+def _spec_key(spec):
+    return json.dumps(spec, sort_keys=True, default=json_handler)
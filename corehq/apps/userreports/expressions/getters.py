@@ -158,23 +158,60 @@ def transform_array(item):
     return [item]
 
 
+DATATYPE_TRANSFORMS = {
+    'date': transform_date,
+    'datetime': transform_datetime,
+    'decimal': transform_decimal,
+    'integer': transform_int,
+    'small_integer': transform_int,
+    'string': transform_unicode,
+    'array': transform_array,
+}
+
+
 def transform_from_datatype(datatype):
     """
     Given a datatype, return a transform for that type.
     """
     identity = lambda x: x
-    transform = {
-        'date': transform_date,
-        'datetime': transform_datetime,
-        'decimal': transform_decimal,
-        'integer': transform_int,
-        'small_integer': transform_int,
-        'string': transform_unicode,
-        'array': transform_array,
-    }.get(datatype) or identity
+    transform = DATATYPE_TRANSFORMS.get(datatype) or identity
     return functools.partial(evaluate_lazy_args, transform)
 
 
+def transform_values_from_datatype(datatype):
+    """
+    Given a datatype, return a transform for a list of values of that type,
+    e.g. all values of a column.
+
+    Each distinct value is only transformed once, which saves most of the
+    work for columns with repeated values like dates.
+    """
+    transform = DATATYPE_TRANSFORMS.get(datatype)
+    if transform is None:
+        return lambda values: [eval_lazy(value) for value in values]
+    if datatype == 'array':
+        # don't share (mutable) lists between rows
+        return lambda values: [transform(eval_lazy(value)) for value in values]
+
+    def transform_values(values):
+        transformed = {}
+        result = []
+        for value in values:
+            value = eval_lazy(value)
+            # 1, 1.0 and True are equal but can transform differently
+            key = (type(value), value)
+            try:
+                result.append(transformed[key])
+            except KeyError:
+                transformed[key] = transform(value)
+                result.append(transformed[key])
+            except TypeError:
+                # unhashable values (e.g. lists)
+                result.append(transform(value))
+        return result
+    return transform_values
+
+
 def getter_from_property_reference(spec):
     if spec.property_name:
         assert not spec.property_path, \
@@ -523,11 +523,19 @@ class RelatedDocExpressionSpec(JsonObject):
             return None
         return doc
 
+    def _get_related_document(self, doc_id, context):
+        related_docs = context.related_docs
+        if related_docs is not None:
+            found, doc = related_docs.get_document(self.related_doc_type, doc_id)
+            if found or related_docs.collecting:
+                return doc
+        return self._get_document(self.related_doc_type, doc_id, context)
+
     def get_value(self, doc_id, context):
         assert context.root_doc['domain']
-        doc = self._get_document(self.related_doc_type, doc_id, context)
+        doc = self._get_related_document(doc_id, context)
         # explicitly use a new evaluation context since this is a new document
-        return self._value_expression(doc, EvaluationContext(doc, 0))
+        return self._value_expression(doc, EvaluationContext(doc, 0, related_docs=context.related_docs))
 
     def __str__(self):
         return "{}[{}]/{}".format(self.related_doc_type,
@@ -784,6 +792,11 @@ class SubcasesExpressionSpec(JsonObject):
             return []
 
         assert context.root_doc['domain']
+        related_docs = context.related_docs
+        if related_docs is not None:
+            found, subcases = related_docs.get_subcases(case_id)
+            if found or related_docs.collecting:
+                return subcases
         return self._get_subcases(case_id, context)
 
     @ucr_context_cache(vary_on=('case_id',))
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+
+from corehq.apps.userreports.benchmark import (
+    DocumentGenerator,
+    benchmark_data_source,
+    get_data_sources,
+    record_result,
+)
+
+
+class Command(BaseCommand):
+    help = """
+    Benchmark how fast data sources evaluate generated documents.
+
+    Runs without a database, related documents are looked up from generated
+    documents. Defaults to the example data sources.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*',
+                            help='JSON files (or globs) of data sources or static data sources')
+        parser.add_argument('--static', action='store_true', default=False,
+                            help='Also benchmark all static data sources')
+        parser.add_argument('--docs', type=int, default=1000, help='The number of documents to evaluate')
+        parser.add_argument('--repeat', type=int, default=3, help='The fastest of this many runs counts')
+        parser.add_argument('--repeat-size', type=int, default=3,
+                            help='The number of items of base item expressions')
+        parser.add_argument('--related-count', type=int, default=10,
+                            help='The number of documents of each related doc type')
+        parser.add_argument('--extra-properties', type=int, default=10,
+                            help='The number of properties added to each document that are not used')
+        parser.add_argument('--cardinality', type=int, default=20,
+                            help='The number of distinct values of string properties')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--compiled', action='store_true', default=False,
+                            help='Evaluate compiled data sources')
+        parser.add_argument('--no-memory', action='store_true', default=False,
+                            help="Don't measure memory, which takes longer than the benchmark itself")
+        parser.add_argument('--indicators', action='store_true', default=False,
+                            help='Show the cost of each indicator')
+        parser.add_argument('--history', help='Record results in this file and compare them to the last ones')
+
+    def handle(self, paths, **options):
+        for config in get_data_sources(paths, options['static']):
+            generator = DocumentGenerator(
+                config,
+                seed=options['seed'],
+                repeat_size=options['repeat_size'],
+                related_count=options['related_count'],
+                extra_properties=options['extra_properties'],
+                cardinality=options['cardinality'],
+            )
+            result = benchmark_data_source(
+                config,
+                generator.get_docs(options['docs']),
+                generator.get_related_docs(),
+                compiled=options['compiled'],
+                repeat=options['repeat'],
+                measure_memory=not options['no_memory'],
+                settings=generator.settings,
+            )
+            previous = record_result(options['history'], result) if options['history'] else None
+            self._print_result(result, previous, options['indicators'])
+
+    def _print_result(self, result, previous, show_indicators):
+        print(result.data_source)
+        line = '    {:>10.0f} docs/sec, {} rows, {} errors'.format(
+            result.docs_per_second, result.rows, len(result.errors))
+        if previous and previous['docs_per_second']:
+            line += ' ({:+.1%} since {})'.format(
+                result.docs_per_second / previous['docs_per_second'] - 1, previous['timestamp'])
+        print(line)
+        if result.peak_memory is not None:
+            print('    {:>10.1f} KiB peak memory'.format(result.peak_memory / 1024))
+        if result.errors:
+            doc_id, error = result.errors[0]
+            print('    first error ({}): {!r}'.format(doc_id, error))
+        if show_indicators:
+            for name, cost in sorted(result.indicator_costs.items(), key=lambda item: -(item[1] or 0)):
+                print('    {:>10} us/row  {}'.format(cost, name))
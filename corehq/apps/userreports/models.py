@@ -51,6 +51,7 @@ from corehq.apps.userreports.const import (
     DATA_SOURCE_TYPE_AGGREGATE,
     DATA_SOURCE_TYPE_STANDARD,
     FILTER_INTERPOLATION_DOC_TYPES,
+    ROLLUP_AGGREGATION_TYPES,
     UCR_SQL_BACKEND,
     VALID_REFERENCED_DOC_TYPES,
 )
@@ -87,6 +88,7 @@ from corehq.apps.userreports.util import (
 )
 from corehq.pillows.utils import get_deleted_doc_types
 from corehq.sql_db.connections import UCR_ENGINE_ID, connection_manager
+from corehq.toggles import UCR_COMPILED_EXPRESSIONS
 from corehq.util.couch import DocumentNotFound, get_document_or_not_found
 from corehq.util.quickcache import quickcache
 
@@ -150,6 +152,28 @@ class SQLSettings(DocumentSchema):
     primary_key = ListProperty()
 
 
+class RollupMeasure(DocumentSchema):
+    column_id = StringProperty(required=True)
+    aggregation = StringProperty(required=True, choices=ROLLUP_AGGREGATION_TYPES)
+
+    @property
+    def rollup_column_id(self):
+        return '{}_{}'.format(self.column_id, self.aggregation)
+
+
+class RollupTableSpec(DocumentSchema):
+    """
+    A pre-aggregated copy of the data source table, grouped by ``group_by``
+    (e.g. a month and a location column) with one column per measure.
+
+    Reports that only filter and group by these columns and aggregate these
+    measures are queried from the rollup table instead.
+    """
+    rollup_id = StringProperty(required=True)
+    group_by = StringListProperty(required=True)
+    measures = SchemaListProperty(RollupMeasure)
+
+
 class DataSourceBuildInformation(DocumentSchema):
     """
     A class to encapsulate meta information about the process through which
@@ -168,6 +192,10 @@ class DataSourceBuildInformation(DocumentSchema):
     # same as previous attributes but used for rebuilding tables in place
     finished_in_place = BooleanProperty(default=False)
     initiated_in_place = DateTimeProperty()
+    # same as previous attributes but used for rebuilding into a shadow table
+    # that replaces the table when it has been built
+    finished_shadow = BooleanProperty(default=False)
+    initiated_shadow = DateTimeProperty()
     rebuilt_asynchronously = BooleanProperty(default=False)
 
 
@@ -247,6 +275,7 @@ class DataSourceConfiguration(CachedCouchDocumentMixin, Document, AbstractUCRDat
     sql_settings = SchemaProperty(SQLSettings)
     validations = SchemaListProperty(Validation)
     mirrored_engine_ids = ListProperty(default=[])
+    rollups = SchemaListProperty(RollupTableSpec)
 
     class Meta(object):
         # prevent JsonObject from auto-converting dates etc.
@@ -267,6 +296,8 @@ class DataSourceConfiguration(CachedCouchDocumentMixin, Document, AbstractUCRDat
         if eval_context is None:
             eval_context = EvaluationContext(document)
 
+        if self.compiled is not None:
+            return self.compiled.filter(document, eval_context)
         filter_fn = self._get_main_filter()
         return filter_fn(document, eval_context)
 
@@ -313,6 +344,15 @@ class DataSourceConfiguration(CachedCouchDocumentMixin, Document, AbstractUCRDat
         if not doc_types:
             return None
 
+        return FilterFactory.from_spec(
+            self._get_filter_spec(doc_types, include_configured),
+            context=self.get_factory_context(),
+        )
+
+    def get_main_filter_spec(self):
+        return self._get_filter_spec([self.referenced_doc_type])
+
+    def _get_filter_spec(self, doc_types, include_configured=True):
         extras = (
             [self.configured_filter]
             if include_configured and self.configured_filter else []
@@ -335,13 +375,10 @@ class DataSourceConfiguration(CachedCouchDocumentMixin, Document, AbstractUCRDat
                 ],
             },
         ]
-        return FilterFactory.from_spec(
-            {
-                'type': 'and',
-                'filters': built_in_filters + extras,
-            },
-            context=self.get_factory_context(),
-        )
+        return {
+            'type': 'and',
+            'filters': built_in_filters + extras,
+        }
 
     def _get_domain_filter_spec(self):
         return {
@@ -431,6 +468,48 @@ class DataSourceConfiguration(CachedCouchDocumentMixin, Document, AbstractUCRDat
             None,
         )
 
+    @property
+    @memoized
+    def compiled(self):
+        """The main filter and indicators compiled into plain Python functions
+
+        None unless the UCR_COMPILED_EXPRESSIONS toggle is enabled for the domain.
+        """
+        from corehq.apps.userreports.expressions.compiler import CompiledDataSource
+        if not UCR_COMPILED_EXPRESSIONS.enabled(self.domain):
+            return None
+        return CompiledDataSource(self)
+
+    @property
+    def is_building_shadow_table(self):
+        return bool(self.meta.build.initiated_shadow and not self.meta.build.finished_shadow)
+
+    @property
+    @memoized
+    def uses_related_documents(self):
+        """Whether the data source looks up related documents that can be fetched in bulk"""
+        from corehq.apps.userreports.related_docs import uses_related_documents
+        return uses_related_documents([
+            self.configured_filter,
+            self.configured_indicators,
+            self.base_item_expression,
+            self.named_expressions,
+            self.named_filters,
+        ])
+
+    @property
+    @memoized
+    def related_document_expressions(self):
+        """The expressions of the indicators that look up related documents"""
+        from corehq.apps.userreports.related_docs import get_related_document_specs
+        context = self.get_factory_context()
+        return [
+            ExpressionFactory.from_spec(spec, context)
+            for spec in get_related_document_specs(
+                self.configured_indicators, [self.named_expressions, self.named_filters]
+            )
+        ]
+
     @property
     @memoized
     def parsed_expression(self):
@@ -469,31 +548,67 @@ class DataSourceConfiguration(CachedCouchDocumentMixin, Document, AbstractUCRDat
         if not eval_context:
             eval_context = EvaluationContext(doc)
 
-        if self.has_validations:
-            try:
-                self.validate_document(doc, eval_context)
-            except ValidationError as e:
-                for error in e.errors:
-                    InvalidUCRData.objects.get_or_create(
-                        doc_id=doc['_id'],
-                        indicator_config_id=self._id,
-                        validation_name=error[0],
-                        defaults={
-                            'doc_type': doc['doc_type'],
-                            'domain': doc['domain'],
-                            'validation_text': error[1],
-                        }
-                    )
-                return []
+        if not self._is_valid_document(doc, eval_context):
+            return []
 
+        indicators = self.compiled or self.indicators
         rows = []
         for item in self.get_items(doc, eval_context):
-            values = self.indicators.get_values(item, eval_context)
+            values = indicators.get_values(item, eval_context)
             rows.append(values)
             eval_context.increment_iteration()
 
         return rows
 
+    def get_bulk_values(self, docs, eval_contexts):
+        """
+        Get the values of the rows of many documents at once, column by column.
+
+        Only for compiled data sources. The values of each column are
+        transformed to its datatype together rather than one by one.
+
+        :param eval_contexts: dict of doc ID -> EvaluationContext
+        :returns: tuple of (OrderedDict of ``Column`` -> list of values,
+            list of ``(doc, exception)`` for documents that could not be evaluated)
+        """
+        compiled = self.compiled
+        raw_rows = []
+        errors = []
+        for doc in docs:
+            eval_context = eval_contexts[doc['_id']]
+            try:
+                if not self._is_valid_document(doc, eval_context):
+                    continue
+                doc_rows = []
+                for item in self.get_items(doc, eval_context):
+                    doc_rows.append(compiled.get_raw_values(item, eval_context))
+                    eval_context.increment_iteration()
+            except Exception as e:
+                errors.append((doc, e))
+            else:
+                raw_rows.extend(doc_rows)
+        return compiled.transform_columns(raw_rows), errors
+
+    def _is_valid_document(self, doc, eval_context):
+        if not self.has_validations:
+            return True
+        try:
+            self.validate_document(doc, eval_context)
+        except ValidationError as e:
+            for error in e.errors:
+                InvalidUCRData.objects.get_or_create(
+                    doc_id=doc['_id'],
+                    indicator_config_id=self._id,
+                    validation_name=error[0],
+                    defaults={
+                        'doc_type': doc['doc_type'],
+                        'domain': doc['domain'],
+                        'validation_text': error[1],
+                    }
+                )
+            return False
+        return True
+
     def get_report_count(self):
         """
         Return the number of ReportConfigurations that reference this data source.
@@ -536,6 +651,19 @@ class DataSourceConfiguration(CachedCouchDocumentMixin, Document, AbstractUCRDat
 
         self.parsed_expression
         self.pk_columns
+        self._validate_rollups(unique_columns)
+
+    def _validate_rollups(self, column_ids):
+        rollup_ids = [rollup.rollup_id for rollup in self.rollups]
+        if len(rollup_ids) != len(set(rollup_ids)):
+            raise BadSpecError(_('Rollup IDs must be unique'))
+        for rollup in self.rollups:
+            rollup_column_ids = rollup.group_by + [measure.column_id for measure in rollup.measures]
+            missing = set(rollup_column_ids) - column_ids
+            if missing:
+                raise BadSpecError(_('Rollup {} uses columns that are not in the data source: {}').format(
+                    rollup.rollup_id, ', '.join(sorted(missing))
+                ))
 
     @classmethod
     def by_domain(cls, domain):
@@ -38,6 +38,7 @@ from corehq.apps.userreports.rebuild import (
     get_tables_rebuild_migrate,
     migrate_tables,
 )
+from corehq.apps.userreports.related_docs import get_evaluation_contexts
 from corehq.apps.userreports.specs import EvaluationContext
 from corehq.apps.userreports.sql import get_metadata
 from corehq.apps.userreports.tasks import rebuild_indicators
@@ -273,6 +274,10 @@ class ConfigurableReportTableManagerMixin(object):
             if config._rev != latest_rev:
                 raise StaleRebuildError('Tried to rebuild a stale table ({})! Ignoring...'.format(config))
 
+        if config.is_building_shadow_table:
+            # the table is replaced once the shadow table has been built
+            return
+
         diff_dicts = [diff.to_dict() for diff in diffs]
         if config.disable_destructive_rebuild and adapter.table_exists:
             adapter.log_table_rebuild_skipped(source='pillowtop', diffs=diff_dicts)
@@ -366,11 +371,15 @@ class ConfigurableReportPillowProcessor(ConfigurableReportTableManagerMixin, Bul
             retry_changes, docs = bulk_fetch_changes_docs(to_update, domain)
         change_exceptions = []
 
+        with self._metrics_timer('related_docs'):
+            eval_contexts = get_evaluation_contexts(
+                domain, [adapter.config for adapter in adapters if not adapter.run_asynchronous], docs)
+
         with self._metrics_timer('single_batch_transform'):
             for doc in docs:
                 change = changes_by_id[doc['_id']]
                 doc_subtype = change.metadata.document_subtype
-                eval_context = EvaluationContext(doc)
+                eval_context = eval_contexts[doc['_id']]
                 with self._metrics_timer('single_doc_transform'):
                     for adapter in adapters:
                         with self._per_config_metrics_timer('transform', adapter.config._id):
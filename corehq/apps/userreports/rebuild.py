@@ -1,10 +1,14 @@
+import json
 import logging
 from collections import defaultdict
 
+from django.db.models import Max, Min, Q
+
 import attr
 from alembic.autogenerate import compare_metadata
 from alembic.operations import Operations
 
+from couchforms.models import all_known_formlike_doc_types
 from dimagi.utils.couch import get_redis_client
 from fluff.signals import (
     DiffTypes,
@@ -12,8 +16,17 @@ from fluff.signals import (
     get_tables_to_rebuild,
     reformat_alembic_diffs,
 )
+from pillowtop.dao.couch import ID_CHUNK_SIZE
 
+from corehq.apps.change_feed.document_types import CASE_DOC_TYPES
+from corehq.apps.userreports.const import UCR_REBUILD_PARTITIONS_PER_SHARD
 from corehq.apps.userreports.models import id_is_static
+from corehq.form_processor.backends.sql.dbaccessors import (
+    CaseReindexAccessor,
+    FormReindexAccessor,
+)
+from corehq.form_processor.models import XFormInstanceSQL
+from corehq.form_processor.utils.general import should_use_sql_backend
 
 logger = logging.getLogger(__name__)
 
@@ -42,10 +55,202 @@ class DataSourceResumeHelper(object):
         self._client.rpush(self._key, case_type_or_xmlns)
 
     def clear_resume_info(self):
-        self._client.delete(self._key)
+        self._client.delete(self._key, self._partitions_key, self._finishing_key)
 
     def has_resume_info(self):
-        return self._client.exists(self._key)
+        return bool(self._client.exists(self._key) or self.has_partitions())
+
+    @property
+    def _partitions_key(self):
+        return '{}:partitions'.format(self._key)
+
+    @property
+    def _finishing_key(self):
+        return '{}:finishing'.format(self._key)
+
+    def has_partitions(self):
+        return bool(self._client.exists(self._partitions_key))
+
+    def set_partitions(self, partitions):
+        self._client.delete(self._partitions_key, self._finishing_key)
+        if partitions:
+            self._client.hmset(self._partitions_key, {
+                partition.key: json.dumps(attr.asdict(PartitionProgress(partition)))
+                for partition in partitions
+            })
+
+    def get_partitions_progress(self):
+        return [
+            PartitionProgress.from_json(progress)
+            for progress in self._client.hgetall(self._partitions_key).values()
+        ]
+
+    def get_partition_progress(self, partition):
+        """
+        :returns: PartitionProgress or None if the partition is not part of
+        the current build
+        """
+        progress = self._client.hget(self._partitions_key, partition.key)
+        return PartitionProgress.from_json(progress) if progress is not None else None
+
+    def set_partition_progress(self, progress):
+        self._client.hset(self._partitions_key, progress.partition.key, json.dumps(attr.asdict(progress)))
+
+    def claim_finish(self):
+        """Claim finishing a partitioned build once all partitions are complete
+
+        :returns: True for only one caller per build, even if several
+        partitions complete at the same time
+        """
+        return bool(self._client.set(self._finishing_key, 1, nx=True))
+
+    def get_build_progress(self):
+        """Combined progress of all partitions of a partitioned build
+
+        :returns: BuildProgress or None if the build is not partitioned
+        """
+        partitions = self.get_partitions_progress()
+        if not partitions:
+            return None
+        return BuildProgress(
+            partition_count=len(partitions),
+            completed_partition_count=len([p for p in partitions if p.complete]),
+            doc_count=sum(p.doc_count for p in partitions),
+        )
+
+
+@attr.s(frozen=True)
+class RebuildPartition(object):
+    """Part of a data source rebuild that can be built independently of the others
+
+    The documents of one case type or XMLNS, optionally restricted to one
+    shard database and a range of primary keys: ``start_pk <= pk < end_pk``.
+    Without a database only the whole partition can be checkpointed.
+    """
+    case_type_or_xmlns = attr.ib()
+    db_alias = attr.ib(default=None)
+    start_pk = attr.ib(default=None)
+    end_pk = attr.ib(default=None)
+
+    @property
+    def key(self):
+        return json.dumps([self.case_type_or_xmlns, self.db_alias, self.start_pk, self.end_pk])
+
+
+@attr.s
+class PartitionProgress(object):
+    partition = attr.ib(converter=lambda p: p if isinstance(p, RebuildPartition) else RebuildPartition(**p))
+    last_pk = attr.ib(default=None)
+    doc_count = attr.ib(default=0)
+    complete = attr.ib(default=False)
+
+    @classmethod
+    def from_json(cls, value):
+        return cls(**json.loads(value))
+
+
+@attr.s
+class BuildProgress(object):
+    partition_count = attr.ib()
+    completed_partition_count = attr.ib()
+    doc_count = attr.ib()
+
+    @property
+    def complete(self):
+        return self.completed_partition_count == self.partition_count
+
+
+class _FormRebuildAccessor(FormReindexAccessor):
+    """Forms included in UCR rebuilds, see ``FormAccessorSQL.iter_form_ids_by_xmlns``"""
+
+    def __init__(self, domain, xmlns=None, **kwargs):
+        super(_FormRebuildAccessor, self).__init__(domain, include_attachments=False, **kwargs)
+        self.xmlns = xmlns
+
+    def extra_filters(self, for_count=False):
+        filters = [Q(domain=self.domain), Q(state=XFormInstanceSQL.NORMAL)]
+        if self.xmlns:
+            filters.append(Q(xmlns=self.xmlns))
+        return filters
+
+
+def _get_reindex_accessor(config, case_type_or_xmlns):
+    if not should_use_sql_backend(config.domain):
+        return None
+    if config.referenced_doc_type in all_known_formlike_doc_types():
+        return _FormRebuildAccessor(config.domain, xmlns=case_type_or_xmlns)
+    if config.referenced_doc_type in CASE_DOC_TYPES:
+        return CaseReindexAccessor(config.domain, case_type=case_type_or_xmlns)
+    return None
+
+
+def get_rebuild_partitions(config, case_type_or_xmlns_list, partitions_per_shard=None):
+    """Split a rebuild by case type or XMLNS, shard database and primary key range"""
+    partitions_per_shard = partitions_per_shard or UCR_REBUILD_PARTITIONS_PER_SHARD
+    partitions = []
+    for case_type_or_xmlns in case_type_or_xmlns_list:
+        accessor = _get_reindex_accessor(config, case_type_or_xmlns)
+        if accessor is None:
+            partitions.append(RebuildPartition(case_type_or_xmlns))
+            continue
+        for db_alias in accessor.sql_db_aliases:
+            partitions.extend(
+                _get_shard_partitions(accessor, case_type_or_xmlns, db_alias, partitions_per_shard)
+            )
+    return partitions
+
+
+def _get_shard_partitions(accessor, case_type_or_xmlns, db_alias, partition_count):
+    if partition_count == 1:
+        return [RebuildPartition(case_type_or_xmlns, db_alias)]
+
+    pk_field = accessor.primary_key_field_name
+    pk_range = accessor.query(db_alias).aggregate(min_pk=Min(pk_field), max_pk=Max(pk_field))
+    if pk_range['min_pk'] is None:
+        return []
+
+    min_pk, end_pk = pk_range['min_pk'], pk_range['max_pk'] + 1
+    step = max(1, -(-(end_pk - min_pk) // partition_count))
+    return [
+        RebuildPartition(case_type_or_xmlns, db_alias, start_pk, min(start_pk + step, end_pk))
+        for start_pk in range(min_pk, end_pk, step)
+    ]
+
+
+def iter_partition_doc_ids(config, partition, document_store, last_pk=None):
+    """Get the IDs of the documents in a partition in chunks
+
+    :param last_pk: the last primary key that was built, to resume building the partition
+    :returns: generator of (list of doc IDs, primary key of the last doc)
+    """
+    if partition.db_alias is None:
+        # documents that aren't sharded can only be built all at once
+        doc_ids = []
+        for doc_id in document_store.iter_document_ids():
+            doc_ids.append(doc_id)
+            if len(doc_ids) >= ID_CHUNK_SIZE:
+                yield doc_ids, None
+                doc_ids = []
+        if doc_ids:
+            yield doc_ids, None
+        return
+
+    accessor = _get_reindex_accessor(config, partition.case_type_or_xmlns)
+    if last_pk is None and partition.start_pk is not None:
+        last_pk = partition.start_pk - 1
+    while True:
+        docs = list(accessor.get_doc_ids(partition.db_alias, last_doc_pk=last_pk, limit=ID_CHUNK_SIZE))
+        if partition.end_pk is not None:
+            in_range = [doc for doc in docs if doc.primary_key < partition.end_pk]
+            reached_end = len(in_range) < len(docs)
+            docs = in_range
+        else:
+            reached_end = False
+        if docs:
+            last_pk = docs[-1].primary_key
+            yield [doc.doc_id for doc in docs], last_pk
+        if reached_end or len(docs) < ID_CHUNK_SIZE:
+            return
 
 
 @attr.s
@@ -0,0 +1,189 @@
+import json
+from collections import defaultdict
+
+from corehq.apps.change_feed.data_sources import get_document_store_for_doc_type
+from corehq.apps.userreports.specs import EvaluationContext
+from corehq.form_processor.interfaces.dbaccessors import CaseAccessors
+from corehq.toggles import UCR_BULK_RELATED_DOCS
+
+# expression types that look up other documents and can be fetched in bulk
+BULK_FETCHED_EXPRESSION_TYPES = ('related_doc', 'get_subcases')
+
+# expression types that evaluate their sub-expressions against other items
+# than the one they are given, these are collected whole
+ITEM_CHANGING_EXPRESSION_TYPES = ('nested', 'root_doc', 'filter_items', 'map_items', 'reduce_items', 'sort_items')
+
+# the number of related document "hops" (e.g. case -> parent -> household)
+# that are fetched in bulk, any further hops are fetched one by one
+MAX_PREFETCH_DEPTH = 3
+
+
+class RelatedDocuments(object):
+    """
+    Related documents and subcases for a chunk of documents in one domain,
+    shared by the evaluation contexts of those documents.
+
+    While ``collecting`` is set, lookups for documents that have not been
+    fetched yet are recorded and return nothing. ``fetch`` then loads all
+    recorded documents with one query per document type.
+    """
+
+    def __init__(self, domain):
+        self.domain = domain
+        self.collecting = False
+        self._docs = {}
+        self._subcases = {}
+        self._missing_doc_ids = defaultdict(set)
+        self._missing_subcase_ids = set()
+
+    def get_document(self, doc_type, doc_id):
+        """
+        :returns: tuple of (found, document). ``document`` is None if it
+        does not exist or belongs to another domain.
+        """
+        key = (doc_type, doc_id)
+        if key in self._docs:
+            return True, self._docs[key]
+        if self.collecting:
+            self._missing_doc_ids[doc_type].add(doc_id)
+        return False, None
+
+    def get_subcases(self, case_id):
+        """
+        :returns: tuple of (found, list of subcase JSON)
+        """
+        if case_id in self._subcases:
+            return True, self._subcases[case_id]
+        if self.collecting:
+            self._missing_subcase_ids.add(case_id)
+        return False, []
+
+    def fetch(self):
+        """Fetch all documents and subcases recorded since the last fetch
+
+        :returns: True if anything was fetched
+        """
+        fetched = bool(self._missing_doc_ids or self._missing_subcase_ids)
+        for doc_type, doc_ids in self._missing_doc_ids.items():
+            self._fetch_documents(doc_type, doc_ids)
+        if self._missing_subcase_ids:
+            self._fetch_subcases(self._missing_subcase_ids)
+        self._missing_doc_ids = defaultdict(set)
+        self._missing_subcase_ids = set()
+        return fetched
+
+    def _fetch_documents(self, doc_type, doc_ids):
+        document_store = get_document_store_for_doc_type(
+            self.domain, doc_type, load_source="related_doc_expression")
+        docs_by_id = {
+            doc['_id']: doc for doc in document_store.iter_documents(list(doc_ids))
+            if doc.get('domain') == self.domain
+        }
+        for doc_id in doc_ids:
+            self._docs[(doc_type, doc_id)] = docs_by_id.get(doc_id)
+
+    def _fetch_subcases(self, case_ids):
+        subcases = {case_id: [] for case_id in case_ids}
+        for case in CaseAccessors(self.domain).get_reverse_indexed_cases(list(case_ids)):
+            case_json = case.to_json()
+            for case_id in {index.referenced_id for index in case.indices}:
+                if case_id in subcases:
+                    subcases[case_id].append(case_json)
+        self._subcases.update(subcases)
+
+
+def uses_related_documents(spec):
+    """Whether a (data source) spec contains any expression that is fetched in bulk"""
+    if isinstance(spec, dict):
+        if spec.get('type') in BULK_FETCHED_EXPRESSION_TYPES:
+            return True
+        return any(uses_related_documents(value) for value in spec.values())
+    if isinstance(spec, list):
+        return any(uses_related_documents(value) for value in spec)
+    return False
+
+
+def get_related_document_specs(spec, named_specs):
+    """
+    Get the outermost expressions in a (data source) spec that look up
+    related documents, including those in named expressions and filters.
+
+    Evaluating these finds the same related documents as evaluating the
+    whole spec. Expressions that evaluate their sub-expressions against
+    other items are returned whole if they contain any such expression.
+
+    :param named_specs: list of dicts of name -> spec, for ``named``
+        expressions and filters
+    """
+    specs = []
+    _collect_related_document_specs(spec, named_specs, specs)
+    unique_specs = {json.dumps(spec, sort_keys=True): spec for spec in specs}
+    return list(unique_specs.values())
+
+
+def _collect_related_document_specs(spec, named_specs, specs):
+    if isinstance(spec, dict):
+        spec_type = spec.get('type')
+        if spec_type in BULK_FETCHED_EXPRESSION_TYPES:
+            specs.append(spec)
+            return
+        if spec_type in ITEM_CHANGING_EXPRESSION_TYPES:
+            if get_related_document_specs(list(spec.values()), named_specs):
+                specs.append(spec)
+            return
+        if spec_type == 'named':
+            for named in named_specs:
+                if spec.get('name') in named:
+                    _collect_related_document_specs(named[spec['name']], named_specs, specs)
+        for value in spec.values():
+            _collect_related_document_specs(value, named_specs, specs)
+    elif isinstance(spec, list):
+        for value in spec:
+            _collect_related_document_specs(value, named_specs, specs)
+
+
+def get_evaluation_contexts(domain, configs, docs):
+    """
+    Get an evaluation context for each document with the related documents
+    needed by ``configs`` fetched in bulk.
+
+    Only the filter, base item expression and the expressions that look up
+    related documents (see ``get_related_document_specs``) of the configs
+    are evaluated against the documents, in passes that only record the
+    related documents they look up. After each pass those documents are
+    fetched together. Each pass resolves one more hop.
+
+    :returns: dict of doc ID -> EvaluationContext
+    """
+    configs = [config for config in configs if config.uses_related_documents]
+    if not configs or not UCR_BULK_RELATED_DOCS.enabled(domain):
+        return {doc['_id']: EvaluationContext(doc) for doc in docs}
+
+    related_docs = RelatedDocuments(domain)
+    contexts = {doc['_id']: EvaluationContext(doc, related_docs=related_docs) for doc in docs}
+    related_docs.collecting = True
+    try:
+        for i in range(MAX_PREFETCH_DEPTH):
+            for doc in docs:
+                context = contexts[doc['_id']]
+                for config in configs:
+                    _collect_related_documents(config, doc, context)
+            if not related_docs.fetch():
+                break
+    finally:
+        related_docs.collecting = False
+    return contexts
+
+
+def _collect_related_documents(config, doc, context):
+    try:
+        # no items for documents that don't pass the filter
+        for item in config.get_items(doc, context):
+            for expression in config.related_document_expressions:
+                expression(item, context)
+            context.increment_iteration()
+    except Exception:
+        # errors are handled when the document is evaluated for real
+        pass
+    finally:
+        context.reset_iteration()
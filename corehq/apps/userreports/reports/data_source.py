@@ -1,3 +1,4 @@
+from corehq.apps.userreports.cache import get_cached_report_result
 from corehq.apps.userreports.const import (
     DATA_SOURCE_TYPE_STANDARD,
     UCR_SQL_BACKEND,
@@ -12,6 +13,7 @@ from corehq.apps.userreports.models import (
 from corehq.apps.userreports.sql.data_source import (
     ConfigurableReportSqlDataSource,
 )
+from corehq.toggles import UCR_REPORT_RESULT_CACHE
 from corehq.util.metrics.load_counters import ucr_load_counter
 
 
@@ -132,9 +134,78 @@ class ConfigurableReportDataSource(object):
     def column_warnings(self):
         return self.data_source.column_warnings
 
+    @property
+    def can_cache_results(self):
+        return not self._custom_query_provider and self.data_source_type == DATA_SOURCE_TYPE_STANDARD
+
+    @property
+    def use_result_cache(self):
+        return self.can_cache_results and UCR_REPORT_RESULT_CACHE.enabled(self.domain)
+
+    def _get_query_key(self, method, *args):
+        data_source = self.data_source
+        return {
+            'method': method,
+            'args': args,
+            'engine_id': data_source.engine_id,
+            'lang': data_source.lang,
+            'columns': [column.to_json() for column in data_source.top_level_columns],
+            'aggregation_columns': data_source.aggregation_columns,
+            'order_by': data_source._order_by,
+            'distinct_on': data_source._distinct_on,
+            'filters': {
+                slug: [filter_value.filter, type(filter_value).__name__, filter_value.to_sql_values()]
+                for slug, filter_value in data_source._filter_values.items()
+            },
+        }
+
+    def _get_result(self, method, *args):
+        get_result = getattr(self.data_source, method)
+        if not self.use_result_cache:
+            return get_result(*args), False
+        return get_cached_report_result(
+            self.config._id,
+            self._get_query_key(method, *args),
+            lambda: self._get_current_result(get_result, *args),
+        )
+
+    def _get_current_result(self, get_result, *args):
+        """Run a query whose result is cached for the current data source version
+
+        The query runs against the primary database: a replica may not have
+        the changes that replaced the version yet.
+        """
+        self.data_source.use_read_replica = False
+        try:
+            return get_result(*args)
+        finally:
+            self.data_source.use_read_replica = True
+
     def get_data(self, start=None, limit=None):
-        data = self.data_source.get_data(start, limit)
-        self.track_load(len(data))
+        data, cached = self._get_result('get_data', start, limit)
+        if not cached:
+            self.track_load(len(data))
+        return data
+
+    def get_shared_data(self, timeout=None):
+        """
+        Get all rows, shared with any other request for the same report and
+        filter values until the data source changes or ``timeout`` passes.
+
+        Concurrent requests for the same rows wait for the first one to run
+        the query.
+        """
+        if not self.can_cache_results:
+            return self.get_data()
+        data, cached = get_cached_report_result(
+            self.config._id,
+            self._get_query_key('get_data', None, None),
+            lambda: self._get_current_result(self.data_source.get_data, None, None),
+            timeout=timeout,
+            wait_for_result=True,
+        )
+        if not cached:
+            self.track_load(len(data))
         return data
 
     @property
@@ -142,10 +213,12 @@ class ConfigurableReportDataSource(object):
         return self.data_source.has_total_row
 
     def get_total_records(self):
-        return self.data_source.get_total_records()
+        total_records, cached = self._get_result('get_total_records')
+        return total_records
 
     def get_total_row(self):
-        return self.data_source.get_total_row()
+        total_row, cached = self._get_result('get_total_row')
+        return total_row
 
     @property
     def total_column_ids(self):
@@ -24,11 +24,15 @@ class EvaluationContext(object):
     """
     An evaluation context. Necessary for repeats to pass both the row of the repeat as well
     as the root document and the iteration number.
+
+    ``related_docs`` is an optional ``RelatedDocuments`` object that holds
+    related documents fetched in bulk for a chunk of documents.
     """
 
-    def __init__(self, root_doc, iteration=0):
+    def __init__(self, root_doc, iteration=0, related_docs=None):
         self.root_doc = root_doc
         self.iteration = iteration
+        self.related_docs = related_docs
         self.inserted_timestamp = datetime.utcnow()
         self.cache = {}
         self.iteration_cache = {}
@@ -1,25 +1,38 @@
 import hashlib
+import io
 import itertools
+import json
 import logging
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
 
 from django.utils.translation import ugettext as _
 
 import psycopg2
 import sqlalchemy
 from memoized import memoized
+from psycopg2 import sql
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.exc import ProgrammingError, OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.schema import Index, PrimaryKeyConstraint
+from sqlalchemy.schema import CreateTable, Index, PrimaryKeyConstraint
 
 from corehq.apps.userreports.adapter import IndicatorAdapter
+from corehq.apps.userreports.cache import bump_data_source_version
+from corehq.apps.userreports.const import UCR_COPY_MIN_ROWS
 from corehq.apps.userreports.exceptions import (
     ColumnNotFoundError,
+    MissingColumnWarning,
+    TableNotFoundWarning,
     TableRebuildError,
     translate_programming_error,
 )
 from corehq.apps.userreports.sql.columns import column_to_sql
-from corehq.apps.userreports.util import get_table_name
+from corehq.apps.userreports.sql.rollups import RollupTableAdapter
+from corehq.apps.userreports.util import get_shadow_table_name, get_table_name
 from corehq.sql_db.connections import connection_manager
+from corehq.toggles import MOBILE_UCR_SHARED_RESULTS, UCR_REPORT_RESULT_CACHE
 from corehq.util.soft_assert import soft_assert
 from corehq.util.test_utils import unit_testing_only
 
@@ -42,6 +55,8 @@ class IndicatorSqlAdapter(IndicatorAdapter):
         self.session_context = self.session_helper.session_context
         self.engine = self.session_helper.engine
         self.override_table_name = override_table_name
+        # session of the transaction rows are changed in by _maintaining_rollups
+        self._rollup_session = None
 
     @property
     def table_id(self):
@@ -98,6 +113,7 @@ class IndicatorSqlAdapter(IndicatorAdapter):
     def rebuild_table(self, initiated_by=None, source=None, skip_log=False, diffs=None):
         self.log_table_rebuild(initiated_by, source, skip=skip_log, diffs=diffs)
         self.session_helper.Session.remove()
+        self.drop_rollup_tables()
         try:
             rebuild_table(self.engine, self.get_table())
             self._apply_sql_addons()
@@ -105,6 +121,7 @@ class IndicatorSqlAdapter(IndicatorAdapter):
             raise TableRebuildError('problem rebuilding UCR table {}: {}'.format(self.config, e))
         finally:
             self.session_helper.Session.commit()
+        self._table_changed()
 
     def build_table(self, initiated_by=None, source=None):
         self.log_table_build(initiated_by, source)
@@ -116,15 +133,169 @@ class IndicatorSqlAdapter(IndicatorAdapter):
             raise TableRebuildError('problem building UCR table {}: {}'.format(self.config, e))
         finally:
             self.session_helper.Session.commit()
+        self._table_changed()
+
+    @property
+    @memoized
+    def rollup_tables(self):
+        if self.override_table_name or self.session_helper.is_citus_db:
+            return []
+        return [RollupTableAdapter(self, rollup) for rollup in self.config.rollups]
+
+    def build_rollup_tables(self):
+        """Build the rollup tables from the data source table
+
+        Called when the data source has been built. Until then changes to the
+        data source table are not rolled up.
+        """
+        for rollup_table in self.rollup_tables:
+            rollup_table.build()
+
+    def drop_rollup_tables(self):
+        for rollup_table in self.rollup_tables:
+            rollup_table.drop()
+
+    @contextmanager
+    def _maintaining_rollups(self, doc_ids):
+        """Apply the changes to the rows of ``doc_ids`` to the rollup tables
+
+        The rows are changed in one transaction with reading their old and new
+        values and updating the rollup tables, holding the rollup tables'
+        locks. Concurrent changes to the same rows are rolled up one after the
+        other, and if anything fails nothing is changed.
+        """
+        if not self.rollup_tables:
+            yield
+            return
+        with self.session_context() as session:
+            connection = session.connection()
+            rollup_tables = [
+                rollup_table for rollup_table in self.rollup_tables if rollup_table.lock(connection)
+            ]
+            column_ids = {
+                column_id for rollup_table in rollup_tables for column_id in rollup_table.source_column_ids
+            }
+            old_rows = self._get_rollup_rows(connection, doc_ids, column_ids) if rollup_tables else []
+            self._rollup_session = session
+            try:
+                yield
+            finally:
+                self._rollup_session = None
+            if rollup_tables:
+                new_rows = self._get_rollup_rows(connection, doc_ids, column_ids)
+                for rollup_table in rollup_tables:
+                    rollup_table.apply_changes(connection, old_rows, new_rows)
+
+    def _get_rollup_rows(self, connection, doc_ids, column_ids):
+        table = self.get_table()
+        query = sqlalchemy.select([table.c[column_id] for column_id in sorted(column_ids)]).where(
+            table.c.doc_id.in_(doc_ids)
+        )
+        return [dict(row) for row in connection.execute(query)]
+
+    @contextmanager
+    def _write_session(self):
+        """Session to change rows in, which joins the transaction of
+        ``_maintaining_rollups`` if there is one
+        """
+        if self._rollup_session is not None:
+            yield self._rollup_session
+        else:
+            with self.session_context() as session:
+                yield session
+
+    def _table_changed(self):
+        """Invalidate cached report results after the data in the table changed"""
+        if not self.override_table_name:
+            bump_data_source_version(self.config._id)
+
+    def _rows_changed(self):
+        # called for every change, so only when report results are cached.
+        # Results cached before the toggles were disabled can be served until
+        # they expire if they are enabled again.
+        domain = self.config.domain
+        if UCR_REPORT_RESULT_CACHE.enabled(domain) or MOBILE_UCR_SHARED_RESULTS.enabled(domain):
+            self._table_changed()
+
+    @property
+    def _shadow_table_name(self):
+        return get_shadow_table_name(self.config.domain, self.config.table_id)
+
+    @property
+    @memoized
+    def shadow_adapter(self):
+        """Adapter for the shadow table the data source is rebuilt into"""
+        return type(self)(self.config, override_table_name=self._shadow_table_name, engine_id=self.engine_id)
+
+    def _get_shadow_table(self, unlogged=False):
+        return get_indicator_table(
+            self.config, get_metadata(self.engine_id),
+            override_table_name=self._shadow_table_name, unlogged=unlogged
+        )
+
+    def build_shadow_table(self, initiated_by=None, source=None, skip_log=False, diffs=None):
+        """Create an empty shadow table to rebuild the data source into
+
+        The table is unlogged and only has its primary key. It is made durable
+        and the other indexes are created by ``swap_shadow_table``.
+        """
+        self.log_table_rebuild(initiated_by, source, skip=skip_log, diffs=diffs)
+        self.session_helper.Session.remove()
+        shadow_table = self._get_shadow_table(unlogged=True)
+        try:
+            with self.engine.begin() as connection:
+                shadow_table.drop(connection, checkfirst=True)
+                connection.execute(CreateTable(shadow_table))
+        except (ProgrammingError, OperationalError) as e:
+            raise TableRebuildError('problem building shadow table for UCR table {}: {}'.format(self.config, e))
+
+    def swap_shadow_table(self):
+        """Replace the data source table with the shadow table that was built for it
+
+        The old table is dropped and the shadow table and its indexes are
+        renamed in a single transaction so queries never see a missing table.
+        """
+        table = self.get_table()
+        shadow_table = self._get_shadow_table()
+        preparer = self.engine.dialect.identifier_preparer
+        index_names = {
+            tuple(column.name for column in index.columns): preparer.format_index(index)
+            for index in table.indexes
+        }
+        self.session_helper.Session.remove()
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(f'ALTER TABLE "{shadow_table.name}" SET LOGGED')
+                for index in shadow_table.indexes:
+                    index.create(connection)
+                connection.execute(f'ANALYZE "{shadow_table.name}"')
+
+            with self.engine.begin() as connection:
+                table.drop(connection, checkfirst=True)
+                connection.execute(f'ALTER TABLE "{shadow_table.name}" RENAME TO "{table.name}"')
+                connection.execute(
+                    f'ALTER TABLE "{table.name}" '
+                    f'RENAME CONSTRAINT "{shadow_table.name}_pkey" TO "{table.name}_pkey"'
+                )
+                for index in shadow_table.indexes:
+                    index_name = index_names[tuple(column.name for column in index.columns)]
+                    connection.execute(f'ALTER INDEX {preparer.format_index(index)} RENAME TO {index_name}')
+        except (ProgrammingError, OperationalError) as e:
+            raise TableRebuildError('problem swapping in shadow table for UCR table {}: {}'.format(self.config, e))
+        finally:
+            get_metadata(self.engine_id).remove(shadow_table)
+        self._table_changed()
 
     def drop_table(self, initiated_by=None, source=None, skip_log=False):
         self.log_table_drop(initiated_by, source, skip_log)
         # this will hang if there are any open sessions, so go ahead and close them
         self.session_helper.Session.remove()
+        self.drop_rollup_tables()
         with self.engine.begin() as connection:
             table = self.get_table()
             table.drop(connection, checkfirst=True)
             get_metadata(self.engine_id).remove(table)
+        self._table_changed()
 
     @unit_testing_only
     def clear_table(self):
@@ -132,6 +303,7 @@ class IndicatorSqlAdapter(IndicatorAdapter):
         with self.engine.begin() as connection:
             delete = table.delete()
             connection.execute(delete)
+        self._table_changed()
 
     def get_query_object(self):
         """
@@ -175,16 +347,40 @@ class IndicatorSqlAdapter(IndicatorAdapter):
         if not rows:
             return
 
+        doc_ids = {value.value for row in rows for value in row if value.column.id == 'doc_id'}
+        with self._maintaining_rollups(doc_ids):
+            self._save_rows(rows, use_shard_col)
+        self._rows_changed()
+
+    def save_columns(self, columns):
+        # build the row dicts straight from the columns rather than going through ColumnValue
+        names = [column.database_column_name.decode('utf-8') for column in columns]
+        formatted_rows = [dict(zip(names, values)) for values in zip(*columns.values())]
+        if not formatted_rows:
+            return
+
+        doc_ids = {row['doc_id'] for row in formatted_rows}
+        with self._maintaining_rollups(doc_ids):
+            self._save_formatted_rows(formatted_rows, use_shard_col=True)
+        self._rows_changed()
+
+    def _save_rows(self, rows, use_shard_col):
         # transform format from ColumnValue to dict
         formatted_rows = [
             {i.column.database_column_name.decode('utf-8'): i.value for i in row}
             for row in rows
         ]
+        self._save_formatted_rows(formatted_rows, use_shard_col)
+
+    def _save_formatted_rows(self, formatted_rows, use_shard_col):
         if self.session_helper.is_citus_db and use_shard_col:
             config = self.config.sql_settings.citus_config
             if config.distribution_type == 'hash':
                 self._by_column_update(formatted_rows)
                 return
+        if len(formatted_rows) >= UCR_COPY_MIN_ROWS and self.supports_copy():
+            self._copy_rows(formatted_rows, upsert=self.supports_upsert() and use_shard_col)
+            return
         doc_ids = set(row['doc_id'] for row in formatted_rows)
         table = self.get_table()
         if self.supports_upsert() and use_shard_col:
@@ -201,10 +397,68 @@ class IndicatorSqlAdapter(IndicatorAdapter):
             #   so it has overhead of format conversions and multiple statements
             insert = table.insert().values(formatted_rows)
             queries = [delete, insert]
-        with self.session_context() as session:
+        with self._write_session() as session:
             for query in queries:
                 session.execute(query)
 
+    @memoized
+    def supports_copy(self):
+        """Return True if rows can be saved with COPY
+
+        Array columns are left to the regular INSERT path.
+        """
+        return not any(isinstance(column.type, postgresql.ARRAY) for column in self.get_table().columns)
+
+    def _copy_rows(self, rows, upsert):
+        """
+        Saves rows by loading them into a temporary table with COPY and
+        merging that into the data source table with a single statement,
+        which is much cheaper than inserting many rows with VALUES.
+
+        The temporary table gets a unique name so that rows can be copied
+        more than once in the same transaction.
+        """
+        table = self.get_table()
+        column_names = list(rows[0])
+        staging_table = sql.Identifier('ucr_copy_staging_{}'.format(uuid.uuid4().hex))
+        data_source_table = sql.Identifier(table.name)
+        columns = sql.SQL(', ').join(sql.Identifier(name) for name in column_names)
+        if upsert:
+            pk_columns = [column.name for column in table.primary_key.columns]
+            merge = [sql.SQL("""
+                INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging}
+                ON CONFLICT ({pk_columns}) DO UPDATE SET {updates}
+            """).format(
+                table=data_source_table,
+                columns=columns,
+                staging=staging_table,
+                pk_columns=sql.SQL(', ').join(sql.Identifier(name) for name in pk_columns),
+                updates=sql.SQL(', ').join(
+                    sql.SQL('{0} = EXCLUDED.{0}').format(sql.Identifier(name))
+                    for name in column_names if name not in pk_columns
+                ),
+            )]
+        else:
+            merge = [
+                sql.SQL('DELETE FROM {table} WHERE doc_id IN (SELECT doc_id FROM {staging})').format(
+                    table=data_source_table, staging=staging_table
+                ),
+                sql.SQL('INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging}').format(
+                    table=data_source_table, columns=columns, staging=staging_table
+                ),
+            ]
+
+        with self._write_session() as session:
+            # COPY needs the psycopg2 cursor
+            cursor = session.connection().connection.cursor()
+            _execute_raw(cursor, sql.SQL(
+                'CREATE TEMPORARY TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP'
+            ).format(staging=staging_table, table=data_source_table))
+            copy = sql.SQL('COPY {staging} ({columns}) FROM STDIN').format(staging=staging_table, columns=columns)
+            _execute_raw(cursor, copy, _get_copy_buffer(rows, column_names))
+            for query in merge:
+                _execute_raw(cursor, query)
+
     def _by_column_update(self, rows):
         config = self.config.sql_settings.citus_config
         shard_col = config.distribution_column
@@ -255,6 +509,11 @@ class IndicatorSqlAdapter(IndicatorAdapter):
         self.save_rows(rows)
 
     def bulk_delete(self, docs, use_shard_col=True):
+        with self._maintaining_rollups({doc['_id'] for doc in docs}):
+            self._bulk_delete(docs, use_shard_col)
+        self._rows_changed()
+
+    def _bulk_delete(self, docs, use_shard_col):
         if self.session_helper.is_citus_db and use_shard_col:
             config = self.config.sql_settings.citus_config
             if config.distribution_type == 'hash':
@@ -263,7 +522,7 @@ class IndicatorSqlAdapter(IndicatorAdapter):
         table = self.get_table()
         doc_ids = [doc['_id'] for doc in docs]
         delete = table.delete(table.c.doc_id.in_(doc_ids))
-        with self.session_context() as session:
+        with self._write_session() as session:
             session.execute(delete)
 
     def _citus_bulk_delete(self, docs, column):
@@ -374,6 +633,14 @@ class MultiDBSqlAdapter(object):
         for adapter in self.all_adapters:
             adapter.drop_table(initiated_by=initiated_by, source=source, skip_log=skip_log)
 
+    def build_rollup_tables(self):
+        for adapter in self.all_adapters:
+            adapter.build_rollup_tables()
+
+    def drop_rollup_tables(self):
+        for adapter in self.all_adapters:
+            adapter.drop_rollup_tables()
+
     @unit_testing_only
     def clear_table(self):
         for adapter in self.all_adapters:
@@ -383,6 +650,15 @@ class MultiDBSqlAdapter(object):
         for adapter in self.all_adapters:
             adapter.save_rows(rows, use_shard_col)
 
+    def save_columns(self, columns):
+        for adapter in self.all_adapters:
+            adapter.save_columns(columns)
+
+    def best_effort_bulk_save(self, docs):
+        docs = list(docs)
+        for adapter in self.all_adapters:
+            adapter.best_effort_bulk_save(docs)
+
     def bulk_save(self, docs):
         for adapter in self.all_adapters:
             adapter.bulk_save(docs)
@@ -398,6 +674,64 @@ class MultiDBSqlAdapter(object):
         ])
 
 
+class ShadowTableBuildAdapter(MultiDBSqlAdapter):
+    """
+    Used while a data source is rebuilt into a shadow table: changes are
+    saved to both the data source table, which is still used for reports,
+    and the shadow table that will replace it.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.main_adapter = self.mirror_adapter_cls(config)
+        self.shadow_adapter = self.main_adapter.shadow_adapter
+        # building, rebuilding and dropping only apply to the data source table
+        self.all_adapters = [self.main_adapter]
+
+    def _save_to_both(self, method, *args):
+        # the data source table may still have the columns of the old definition
+        with _ignore_table_errors(MissingColumnWarning):
+            getattr(self.main_adapter, method)(*args)
+        # the shadow table is gone once it has replaced the data source table
+        with _ignore_table_errors(TableNotFoundWarning):
+            getattr(self.shadow_adapter, method)(*args)
+
+    def best_effort_save(self, doc, eval_context=None):
+        self._save_to_both('best_effort_save', doc, eval_context)
+
+    def save(self, doc, eval_context=None):
+        self._save_to_both('save', doc, eval_context)
+
+    def save_rows(self, rows, use_shard_col=True):
+        self._save_to_both('save_rows', rows, use_shard_col)
+
+    def save_columns(self, columns):
+        self._save_to_both('save_columns', columns)
+
+    def best_effort_bulk_save(self, docs):
+        self._save_to_both('best_effort_bulk_save', list(docs))
+
+    def bulk_save(self, docs):
+        self._save_to_both('bulk_save', list(docs))
+
+    def bulk_delete(self, docs, use_shard_col=True):
+        self._save_to_both('bulk_delete', docs, use_shard_col)
+
+    def delete(self, doc, use_shard_col=True):
+        self.bulk_delete([doc], use_shard_col)
+
+
+@contextmanager
+def _ignore_table_errors(warning_class):
+    try:
+        yield
+    except warning_class:
+        pass
+    except ProgrammingError as e:
+        if not isinstance(translate_programming_error(e), warning_class):
+            raise
+
+
 class ErrorRaisingIndicatorSqlAdapter(IndicatorSqlAdapter):
 
     def handle_exception(self, doc, exception):
@@ -426,7 +760,11 @@ class ErrorRaisingMultiDBAdapter(MultiDBSqlAdapter):
     mirror_adapter_cls = ErrorRaisingIndicatorSqlAdapter
 
 
-def get_indicator_table(indicator_config, metadata, override_table_name=None):
+class ErrorRaisingShadowTableBuildAdapter(ShadowTableBuildAdapter):
+    mirror_adapter_cls = ErrorRaisingIndicatorSqlAdapter
+
+
+def get_indicator_table(indicator_config, metadata, override_table_name=None, unlogged=False):
     sql_columns = [column_to_sql(col) for col in indicator_config.get_columns()]
     table_name = override_table_name or get_table_name(indicator_config.domain, indicator_config.table_id)
     columns_by_col_id = {col.database_column_name.decode('utf-8') for col in indicator_config.get_columns()}
@@ -457,10 +795,57 @@ def get_indicator_table(indicator_config, metadata, override_table_name=None):
     return sqlalchemy.Table(
         table_name,
         metadata,
-        *columns_and_indices
+        *columns_and_indices,
+        prefixes=['UNLOGGED'] if unlogged else []
     )
 
 
+def _execute_raw(cursor, query, copy_file=None):
+    """Execute a query with a psycopg2 cursor
+
+    Errors are raised as the SQLAlchemy errors ``session.execute`` raises,
+    which the error handling of the adapters relies on.
+
+    :param copy_file: file to read the data of a ``COPY ... FROM STDIN`` from
+    """
+    statement = query.as_string(cursor)
+    try:
+        if copy_file is None:
+            cursor.execute(statement)
+        else:
+            cursor.copy_expert(statement, copy_file)
+    except psycopg2.Error as e:
+        raise sqlalchemy.exc.DBAPIError.instance(statement, None, e, psycopg2.Error) from e
+
+
+def _get_copy_buffer(rows, column_names):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_format_copy_value(row[name]) for name in column_names))
+        buffer.write('\n')
+    buffer.seek(0)
+    return buffer
+
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _format_copy_value(value):
+    """Format a value for PostgreSQL's COPY text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    elif isinstance(value, dict):
+        value = json.dumps(value)
+    elif isinstance(value, (bytes, memoryview)):
+        # bytea hex format
+        value = '\\x' + bytes(value).hex()
+    return str(value).translate(_COPY_ESCAPES)
+
+
 def _custom_index_name(table_name, column_ids):
     base_name = "ix_{}_{}".format(table_name, ','.join(column_ids))
     base_hash = hashlib.md5(base_name.encode('utf-8')).hexdigest()
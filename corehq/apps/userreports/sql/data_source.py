@@ -10,8 +10,15 @@ from corehq.apps.userreports.decorators import catch_and_raise_exceptions
 from corehq.apps.userreports.exceptions import InvalidQueryColumn
 from corehq.apps.userreports.mixins import ConfigurableReportDataSourceMixin
 from corehq.apps.userreports.reports.sorting import ASCENDING
-from corehq.apps.userreports.reports.specs import CalculatedColumn
+from corehq.apps.userreports.reports.specs import CalculatedColumn, FieldColumn
+from corehq.apps.userreports.sql.adapter import IndicatorSqlAdapter
+from corehq.apps.userreports.sql.rollups import (
+    REAGGREGATION_TYPES,
+    RollupTableAdapter,
+    get_matching_rollup,
+)
 from corehq.sql_db.connections import connection_manager
+from corehq.toggles import UCR_ROLLUP_TABLES
 
 
 class ConfigurableReportSqlDataSource(ConfigurableReportDataSourceMixin, SqlData):
@@ -26,6 +33,48 @@ class ConfigurableReportSqlDataSource(ConfigurableReportDataSourceMixin, SqlData
     def override_engine_id(self, engine_id):
         self._engine_id = engine_id
 
+    @property
+    def rollup_table(self):
+        """The rollup table to query instead of the data source table, if any"""
+        if not UCR_ROLLUP_TABLES.enabled(self.domain) or self.distinct_on:
+            return None
+        rollup = get_matching_rollup(
+            self.config,
+            self.top_level_columns,
+            self.aggregation_columns,
+            [
+                field for filter_value in self._filter_values.values()
+                for field in filter_value.filter.get('fields') or [filter_value.filter['field']]
+            ],
+        )
+        if rollup is None:
+            return None
+        return self._get_rollup_table(rollup.rollup_id)
+
+    @memoized
+    def _get_rollup_table(self, rollup_id):
+        rollup = [rollup for rollup in self.config.rollups if rollup.rollup_id == rollup_id][0]
+        rollup_table = RollupTableAdapter(IndicatorSqlAdapter(self.config, engine_id=self.engine_id), rollup)
+        return rollup_table if rollup_table.exists() else None
+
+    @property
+    def table_name(self):
+        rollup_table = self.rollup_table
+        if rollup_table is not None:
+            return rollup_table.table_name
+        return super(ConfigurableReportSqlDataSource, self).table_name
+
+    @property
+    def inner_columns(self):
+        rollup_table = self.rollup_table
+        if rollup_table is None:
+            return super(ConfigurableReportSqlDataSource, self).inner_columns
+        return [
+            inner_col for col in self.top_level_columns
+            for inner_col in _get_rollup_column(rollup_table.rollup, col).get_column_config(
+                self.config, self.lang).columns
+        ]
+
     @property
     def filters(self):
         return [_f for _f in [fv.to_sql_filter() for fv in self._filter_values.values()] if _f]
@@ -75,14 +124,14 @@ class ConfigurableReportSqlDataSource(ConfigurableReportDataSourceMixin, SqlData
     @method_decorator(catch_and_raise_exceptions)
     def get_query_strings(self):
         qc = self.query_context()
-        session_helper = connection_manager.get_session_helper(self.engine_id, readonly=True)
+        session_helper = connection_manager.get_session_helper(self.engine_id, readonly=self.use_read_replica)
         with session_helper.session_context() as session:
             return qc.get_query_strings(session.connection())
 
     @method_decorator(catch_and_raise_exceptions)
     def get_total_records(self):
         qc = self.query_context()
-        session_helper = connection_manager.get_session_helper(self.engine_id, readonly=True)
+        session_helper = connection_manager.get_session_helper(self.engine_id, readonly=self.use_read_replica)
         with session_helper.session_context() as session:
             return qc.count(session.connection(), self.filter_values)
 
@@ -96,7 +145,7 @@ class ConfigurableReportSqlDataSource(ConfigurableReportDataSourceMixin, SqlData
             return ''
 
         qc = self.query_context()
-        session_helper = connection_manager.get_session_helper(self.engine_id, readonly=True)
+        session_helper = connection_manager.get_session_helper(self.engine_id, readonly=self.use_read_replica)
         with session_helper.session_context() as session:
             totals = qc.totals(
                 session.connection(),
@@ -111,3 +160,19 @@ class ConfigurableReportSqlDataSource(ConfigurableReportDataSourceMixin, SqlData
         if total_row and total_row[0] == '':
             total_row[0] = ugettext('Total')
         return total_row
+
+
+def _get_rollup_column(rollup, column):
+    """Get a report column that aggregates a measure of a rollup table like ``column``
+    aggregates the data source table
+    """
+    if column.type != 'field':
+        return column
+    for measure in rollup.measures:
+        if (column.field, column.aggregation) == (measure.column_id, measure.aggregation):
+            return FieldColumn.wrap(dict(
+                column.to_json(),
+                field=measure.rollup_column_id,
+                aggregation=REAGGREGATION_TYPES[measure.aggregation],
+            ))
+    return column
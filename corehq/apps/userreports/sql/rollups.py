@@ -0,0 +1,324 @@
+from collections import defaultdict
+
+import sqlalchemy
+from memoized import memoized
+from sqlalchemy import and_, func, or_, select
+
+from corehq.apps.userreports.const import (
+    AGGGREGATION_TYPE_COUNT,
+    AGGGREGATION_TYPE_MAX,
+    AGGGREGATION_TYPE_MIN,
+    AGGGREGATION_TYPE_MONTH,
+    AGGGREGATION_TYPE_SIMPLE,
+    AGGGREGATION_TYPE_SUM,
+    AGGGREGATION_TYPE_YEAR,
+)
+from corehq.apps.userreports.util import get_rollup_table_name
+
+# SQL function used to compute each measure from the data source table
+ROLLUP_FUNCTIONS = {
+    AGGGREGATION_TYPE_COUNT: func.count,
+    AGGGREGATION_TYPE_SUM: func.sum,
+    AGGGREGATION_TYPE_MIN: func.min,
+    AGGGREGATION_TYPE_MAX: func.max,
+}
+
+# aggregation a report uses on a rollup column to get the same result it
+# would get by aggregating the data source table
+REAGGREGATION_TYPES = {
+    AGGGREGATION_TYPE_COUNT: AGGGREGATION_TYPE_SUM,
+    AGGGREGATION_TYPE_SUM: AGGGREGATION_TYPE_SUM,
+    AGGGREGATION_TYPE_MIN: AGGGREGATION_TYPE_MIN,
+    AGGGREGATION_TYPE_MAX: AGGGREGATION_TYPE_MAX,
+}
+
+# the same aggregations of rows that are in memory, ignoring NULLs like SQL does
+PYTHON_ROLLUP_FUNCTIONS = {
+    AGGGREGATION_TYPE_COUNT: len,
+    AGGGREGATION_TYPE_SUM: lambda values: sum(values) if values else None,
+    AGGGREGATION_TYPE_MIN: lambda values: min(values, default=None),
+    AGGGREGATION_TYPE_MAX: lambda values: max(values, default=None),
+}
+
+# number of data source rows in each group, used to delete groups that no
+# longer have any rows
+ROLLUP_ROW_COUNT_COLUMN = 'rollup_row_count'
+
+# report aggregations that group by a column rather than aggregating it
+GROUPING_AGGREGATION_TYPES = (AGGGREGATION_TYPE_SIMPLE, AGGGREGATION_TYPE_MONTH, AGGGREGATION_TYPE_YEAR)
+
+
+class RollupTableAdapter(object):
+    """
+    Builds and maintains a rollup table of a data source table.
+
+    The rollup table is built from the data source table once the data source
+    has been built. After that, when rows are saved or deleted, the aggregates
+    of their old rows are subtracted from their groups and those of their new
+    rows are added. Only groups whose min or max may have been one of the old
+    rows are recomputed from the data source table. If the rollup table does
+    not exist (e.g. while the data source is rebuilt) it is left alone and
+    reports query the data source table.
+
+    Changes are applied in the transaction that changes the data source rows,
+    holding the rollup table's lock (see ``lock``).
+    """
+
+    def __init__(self, adapter, rollup):
+        self.adapter = adapter
+        self.rollup = rollup
+        self.table_name = get_rollup_table_name(adapter.config.domain, adapter.config.table_id, rollup)
+
+    @property
+    def source_column_ids(self):
+        """Data source columns the rollup is computed from"""
+        return self.rollup.group_by + [measure.column_id for measure in self.rollup.measures]
+
+    @property
+    def engine(self):
+        return self.adapter.engine
+
+    @memoized
+    def get_table(self):
+        source_table = self.adapter.get_table()
+        group_columns = [
+            sqlalchemy.Column(column_id, source_table.c[column_id].type)
+            for column_id in self.rollup.group_by
+        ]
+        measure_columns = [
+            sqlalchemy.Column(
+                measure.rollup_column_id,
+                _get_measure_type(measure, source_table.c[measure.column_id].type)
+            )
+            for measure in self.rollup.measures
+        ]
+        return sqlalchemy.Table(
+            self.table_name,
+            sqlalchemy.MetaData(),
+            *group_columns + measure_columns,
+            sqlalchemy.Column(ROLLUP_ROW_COUNT_COLUMN, sqlalchemy.BigInteger, nullable=False),
+            sqlalchemy.Index('ix_{}'.format(self.table_name), *self.rollup.group_by)
+        )
+
+    def exists(self, connection=None):
+        if connection is None:
+            return self.engine.has_table(self.table_name)
+        return self.engine.dialect.has_table(connection, self.table_name)
+
+    def lock(self, connection):
+        """Lock the rollup table until the transaction of ``connection`` ends
+
+        Changes to data source rows hold the lock from reading the old rows
+        until the rollup table is updated, so that concurrent changes to the
+        same rows are applied one after the other, and can't be applied while
+        the rollup table is built or dropped.
+
+        :returns: whether the rollup table exists
+        """
+        self._lock(connection)
+        return self.exists(connection)
+
+    def build(self):
+        """(Re)build the rollup table from the whole data source table"""
+        table = self.get_table()
+        with self.engine.begin() as connection:
+            self._lock(connection)
+            table.drop(connection, checkfirst=True)
+            table.create(connection)
+            connection.execute(self._insert())
+            connection.execute(f'ANALYZE "{table.name}"')
+
+    def drop(self):
+        with self.engine.begin() as connection:
+            self._lock(connection)
+            self.get_table().drop(connection, checkfirst=True)
+
+    def apply_changes(self, connection, old_rows, new_rows):
+        """Update the rollup table after data source rows changed
+
+        Must be called in the transaction that changed the rows, holding the
+        lock taken by ``lock``.
+
+        :param old_rows: the changed rows before the change, as dicts
+        :param new_rows: the changed rows after the change, as dicts
+        """
+        old_groups = self._aggregate_groups(old_rows)
+        new_groups = self._aggregate_groups(new_rows)
+        changed_keys = [
+            group_key for group_key in set(old_groups) | set(new_groups)
+            if old_groups.get(group_key) != new_groups.get(group_key)
+        ]
+        if not changed_keys:
+            return
+        stale_keys = [
+            group_key for group_key in changed_keys
+            if not self._apply_group_change(
+                connection, group_key, old_groups.get(group_key), new_groups.get(group_key)
+            )
+        ]
+        if stale_keys:
+            self._recompute_extremes(connection, stale_keys)
+
+    def _aggregate_groups(self, rows):
+        rows_by_group = defaultdict(list)
+        for row in rows:
+            rows_by_group[tuple(row[column_id] for column_id in self.rollup.group_by)].append(row)
+        return {
+            group_key: self._aggregate(group_rows)
+            for group_key, group_rows in rows_by_group.items()
+        }
+
+    def _aggregate(self, rows):
+        values = {ROLLUP_ROW_COUNT_COLUMN: len(rows)}
+        for measure in self.rollup.measures:
+            values[measure.rollup_column_id] = PYTHON_ROLLUP_FUNCTIONS[measure.aggregation]([
+                row[measure.column_id] for row in rows if row[measure.column_id] is not None
+            ])
+        return values
+
+    def _apply_group_change(self, connection, group_key, old_values, new_values):
+        """Subtract the aggregates of a group's old rows and add those of its new rows
+
+        :returns: False if the group's min or max measures must be recomputed
+        """
+        table = self.get_table()
+        old_values = old_values or self._aggregate([])
+        new_values = new_values or self._aggregate([])
+        row_count = table.c[ROLLUP_ROW_COUNT_COLUMN]
+        updates = {
+            row_count: row_count + new_values[ROLLUP_ROW_COUNT_COLUMN] - old_values[ROLLUP_ROW_COUNT_COLUMN],
+        }
+        is_current = True
+        for measure in self.rollup.measures:
+            column = table.c[measure.rollup_column_id]
+            old_value = old_values[measure.rollup_column_id]
+            new_value = new_values[measure.rollup_column_id]
+            if measure.aggregation == AGGGREGATION_TYPE_COUNT:
+                updates[column] = column + new_value - old_value
+            elif measure.aggregation == AGGGREGATION_TYPE_SUM:
+                if old_value is not None or new_value is not None:
+                    updates[column] = func.coalesce(column, 0) + (new_value or 0) - (old_value or 0)
+            elif measure.aggregation in (AGGGREGATION_TYPE_MIN, AGGGREGATION_TYPE_MAX):
+                is_min = measure.aggregation == AGGGREGATION_TYPE_MIN
+                if new_value is not None:
+                    # LEAST and GREATEST ignore NULLs
+                    updates[column] = (func.least if is_min else func.greatest)(column, new_value)
+                if old_value is not None and (
+                    new_value is None or (new_value > old_value if is_min else new_value < old_value)
+                ):
+                    # the old rows may have held the group's min or max
+                    is_current = False
+
+        match = _match_groups(table, self.rollup.group_by, [group_key])
+        result = connection.execute(table.update().where(match).values(updates).returning(row_count)).fetchall()
+        if not result:
+            if new_values[ROLLUP_ROW_COUNT_COLUMN]:
+                connection.execute(table.insert().values(
+                    dict(zip(self.rollup.group_by, group_key), **new_values)
+                ))
+            return True
+        if result[0][0] <= 0:
+            connection.execute(table.delete().where(match))
+            return True
+        return is_current
+
+    def _recompute_extremes(self, connection, group_keys):
+        """Recompute the min and max measures of ``group_keys`` from the data source table"""
+        source_table = self.adapter.get_table()
+        table = self.get_table()
+        measures = [
+            measure for measure in self.rollup.measures
+            if measure.aggregation in (AGGGREGATION_TYPE_MIN, AGGGREGATION_TYPE_MAX)
+        ]
+        group_columns = [source_table.c[column_id] for column_id in self.rollup.group_by]
+        query = select(group_columns + [
+            _aggregate_measure(source_table, measure)
+            for measure in measures
+        ]).where(
+            _match_groups(source_table, self.rollup.group_by, group_keys)
+        ).group_by(*group_columns)
+        for row in connection.execute(query).fetchall():
+            group_key = tuple(row[column_id] for column_id in self.rollup.group_by)
+            connection.execute(
+                table.update()
+                .where(_match_groups(table, self.rollup.group_by, [group_key]))
+                .values({measure.rollup_column_id: row[measure.rollup_column_id] for measure in measures})
+            )
+
+    def _insert(self):
+        source_table = self.adapter.get_table()
+        group_columns = [source_table.c[column_id] for column_id in self.rollup.group_by]
+        query = select(group_columns + [
+            _aggregate_measure(source_table, measure)
+            for measure in self.rollup.measures
+        ] + [func.count().label(ROLLUP_ROW_COUNT_COLUMN)]).group_by(*group_columns)
+        return self.get_table().insert().from_select(
+            self.rollup.group_by
+            + [measure.rollup_column_id for measure in self.rollup.measures]
+            + [ROLLUP_ROW_COUNT_COLUMN],
+            query
+        )
+
+    def _lock(self, connection):
+        connection.execute(select([func.pg_advisory_xact_lock(func.hashtext(self.table_name))]))
+
+
+def _aggregate_measure(source_table, measure):
+    aggregate = ROLLUP_FUNCTIONS[measure.aggregation]
+    return aggregate(source_table.c[measure.column_id]).label(measure.rollup_column_id)
+
+
+def _get_measure_type(measure, column_type):
+    if measure.aggregation == AGGGREGATION_TYPE_COUNT:
+        return sqlalchemy.BigInteger
+    if measure.aggregation == AGGGREGATION_TYPE_SUM:
+        return sqlalchemy.Numeric if isinstance(column_type, sqlalchemy.Numeric) else sqlalchemy.BigInteger
+    return column_type
+
+
+def _match_groups(table, group_by, group_keys):
+    # "column = NULL" is compiled to "column IS NULL"
+    return or_(*[
+        and_(*[table.c[column_id] == value for column_id, value in zip(group_by, group_key)])
+        for group_key in group_keys
+    ])
+
+
+def get_matching_rollup(config, report_columns, aggregation_columns, filter_fields):
+    """
+    Get the smallest rollup of a data source that a report can be queried from.
+
+    :param report_columns: the report's top level columns
+    :param aggregation_columns: column IDs the report groups by
+    :param filter_fields: data source columns the report filters on
+    :returns: a ``RollupTableSpec`` or None
+    """
+    # aggregate data sources don't have rollups
+    if not getattr(config, 'rollups', None) or not aggregation_columns:
+        return None
+
+    columns_by_id = {column.column_id: column for column in report_columns}
+    group_fields = set(filter_fields)
+    measures = set()
+    for column in report_columns:
+        if column.type == 'expression':
+            # calculated from the other columns after the query
+            continue
+        if column.type != 'field':
+            return None
+        if column.aggregation in GROUPING_AGGREGATION_TYPES:
+            group_fields.add(column.field)
+        elif column.aggregation in REAGGREGATION_TYPES:
+            measures.add((column.field, column.aggregation))
+        else:
+            return None
+    for column_id in aggregation_columns:
+        column = columns_by_id.get(column_id)
+        group_fields.add(column.field if column is not None and column.type == 'field' else column_id)
+
+    rollups = [
+        rollup for rollup in config.rollups
+        if group_fields <= set(rollup.group_by)
+        and measures <= {(measure.column_id, measure.aggregation) for measure in rollup.measures}
+    ]
+    return min(rollups, key=lambda rollup: len(rollup.group_by), default=None)
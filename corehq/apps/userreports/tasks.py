@@ -3,8 +3,8 @@ from collections import defaultdict
 from datetime import datetime, timedelta
 
 from django.conf import settings
-from django.db import DatabaseError, InternalError, transaction
-from django.db.models import Count, Min
+from django.db import DatabaseError, IntegrityError, InternalError, transaction
+from django.db.models import Count, Min, Q
 from django.utils.translation import ugettext as _
 
 from botocore.vendored.requests.exceptions import ReadTimeout
@@ -43,6 +43,7 @@ from corehq.apps.userreports.const import (
 )
 from corehq.apps.userreports.exceptions import (
     StaticDataSourceConfigurationNotFoundError,
+    TableRebuildError,
 )
 from corehq.apps.userreports.models import (
     AsyncIndicator,
@@ -51,11 +52,15 @@ from corehq.apps.userreports.models import (
     get_report_config,
     id_is_static,
 )
-from corehq.apps.userreports.rebuild import DataSourceResumeHelper
+from corehq.apps.userreports.rebuild import (
+    DataSourceResumeHelper,
+    get_rebuild_partitions,
+    iter_partition_doc_ids,
+)
+from corehq.apps.userreports.related_docs import get_evaluation_contexts
 from corehq.apps.userreports.reports.data_source import (
     ConfigurableReportDataSource,
 )
-from corehq.apps.userreports.specs import EvaluationContext
 from corehq.apps.userreports.util import (
     get_async_indicator_modify_lock_key,
     get_indicator_adapter,
@@ -76,17 +81,27 @@ def _get_config_by_id(indicator_config_id):
         return DataSourceConfiguration.get(indicator_config_id)
 
 
-def _build_indicators(config, document_store, relevant_ids):
+def _build_indicators(config, document_store, relevant_ids, shadow=False):
     adapter = get_indicator_adapter(config, raise_errors=True, load_source='build_indicators')
+    if shadow:
+        adapter = adapter.shadow_adapter
 
-    for doc in document_store.iter_documents(relevant_ids):
-        if config.asynchronous:
-            AsyncIndicator.update_record(
-                doc.get('_id'), config.referenced_doc_type, config.domain, [config._id]
-            )
-        else:
-            # save is a noop if the filter doesn't match
-            adapter.best_effort_save(doc)
+    if not config.asynchronous:
+        # documents that don't match the filter have no rows to save
+        adapter.best_effort_bulk_save(document_store.iter_documents(relevant_ids))
+        return
+
+    # queue all documents together, the documents are fetched when the indicators are processed
+    try:
+        AsyncIndicator.bulk_update_records(
+            {doc_id: [config._id] for doc_id in relevant_ids},
+            config.domain,
+            {doc_id: config.referenced_doc_type for doc_id in relevant_ids},
+        )
+    except IntegrityError:
+        # some of the documents were queued since they were checked, add them one at a time
+        for doc_id in relevant_ids:
+            AsyncIndicator.update_record(doc_id, config.referenced_doc_type, config.domain, [config._id])
 
 
 @task(serializer='pickle', queue=UCR_CELERY_QUEUE, ignore_result=True)
@@ -109,6 +124,20 @@ def rebuild_indicators(indicator_config_id, initiated_by=None, limit=-1, source=
             elif adapter.engine_id != engine_id:
                 raise AssertionError("Engine ID does not match adapter")
 
+        if _can_rebuild_with_shadow_table(config, limit, engine_id):
+            if config.is_building_shadow_table:
+                # the tasks of the running build would keep writing to the new shadow table
+                raise TableRebuildError(
+                    'UCR table {} is already being rebuilt, resume that build instead'.format(config.table_id))
+            config.meta.build.initiated_shadow = datetime.utcnow()
+            config.meta.build.finished_shadow = False
+            config.meta.build.rebuilt_asynchronously = False
+            # raises ResourceConflict if another rebuild started since the config was loaded
+            config.save()
+            adapter.build_shadow_table(initiated_by=initiated_by, source=source, diffs=diffs)
+            _iteratively_build_table(config, shadow=True)
+            return
+
         if not id_is_static(indicator_config_id):
             # Save the start time now in case anything goes wrong. This way we'll be
             # able to see if the rebuild started a long time ago without finishing.
@@ -122,6 +151,26 @@ def rebuild_indicators(indicator_config_id, initiated_by=None, limit=-1, source=
         _iteratively_build_table(config, limit=limit)
 
 
+def _can_rebuild_with_shadow_table(config, limit, engine_id):
+    """
+    Whether the table can be rebuilt into a shadow table that replaces it when it
+    has been built, instead of being emptied and rebuilt while reports use it.
+
+    Only for data sources whose build state is saved (the pillow uses it to save
+    changes to the shadow table too), that are built synchronously and that
+    don't use mirrored or Citus distributed tables.
+    """
+    return (
+        limit == -1
+        and engine_id in (None, config.engine_id)
+        and not id_is_static(config._id)
+        and not config.asynchronous
+        and not config.mirrored_engine_ids
+        and not config.sql_settings.citus_config.distribution_type
+        and toggles.UCR_SHADOW_TABLE_REBUILD.enabled(config.domain)
+    )
+
+
 @task(serializer='pickle', queue=UCR_CELERY_QUEUE, ignore_result=True)
 def rebuild_indicators_in_place(indicator_config_id, initiated_by=None, source=None):
     config = _get_config_by_id(indicator_config_id)
@@ -136,6 +185,8 @@ def rebuild_indicators_in_place(indicator_config_id, initiated_by=None, source=N
             config.meta.build.rebuilt_asynchronously = False
             config.save()
 
+        # rollups are rebuilt when the data source has been rebuilt
+        adapter.drop_rollup_tables()
         adapter.build_table(initiated_by=initiated_by, source=source)
         _iteratively_build_table(config, in_place=True)
 
@@ -153,13 +204,17 @@ def resume_building_indicators(indicator_config_id, initiated_by=None):
             initiated_by=initiated_by,
             source='resume_building_indicators',
         )
-        _iteratively_build_table(config, resume_helper)
+        _iteratively_build_table(config, resume_helper, shadow=config.is_building_shadow_table)
 
 
-def _iteratively_build_table(config, resume_helper=None, in_place=False, limit=-1):
+def _iteratively_build_table(config, resume_helper=None, in_place=False, limit=-1, shadow=False):
+    resuming = resume_helper is not None
     resume_helper = resume_helper or DataSourceResumeHelper(config)
-    indicator_config_id = config._id
     case_type_or_xmlns_list = config.get_case_type_or_xmlns_filter()
+    if limit == -1 and toggles.UCR_PARTITIONED_REBUILD.enabled(config.domain):
+        _build_table_partitioned(config, resume_helper, resuming, case_type_or_xmlns_list, in_place, shadow)
+        return
+
     completed_ct_xmlns = resume_helper.get_completed_case_type_or_xmlns()
     if completed_ct_xmlns:
         case_type_or_xmlns_list = [
@@ -181,18 +236,74 @@ def _iteratively_build_table(config, resume_helper=None, in_place=False, limit=-
                 break
             relevant_ids.append(relevant_id)
             if len(relevant_ids) >= ID_CHUNK_SIZE:
-                _build_indicators(config, document_store, relevant_ids)
+                _build_indicators(config, document_store, relevant_ids, shadow)
                 relevant_ids = []
 
         if relevant_ids:
-            _build_indicators(config, document_store, relevant_ids)
+            _build_indicators(config, document_store, relevant_ids, shadow)
 
         resume_helper.add_completed_case_type_or_xmlns(case_type_or_xmlns)
 
+    _finish_building_table(config, resume_helper, in_place, shadow)
+
+
+def _build_table_partitioned(config, resume_helper, resuming, case_type_or_xmlns_list, in_place, shadow):
+    """Queue a task for every partition of the rebuild that hasn't been built yet"""
+    if not (resuming and resume_helper.has_partitions()):
+        resume_helper.clear_resume_info()
+        partitions = get_rebuild_partitions(config, case_type_or_xmlns_list)
+        if not partitions:
+            _finish_building_table(config, resume_helper, in_place, shadow)
+            return
+        resume_helper.set_partitions(partitions)
+
+    for progress in resume_helper.get_partitions_progress():
+        if not progress.complete:
+            build_indicators_partition.delay(config._id, progress.partition, in_place=in_place, shadow=shadow)
+
+
+@task(serializer='pickle', queue=UCR_CELERY_QUEUE, ignore_result=True, acks_late=True)
+def build_indicators_partition(indicator_config_id, partition, in_place=False, shadow=False):
+    config = _get_config_by_id(indicator_config_id)
+    resume_helper = DataSourceResumeHelper(config)
+    progress = resume_helper.get_partition_progress(partition)
+    if progress is None or progress.complete:
+        # the partition was already built or a newer rebuild was started
+        return
+
+    document_store = get_document_store_for_doc_type(
+        config.domain, config.referenced_doc_type,
+        case_type_or_xmlns=partition.case_type_or_xmlns,
+        load_source="build_indicators",
+    )
+    for doc_ids, last_pk in iter_partition_doc_ids(config, partition, document_store, progress.last_pk):
+        _build_indicators(config, document_store, doc_ids, shadow)
+        progress.doc_count += len(doc_ids)
+        progress.last_pk = last_pk
+        resume_helper.set_partition_progress(progress)
+
+    progress.complete = True
+    resume_helper.set_partition_progress(progress)
+    build_progress = resume_helper.get_build_progress()
+    # the last partitions can complete at the same time
+    if build_progress and build_progress.complete and resume_helper.claim_finish():
+        _finish_building_table(config, resume_helper, in_place, shadow)
+
+
+def _finish_building_table(config, resume_helper, in_place, shadow=False):
+    adapter = get_indicator_adapter(config)
+    if shadow:
+        if not _is_current_shadow_build(config):
+            # the shadow table belongs to a newer build, which swaps it in
+            return
+        adapter.swap_shadow_table()
+    adapter.build_rollup_tables()
     resume_helper.clear_resume_info()
-    if not id_is_static(indicator_config_id):
+    if not id_is_static(config._id):
         if in_place:
             config.meta.build.finished_in_place = True
+        elif shadow:
+            config.meta.build.finished_shadow = True
         else:
             config.meta.build.finished = True
         try:
@@ -203,12 +314,23 @@ def _iteratively_build_table(config, resume_helper=None, in_place=False, limit=-
             if in_place:
                 if config.meta.build.initiated_in_place == current_config.meta.build.initiated_in_place:
                     current_config.meta.build.finished_in_place = True
+            elif shadow:
+                if config.meta.build.initiated_shadow == current_config.meta.build.initiated_shadow:
+                    current_config.meta.build.finished_shadow = True
             else:
                 if config.meta.build.initiated == current_config.meta.build.initiated:
                     current_config.meta.build.finished = True
             current_config.save()
 
 
+def _is_current_shadow_build(config):
+    current_config = DataSourceConfiguration.get(config._id)
+    return (
+        current_config.is_building_shadow_table
+        and current_config.meta.build.initiated_shadow == config.meta.build.initiated_shadow
+    )
+
+
 @task(serializer='pickle', queue=UCR_CELERY_QUEUE)
 def compare_ucr_dbs(domain, report_config_id, filter_values, sort_column=None, sort_order=None, params=None):
     if report_config_id not in settings.UCR_COMPARISONS:
@@ -328,21 +450,37 @@ def queue_async_indicators():
         This task quits after it has run for more than
         ASYNC_INDICATOR_QUEUE_TIME - 30 seconds i.e 4 minutes 30 seconds.
         While it runs, it clubs fetched AsyncIndicators by domain and doc type and queue them for processing.
+
+        No more than settings.ASYNC_INDICATORS_TO_QUEUE indicators are queued at any time,
+        so indicators are only queued as fast as they are processed.
     """
     start = datetime.utcnow()
     cutoff = start + ASYNC_INDICATOR_QUEUE_TIME - timedelta(seconds=30)
     retry_threshold = start - timedelta(hours=4)
-    # don't requeue anything that has been retried more than ASYNC_INDICATOR_MAX_RETRIES times
-    indicators = AsyncIndicator.objects.filter(unsuccessful_attempts__lt=ASYNC_INDICATOR_MAX_RETRIES)[:settings.ASYNC_INDICATORS_TO_QUEUE]
+
+    in_flight = AsyncIndicator.objects.filter(date_queued__gte=retry_threshold).count()
+    metrics_gauge('commcare.async_indicator.in_flight', in_flight, multiprocess_mode=MPM_MAX)
+    to_queue = settings.ASYNC_INDICATORS_TO_QUEUE - in_flight
+    if to_queue <= 0:
+        metrics_counter('commcare.async_indicator.queue_throttled')
+        return
+
+    # only requeue things that are not in queue or were last queued earlier than the threshold
+    # and don't requeue anything that has been retried more than ASYNC_INDICATOR_MAX_RETRIES times
+    indicators = AsyncIndicator.objects.filter(
+        Q(date_queued__isnull=True) | Q(date_queued__lt=retry_threshold),
+        unsuccessful_attempts__lt=ASYNC_INDICATOR_MAX_RETRIES,
+    )[:to_queue]
 
     indicators_by_domain_doc_type = defaultdict(list)
     # page so that envs can have arbitarily large settings.ASYNC_INDICATORS_TO_QUEUE
     for indicator in paginated_queryset(indicators, 1000):
-        # only requeue things that are not in queue or were last queued earlier than the threshold
-        if not indicator.date_queued or indicator.date_queued < retry_threshold:
-            indicators_by_domain_doc_type[(indicator.domain, indicator.doc_type)].append(indicator)
+        indicators_by_domain_doc_type[(indicator.domain, indicator.doc_type)].append(indicator)
 
     for k, indicators in indicators_by_domain_doc_type.items():
+        # keep indicators for the same data sources together so that each
+        # task saves as many rows as possible to each data source
+        indicators.sort(key=lambda indicator: indicator.indicator_config_ids)
         _queue_indicators(indicators)
         if datetime.utcnow() > cutoff:
             break
@@ -374,7 +512,6 @@ def build_indicators_with_agg_queue(indicator_doc_ids):
 def build_async_indicators(indicator_doc_ids):
     # written to be used with _queue_indicators, indicator_doc_ids must
     #   be a chunk of 100
-    memoizers = {'configs': {}, 'adapters': {}}
     assert(len(indicator_doc_ids)) <= ASYNC_INDICATOR_CHUNK_SIZE
 
     def handle_exception(exception, config_id, doc, adapter):
@@ -388,37 +525,10 @@ def build_async_indicators(indicator_doc_ids):
             # a database had an issue so log it and go on to the next document
             metric = 'commcare.async_indicator.psql_error'
         else:
-            # getting the config could fail before the adapter is set
-            if adapter:
-                adapter.handle_exception(doc, exception)
+            adapter.handle_exception(doc, exception)
         if metric:
             metrics_counter(metric, tags={'config_id': config_id})
 
-    def doc_ids_from_rows(rows):
-        formatted_rows = [
-            {column.column.database_column_name.decode('utf-8'): column.value for column in row}
-            for row in rows
-        ]
-        return set(row['doc_id'] for row in formatted_rows)
-
-    def _get_config(config_id):
-        config_by_id = memoizers['configs']
-        if config_id in config_by_id:
-            return config_by_id[config_id]
-        else:
-            config = _get_config_by_id(config_id)
-            config_by_id[config_id] = config
-            return config
-
-    def _get_adapter(config):
-        adapter_by_config = memoizers['adapters']
-        if config._id in adapter_by_config:
-            return adapter_by_config[config._id]
-        else:
-            adapter = get_indicator_adapter(config, load_source='build_async_indicators')
-            adapter_by_config[config._id] = adapter
-            return adapter
-
     def _metrics_timer(step, config_id=None):
         tags = {
             'action': step,
@@ -436,14 +546,14 @@ def build_async_indicators(indicator_doc_ids):
     # tracks processed/deleted configs to be removed from each indicator
     configs_to_remove_by_indicator_id = defaultdict(list)
 
-    def _mark_config_to_remove(config_id, indicator_ids):
-        for _id in indicator_ids:
-            configs_to_remove_by_indicator_id[_id].append(config_id)
+    def _mark_config_to_remove(config_id, indicators):
+        for indicator in indicators:
+            configs_to_remove_by_indicator_id[indicator.pk].append(config_id)
 
     timer = TimingContext()
     lock_keys = [
         get_async_indicator_modify_lock_key(indicator_doc_id)
-        for indicator_doc_id in indicator_doc_ids
+        for indicator_doc_id in set(indicator_doc_ids)
     ]
     with CriticalSection(lock_keys):
         all_indicators = AsyncIndicator.objects.filter(
@@ -452,70 +562,86 @@ def build_async_indicators(indicator_doc_ids):
         if not all_indicators:
             return
 
+        domain = all_indicators[0].domain
         doc_store = get_document_store_for_doc_type(
-            all_indicators[0].domain, all_indicators[0].doc_type,
+            domain, all_indicators[0].doc_type,
             load_source="build_async_indicators",
         )
         failed_indicators = set()
 
-        rows_to_save_by_adapter = defaultdict(list)
-        docs_to_delete_by_adapter = defaultdict(list)
         # there will always be one AsyncIndicator per doc id
         indicator_by_doc_id = {i.doc_id: i for i in all_indicators}
-        config_ids = set()
+        doc_ids_by_config_id = defaultdict(set)
+        for indicator in all_indicators:
+            for config_id in indicator.indicator_config_ids:
+                doc_ids_by_config_id[config_id].add(indicator.doc_id)
+        config_ids = set(doc_ids_by_config_id)
+
         with timer:
-            for doc in doc_store.iter_documents(list(indicator_by_doc_id.keys())):
-                indicator = indicator_by_doc_id[doc['_id']]
-                eval_context = EvaluationContext(doc)
-                for config_id in indicator.indicator_config_ids:
-                    with _metrics_timer('transform', config_id):
-                        config_ids.add(config_id)
-                        try:
-                            config = _get_config(config_id)
-                        except (ResourceNotFound, StaticDataSourceConfigurationNotFoundError):
-                            celery_task_logger.info("{} no longer exists, skipping".format(config_id))
-                            # remove because the config no longer exists
-                            _mark_config_to_remove(config_id, [indicator.pk])
-                            continue
-                        except ESError:
-                            celery_task_logger.info("ES errored when trying to retrieve config")
-                            failed_indicators.add(indicator)
+            adapters = []
+            for config_id, doc_ids in doc_ids_by_config_id.items():
+                indicators = [indicator_by_doc_id[doc_id] for doc_id in doc_ids]
+                try:
+                    config = _get_config_by_id(config_id)
+                except (ResourceNotFound, StaticDataSourceConfigurationNotFoundError):
+                    celery_task_logger.info("{} no longer exists, skipping".format(config_id))
+                    # remove because the config no longer exists
+                    _mark_config_to_remove(config_id, indicators)
+                    continue
+                except ESError:
+                    celery_task_logger.info("ES errored when trying to retrieve config")
+                    failed_indicators.update(indicators)
+                    continue
+                try:
+                    adapters.append(get_indicator_adapter(config, load_source='build_async_indicators'))
+                except Exception:
+                    notify_exception(None, "Exception getting adapter for async indicators: {}".format(config_id))
+                    failed_indicators.update(indicators)
+
+            # fetch the documents once for all data sources
+            with _metrics_timer('extract'):
+                docs = list(doc_store.iter_documents(list(indicator_by_doc_id)))
+                eval_contexts = get_evaluation_contexts(domain, [adapter.config for adapter in adapters], docs)
+
+            for adapter in adapters:
+                config_id = adapter.config._id
+                doc_ids = doc_ids_by_config_id[config_id]
+                rows_to_save = []
+                docs_to_delete = []
+                with _metrics_timer('transform', config_id):
+                    for doc in docs:
+                        if doc['_id'] not in doc_ids:
                             continue
-                        adapter = None
+                        eval_context = eval_contexts[doc['_id']]
                         try:
-                            adapter = _get_adapter(config)
-                            rows_to_save = adapter.get_all_values(doc, eval_context)
-                            if rows_to_save:
-                                rows_to_save_by_adapter[adapter].extend(rows_to_save)
-                            else:
-                                docs_to_delete_by_adapter[adapter].append(doc)
-                            eval_context.reset_iteration()
+                            rows = adapter.get_all_values(doc, eval_context)
                         except Exception as e:
-                            failed_indicators.add(indicator)
+                            failed_indicators.add(indicator_by_doc_id[doc['_id']])
                             handle_exception(e, config_id, doc, adapter)
+                        else:
+                            if rows:
+                                rows_to_save.extend(rows)
+                            else:
+                                docs_to_delete.append(doc)
+                        finally:
+                            eval_context.reset_iteration()
 
-            with _metrics_timer('single_batch_update'):
-                for adapter, rows in rows_to_save_by_adapter.items():
-                    doc_ids = doc_ids_from_rows(rows)
-                    indicators = [indicator_by_doc_id[doc_id] for doc_id in doc_ids]
-                    try:
-                        with _metrics_timer('update', adapter.config._id):
-                            adapter.save_rows(rows, use_shard_col=True)
-                    except Exception as e:
-                        failed_indicators.union(indicators)
-                        message = str(e)
-                        notify_exception(None, "Exception bulk saving async indicators:{}".format(message))
-                    else:
-                        # remove because it's successfully processed
-                        _mark_config_to_remove(
-                            config_id,
-                            [i.pk for i in indicators]
-                        )
-
-            with _metrics_timer('single_batch_delete'):
-                for adapter, docs in docs_to_delete_by_adapter.items():
-                    with _metrics_timer('delete', adapter.config._id):
-                        adapter.bulk_delete(docs)
+                saved_doc_ids = _doc_ids_from_rows(rows_to_save) | {doc['_id'] for doc in docs_to_delete}
+                indicators = [indicator_by_doc_id[doc_id] for doc_id in saved_doc_ids]
+                try:
+                    # one bulk save and delete per data source
+                    with _metrics_timer('update', config_id):
+                        adapter.save_rows(rows_to_save, use_shard_col=True)
+                    if docs_to_delete:
+                        with _metrics_timer('delete', config_id):
+                            adapter.bulk_delete(docs_to_delete)
+                except Exception as e:
+                    failed_indicators.update(indicators)
+                    message = str(e)
+                    notify_exception(None, "Exception bulk saving async indicators:{}".format(message))
+                else:
+                    # remove because it's successfully processed
+                    _mark_config_to_remove(config_id, indicators)
 
         # delete fully processed indicators
         processed_indicators = set(all_indicators) - failed_indicators
@@ -541,6 +667,15 @@ def build_async_indicators(indicator_doc_ids):
         )
 
 
+def _doc_ids_from_rows(rows):
+    return {
+        column.value
+        for row in rows
+        for column in row
+        if column.column.database_column_name == b'doc_id'
+    }
+
+
 @periodic_task(run_every=crontab(minute="*/5"), queue=settings.CELERY_PERIODIC_QUEUE)
 def async_indicators_metrics():
     now = datetime.utcnow()
@@ -1,6 +1,7 @@
 import uuid
+from datetime import datetime
 
-from django.test import SimpleTestCase, TestCase
+from django.test import SimpleTestCase, TestCase, override_settings
 
 import mock
 
@@ -10,6 +11,7 @@ from corehq.apps.userreports.models import (
     AsyncIndicator,
     DataSourceConfiguration,
 )
+from corehq.apps.userreports.sql.adapter import IndicatorSqlAdapter
 from corehq.apps.userreports.tasks import build_async_indicators, queue_async_indicators
 from corehq.apps.userreports.tests.utils import load_data_from_db
 from corehq.apps.userreports.util import get_indicator_adapter, get_table_name
@@ -275,3 +277,41 @@ class BulkAsyncIndicatorProcessingTest(TestCase):
             mock.call('commcare.async_indicator.processed_success', 0),
             mock.call('commcare.async_indicator.processed_fail', 10)
         ])
+
+    def test_save_failure(self):
+        AsyncIndicator.objects.filter(
+            doc_id__in=self.doc_ids
+        ).update(indicator_config_ids=[self.config1._id, self.config2._id])
+        original_save_rows = IndicatorSqlAdapter.save_rows
+
+        def save_rows(adapter, rows, use_shard_col=True):
+            if adapter.config._id == self.config2._id:
+                raise Exception("save failed")
+            original_save_rows(adapter, rows, use_shard_col)
+
+        with mock.patch.object(IndicatorSqlAdapter, 'save_rows', new=save_rows), \
+                mock.patch('corehq.apps.userreports.tasks.notify_exception'):
+            build_async_indicators(self.doc_ids)
+
+        self._assert_rows_in_ucr_table(self.config1, [
+            {'doc_id': d["_id"], 'name': d["name"]} for d in self.docs
+        ])
+        # only the data source that failed is left to be processed
+        self.assertEqual(
+            AsyncIndicator.objects.filter(indicator_config_ids=[self.config2._id]).count(),
+            10
+        )
+
+    @mock.patch('corehq.apps.userreports.tasks.build_async_indicators')
+    def test_queue_async_indicators_backpressure(self, patched_build):
+        AsyncIndicator.objects.filter(doc_id__in=self.doc_ids[:4]).update(date_queued=datetime.utcnow())
+        with override_settings(ASYNC_INDICATORS_TO_QUEUE=4):
+            queue_async_indicators()
+        patched_build.delay.assert_not_called()
+
+        with override_settings(ASYNC_INDICATORS_TO_QUEUE=6):
+            queue_async_indicators()
+        patched_build.delay.assert_called_once()
+        queued_doc_ids = patched_build.delay.call_args[0][0]
+        self.assertEqual(len(queued_doc_ids), 2)
+        self.assertFalse(set(queued_doc_ids) & set(self.doc_ids[:4]))
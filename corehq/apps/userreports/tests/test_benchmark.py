@@ -0,0 +1,56 @@
+from django.test import SimpleTestCase
+
+from corehq.apps.userreports.benchmark import (
+    DocumentGenerator,
+    benchmark_data_source,
+    get_data_sources,
+)
+from corehq.apps.userreports.tests.utils import (
+    get_data_source_with_related_doc_type,
+    get_data_source_with_repeat,
+    get_sample_data_source,
+)
+
+
+class BenchmarkTest(SimpleTestCase):
+
+    def _benchmark(self, config, compiled=False):
+        generator = DocumentGenerator(config, related_count=2)
+        return benchmark_data_source(
+            config,
+            generator.get_docs(10),
+            generator.get_related_docs(),
+            compiled=compiled,
+            repeat=1,
+            measure_memory=False,
+        )
+
+    def test_sample_data_source(self):
+        config = get_sample_data_source()
+        docs = DocumentGenerator(config).get_docs(10)
+        self.assertTrue(all(config.filter(doc) for doc in docs))
+        result = self._benchmark(config)
+        self.assertEqual((result.docs, result.rows, result.errors), (10, 10, []))
+        self.assertEqual(list(result.indicator_costs)[0], 'doc_id')
+        self.assertEqual(len(result.indicator_costs), len(config.indicators.indicators))
+
+    def test_repeat(self):
+        result = self._benchmark(get_data_source_with_repeat(), compiled=True)
+        self.assertEqual((result.rows, result.errors), (30, []))
+
+    def test_related_docs_in_memory(self):
+        config = get_data_source_with_related_doc_type()
+        generator = DocumentGenerator(config, related_count=2)
+        related_ids = {doc['_id'] for doc in generator.get_related_docs()}
+        self.assertEqual(len(related_ids), 2)
+        for doc in generator.get_docs(5):
+            self.assertIn(doc['indices'][0]['referenced_id'], related_ids)
+        result = self._benchmark(config)
+        self.assertEqual((result.rows, result.errors), (10, []))
+
+    def test_example_data_sources(self):
+        configs = get_data_sources()
+        self.assertTrue(configs)
+        for config in configs:
+            result = self._benchmark(config)
+            self.assertEqual(result.errors, [], config.table_id)
@@ -0,0 +1,212 @@
+from django.test import SimpleTestCase
+
+from corehq.apps.userreports.expressions.compiler import (
+    CompiledDataSource,
+    Constant,
+    DataSourceCompiler,
+    SharedExpression,
+)
+from corehq.apps.userreports.models import DataSourceConfiguration
+from corehq.apps.userreports.specs import EvaluationContext
+from corehq.apps.userreports.tests.utils import (
+    get_data_source_with_repeat,
+    get_sample_data_source,
+    get_sample_doc_and_indicators,
+)
+from corehq.util.test_utils import flag_enabled
+
+
+def _get_config():
+    return DataSourceConfiguration(
+        domain='compiler-test',
+        referenced_doc_type='CommCareCase',
+        table_id='compiler',
+        named_expressions={
+            'age': {'type': 'property_name', 'property_name': 'age', 'datatype': 'integer'},
+            'adult': {
+                'type': 'conditional',
+                'test': {
+                    'type': 'boolean_expression',
+                    'expression': {'type': 'named', 'name': 'age'},
+                    'operator': 'gte',
+                    'property_value': 18,
+                },
+                'expression_if_true': 'adult',
+                'expression_if_false': 'child',
+            },
+        },
+        named_filters={
+            'is_adult': {
+                'type': 'boolean_expression',
+                'expression': {'type': 'named', 'name': 'adult'},
+                'operator': 'eq',
+                'property_value': 'adult',
+            },
+        },
+        configured_filter={
+            'type': 'not',
+            'filter': {
+                'type': 'boolean_expression',
+                'expression': {'type': 'property_name', 'property_name': 'closed'},
+                'operator': 'eq',
+                'property_value': True,
+            },
+        },
+        configured_indicators=[{
+            'type': 'expression',
+            'column_id': 'group',
+            'datatype': 'string',
+            'expression': {'type': 'named', 'name': 'adult'},
+        }, {
+            'type': 'boolean',
+            'column_id': 'is_adult',
+            'filter': {'type': 'named', 'name': 'is_adult'},
+        }, {
+            'type': 'expression',
+            'column_id': 'label',
+            'datatype': 'string',
+            'expression': {
+                'type': 'switch',
+                'switch_on': {'type': 'property_path', 'property_path': ['location', 'region']},
+                'cases': {'north': 'N', 'south': 'S'},
+                'default': {
+                    'type': 'coalesce',
+                    'expression': {'type': 'property_name', 'property_name': 'region'},
+                    'default_expression': 'unknown',
+                },
+            },
+        }, {
+            'type': 'expression',
+            'column_id': 'owner_name',
+            'datatype': 'string',
+            'expression': {
+                'type': 'nested',
+                'argument_expression': {'type': 'root_doc', 'expression': {
+                    'type': 'property_name', 'property_name': 'owner'}},
+                'value_expression': {'type': 'property_name', 'property_name': 'name'},
+            },
+        }, {
+            'type': 'boolean',
+            'column_id': 'always',
+            'filter': {
+                'type': 'and',
+                'filters': [{
+                    'type': 'boolean_expression',
+                    'expression': 1,
+                    'operator': 'eq',
+                    'property_value': 1,
+                }],
+            },
+        }, {
+            'type': 'choice_list',
+            'column_id': 'color',
+            'property_name': 'color',
+            'choices': ['red', 'blue'],
+        }],
+    )
+
+
+class CompiledDataSourceTest(SimpleTestCase):
+
+    def _assert_same_values(self, config, docs):
+        compiled = CompiledDataSource(config)
+        for doc in docs:
+            context = EvaluationContext(doc)
+            self.assertEqual(compiled.filter(doc, context), config._get_main_filter()(doc, context))
+            for item in config.get_items(doc, context):
+                self.assertEqual(
+                    [(v.column.id, v.value) for v in compiled.get_values(item, context)],
+                    [(v.column.id, v.value) for v in config.indicators.get_values(item, context)],
+                )
+
+    def test_same_values(self):
+        docs = [
+            {'_id': 'a', 'domain': 'compiler-test', 'doc_type': 'CommCareCase', 'age': '30',
+             'location': {'region': 'north'}, 'owner': {'name': 'Kim'}, 'color': 'red'},
+            {'_id': 'b', 'domain': 'compiler-test', 'doc_type': 'CommCareCase', 'age': 4,
+             'region': 'west', 'color': 'green'},
+            {'_id': 'c', 'domain': 'compiler-test', 'doc_type': 'CommCareCase', 'region': ''},
+            {'_id': 'd', 'domain': 'compiler-test', 'doc_type': 'CommCareCase', 'closed': True},
+            {'_id': 'e', 'domain': 'other', 'doc_type': 'CommCareCase'},
+        ]
+        self._assert_same_values(_get_config(), docs)
+
+    def test_sample_data_sources(self):
+        doc, expected_indicators = get_sample_doc_and_indicators()
+        self._assert_same_values(get_sample_data_source(), [doc])
+        self._assert_same_values(get_data_source_with_repeat(), [
+            dict(doc, form={'time_logs': [{'start_time': '2020-01-01'}, {'start_time': '2020-02-01'}]}),
+        ])
+
+    def test_constant_folding(self):
+        compiler = DataSourceCompiler(_get_config())
+        folded = compiler.compile_filter({
+            'type': 'or',
+            'filters': [
+                {'type': 'boolean_expression', 'expression': 'a', 'operator': 'eq', 'property_value': 'b'},
+                {'type': 'not', 'filter': {
+                    'type': 'boolean_expression', 'expression': 2, 'operator': 'gt', 'property_value': 3,
+                }},
+            ],
+        })
+        self.assertIsInstance(folded, Constant)
+        self.assertTrue(folded.value)
+
+    def test_named_expressions_evaluated_once(self):
+        compiler = DataSourceCompiler(_get_config())
+        adult = compiler.compile_expression({'type': 'named', 'name': 'adult'})
+        self.assertIsInstance(adult, SharedExpression)
+        doc = {'age': 20}
+        context = EvaluationContext(doc)
+        self.assertEqual(adult(doc, context), 'adult')
+        doc['age'] = 10
+        self.assertEqual(adult(doc, context), 'adult')
+        context.increment_iteration()
+        self.assertEqual(adult(doc, context), 'child')
+
+    def test_shared_value_is_for_the_same_item(self):
+        shared = SharedExpression('key', lambda item, context: item['value'])
+        item = {'value': 'new'}
+        context = EvaluationContext({})
+        # a value cached for another item with the same id
+        context.set_iteration_cache_value(('key', id(item)), ({'value': 'old'}, 'old'))
+        self.assertEqual(shared(item, context), 'new')
+        self.assertEqual(shared(item, context), 'new')
+
+
+@flag_enabled('UCR_COMPILED_EXPRESSIONS')
+class BulkValuesTest(SimpleTestCase):
+
+    def _assert_same_values(self, config, docs):
+        columns, errors = config.get_bulk_values(docs, {doc['_id']: EvaluationContext(doc) for doc in docs})
+        self.assertEqual(errors, [])
+        rows = [row for doc in docs for row in config.get_all_values(doc)]
+        self.assertEqual(
+            [column.id for column in columns],
+            [column.id for column in config.indicators.get_columns()],
+        )
+        self.assertEqual(
+            [[(column.id, value) for column, value in zip(columns, values)] for values in zip(*columns.values())],
+            [[(v.column.id, v.value) for v in row] for row in rows],
+        )
+
+    def test_same_values(self):
+        docs = [
+            {'_id': 'a', 'domain': 'compiler-test', 'doc_type': 'CommCareCase', 'age': '30',
+             'location': {'region': 'north'}, 'color': 'red'},
+            {'_id': 'b', 'domain': 'compiler-test', 'doc_type': 'CommCareCase', 'age': 4, 'color': 'blue'},
+            {'_id': 'c', 'domain': 'compiler-test', 'doc_type': 'CommCareCase', 'age': '30'},
+        ]
+        self._assert_same_values(_get_config(), docs)
+
+    def test_sample_data_sources(self):
+        doc, expected_indicators = get_sample_doc_and_indicators()
+        self._assert_same_values(get_sample_data_source(), [doc, dict(doc, _id='other')])
+        self._assert_same_values(get_data_source_with_repeat(), [
+            dict(doc, form={'time_logs': [{'start_time': '2020-01-01'}, {'start_time': '2020-02-01'}]}),
+        ])
+
+    def test_no_rows(self):
+        columns, errors = _get_config().get_bulk_values([], {})
+        self.assertEqual(errors, [])
+        self.assertEqual(set(map(len, columns.values())), {0})
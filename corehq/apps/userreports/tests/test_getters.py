@@ -4,6 +4,8 @@ from corehq.apps.userreports.expressions.getters import (
     DictGetter,
     NestedDictGetter,
     TransformedGetter,
+    transform_from_datatype,
+    transform_values_from_datatype,
 )
 
 
@@ -79,3 +81,29 @@ class TransformedGetterTest(SimpleTestCase):
         getter = TransformedGetter(self.base_getter, lambda x: '{}-transformed'.format(x))
         self.assertEqual('bar-transformed', getter({'foo': 'bar'}))
         self.assertEqual('1-transformed', getter({'foo': 1}))
+
+
+class TransformValuesFromDatatypeTest(SimpleTestCase):
+
+    def test_same_as_single_values(self):
+        for datatype, values in [
+            ('integer', ['1', 1, 1.0, '1', 'a', None, True]),
+            ('decimal', ['1.5', 1, '1.5', '']),
+            ('date', ['2020-01-01', '2020-01-01', 'not a date', None]),
+            ('string', [1, '1', 1, ['a']]),
+            ('array', ['a', ['a'], None]),
+            ('small_integer', ['3', '3']),
+        ]:
+            transform = transform_from_datatype(datatype)
+            self.assertEqual(
+                transform_values_from_datatype(datatype)(values),
+                [transform(value) for value in values],
+                datatype,
+            )
+
+    def test_unknown_datatype(self):
+        self.assertEqual(transform_values_from_datatype('unknown')(['1', 1]), ['1', 1])
+
+    def test_arrays_not_shared(self):
+        first, second = transform_values_from_datatype('array')(['a', 'a'])
+        self.assertIsNot(first, second)
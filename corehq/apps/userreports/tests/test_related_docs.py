@@ -0,0 +1,162 @@
+from django.test import SimpleTestCase
+
+from mock import MagicMock, patch
+
+from corehq.apps.userreports.models import DataSourceConfiguration
+from corehq.apps.userreports.related_docs import (
+    RelatedDocuments,
+    get_evaluation_contexts,
+    get_related_document_specs,
+    uses_related_documents,
+)
+
+
+class FakeDocumentStore(object):
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    def iter_documents(self, ids):
+        self.queries.append(sorted(ids))
+        return [self.docs[doc_id] for doc_id in ids if doc_id in self.docs]
+
+
+def _related_doc(doc_id_property, value_expression):
+    return {
+        'type': 'related_doc',
+        'related_doc_type': 'CommCareCase',
+        'doc_id_expression': {'type': 'property_name', 'property_name': doc_id_property},
+        'value_expression': value_expression,
+    }
+
+
+def _get_config(configured_filter=None):
+    return DataSourceConfiguration(
+        domain='related-docs',
+        referenced_doc_type='CommCareCase',
+        table_id='related',
+        configured_filter=configured_filter or {},
+        configured_indicators=[{
+            'type': 'expression',
+            'column_id': 'village',
+            'datatype': 'string',
+            # case -> parent -> household
+            'expression': _related_doc('parent_id', _related_doc(
+                'household_id', {'type': 'property_name', 'property_name': 'village'})),
+        }],
+    )
+
+
+@patch('corehq.apps.userreports.related_docs.UCR_BULK_RELATED_DOCS', MagicMock())
+class RelatedDocumentsTest(SimpleTestCase):
+    domain = 'related-docs'
+
+    def setUp(self):
+        self.store = FakeDocumentStore({
+            'parent1': {'_id': 'parent1', 'domain': self.domain, 'household_id': 'hh1'},
+            'parent2': {'_id': 'parent2', 'domain': self.domain, 'household_id': 'hh2'},
+            'hh1': {'_id': 'hh1', 'domain': self.domain, 'village': 'Ilala'},
+            'hh2': {'_id': 'hh2', 'domain': 'other-domain', 'village': 'Temeke'},
+        })
+        patcher = patch('corehq.apps.userreports.related_docs.get_document_store_for_doc_type',
+                        return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _get_docs(self):
+        return [
+            {'_id': 'case{}'.format(i), 'domain': self.domain, 'doc_type': 'CommCareCase', 'parent_id': parent_id}
+            for i, parent_id in enumerate(['parent1', 'parent2', 'parent1', 'missing'])
+        ]
+
+    def test_uses_related_documents(self):
+        self.assertTrue(_get_config().uses_related_documents)
+        self.assertFalse(uses_related_documents({'type': 'property_name', 'property_name': 'related_doc'}))
+        self.assertTrue(uses_related_documents([{'type': 'get_subcases', 'case_id_expression': 'a'}]))
+
+    def test_one_query_per_hop(self):
+        config = _get_config()
+        docs = self._get_docs()
+        contexts = get_evaluation_contexts(self.domain, [config], docs)
+        self.assertEqual(self.store.queries, [
+            ['missing', 'parent1', 'parent2'],
+            ['hh1', 'hh2'],
+        ])
+
+        values = [
+            config.get_all_values(doc, contexts[doc['_id']])[0][0].value
+            for doc in docs
+        ]
+        self.assertEqual(values, ['Ilala', None, 'Ilala', None])
+        self.assertEqual(len(self.store.queries), 2)
+
+    def test_filtered_documents_are_skipped(self):
+        config = _get_config({
+            'type': 'boolean_expression',
+            'expression': {'type': 'property_name', 'property_name': 'parent_id'},
+            'operator': 'eq',
+            'property_value': 'parent2',
+        })
+        get_evaluation_contexts(self.domain, [config], self._get_docs())
+        self.assertEqual(self.store.queries, [['parent2'], ['hh2']])
+
+    def test_related_document_specs(self):
+        parent = _related_doc('parent_id', {'type': 'property_name', 'property_name': 'name'})
+        subcases = {
+            'type': 'get_subcases',
+            'case_id_expression': {'type': 'property_name', 'property_name': '_id'},
+        }
+        nested = {
+            'type': 'nested',
+            'argument_expression': {'type': 'property_name', 'property_name': 'form'},
+            'value_expression': parent,
+        }
+        spec = [
+            {'type': 'expression', 'expression': {'type': 'property_name', 'property_name': 'name'}},
+            {'type': 'expression', 'expression': parent},
+            {'type': 'expression', 'expression': {'type': 'named', 'name': 'subcases'}},
+            {'type': 'boolean', 'filter': {'type': 'named', 'name': 'has_parent'}},
+            {'type': 'expression', 'expression': nested},
+        ]
+        named_expressions = {'subcases': subcases}
+        named_filters = {'has_parent': {'type': 'boolean_expression', 'expression': parent}}
+        self.assertEqual(
+            get_related_document_specs(spec, [named_expressions, named_filters]),
+            [parent, subcases, nested],
+        )
+
+    def test_collecting(self):
+        related_docs = RelatedDocuments(self.domain)
+        self.assertEqual(related_docs.get_document('CommCareCase', 'parent1'), (False, None))
+        self.assertFalse(related_docs.fetch())
+
+        related_docs.collecting = True
+        related_docs.get_document('CommCareCase', 'parent1')
+        related_docs.get_document('CommCareCase', 'hh2')
+        self.assertTrue(related_docs.fetch())
+        self.assertEqual(related_docs.get_document('CommCareCase', 'parent1'), (True, self.store.docs['parent1']))
+        # documents from other domains are never returned
+        self.assertEqual(related_docs.get_document('CommCareCase', 'hh2'), (True, None))
+        self.assertFalse(related_docs.fetch())
+
+    @patch('corehq.apps.userreports.related_docs.CaseAccessors')
+    def test_subcases(self, CaseAccessors):
+        def _case(case_id, *referenced_ids):
+            case = MagicMock(indices=[MagicMock(referenced_id=ref) for ref in referenced_ids])
+            case.to_json.return_value = {'_id': case_id}
+            return case
+
+        CaseAccessors.return_value.get_reverse_indexed_cases.return_value = [
+            _case('child1', 'p1'), _case('child2', 'p1', 'p2'),
+        ]
+        related_docs = RelatedDocuments(self.domain)
+        related_docs.collecting = True
+        related_docs.get_subcases('p1')
+        related_docs.get_subcases('p2')
+        related_docs.get_subcases('p3')
+        related_docs.fetch()
+        CaseAccessors.return_value.get_reverse_indexed_cases.assert_called_once()
+        self.assertEqual(related_docs.get_subcases('p1'), (True, [{'_id': 'child1'}, {'_id': 'child2'}]))
+        self.assertEqual(related_docs.get_subcases('p2'), (True, [{'_id': 'child2'}]))
+        self.assertEqual(related_docs.get_subcases('p3'), (True, []))
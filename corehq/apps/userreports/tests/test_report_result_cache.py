@@ -0,0 +1,48 @@
+import uuid
+
+from django.test import SimpleTestCase
+
+from mock import patch
+
+from corehq.apps.userreports.cache import (
+    bump_data_source_version,
+    get_cached_report_result,
+    get_data_source_version,
+)
+
+
+class ReportResultCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.config_id = uuid.uuid4().hex
+        self.queries = []
+
+    def _get_result(self, query_key, **kwargs):
+        def _query():
+            self.queries.append(query_key)
+            return [{'count': len(self.queries)}]
+        return get_cached_report_result(self.config_id, query_key, _query, **kwargs)
+
+    def test_cached_until_data_source_changes(self):
+        self.assertEqual(self._get_result({'filter': 'a'}), ([{'count': 1}], False))
+        self.assertEqual(self._get_result({'filter': 'a'}), ([{'count': 1}], True))
+        self.assertEqual(self._get_result({'filter': 'b'}), ([{'count': 2}], False))
+
+        bump_data_source_version(self.config_id)
+        self.assertEqual(self._get_result({'filter': 'a'}), ([{'count': 3}], False))
+        self.assertEqual(len(self.queries), 3)
+
+    def test_version_is_stable(self):
+        version = get_data_source_version(self.config_id)
+        self.assertEqual(get_data_source_version(self.config_id), version)
+        bump_data_source_version(self.config_id)
+        self.assertNotEqual(get_data_source_version(self.config_id), version)
+
+    @patch('corehq.apps.userreports.cache.UCR_REPORT_CACHE_MAX_ROWS', 0)
+    def test_large_results_not_cached(self):
+        self.assertEqual(self._get_result({}), ([{'count': 1}], False))
+        self.assertEqual(self._get_result({}), ([{'count': 2}], False))
+
+    def test_wait_for_result(self):
+        self.assertEqual(self._get_result({}, wait_for_result=True), ([{'count': 1}], False))
+        self.assertEqual(self._get_result({}, wait_for_result=True), ([{'count': 1}], True))
@@ -1,6 +1,16 @@
 from django.test import SimpleTestCase
 
-from corehq.apps.userreports.rebuild import DataSourceResumeHelper
+from mock import MagicMock, patch
+
+from corehq.apps.userreports.rebuild import (
+    BuildProgress,
+    DataSourceResumeHelper,
+    PartitionProgress,
+    RebuildPartition,
+    _get_shard_partitions,
+    iter_partition_doc_ids,
+)
+from corehq.form_processor.backends.sql.dbaccessors import DocIds
 from corehq.apps.userreports.tests.utils import get_sample_data_source
 
 
@@ -41,3 +51,92 @@ class DataSourceResumeBuildTest(SimpleTestCase):
     def test_has_resume_info_true(self):
         self._resume_helper.add_completed_case_type_or_xmlns('type1')
         self.assertEqual(True, self._resume_helper.has_resume_info())
+
+
+class DataSourcePartitionedBuildTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(DataSourcePartitionedBuildTest, cls).setUpClass()
+        cls._data_source = get_sample_data_source()
+        cls._resume_helper = DataSourceResumeHelper(cls._data_source)
+
+    def setUp(self):
+        super(DataSourcePartitionedBuildTest, self).setUp()
+        self._resume_helper.clear_resume_info()
+        self.partitions = [
+            RebuildPartition('type1', 'db1', 1, 100),
+            RebuildPartition('type1', 'db2', 1, 100),
+        ]
+        self._resume_helper.set_partitions(self.partitions)
+
+    def test_partition_progress(self):
+        self.assertTrue(self._resume_helper.has_resume_info())
+        progress = self._resume_helper.get_partition_progress(self.partitions[0])
+        self.assertEqual(progress, PartitionProgress(self.partitions[0]))
+
+        progress.last_pk = 50
+        progress.doc_count = 20
+        self._resume_helper.set_partition_progress(progress)
+        self.assertEqual(self._resume_helper.get_partition_progress(self.partitions[0]), progress)
+        self.assertIsNone(self._resume_helper.get_partition_progress(RebuildPartition('type2')))
+
+    def test_build_progress(self):
+        for partition in self.partitions:
+            self._resume_helper.set_partition_progress(PartitionProgress(partition, 99, 10, complete=True))
+        build_progress = self._resume_helper.get_build_progress()
+        self.assertEqual(build_progress, BuildProgress(2, 2, 20))
+        self.assertTrue(build_progress.complete)
+
+    def test_clear_resume_info(self):
+        self._resume_helper.clear_resume_info()
+        self.assertFalse(self._resume_helper.has_resume_info())
+        self.assertIsNone(self._resume_helper.get_build_progress())
+
+    def test_claim_finish(self):
+        self.assertTrue(self._resume_helper.claim_finish())
+        self.assertFalse(DataSourceResumeHelper(self._data_source).claim_finish())
+        # a new build can be finished again
+        self._resume_helper.set_partitions(self.partitions)
+        self.assertTrue(self._resume_helper.claim_finish())
+
+
+class PartitionDocIdsTest(SimpleTestCase):
+
+    def _get_accessor(self, primary_keys):
+        def get_doc_ids(from_db, last_doc_pk=None, limit=500):
+            return [
+                DocIds('doc{}'.format(pk), pk) for pk in primary_keys
+                if last_doc_pk is None or pk > last_doc_pk
+            ][:limit]
+
+        accessor = MagicMock(primary_key_field_name='id')
+        accessor.get_doc_ids.side_effect = get_doc_ids
+        accessor.query.return_value.aggregate.return_value = {
+            'min_pk': min(primary_keys), 'max_pk': max(primary_keys)
+        }
+        return accessor
+
+    def test_shard_partitions(self):
+        accessor = self._get_accessor(list(range(1, 11)))
+        self.assertEqual(_get_shard_partitions(accessor, 'type1', 'db1', 4), [
+            RebuildPartition('type1', 'db1', 1, 4),
+            RebuildPartition('type1', 'db1', 4, 7),
+            RebuildPartition('type1', 'db1', 7, 10),
+            RebuildPartition('type1', 'db1', 10, 11),
+        ])
+
+    @patch('corehq.apps.userreports.rebuild.ID_CHUNK_SIZE', 2)
+    def test_iter_partition_doc_ids(self):
+        accessor = self._get_accessor(list(range(1, 11)))
+        partition = RebuildPartition('type1', 'db1', 4, 9)
+        with patch('corehq.apps.userreports.rebuild._get_reindex_accessor', return_value=accessor):
+            self.assertEqual(list(iter_partition_doc_ids(None, partition, None)), [
+                (['doc4', 'doc5'], 5),
+                (['doc6', 'doc7'], 7),
+                (['doc8'], 8),
+            ])
+            # resume after the last primary key that was built
+            self.assertEqual(list(iter_partition_doc_ids(None, partition, None, last_pk=7)), [
+                (['doc8'], 8),
+            ])
@@ -0,0 +1,152 @@
+from django.test import SimpleTestCase
+
+from mock import Mock, PropertyMock, patch
+
+from corehq.apps.userreports.exceptions import BadSpecError
+from corehq.apps.userreports.models import DataSourceConfiguration
+from corehq.apps.userreports.reports.factory import ReportColumnFactory
+from corehq.apps.userreports.sql.adapter import IndicatorSqlAdapter
+from corehq.apps.userreports.sql.data_source import _get_rollup_column
+from corehq.apps.userreports.sql.rollups import (
+    ROLLUP_ROW_COUNT_COLUMN,
+    RollupTableAdapter,
+    get_matching_rollup,
+)
+
+
+def _get_config(rollups):
+    return DataSourceConfiguration(
+        domain='rollups',
+        referenced_doc_type='CommCareCase',
+        table_id='rollups',
+        configured_filter={},
+        configured_indicators=[
+            {'type': 'expression', 'column_id': column_id, 'datatype': datatype,
+             'expression': {'type': 'property_name', 'property_name': column_id}}
+            for column_id, datatype in [
+                ('month', 'date'), ('location_id', 'string'), ('owner_id', 'string'), ('visits', 'integer'),
+            ]
+        ],
+        rollups=rollups,
+    )
+
+
+def _column(column_id, field, aggregation):
+    return ReportColumnFactory.from_spec({
+        'type': 'field',
+        'column_id': column_id,
+        'field': field,
+        'aggregation': aggregation,
+    })
+
+
+MONTHLY_BY_LOCATION = {
+    'rollup_id': 'monthly_by_location',
+    'group_by': ['month', 'location_id'],
+    'measures': [
+        {'column_id': 'visits', 'aggregation': 'sum'},
+        {'column_id': 'doc_id', 'aggregation': 'count'},
+    ],
+}
+MONTHLY_BY_OWNER = {
+    'rollup_id': 'monthly_by_owner',
+    'group_by': ['month', 'location_id', 'owner_id'],
+    'measures': [{'column_id': 'visits', 'aggregation': 'sum'}],
+}
+
+
+class RollupMatchingTest(SimpleTestCase):
+
+    def setUp(self):
+        self.config = _get_config([MONTHLY_BY_OWNER, MONTHLY_BY_LOCATION])
+
+    def _get_rollup_id(self, columns, aggregation_columns, filter_fields=()):
+        rollup = get_matching_rollup(self.config, columns, aggregation_columns, filter_fields)
+        return rollup.rollup_id if rollup else None
+
+    def test_smallest_matching_rollup(self):
+        columns = [_column('location', 'location_id', 'simple'), _column('visits', 'visits', 'sum')]
+        self.assertEqual(self._get_rollup_id(columns, ['location'], ['month']), 'monthly_by_location')
+        self.assertEqual(self._get_rollup_id(columns, ['location', 'owner_id']), 'monthly_by_owner')
+
+    def test_no_matching_rollup(self):
+        location = _column('location', 'location_id', 'simple')
+        # not a measure of any rollup
+        self.assertIsNone(self._get_rollup_id([location, _column('visits', 'visits', 'max')], ['location']))
+        count_unique = _column('count', 'doc_id', 'count_unique')
+        self.assertIsNone(self._get_rollup_id([location, count_unique], ['location']))
+        # filtering or grouping on a column that isn't rolled up
+        visits = _column('visits', 'visits', 'sum')
+        self.assertIsNone(self._get_rollup_id([location, visits], ['location'], ['visits']))
+        self.assertIsNone(self._get_rollup_id([location, visits], ['location', 'doc_id']))
+        # not aggregated
+        self.assertIsNone(self._get_rollup_id([location, visits], []))
+
+    def test_rollup_column(self):
+        rollup = self.config.rollups[1]
+        count = _get_rollup_column(rollup, _column('count', 'doc_id', 'count'))
+        self.assertEqual((count.column_id, count.field, count.aggregation), ('count', 'doc_id_count', 'sum'))
+        location = _column('location', 'location_id', 'simple')
+        self.assertIs(_get_rollup_column(rollup, location), location)
+
+    def test_validate_rollup_columns(self):
+        _get_config([MONTHLY_BY_LOCATION]).validate()
+        with self.assertRaises(BadSpecError):
+            _get_config([dict(MONTHLY_BY_LOCATION, group_by=['month', 'district'])]).validate()
+        with self.assertRaises(BadSpecError):
+            _get_config([MONTHLY_BY_LOCATION, MONTHLY_BY_LOCATION]).validate()
+
+
+class RollupAggregationTest(SimpleTestCase):
+
+    def test_aggregate_groups(self):
+        config = _get_config([dict(MONTHLY_BY_LOCATION, measures=[
+            {'column_id': 'visits', 'aggregation': 'sum'},
+            {'column_id': 'visits', 'aggregation': 'count'},
+            {'column_id': 'visits', 'aggregation': 'min'},
+        ])])
+        rollup_table = RollupTableAdapter(Mock(config=config), config.rollups[0])
+        rows = [
+            {'month': 'jan', 'location_id': 'a', 'visits': 2},
+            {'month': 'jan', 'location_id': 'a', 'visits': None},
+            {'month': 'jan', 'location_id': 'a', 'visits': 3},
+            {'month': 'feb', 'location_id': None, 'visits': None},
+        ]
+        self.assertEqual(rollup_table._aggregate_groups(rows), {
+            ('jan', 'a'): {ROLLUP_ROW_COUNT_COLUMN: 3, 'visits_sum': 5, 'visits_count': 2, 'visits_min': 2},
+            ('feb', None): {ROLLUP_ROW_COUNT_COLUMN: 1, 'visits_sum': None, 'visits_count': 0, 'visits_min': None},
+        })
+
+
+@patch.object(IndicatorSqlAdapter, 'rollup_tables', new_callable=PropertyMock)
+class MaintainingRollupsTest(SimpleTestCase):
+
+    def _maintain_rollups(self, rollup_table):
+        adapter = IndicatorSqlAdapter(_get_config([MONTHLY_BY_LOCATION]))
+        session = Mock()
+        old_rows, new_rows = [{'month': 'jan'}], [{'month': 'feb'}]
+        with patch.object(adapter, 'session_context') as session_context, \
+                patch.object(adapter, '_get_rollup_rows', side_effect=[old_rows, new_rows]):
+            session_context.return_value.__enter__.return_value = session
+            with adapter._maintaining_rollups({'doc'}):
+                with adapter._write_session() as write_session:
+                    # rows are changed in the transaction the rollups are updated in
+                    self.assertIs(write_session, session)
+        self.assertEqual(session_context.call_count, 1)
+        self.assertIsNone(adapter._rollup_session)
+        return session.connection.return_value, old_rows, new_rows
+
+    def test_changes_are_applied_in_the_same_transaction(self, rollup_tables):
+        rollup_table = Mock(source_column_ids=['month'])
+        rollup_table.lock.return_value = True
+        rollup_tables.return_value = [rollup_table]
+        connection, old_rows, new_rows = self._maintain_rollups(rollup_table)
+        rollup_table.lock.assert_called_once_with(connection)
+        rollup_table.apply_changes.assert_called_once_with(connection, old_rows, new_rows)
+
+    def test_missing_rollup_table_is_skipped(self, rollup_tables):
+        rollup_table = Mock(source_column_ids=['month'])
+        rollup_table.lock.return_value = False
+        rollup_tables.return_value = [rollup_table]
+        self._maintain_rollups(rollup_table)
+        rollup_table.apply_changes.assert_not_called()
@@ -1,20 +1,30 @@
 import uuid
+from datetime import date
 
-from django.test import TestCase, override_settings
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from mock import Mock, patch
 
 from alembic.operations import Operations
 from alembic.runtime.migration import MigrationContext
+from sqlalchemy.exc import ProgrammingError
 
+from corehq.apps.userreports.adapter import IndicatorAdapter
 from corehq.apps.userreports.app_manager.helpers import clean_table_name
 from corehq.apps.userreports.const import UCR_SQL_BACKEND
 from corehq.apps.userreports.exceptions import (
     MissingColumnWarning,
     TableNotFoundWarning,
+    translate_programming_error,
 )
 from corehq.apps.userreports.models import (
     DataSourceConfiguration,
     InvalidUCRData,
 )
+from corehq.apps.userreports.sql.adapter import (
+    _format_copy_value,
+    _ignore_table_errors,
+)
 from corehq.apps.userreports.util import get_indicator_adapter
 
 
@@ -79,6 +89,36 @@ class SaveErrorsTest(TestCase):
         with self.assertRaises(MissingColumnWarning):
             adapter.best_effort_save(doc)
 
+    def _get_copy_docs(self):
+        return [
+            {"_id": str(i), "domain": "domain", "doc_type": "CommCareCase", "name": 'bob'}
+            for i in range(2)
+        ]
+
+    @patch('corehq.apps.userreports.sql.adapter.UCR_COPY_MIN_ROWS', 2)
+    def test_missing_table_with_copy(self):
+        adapter = self._get_adapter()
+        adapter.drop_table()
+
+        with self.assertRaises(ProgrammingError) as context:
+            adapter.bulk_save(self._get_copy_docs())
+        self.assertIsInstance(translate_programming_error(context.exception), TableNotFoundWarning)
+
+    @patch('corehq.apps.userreports.sql.adapter.UCR_COPY_MIN_ROWS', 2)
+    def test_missing_column_with_copy(self):
+        adapter = self._get_adapter()
+        adapter.build_table()
+        with adapter.engine.begin() as connection:
+            context = MigrationContext.configure(connection)
+            op = Operations(context)
+            op.drop_column(adapter.get_table().name, 'name')
+
+        with self.assertRaises(ProgrammingError) as context:
+            adapter.bulk_save(self._get_copy_docs())
+        self.assertIsInstance(translate_programming_error(context.exception), MissingColumnWarning)
+        with _ignore_table_errors(MissingColumnWarning):
+            adapter.bulk_save(self._get_copy_docs())
+
     def test_non_nullable_column(self):
         self.config.configured_indicators[0]['is_nullable'] = False
         self.config._id = 'docs id'
@@ -131,3 +171,48 @@ class AdapterBulkSaveTest(TestCase):
     def test_save_rows_empty(self):
         self.adapter.build_table()
         self.adapter.save_rows([])
+
+    @patch('corehq.apps.userreports.sql.adapter.UCR_COPY_MIN_ROWS', 2)
+    def test_save_rows_with_copy(self):
+        names = ['tab\there', 'new\nline', 'back\\slash', None]
+        docs = [
+            {"_id": str(i), "domain": self.domain, "doc_type": "CommCareCase", "name": name}
+            for i, name in enumerate(names)
+        ]
+        self.adapter.build_table()
+        self.adapter.best_effort_bulk_save(docs)
+        # saving again replaces the existing rows
+        docs[0]['name'] = 'updated'
+        self.adapter.best_effort_bulk_save(docs)
+
+        rows = self.adapter.get_query_object().order_by(self.adapter.get_table().c.doc_id).all()
+        self.assertEqual([row.name for row in rows], ['updated'] + names[1:])
+
+
+class FormatCopyValueTest(SimpleTestCase):
+
+    def test_format_copy_value(self):
+        self.assertEqual(_format_copy_value(None), '\\N')
+        self.assertEqual(_format_copy_value(True), 't')
+        self.assertEqual(_format_copy_value(12), '12')
+        self.assertEqual(_format_copy_value(date(2020, 1, 2)), '2020-01-02')
+        self.assertEqual(_format_copy_value('a\tb\\c\n'), 'a\\tb\\\\c\\n')
+        self.assertEqual(_format_copy_value({'a': 'b\tc'}), '{"a": "b\\\\tc"}')
+        self.assertEqual(_format_copy_value(b'\x01\xff'), '\\\\x01ff')
+
+
+class BulkSaveColumnsErrorTest(SimpleTestCase):
+
+    @patch('corehq.apps.userreports.adapter.notify_exception')
+    @patch('corehq.apps.userreports.adapter.metrics_counter')
+    @patch('corehq.util.cache_utils.is_rate_limited', return_value=False)
+    def test_failure_is_reported(self, is_rate_limited, metrics_counter, notify_exception):
+        config = Mock(domain='bulk-domain', table_id='bulk_table', display_name='Bulk', _id='abc')
+        config.get_bulk_values.side_effect = ValueError('bulk failure')
+        adapter = IndicatorAdapter(config)
+
+        self.assertFalse(adapter._bulk_save_columns([{'_id': 'doc'}], {}))
+        metrics_counter.assert_called_once_with(
+            'commcare.ucr.bulk_save_columns.fallback', tags={'domain': 'bulk-domain'}
+        )
+        self.assertEqual(notify_exception.call_count, 1)
@@ -0,0 +1,98 @@
+from datetime import datetime
+
+from django.test import TestCase
+
+from corehq.apps.userreports.exceptions import TableRebuildError
+from corehq.apps.userreports.models import DataSourceConfiguration
+from corehq.apps.userreports.rebuild import DataSourceResumeHelper
+from corehq.apps.userreports.sql.adapter import ShadowTableBuildAdapter
+from corehq.apps.userreports.tasks import _finish_building_table, rebuild_indicators
+from corehq.apps.userreports.tests.test_save_errors import get_sample_config
+from corehq.apps.userreports.util import get_indicator_adapter
+from corehq.util.test_utils import flag_enabled
+
+
+def _doc(doc_id, name):
+    return {
+        '_id': doc_id,
+        'domain': 'domain',
+        'doc_type': 'CommCareCase',
+        'name': name,
+    }
+
+
+class ShadowTableRebuildTest(TestCase):
+
+    def setUp(self):
+        self.config = get_sample_config()
+        self.adapter = get_indicator_adapter(self.config, raise_errors=True)
+        self.adapter.build_table()
+        self.adapter.best_effort_save(_doc('1', 'old'))
+
+    def tearDown(self):
+        self.adapter.shadow_adapter.drop_table()
+        self.adapter.drop_table()
+
+    def _get_names(self, adapter):
+        return sorted(
+            (row.doc_id, row.name) for row in adapter.get_query_object()
+        )
+
+    def test_rebuild_with_shadow_table(self):
+        self.config.meta.build.initiated_shadow = datetime.utcnow()
+        build_adapter = get_indicator_adapter(self.config, raise_errors=True)
+        self.assertIsInstance(build_adapter.adapter, ShadowTableBuildAdapter)
+
+        build_adapter.build_shadow_table()
+        build_adapter.shadow_adapter.best_effort_bulk_save([_doc('1', 'new'), _doc('2', 'new')])
+        # changes while building are saved to both tables
+        build_adapter.save_rows(build_adapter.get_all_values(_doc('3', 'changed')))
+        self.assertEqual(self._get_names(self.adapter), [('1', 'old'), ('3', 'changed')])
+
+        build_adapter.swap_shadow_table()
+        self.assertEqual(self._get_names(self.adapter), [('1', 'new'), ('2', 'new'), ('3', 'changed')])
+        self.assertFalse(build_adapter.shadow_adapter.table_exists)
+
+        # saving after the shadow table has replaced the table doesn't fail
+        build_adapter.save_rows(build_adapter.get_all_values(_doc('4', 'later')))
+        self.assertEqual(len(self._get_names(self.adapter)), 4)
+
+    @flag_enabled('UCR_SHADOW_TABLE_REBUILD')
+    def test_rebuild_indicators_task(self):
+        self.config.save()
+        self.addCleanup(self.config.delete)
+
+        rebuild_indicators(self.config._id)
+
+        config = DataSourceConfiguration.get(self.config._id)
+        self.assertTrue(config.meta.build.finished_shadow)
+        self.assertFalse(config.is_building_shadow_table)
+        # the table was replaced by the shadow table, built from no documents
+        self.assertEqual(self._get_names(self.adapter), [])
+        self.assertFalse(self.adapter.shadow_adapter.table_exists)
+
+    @flag_enabled('UCR_SHADOW_TABLE_REBUILD')
+    def test_no_second_rebuild_while_building(self):
+        self.config.meta.build.initiated_shadow = datetime.utcnow()
+        self.config.save()
+        self.addCleanup(self.config.delete)
+
+        with self.assertRaises(TableRebuildError):
+            rebuild_indicators(self.config._id)
+        self.assertEqual(self._get_names(self.adapter), [('1', 'old')])
+
+    def test_stale_build_does_not_swap(self):
+        self.config.meta.build.initiated_shadow = datetime(2020, 1, 1)
+        self.config.save()
+        self.addCleanup(self.config.delete)
+        build_adapter = get_indicator_adapter(self.config, raise_errors=True)
+        build_adapter.build_shadow_table()
+
+        # a newer build was started
+        config = DataSourceConfiguration.get(self.config._id)
+        config.meta.build.initiated_shadow = datetime(2020, 1, 2)
+        config.save()
+
+        _finish_building_table(self.config, DataSourceResumeHelper(self.config), in_place=False, shadow=True)
+        self.assertEqual(self._get_names(self.adapter), [('1', 'old')])
+        self.assertTrue(build_adapter.shadow_adapter.table_exists)
@@ -1,5 +1,6 @@
 import collections
 import hashlib
+import json
 
 from django_prbac.utils import has_privilege
 
@@ -15,6 +16,8 @@ from corehq.util.metrics.load_counters import ucr_load_counter
 
 UCR_TABLE_PREFIX = 'ucr_'
 LEGACY_UCR_TABLE_PREFIX = 'config_report_'
+UCR_SHADOW_TABLE_PREFIX = 'ucr_shadow_'
+UCR_ROLLUP_TABLE_PREFIX = 'ucr_rollup_'
 
 
 def localize(value, lang):
@@ -138,10 +141,12 @@ def number_of_ucr_reports(domain):
 
 def get_indicator_adapter(config, raise_errors=False, load_source="unknown"):
     from corehq.apps.userreports.sql.adapter import IndicatorSqlAdapter, ErrorRaisingIndicatorSqlAdapter, \
-        MultiDBSqlAdapter, ErrorRaisingMultiDBAdapter
+        MultiDBSqlAdapter, ErrorRaisingMultiDBAdapter, ShadowTableBuildAdapter, ErrorRaisingShadowTableBuildAdapter
     requires_mirroring = config.mirrored_engine_ids
     if requires_mirroring and ENABLE_UCR_MIRRORS.enabled(config.domain):
         adapter_cls = ErrorRaisingMultiDBAdapter if raise_errors else MultiDBSqlAdapter
+    elif config.is_building_shadow_table:
+        adapter_cls = ErrorRaisingShadowTableBuildAdapter if raise_errors else ShadowTableBuildAdapter
     else:
         adapter_cls = ErrorRaisingIndicatorSqlAdapter if raise_errors else IndicatorSqlAdapter
     adapter = adapter_cls(config)
@@ -149,6 +154,23 @@ def get_indicator_adapter(config, raise_errors=False, load_source="unknown"):
     return IndicatorAdapterLoadTracker(adapter, track_load)
 
 
+def get_shadow_table_name(domain, table_id):
+    """Name of the table a data source is rebuilt into before it replaces the data source table"""
+    return get_table_name(domain, table_id, prefix=UCR_SHADOW_TABLE_PREFIX)
+
+
+def get_rollup_table_name(domain, table_id, rollup):
+    """Name of a rollup table of a data source
+
+    The name changes when the rollup spec changes so that a table with the
+    old columns is never used for the new spec.
+    """
+    spec_hash = hashlib.md5(json.dumps(rollup.to_json(), sort_keys=True).encode('utf-8')).hexdigest()[:8]
+    return get_table_name(
+        domain, '{}_{}_{}'.format(table_id, rollup.rollup_id, spec_hash), prefix=UCR_ROLLUP_TABLE_PREFIX
+    )
+
+
 def get_table_name(domain, table_id, max_length=50, prefix=UCR_TABLE_PREFIX):
     """
     :param domain:
@@ -1056,8 +1056,14 @@ class BaseEditDataSourceView(BaseUserConfigReportsView):
             'data_source': self.config,
             'read_only': self.read_only,
             'used_by_reports': self.get_reports(),
+            'build_progress': self.get_build_progress(),
         }
 
+    def get_build_progress(self):
+        if self.config_id is None:
+            return None
+        return DataSourceResumeHelper(self.config).get_build_progress()
+
     @property
     def page_url(self):
         if self.config_id:
@@ -16,6 +16,18 @@ ASYNC_RETRY_AFTER = 5
 ASYNC_RESTORE_CACHE_KEY_PREFIX = "async-restore-task"
 RESTORE_CACHE_KEY_PREFIX = "ota-restore"
 
+# how long a shared (content-addressed) fixture sits around for (in minutes).
+# Cached fixtures are keyed by their inputs, so they never need to be
+# invalidated; this only bounds storage used by stale entries.
+SHARED_FIXTURE_CACHE_TIMEOUT = 24 * 60  # 1 day
+
+# restores taking longer than this (in seconds) are profiled per data provider
+RESTORE_PROFILE_THRESHOLD = 10
+# number of slowest restore profiles kept per domain
+RESTORE_PROFILE_MAX_PER_DOMAIN = 50
+# how long a domain's restore profiles sit around after the last slow restore (in seconds)
+RESTORE_PROFILE_TIMEOUT = 30 * 24 * 60 * 60  # 30 days
+
 # case sync algorithms
 CLEAN_OWNERS = 'clean_owners'
 LIVEQUERY = 'livequery'
@@ -171,7 +171,8 @@ class CleanOwnerSyncPayload(object):
             if syncable_case_id not in irrelevant_cases
         ]
 
-        with self.timing_context('add_commtrack_elements_to_response'):
+        with self.timing_context('add_commtrack_elements_to_response'), \
+                self.restore_state.profile.segment('stock'):
             self._add_commtrack_elements_to_response(relevant_sync_elements, response)
 
         self._add_case_elements_to_response(relevant_sync_elements, response)
@@ -23,11 +23,17 @@ Example case graphs with outcomes:
 """
 import logging
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 from itertools import chain, islice
 
+from django.db import connections
+
 from casexml.apps.case.const import CASE_INDEX_EXTENSION as EXTENSION
 from casexml.apps.phone.const import ASYNC_RETRY_AFTER
+from casexml.apps.phone.data_providers.case.livequery_graph import (
+    CaseGraphAccessor,
+)
 from casexml.apps.phone.data_providers.case.load_testing import (
     get_xml_for_response,
 )
@@ -35,8 +41,16 @@ from casexml.apps.phone.data_providers.case.stock import get_stock_payload
 from casexml.apps.phone.data_providers.case.utils import get_case_sync_updates
 from casexml.apps.phone.tasks import ASYNC_RESTORE_SENT
 from corehq.form_processor.interfaces.dbaccessors import CaseAccessors
-from corehq.sql_db.routers import read_from_plproxy_standbys
-from corehq.toggles import LIVEQUERY_READ_FROM_STANDBYS, NAMESPACE_USER
+from corehq.sql_db.routers import (
+    allow_read_from_plproxy_standby,
+    read_from_plproxy_standbys,
+)
+from corehq.toggles import (
+    LIVEQUERY_INCREMENTAL_GRAPH,
+    LIVEQUERY_PREFETCH_CASES,
+    LIVEQUERY_READ_FROM_STANDBYS,
+    NAMESPACE_USER,
+)
 from corehq.util.metrics import metrics_histogram
 from corehq.util.metrics.load_counters import case_load_counter
 
@@ -60,6 +74,11 @@ def do_livequery(timing_context, restore_state, response, async_task=None):
     This function makes no changes to external state other than updating
     the `restore_state.current_sync_log` and progress of `async_task`.
     Extends `response` with restore elements.
+
+    When `LIVEQUERY_INCREMENTAL_GRAPH` is enabled the case graph walked by
+    this sync is saved for the sync log, and the next sync only reads
+    cases that changed since then from the database. See
+    `casexml.apps.phone.data_providers.case.livequery_graph`.
     """
     def index_key(index):
         return '{} {}'.format(index.case_id, index.identifier)
@@ -188,7 +207,7 @@ def do_livequery(timing_context, restore_state, response, async_task=None):
             if index.relationship == 'extension'
         }
         check_cases = list(set(case_ids) - open_cases)
-        rows = accessor.get_closed_and_deleted_ids(check_cases)
+        rows = graph_accessor.get_closed_and_deleted_ids(check_cases)
         for case_id, closed, deleted in rows:
             if deleted:
                 deleted_ids.add(case_id)
@@ -216,6 +235,13 @@ def do_livequery(timing_context, restore_state, response, async_task=None):
             owned_ids = accessor.get_case_ids_by_owners(owner_ids, closed=False)
             debug("owned: %r", owned_ids)
 
+        if LIVEQUERY_INCREMENTAL_GRAPH.enabled(restore_state.domain):
+            with timing_context("load_case_graph"):
+                graph_accessor = CaseGraphAccessor.from_sync_log(
+                    accessor, restore_state.last_sync_log, owner_ids, owned_ids)
+        else:
+            graph_accessor = accessor
+
         next_ids = all_ids = set(owned_ids)
         owned_ids = set(owned_ids)  # owned, open case ids (may be extensions)
         open_ids = set(owned_ids)
@@ -223,7 +249,7 @@ def do_livequery(timing_context, restore_state, response, async_task=None):
             exclude = set(chain.from_iterable(seen_ix[id] for id in next_ids))
             with timing_context("get_related_indices({} cases, {} seen)".format(
                     len(next_ids), len(exclude))):
-                related = accessor.get_related_indices(list(next_ids), exclude)
+                related = graph_accessor.get_related_indices(list(next_ids), exclude)
                 if not related:
                     break
                 update_open_and_deleted_ids(related)
@@ -259,6 +285,8 @@ def do_livequery(timing_context, restore_state, response, async_task=None):
         else:
             sync_ids = live_ids
         restore_state.current_sync_log.case_ids_on_phone = live_ids
+        if graph_accessor is not accessor:
+            graph_accessor.save_graph(restore_state.current_sync_log, owned_ids)
 
         with timing_context("compile_response(%s cases)" % len(sync_ids)):
             iaccessor = PrefetchIndexCaseAccessor(accessor, indices)
@@ -266,7 +294,11 @@ def do_livequery(timing_context, restore_state, response, async_task=None):
                 timing_context,
                 restore_state,
                 response,
-                batch_cases(iaccessor, sync_ids),
+                batch_cases(
+                    iaccessor,
+                    sync_ids,
+                    prefetch=LIVEQUERY_PREFETCH_CASES.enabled(restore_state.domain),
+                ),
                 init_progress(async_task, len(sync_ids)),
             )
 
@@ -301,7 +333,12 @@ class PrefetchIndexCaseAccessor(object):
         return self.accessor.get_cases(case_ids, **kw)
 
 
-def batch_cases(accessor, case_ids):
+def batch_cases(accessor, case_ids, prefetch=False):
+    """Yield lists of cases in batches of 1000
+
+    :param prefetch: Fetch the next batch in a background thread while
+    the caller processes the current batch.
+    """
     def take(n, iterable):
         # https://docs.python.org/2/library/itertools.html#recipes
         return list(islice(iterable, n))
@@ -315,14 +352,48 @@ def batch_cases(accessor, case_ids):
         tags={'domain': accessor.domain}
     )
     ids = iter(case_ids)
-    while True:
-        next_ids = take(1000, ids)
-        if not next_ids:
-            break
+    id_batches = iter(lambda: take(1000, ids), [])
+    if prefetch:
+        yield from prefetch_batches(accessor.get_cases, id_batches, track_load)
+        return
+    for next_ids in id_batches:
         track_load(len(next_ids))
         yield accessor.get_cases(next_ids)
 
 
+def prefetch_batches(fetch, id_batches, track_load):
+    """Yield `fetch(ids)` for each batch of ids, fetching one batch ahead
+
+    Batches are fetched in order on a single background thread so the
+    next batch is loaded from the database while the caller renders the
+    current one. Output order is the same as without prefetching.
+    """
+    read_from_standbys = allow_read_from_plproxy_standby()
+
+    def fetch_batch(ids):
+        # plproxy standby routing is thread local
+        if read_from_standbys:
+            with read_from_plproxy_standbys():
+                return fetch(ids)
+        return fetch(ids)
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        pending = None
+        for next_ids in id_batches:
+            track_load(len(next_ids))
+            future = executor.submit(fetch_batch, next_ids)
+            if pending is not None:
+                yield pending.result()
+            pending = future
+        if pending is not None:
+            yield pending.result()
+    finally:
+        # close database connections opened by the worker thread
+        executor.submit(connections.close_all).result()
+        executor.shutdown()
+
+
 def init_progress(async_task, total):
     if not async_task:
         return lambda done: None
@@ -344,7 +415,7 @@ def init_progress(async_task, total):
 def compile_response(timing_context, restore_state, response, batches, update_progress):
     done = 0
     for cases in batches:
-        with timing_context("get_stock_payload"):
+        with timing_context("get_stock_payload"), restore_state.profile.segment("stock"):
             response.extend(get_stock_payload(
                 restore_state.project,
                 restore_state.stock_settings,
@@ -0,0 +1,301 @@
+"""Persisted case graph for incremental livequery restores
+
+A full livequery sync walks the owned/extension/child case graph level by
+level, issuing one `get_related_indices` and one
+`get_closed_and_deleted_ids` query per level. For users with many cases
+most of that graph is unchanged between syncs.
+
+`CaseGraphAccessor` stands in for the case accessor during that walk. It
+answers relationship and status lookups for cases whose state is known
+from the graph stored for the previous sync log and delegates everything
+else to the database. Cases that changed since the previous sync (and
+their direct neighbours) are forgotten up front so the walk re-reads
+them. Finding them only reads cases modified since the previous sync,
+which keeps database work proportional to the change set while leaving
+the liveness rules in `do_livequery` untouched.
+
+The graph seen during the walk is saved in the blob db, compressed, and
+its key is stored on the new sync log for the next incremental sync.
+"""
+import gzip
+import json
+from io import BytesIO
+from itertools import chain
+from uuid import uuid4
+
+from corehq.blobs import CODES, NotFound, get_blob_db
+from corehq.form_processor.models import CommCareCaseIndexSQL
+
+OPEN = 0
+CLOSED = 1
+DELETED = 2
+
+# minutes a saved graph is kept, syncs after that walk the whole graph
+GRAPH_BLOB_TIMEOUT = 7 * 24 * 60
+
+
+class CaseGraph(object):
+    """Compact snapshot of case relationships seen by a livequery walk
+
+    :param indices: dict `{case_id: {identifier: (referenced_type,
+    referenced_id, relationship_id)}}` of indices owned by each case.
+    :param status: dict `{case_id: OPEN | CLOSED | DELETED}` of every case
+    seen by the walk.
+    :param walked_ids: set of case ids for which all related indices
+    (owned indices and open extension indices pointing to the case) are
+    included in the graph.
+    :param owned_ids: set of open case ids owned by the user when the
+    graph was walked.
+    """
+
+    def __init__(self, domain, indices=None, status=None, walked_ids=None, owned_ids=None):
+        self.domain = domain
+        self.indices = indices if indices is not None else {}
+        self.status = status if status is not None else {}
+        self.walked_ids = walked_ids if walked_ids is not None else set()
+        self.owned_ids = owned_ids if owned_ids is not None else set()
+
+    @classmethod
+    def wrap(cls, domain, data):
+        if not data:
+            return cls(domain)
+        ids = data["ids"]
+        indices = {}
+        for case_pos, identifier, ref_type, ref_pos, relationship_id in data["indices"]:
+            indices.setdefault(ids[case_pos], {})[identifier] = (ref_type, ids[ref_pos], relationship_id)
+        return cls(
+            domain,
+            indices,
+            dict(zip(ids, data["status"])),
+            {ids[pos] for pos in data["walked"]},
+            {ids[pos] for pos in data["owned"]},
+        )
+
+    def to_json(self):
+        """Get compact JSON representation
+
+        Each case id is listed once, those with a status first in the
+        order of `status`, and is referred to by its position elsewhere.
+        """
+        ids = list(self.status)
+        positions = {case_id: pos for pos, case_id in enumerate(ids)}
+
+        def position(case_id):
+            if case_id not in positions:
+                positions[case_id] = len(ids)
+                ids.append(case_id)
+            return positions[case_id]
+
+        data = {
+            "status": list(self.status.values()),
+            "walked": sorted(position(case_id) for case_id in self.walked_ids),
+            "owned": sorted(position(case_id) for case_id in self.owned_ids),
+            "indices": [
+                [position(case_id), identifier, ref_type, position(ref_id), relationship_id]
+                for case_id, case_indices in self.indices.items()
+                for identifier, (ref_type, ref_id, relationship_id) in case_indices.items()
+            ],
+        }
+        data["ids"] = ids
+        return data
+
+    def add_index(self, index):
+        self.indices.setdefault(index.case_id, {})[index.identifier] = (
+            index.referenced_type,
+            index.referenced_id,
+            index.relationship_id,
+        )
+
+    def iter_indices(self, case_id):
+        for identifier, (ref_type, ref_id, relationship_id) in self.indices.get(case_id, {}).items():
+            yield CommCareCaseIndexSQL(
+                domain=self.domain,
+                case_id=case_id,
+                identifier=identifier,
+                referenced_type=ref_type,
+                referenced_id=ref_id,
+                relationship_id=relationship_id,
+            )
+
+    def get_reverse_map(self):
+        """Get dict `{referenced_id: {case_id, ...}}`"""
+        reverse = {}
+        for case_id, case_indices in self.indices.items():
+            for ref_type, ref_id, relationship_id in case_indices.values():
+                reverse.setdefault(ref_id, set()).add(case_id)
+        return reverse
+
+    def get_index_keys(self, case_ids):
+        """Get '<index.case_id> <index.identifier>' strings of indices
+        owned by the given cases
+
+        This is the format of `exclude_indices` in `get_related_indices`.
+        """
+        return {
+            '{} {}'.format(case_id, identifier)
+            for case_id in case_ids
+            for identifier in self.indices.get(case_id, {})
+        }
+
+
+class CaseGraphAccessor(object):
+    """Case accessor proxy answering livequery graph lookups from a
+    `CaseGraph` where possible
+
+    Only `get_related_indices` and `get_closed_and_deleted_ids` are served
+    from the graph; the results of both are recorded in `self.seen`, which
+    becomes the graph stored on the new sync log.
+    """
+
+    def __init__(self, accessor, graph):
+        self.domain = accessor.domain
+        self.accessor = accessor
+        self.graph = graph
+        self.known_ids = set(graph.status)
+        self.seen = CaseGraph(accessor.domain)
+        self._reverse = None
+
+    @classmethod
+    def from_sync_log(cls, accessor, sync_log, owner_ids, owned_ids):
+        """Create accessor with graph stored for the given sync log
+
+        Cases that may have changed since the sync log was created are
+        discarded.
+
+        :param owner_ids: Owner ids of the restore user.
+        :param owned_ids: Ids of open cases owned by the restore user.
+        """
+        self = cls(accessor, load_case_graph(accessor.domain, sync_log))
+        if self.known_ids:
+            self.discard_changed(sync_log.date, owner_ids, owned_ids)
+        return self
+
+    @property
+    def reverse(self):
+        if self._reverse is None:
+            self._reverse = self.graph.get_reverse_map()
+        return self._reverse
+
+    def discard_changed(self, since, owner_ids, owned_ids):
+        """Forget cases that may have changed since the given date
+
+        Forgotten cases are looked up in the database when the walk reaches
+        them. A case is forgotten if
+        - it was opened, closed or reassigned to or from the user, which
+          changes the set of open owned cases,
+        - it was modified: cases of the user's owners are found by owner,
+          only the other cases of the graph are looked up by id,
+        - an open case modified since then is an extension of it,
+        - it is a direct neighbour of another forgotten case (its reverse
+          indices may have changed).
+        """
+        graph = self.graph
+        stale = graph.owned_ids.symmetric_difference(owned_ids)
+        other_ids = [case_id for case_id in self.known_ids if case_id not in graph.owned_ids]
+        stale.update(self.accessor.get_case_ids_modified_since(owner_ids, other_ids, since))
+        # extensions of closed cases are not synced
+        host_ids = [case_id for case_id in self.known_ids if graph.status.get(case_id) == OPEN]
+        stale.update(chain.from_iterable(
+            self.accessor.get_modified_extension_indices_since(host_ids, since)))
+
+        neighbours = set()
+        for case_id in stale:
+            neighbours.update(ref_id for ref_type, ref_id, rel_id in graph.indices.get(case_id, {}).values())
+            neighbours.update(self.reverse.get(case_id, ()))
+        stale.update(neighbours)
+        self.known_ids.difference_update(stale)
+
+    def get_related_indices(self, case_ids, exclude_indices):
+        """Get indices (forward and reverse) for the given case ids
+
+        Same semantics as `CaseAccessors.get_related_indices`: all indices
+        owned by the given cases plus extension indices pointing to them
+        from open, non-deleted cases.
+        """
+        graph = self.graph
+        known = {case_id for case_id in case_ids
+                 if case_id in self.known_ids and case_id in graph.walked_ids}
+        unknown = [case_id for case_id in case_ids if case_id not in known]
+        related = list(self.accessor.get_related_indices(unknown, exclude_indices)) if unknown else []
+        if known:
+            ext_ids = {
+                ext_id
+                for case_id in known
+                for ext_id in self.reverse.get(case_id, ())
+                if graph.status.get(ext_id) == OPEN
+            }
+            known_related = chain(
+                chain.from_iterable(graph.iter_indices(case_id) for case_id in known),
+                (ix for ext_id in ext_ids
+                    for ix in graph.iter_indices(ext_id)
+                    if ix.relationship_id == CommCareCaseIndexSQL.EXTENSION
+                    and ix.referenced_id in known),
+            )
+            keys = {'{} {}'.format(ix.case_id, ix.identifier) for ix in related}
+            for index in known_related:
+                key = '{} {}'.format(index.case_id, index.identifier)
+                if key not in exclude_indices and key not in keys:
+                    keys.add(key)
+                    related.append(index)
+        self.seen.walked_ids.update(case_ids)
+        for index in related:
+            self.seen.add_index(index)
+            self.seen.status.setdefault(index.case_id, OPEN)
+        return related
+
+    def get_closed_and_deleted_ids(self, case_ids):
+        """Get the subset of given case ids that are closed or deleted
+
+        :returns: List of three-tuples: `(case_id, closed, deleted)`
+        """
+        status = self.graph.status
+        unknown = [case_id for case_id in case_ids if case_id not in self.known_ids]
+        rows = list(self.accessor.get_closed_and_deleted_ids(unknown)) if unknown else []
+        rows.extend(
+            (case_id, status[case_id] != OPEN, status[case_id] == DELETED)
+            for case_id in case_ids
+            if case_id in self.known_ids and status[case_id] != OPEN
+        )
+        for case_id in case_ids:
+            self.seen.status[case_id] = OPEN
+        for case_id, closed, deleted in rows:
+            self.seen.status[case_id] = DELETED if deleted else (CLOSED if closed else OPEN)
+        return rows
+
+    def save_graph(self, sync_log, owned_ids):
+        """Save the graph seen by this walk for the given sync log"""
+        for case_id in owned_ids:
+            self.seen.status.setdefault(case_id, OPEN)
+        self.seen.owned_ids = set(owned_ids)
+        save_case_graph(self.seen, sync_log)
+
+
+def load_case_graph(domain, sync_log):
+    """Load the case graph saved for the given sync log
+
+    :returns: `CaseGraph`, which is empty if no graph was saved or it
+    has expired.
+    """
+    key = getattr(sync_log, "livequery_graph_key", None) if sync_log else None
+    if not key:
+        return CaseGraph(domain)
+    try:
+        blob = get_blob_db().get(key=key, type_code=CODES.restore)
+    except NotFound:
+        return CaseGraph(domain)
+    with blob, gzip.GzipFile(fileobj=blob, mode="rb") as fileobj:
+        return CaseGraph.wrap(domain, json.load(fileobj))
+
+
+def save_case_graph(graph, sync_log):
+    key = "livequery-graph-{}.json.gz".format(uuid4().hex)
+    content = json.dumps(graph.to_json(), separators=(",", ":")).encode("utf-8")
+    get_blob_db().put(
+        BytesIO(gzip.compress(content)),
+        domain=sync_log.domain,
+        parent_id=sync_log.user_id,
+        type_code=CODES.restore,
+        key=key,
+        timeout=GRAPH_BLOB_TIMEOUT,
+    )
+    sync_log.livequery_graph_key = key
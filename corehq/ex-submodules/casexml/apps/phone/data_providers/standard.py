@@ -57,7 +57,8 @@ class FixtureElementProvider(RestoreDataProvider):
             version=restore_state.version,
         )
         for provider in providers:
-            with self.timing_context('fixture:{}'.format(provider.id)):
+            name = 'fixture:{}'.format(provider.id)
+            with self.timing_context(name), restore_state.profile.segment(name):
                 elements = provider(restore_state)
                 for element in elements:
                     yield element
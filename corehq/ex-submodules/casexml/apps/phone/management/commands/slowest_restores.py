@@ -0,0 +1,45 @@
+import json
+
+from django.core.management import BaseCommand
+
+from casexml.apps.phone.restore_profile import clear_restore_profiles, get_slowest_restores
+
+
+class Command(BaseCommand):
+    """
+    Show per data provider profiles of the slowest recent restores in a domain.
+
+    Usage: ./manage.py slowest_restores my-domain --limit 5
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('domain')
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--json', action='store_true', dest='as_json',
+                            help="Print raw profiles as JSON")
+        parser.add_argument('--clear', action='store_true',
+                            help="Delete the domain's stored profiles")
+
+    def handle(self, domain, limit, as_json, clear, **options):
+        if clear:
+            clear_restore_profiles(domain)
+            return
+
+        profiles = get_slowest_restores(domain, limit)
+        if as_json:
+            print(json.dumps(profiles, indent=2))
+            return
+
+        if not profiles:
+            print("No slow restores recorded for {}".format(domain))
+        for profile in profiles:
+            print("{date} {username} device={device_id} sync_log={sync_log_id}".format(**profile))
+            print("  {case_sync} {kind} status={status} duration={duration:.3f}s "
+                  "bytes={bytes} items={items}".format(
+                      kind='initial' if profile['is_initial'] else 'incremental', **profile))
+            print("  {:<40} {:>6} {:>10} {:>8} {:>10} {:>10} {:>12} {:>8}".format(
+                'provider', 'calls', 'duration', 'queries', 'db time', 'rows', 'bytes', 'items'))
+            for segment in profile['providers']:
+                print("  {name:<40} {calls:>6} {duration:>10.3f} {queries:>8} {db_time:>10.3f} "
+                      "{rows:>10} {bytes:>12} {items:>8}".format(**segment))
+            print()
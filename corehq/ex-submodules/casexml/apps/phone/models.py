@@ -592,6 +592,9 @@ class SimplifiedSyncLog(AbstractSyncLog):
     closed_cases = SetProperty(six.text_type)
     extensions_checked = BooleanProperty(default=False)
     device_id = StringProperty()
+    # blob db key of the case graph used by incremental livequery sync,
+    # see casexml.apps.phone.data_providers.case.livequery_graph
+    livequery_graph_key = StringProperty()
 
     _purged_cases = None
 
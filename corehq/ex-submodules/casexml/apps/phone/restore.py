@@ -1,3 +1,4 @@
+import gzip
 import logging
 import os
 import shutil
@@ -22,9 +23,10 @@ from casexml.apps.phone.exceptions import (
     BadStateException, RestoreException
 )
 from casexml.apps.phone.restore_caching import AsyncRestoreTaskIdCache, RestorePayloadPathCache
+from casexml.apps.phone.restore_profile import RestoreProfile, record_restore_profile
 from casexml.apps.phone.tasks import get_async_restore_payload, ASYNC_RESTORE_SENT
 from casexml.apps.phone.utils import get_cached_items_with_count
-from corehq.toggles import EXTENSION_CASES_SYNC_ENABLED, LIVEQUERY_SYNC
+from corehq.toggles import EXTENSION_CASES_SYNC_ENABLED, LIVEQUERY_SYNC, RESTORE_GZIP_PAYLOAD
 from corehq.util.metrics.utils import maybe_add_domain_tag
 from corehq.util.metrics import metrics_counter, metrics_histogram
 from corehq.util.timer import TimingContext
@@ -98,6 +100,14 @@ class StockSettings(object):
 
 
 class RestoreContent(object):
+    """Restore response body writer
+
+    Elements are written to a single temporary file, optionally through
+    gzip, so the finished file can be streamed or saved to the blob db
+    without being copied. When `items` is true the item count must be
+    known before the start tag is written, so elements are buffered in a
+    second temporary file and copied into the output at the end.
+    """
     start_tag_template = (
         b'<OpenRosaResponse xmlns="http://openrosa.org/http/response"%(items)s>'
         b'<message nature="%(nature)s">Successfully restored account %(username)s!</message>'
@@ -105,32 +115,48 @@ class RestoreContent(object):
     items_template = b' items="%s"'
     closing_tag = b'</OpenRosaResponse>'
 
-    def __init__(self, username=None, items=False):
+    def __init__(self, username=None, items=False, compress=False):
         self.username = username
         self.items = items
+        self.compress = compress
         self.num_items = 0
+        self.num_bytes = 0  # uncompressed size of appended elements
 
     def __enter__(self):
-        self.response_body = tempfile.TemporaryFile('w+b')
+        self.fileobj = tempfile.TemporaryFile('w+b')
+        if self.items:
+            self.response_body = tempfile.TemporaryFile('w+b')
+        else:
+            self.response_body = self._get_writer(self.fileobj)
+            self._write_start_tag(self.response_body)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.response_body.close()
+        if self.response_body is not None:
+            self.response_body.close()
+        if self.fileobj is not None:
+            self.fileobj.close()
 
     def append(self, xml_element):
         self.num_items += 1
         if isinstance(xml_element, bytes):
             xml_element, num = get_cached_items_with_count(xml_element)
             self.num_items += num - 1
-            self.response_body.write(xml_element)
         else:
-            self.response_body.write(ElementTree.tostring(xml_element, encoding='utf-8'))
+            xml_element = ElementTree.tostring(xml_element, encoding='utf-8')
+        self.num_bytes += len(xml_element)
+        self.response_body.write(xml_element)
 
     def extend(self, iterable):
         for element in iterable:
             self.append(element)
 
-    def _write_to_file(self, fileobj):
+    def _get_writer(self, fileobj):
+        if self.compress:
+            return gzip.GzipFile(fileobj=fileobj, mode='wb')
+        return fileobj
+
+    def _write_start_tag(self, fileobj):
         # Add 1 to num_items to account for message element
         items = (self.items_template % ('%s' % (self.num_items + 1)).encode('utf-8')) if self.items else b''
         fileobj.write(self.start_tag_template % {
@@ -139,29 +165,58 @@ class RestoreContent(object):
             b"nature": ResponseNature.OTA_RESTORE_SUCCESS.encode("utf8"),
         })
 
-        self.response_body.seek(0)
-        shutil.copyfileobj(self.response_body, fileobj)
-
-        fileobj.write(self.closing_tag)
-
     def get_fileobj(self):
-        fileobj = tempfile.TemporaryFile('w+b')
+        """Finish the response and get the file containing it
+
+        The caller is responsible for closing the returned file. Its
+        content is gzip-compressed if `self.compress` is true.
+        """
+        fileobj = self.fileobj
         try:
-            self._write_to_file(fileobj)
+            if self.items:
+                writer = self._get_writer(fileobj)
+                self._write_start_tag(writer)
+                self.response_body.seek(0)
+                shutil.copyfileobj(self.response_body, writer)
+            else:
+                writer = self.response_body
+            writer.write(self.closing_tag)
+            if writer is not fileobj:
+                writer.close()  # flush gzip trailer, leaves fileobj open
             fileobj.seek(0)
-            return fileobj
         except:
             fileobj.close()
             raise
+        if self.response_body is fileobj:
+            self.response_body = None
+        self.fileobj = None
+        return fileobj
+
+
+def _decompress(fileobj):
+    return gzip.GzipFile(fileobj=fileobj, mode='rb')
+
+
+def _stream_payload(fileobj, content_length, is_gzip, accept_gzip):
+    if not is_gzip:
+        return stream_response(fileobj, {'Content-Length': content_length})
+    if accept_gzip:
+        return stream_response(fileobj, {
+            'Content-Length': content_length,
+            'Content-Encoding': 'gzip',
+        })
+    # decompressed length is unknown without reading the whole file
+    return stream_response(_decompress(fileobj))
 
 
 class RestoreResponse(object):
 
-    def __init__(self, fileobj):
+    def __init__(self, fileobj, is_gzip=False):
         self.fileobj = fileobj
+        self.is_gzip = is_gzip
 
     def as_file(self):
-        return self.fileobj
+        return _decompress(self.fileobj) if self.is_gzip else self.fileobj
 
     def as_string(self):
         """Get content as utf8-encoded bytes
@@ -170,14 +225,14 @@ class RestoreResponse(object):
         Cannot be called more than once, and `self.as_file()` will
         return a closed file after this is called.
         """
-        with self.fileobj:
-            return self.fileobj.read()
+        with self.fileobj, self.as_file() as fileobj:
+            return fileobj.read()
 
-    def get_http_response(self):
+    def get_http_response(self, accept_gzip=False):
         self.fileobj.seek(0, os.SEEK_END)
-        headers = {'Content-Length': self.fileobj.tell()}
+        content_length = self.fileobj.tell()
         self.fileobj.seek(0)
-        return stream_response(self.fileobj, headers)
+        return _stream_payload(self.fileobj, content_length, self.is_gzip, accept_gzip)
 
 
 class AsyncRestoreResponse(object):
@@ -204,7 +259,7 @@ class AsyncRestoreResponse(object):
 
         return ElementTree.tostring(root, encoding='utf-8')
 
-    def get_http_response(self):
+    def get_http_response(self, accept_gzip=False):
         headers = {"Retry-After": self.progress['retry_after']}
         response = stream_response(
             BytesIO(self.compile_response()),
@@ -226,15 +281,20 @@ class CachedResponse(object):
             name = "_default/" + name
         self.name = name
 
+    @property
+    def is_gzip(self):
+        return bool(self.name) and self.name.endswith('.gz')
+
     @classmethod
-    def save_for_later(cls, fileobj, timeout, domain, restore_user_id):
+    def save_for_later(cls, fileobj, timeout, domain, restore_user_id, is_gzip=False):
         """Save restore response for later
 
         :param fileobj: A file-like object.
         :param timeout: Minimum content expiration in seconds.
+        :param is_gzip: Whether the content of `fileobj` is gzip-compressed.
         :returns: A new `CachedResponse` pointing to the saved content.
         """
-        name = 'restore-{}.xml'.format(uuid4().hex)
+        name = 'restore-{}.xml{}'.format(uuid4().hex, '.gz' if is_gzip else '')
         get_blob_db().put(
             NoClose(fileobj),
             domain=domain,
@@ -247,17 +307,21 @@ class CachedResponse(object):
 
     def __bool__(self):
         try:
-            return bool(self.as_file())
+            return bool(self._get_blob())
         except NotFound:
             return False
 
     __nonzero__ = __bool__
 
     def as_string(self):
-        with self.as_file() as fileobj:
+        with self._get_blob(), self.as_file() as fileobj:
             return fileobj.read()
 
     def as_file(self):
+        blob = self._get_blob()
+        return _decompress(blob) if blob and self.is_gzip else blob
+
+    def _get_blob(self):
         try:
             value = self._fileobj
         except AttributeError:
@@ -265,10 +329,9 @@ class CachedResponse(object):
             self._fileobj = value
         return value
 
-    def get_http_response(self):
-        file = self.as_file()
-        headers = {'Content-Length': file.content_length}
-        return stream_response(file, headers)
+    def get_http_response(self, accept_gzip=False):
+        file = self._get_blob()
+        return _stream_payload(file, file.content_length, self.is_gzip, accept_gzip)
 
 
 class RestoreParams(object):
@@ -282,6 +345,7 @@ class RestoreParams(object):
     :param state_hash:          The case state hash string to use to verify the state of the phone
     :param include_item_count:  Set to `True` to include the item count in the response
     :param device_id:           The Device id of the device restoring
+    :param accept_gzip:         Set to `True` if the client accepts gzip content encoding
     """
 
     def __init__(self,
@@ -291,7 +355,8 @@ class RestoreParams(object):
             include_item_count=False,
             device_id=None,
             app=None,
-            openrosa_version=None):
+            openrosa_version=None,
+            accept_gzip=False):
         self.sync_log_id = sync_log_id
         self.version = version
         self.state_hash = state_hash
@@ -300,6 +365,7 @@ class RestoreParams(object):
         self.device_id = device_id
         self.openrosa_version = (LooseVersion(openrosa_version)
             if isinstance(openrosa_version, str) else openrosa_version)
+        self.accept_gzip = accept_gzip
 
     @property
     def app_id(self):
@@ -357,6 +423,7 @@ class RestoreState(object):
         self.restore_user = restore_user
         self.params = params
         self.provider_log = {}  # individual data providers can log stuff here
+        self.profile = RestoreProfile()
         # get set in the start_sync() function
         self.start_time = None
         self.duration = None
@@ -532,6 +599,13 @@ class RestoreConfig(object):
     def sync_log(self):
         return self.restore_state.last_sync_log
 
+    @property
+    @memoized
+    def compress_payload(self):
+        # async and cached payloads may be served to a client that does
+        # not accept gzip, in which case they are decompressed on the fly
+        return self.params.accept_gzip and RESTORE_GZIP_PAYLOAD.enabled(self.domain)
+
     @property
     def async_restore_task_id_cache(self):
         return AsyncRestoreTaskIdCache(
@@ -564,7 +638,7 @@ class RestoreConfig(object):
         try:
             with self.timing_context:
                 payload = self.get_payload()
-            response = payload.get_http_response()
+            response = payload.get_http_response(accept_gzip=self.params.accept_gzip)
         except RestoreException as e:
             logger.exception("%s error during restore submitted by %s: %s" %
                               (type(e).__name__, self.restore_user.username, str(e)))
@@ -634,7 +708,7 @@ class RestoreConfig(object):
                 self._record_timing('async')
             else:
                 fileobj.seek(0)
-                response = RestoreResponse(fileobj)
+                response = RestoreResponse(fileobj, is_gzip=self.compress_payload)
         except:
             fileobj.close()
             raise
@@ -693,13 +767,17 @@ class RestoreConfig(object):
         """
         username = self.restore_user.username
         count_items = self.params.include_item_count
-        with RestoreContent(username, count_items) as content:
+        profile = self.restore_state.profile
+        with RestoreContent(username, count_items, self.compress_payload) as content:
+            profile.content = content
             for provider in get_element_providers(self.timing_context, skip_fixtures=self.skip_fixtures):
-                with self.timing_context(provider.__class__.__name__):
+                name = provider.__class__.__name__
+                with self.timing_context(name), profile.segment(name):
                     content.extend(provider.get_elements(self.restore_state))
 
             for provider in get_async_providers(self.timing_context, async_task):
-                with self.timing_context(provider.__class__.__name__):
+                name = provider.__class__.__name__
+                with self.timing_context(name), profile.segment(name):
                     provider.extend_response(self.restore_state, content)
 
             return content.get_fileobj()
@@ -725,6 +803,7 @@ class RestoreConfig(object):
                 self.cache_timeout,
                 self.domain,
                 self.restore_user.user_id,
+                is_gzip=self.compress_payload,
             )
             self.restore_payload_path_cache.set_value(response.name, self.cache_timeout)
             return response
@@ -806,6 +885,7 @@ class RestoreConfig(object):
             bucket_tag='duration', buckets=timer_buckets, bucket_unit='s',
             tags=tags
         )
+        record_restore_profile(self, duration, status)
 
     def __repr__(self):
         return \
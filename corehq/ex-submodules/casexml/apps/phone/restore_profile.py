@@ -0,0 +1,164 @@
+"""Per data provider restore profiles
+
+`RestoreProfile` records, for each data provider (and selected parts of
+providers such as individual fixtures and ledgers), how long it ran, how
+many SQL queries it made, how much time those queries took, how many rows
+they returned and how many bytes and items it added to the restore.
+
+Segments may be nested and may be entered more than once (the stock
+payload is generated once per case batch, for example); each segment's
+numbers include its nested segments and are summed over all entries.
+
+Profiles of slow restores are kept in redis in a sorted set per domain,
+trimmed to the slowest `RESTORE_PROFILE_MAX_PER_DOMAIN` restores.
+
+Only queries made through Django database connections on the restore
+thread are counted. Couch requests and queries made by the livequery case
+prefetch thread are not.
+"""
+import json
+import logging
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+
+from django.db import connections
+
+from dimagi.utils.couch import get_redis_client
+
+from casexml.apps.phone.const import (
+    RESTORE_PROFILE_MAX_PER_DOMAIN,
+    RESTORE_PROFILE_THRESHOLD,
+    RESTORE_PROFILE_TIMEOUT,
+)
+
+logger = logging.getLogger('restore')
+
+
+class SegmentStats(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.duration = 0
+        self.queries = 0
+        self.db_time = 0
+        self.rows = 0
+        self.bytes = 0
+        self.items = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.time()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.time() - start
+            rowcount = getattr(context.get('cursor'), 'rowcount', -1)
+            if rowcount and rowcount > 0:
+                self.rows += rowcount
+
+    def to_json(self):
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'duration': self.duration,
+            'queries': self.queries,
+            'db_time': self.db_time,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'items': self.items,
+        }
+
+
+class RestoreProfile(object):
+    """Collect per data provider restore statistics
+
+    `content` is the `RestoreContent` being written; bytes and items are
+    counted by comparing its totals before and after each segment.
+    """
+
+    def __init__(self):
+        self.content = None
+        self.segments = OrderedDict()
+
+    @contextmanager
+    def segment(self, name):
+        stats = self.segments.get(name)
+        if stats is None:
+            stats = self.segments[name] = SegmentStats(name)
+        content = self.content
+        start_bytes = content.num_bytes if content is not None else 0
+        start_items = content.num_items if content is not None else 0
+        start = time.time()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats.record_query))
+                yield stats
+        finally:
+            stats.calls += 1
+            stats.duration += time.time() - start
+            if content is not None:
+                stats.bytes += content.num_bytes - start_bytes
+                stats.items += content.num_items - start_items
+
+    def to_json(self):
+        return [stats.to_json() for stats in self.segments.values()]
+
+
+def _get_profile_key(domain):
+    return 'restore-profiles:{}'.format(domain)
+
+
+def record_restore_profile(restore_config, duration, status):
+    """Store the restore's profile if it is one of the slowest for its domain
+
+    Restores faster than `RESTORE_PROFILE_THRESHOLD` are not recorded.
+    """
+    profile = restore_config.restore_state.profile
+    if duration < RESTORE_PROFILE_THRESHOLD or not profile.segments:
+        return
+    restore_state = restore_config.restore_state
+    sync_log = restore_state.current_sync_log
+    content = profile.content
+    data = {
+        'date': datetime.utcnow().isoformat(),
+        'username': restore_config.restore_user.username,
+        'user_id': restore_config.restore_user.user_id,
+        'device_id': restore_config.params.device_id,
+        'sync_log_id': sync_log._id if sync_log else None,
+        'is_initial': restore_state.is_initial,
+        'is_async': bool(restore_config.is_async),
+        'case_sync': restore_state._case_sync,
+        'status': status,
+        'duration': duration,
+        'bytes': content.num_bytes if content is not None else None,
+        'items': content.num_items if content is not None else None,
+        'providers': profile.to_json(),
+    }
+    key = _get_profile_key(restore_config.domain)
+    try:
+        client = get_redis_client().client.get_client()
+        pipeline = client.pipeline()
+        pipeline.zadd(key, {json.dumps(data): duration})
+        pipeline.zremrangebyrank(key, 0, -RESTORE_PROFILE_MAX_PER_DOMAIN - 1)
+        pipeline.expire(key, RESTORE_PROFILE_TIMEOUT)
+        pipeline.execute()
+    except Exception:
+        logger.exception("Error recording restore profile for %s", restore_config.domain)
+
+
+def get_slowest_restores(domain, limit=RESTORE_PROFILE_MAX_PER_DOMAIN):
+    """Get profiles of the slowest recent restores in the domain
+
+    :returns: List of profile dicts, slowest first.
+    """
+    client = get_redis_client().client.get_client()
+    values = client.zrevrange(_get_profile_key(domain), 0, limit - 1)
+    return [json.loads(value) for value in values]
+
+
+def clear_restore_profiles(domain):
+    get_redis_client().client.get_client().delete(_get_profile_key(domain))
@@ -0,0 +1,211 @@
+from datetime import datetime
+
+from django.test import SimpleTestCase
+
+from mock import patch
+
+from casexml.apps.phone.data_providers.case.livequery_graph import (
+    CLOSED,
+    OPEN,
+    CaseGraph,
+    CaseGraphAccessor,
+)
+from corehq.form_processor.models import CommCareCaseIndexSQL
+
+SYNC_DATE = datetime(2020, 1, 1)
+OWNER_ID = "owner"
+CHILD = CommCareCaseIndexSQL.CHILD
+EXTENSION = CommCareCaseIndexSQL.EXTENSION
+
+
+class FakeAccessor(object):
+    """In-memory stand-in for `CaseAccessors` recording graph queries"""
+
+    domain = "test"
+
+    def __init__(self, indices, closed=(), modified=(), owned=()):
+        self.indices = [
+            CommCareCaseIndexSQL(
+                domain=self.domain,
+                case_id=case_id,
+                identifier=identifier,
+                referenced_type="case",
+                referenced_id=ref_id,
+                relationship_id=relationship_id,
+            )
+            for case_id, identifier, ref_id, relationship_id in indices
+        ]
+        self.closed = set(closed)
+        self.modified = set(modified)
+        self.owned = set(owned)
+        self.queried_ids = []
+
+    def get_related_indices(self, case_ids, exclude_indices):
+        self.queried_ids.extend(case_ids)
+        return [
+            ix for ix in self.indices
+            if '{} {}'.format(ix.case_id, ix.identifier) not in exclude_indices
+            and (ix.case_id in case_ids or (
+                ix.referenced_id in case_ids
+                and ix.relationship_id == EXTENSION
+                and ix.case_id not in self.closed
+            ))
+        ]
+
+    def get_closed_and_deleted_ids(self, case_ids):
+        return [(case_id, True, False) for case_id in case_ids if case_id in self.closed]
+
+    def get_case_ids_modified_since(self, owner_ids, case_ids, reference_date):
+        assert reference_date == SYNC_DATE, reference_date
+        return [
+            case_id for case_id in self.modified
+            if (case_id in self.owned and OWNER_ID in owner_ids) or case_id in case_ids
+        ]
+
+    def get_modified_extension_indices_since(self, referenced_ids, reference_date):
+        assert reference_date == SYNC_DATE, reference_date
+        return [
+            (ix.case_id, ix.referenced_id) for ix in self.indices
+            if ix.referenced_id in referenced_ids
+            and ix.relationship_id == EXTENSION
+            and ix.case_id in self.modified
+            and ix.case_id not in self.closed
+        ]
+
+    def get_owned_ids(self):
+        return sorted(self.owned - self.closed)
+
+
+class SyncLogStub(object):
+    date = SYNC_DATE
+    livequery_graph_key = None
+
+
+class GraphStore(object):
+    """In-memory stand-in for the blob db storing case graphs"""
+
+    def __init__(self):
+        self.graphs = {}
+
+    def load(self, domain, sync_log):
+        return CaseGraph.wrap(domain, self.graphs.get(sync_log.livequery_graph_key) if sync_log else None)
+
+    def save(self, graph, sync_log):
+        sync_log.livequery_graph_key = "graph-{}".format(len(self.graphs))
+        self.graphs[sync_log.livequery_graph_key] = graph.to_json()
+
+
+def walk(accessor, case_ids):
+    """Simplified livequery walk collecting related index keys"""
+    seen = set()
+    next_ids = set(case_ids)
+    all_ids = set(case_ids)
+    while next_ids:
+        related = accessor.get_related_indices(list(next_ids), seen)
+        if not related:
+            break
+        accessor.get_closed_and_deleted_ids(sorted(
+            {cid for ix in related for cid in [ix.case_id, ix.referenced_id]} - all_ids))
+        seen.update('{} {}'.format(ix.case_id, ix.identifier) for ix in related)
+        next_ids = {cid for ix in related for cid in [ix.case_id, ix.referenced_id]} - all_ids
+        all_ids.update(next_ids)
+    return seen
+
+
+def get_graph_accessor(db, sync_log):
+    return CaseGraphAccessor.from_sync_log(db, sync_log, [OWNER_ID], db.get_owned_ids())
+
+
+def snapshot(db):
+    graph_accessor = get_graph_accessor(db, None)
+    walk(graph_accessor, db.get_owned_ids())
+    sync_log = SyncLogStub()
+    graph_accessor.save_graph(sync_log, db.get_owned_ids())
+    return sync_log
+
+
+class CaseGraphTest(SimpleTestCase):
+
+    def test_wrap_compact_json(self):
+        graph = CaseGraph(
+            "test",
+            indices={"c": {"parent": ("case", "b", CHILD)}, "b": {"host": ("case", "a", EXTENSION)}},
+            status={"c": OPEN, "a": CLOSED},
+            walked_ids={"a", "b", "c"},
+            owned_ids={"c"},
+        )
+        data = graph.to_json()
+        self.assertEqual(data["ids"][:2], ["c", "a"])
+        self.assertEqual(len(data["ids"]), 3)
+
+        wrapped = CaseGraph.wrap("test", data)
+        self.assertEqual(wrapped.indices, graph.indices)
+        self.assertEqual(wrapped.status, graph.status)
+        self.assertEqual(wrapped.walked_ids, graph.walked_ids)
+        self.assertEqual(wrapped.owned_ids, graph.owned_ids)
+
+
+class CaseGraphAccessorTest(SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        store = GraphStore()
+        for name, func in [("load_case_graph", store.load), ("save_case_graph", store.save)]:
+            patcher = patch("casexml.apps.phone.data_providers.case.livequery_graph." + name, func)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.store = store
+
+    def test_initial_walk_records_graph(self):
+        db = FakeAccessor([("c", "parent", "b", CHILD), ("b", "host", "a", EXTENSION)], closed=["a"], owned=["c"])
+        sync_log = snapshot(db)
+        graph = CaseGraph.wrap("test", self.store.graphs[sync_log.livequery_graph_key])
+        self.assertEqual(graph.walked_ids, {"a", "b", "c"})
+        self.assertEqual(graph.status, {"a": CLOSED, "b": OPEN, "c": OPEN})
+        self.assertEqual(set(graph.indices), {"b", "c"})
+        self.assertEqual(graph.owned_ids, {"c"})
+
+    def test_unchanged_graph_is_not_queried(self):
+        db = FakeAccessor([("c", "parent", "b", CHILD), ("b", "host", "a", EXTENSION)], owned=["c"])
+        expected = walk(db, ["c"])
+        sync_log = snapshot(db)
+
+        graph_accessor = get_graph_accessor(db, sync_log)
+        db.queried_ids = []
+        self.assertEqual(walk(graph_accessor, ["c"]), expected)
+        self.assertEqual(db.queried_ids, [])
+
+    def test_modified_case_and_neighbours_are_queried(self):
+        db = FakeAccessor([
+            ("d", "parent", "c", CHILD),
+            ("c", "parent", "b", CHILD),
+            ("b", "host", "a", EXTENSION),
+        ], owned=["d"])
+        sync_log = snapshot(db)
+        # d is now a child of n instead of c
+        db.indices[0] = FakeAccessor([("d", "parent", "n", CHILD)]).indices[0]
+        db.modified.add("d")
+
+        graph_accessor = get_graph_accessor(db, sync_log)
+        self.assertEqual(graph_accessor.known_ids, {"a", "b"})
+        db.queried_ids = []
+        self.assertEqual(walk(graph_accessor, ["d"]), {"d parent"})
+        self.assertEqual(db.queried_ids, ["d", "n"])
+
+    def test_case_no_longer_owned_is_queried(self):
+        db = FakeAccessor([("c", "parent", "b", CHILD), ("e", "parent", "f", CHILD)], owned=["c", "e"])
+        sync_log = snapshot(db)
+        db.owned.discard("c")
+
+        graph_accessor = get_graph_accessor(db, sync_log)
+        self.assertEqual(graph_accessor.known_ids, {"e", "f"})
+
+    def test_new_extension_of_graph_case_is_found(self):
+        db = FakeAccessor([("b", "host", "a", EXTENSION)], owned=["b"])
+        sync_log = snapshot(db)
+        db.indices.append(FakeAccessor([("x", "host", "b", EXTENSION)]).indices[0])
+        db.modified.add("x")
+
+        graph_accessor = get_graph_accessor(db, sync_log)
+        self.assertNotIn("b", graph_accessor.known_ids)
+        self.assertEqual(walk(graph_accessor, ["b"]), {"b host", "x host"})
@@ -0,0 +1,30 @@
+import threading
+
+from django.test import SimpleTestCase
+
+from casexml.apps.phone.data_providers.case.livequery import prefetch_batches
+
+
+class PrefetchBatchesTest(SimpleTestCase):
+
+    def test_batches_are_yielded_in_order(self):
+        def fetch(ids):
+            return [i * 2 for i in ids]
+
+        loaded = []
+        batches = list(prefetch_batches(fetch, iter([[1, 2], [3], [4, 5, 6]]), loaded.append))
+        self.assertEqual(batches, [[2, 4], [6], [8, 10, 12]])
+        self.assertEqual(loaded, [2, 1, 3])
+
+    def test_fetch_runs_off_the_calling_thread(self):
+        threads = set()
+
+        def fetch(ids):
+            threads.add(threading.current_thread())
+            return ids
+
+        list(prefetch_batches(fetch, iter([[1], [2]]), lambda n: None))
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_no_batches(self):
+        self.assertEqual(list(prefetch_batches(list, iter([]), lambda n: None)), [])
@@ -1,3 +1,5 @@
+import gzip
+
 import six
 from django.test import TestCase
 from django.test.testcases import SimpleTestCase
@@ -75,3 +77,13 @@ class TestRestoreContent(SimpleTestCase):
             response.append(body.encode('utf-8'))
             with response.get_fileobj() as fileobj:
                 self.assertEqual(expected, fileobj.read().decode('utf-8'))
+
+    def test_compressed(self):
+        user = 'user1'
+        body = '<elem>data0</elem>'
+        for items in [False, True]:
+            expected = self._expected(user, body, items=2 if items else None)
+            with RestoreContent(user, items, compress=True) as response:
+                response.append(body.encode('utf-8'))
+                with response.get_fileobj() as fileobj:
+                    self.assertEqual(expected, gzip.decompress(fileobj.read()).decode('utf-8'))
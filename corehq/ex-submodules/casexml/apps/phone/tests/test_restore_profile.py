@@ -0,0 +1,33 @@
+from xml.etree import cElementTree as ElementTree
+
+from django.test import SimpleTestCase
+
+from casexml.apps.phone.restore import RestoreContent
+from casexml.apps.phone.restore_profile import RestoreProfile
+
+
+class RestoreProfileTest(SimpleTestCase):
+
+    def test_segments_count_content(self):
+        profile = RestoreProfile()
+        with RestoreContent('user') as content:
+            profile.content = content
+            with profile.segment('FixtureElementProvider'):
+                with profile.segment('fixture:a'):
+                    content.append(b'<!--items=2--><a/><a/>')
+                with profile.segment('fixture:b'):
+                    content.append(ElementTree.Element('b'))
+            for x in range(2):
+                with profile.segment('stock'):
+                    content.append(b'<c/>')
+
+        stats = {segment['name']: segment for segment in profile.to_json()}
+        self.assertEqual(list(stats), ['FixtureElementProvider', 'fixture:a', 'fixture:b', 'stock'])
+        self.assertEqual(stats['fixture:a']['items'], 2)
+        self.assertEqual(stats['fixture:a']['bytes'], 8)
+        self.assertEqual(stats['fixture:b']['bytes'], len(b'<b />'))
+        self.assertEqual(stats['FixtureElementProvider']['items'], 3)
+        self.assertEqual(stats['FixtureElementProvider']['bytes'], 8 + len(b'<b />'))
+        self.assertEqual(stats['stock']['calls'], 2)
+        self.assertEqual(stats['stock']['items'], 2)
+        self.assertEqual(content.num_bytes, 8 + len(b'<b />') + 8)
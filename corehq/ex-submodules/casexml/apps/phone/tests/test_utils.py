@@ -1,6 +1,10 @@
+import hashlib
+import json
 from datetime import datetime
+from xml.etree import cElementTree as ElementTree
 
-from django.test import SimpleTestCase, override_settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from mock import Mock
 
 import casexml.apps.phone.utils as mod
 from casexml.apps.case.mock import CaseStructure
@@ -8,6 +12,8 @@ from casexml.apps.case.tests.util import delete_all_cases, delete_all_ledgers, d
 from casexml.apps.phone.tests.test_sync_mode import BaseSyncTest
 from casexml.apps.stock.mock import Balance, Entry, Transfer
 from corehq.apps.app_manager.tests.util import TestXmlMixin
+from corehq.blobs import CODES, get_blob_db
+from corehq.blobs.tests.util import TemporaryFilesystemBlobDB
 from corehq.form_processor.interfaces.dbaccessors import CaseAccessors
 from corehq.util.test_utils import flag_enabled
 
@@ -33,6 +39,39 @@ class TestUtils(SimpleTestCase):
         self.assertEqual(num, 1)
 
 
+class TestSharedFixtureCache(TestCase):
+
+    def setUp(self):
+        super(TestSharedFixtureCache, self).setUp()
+        self.db = TemporaryFilesystemBlobDB()
+        self.addCleanup(self.db.close)
+        self.content_key = ['shared-fixture-test', datetime.utcnow().isoformat()]
+
+    def get_fixture(self, name, overwrite_cache=False):
+        restore_state = Mock(overwrite_cache=overwrite_cache)
+        restore_state.restore_user.domain = 'shared-fixture-test'
+        restore_state.restore_user.user_id = 'user-id'
+        data_fn = Mock(return_value=[ElementTree.Element(name)])
+        data, = mod.get_or_cache_shared_fixture(restore_state, 'fixtures', self.content_key, data_fn)
+        return data, data_fn.called
+
+    def test_cache_hit(self):
+        self.assertEqual(self.get_fixture('one'), (b'<!--items=1--><one />', True))
+        self.assertEqual(self.get_fixture('two'), (b'<!--items=1--><one />', False))
+
+    def test_overwrite_cache_writes_new_blob(self):
+        self.get_fixture('one')
+        content_hash = hashlib.sha1(json.dumps(self.content_key).encode('utf-8')).hexdigest()
+        blob_key = mod.get_redis_default_cache().get(
+            mod._shared_fixture_cache_key('fixtures/shared-fixture-test/' + content_hash))
+        self.assertEqual(self.get_fixture('two', overwrite_cache=True), (b'<!--items=1--><two />', True))
+        self.assertEqual(self.get_fixture('three'), (b'<!--items=1--><two />', False))
+
+        # the previous version is still readable until it expires
+        with get_blob_db().get(key=blob_key, type_code=CODES.fixture) as blob:
+            self.assertEqual(blob.read(), b'<!--items=1--><one />')
+
+
 @flag_enabled('NON_COMMTRACK_LEDGERS')
 @override_settings(TESTS_SHOULD_USE_SQL_BACKEND=True)
 class MockDeviceLedgersTest(BaseSyncTest, TestXmlMixin):
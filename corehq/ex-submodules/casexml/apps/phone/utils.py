@@ -1,3 +1,5 @@
+import hashlib
+import json
 import re
 import weakref
 from io import BytesIO
@@ -9,6 +11,7 @@ import six
 
 from casexml.apps.case.mock import CaseBlock, CaseFactory, CaseStructure
 from casexml.apps.case.xml import V1, V2, V2_NAMESPACE
+from casexml.apps.phone.const import SHARED_FIXTURE_CACHE_TIMEOUT
 from casexml.apps.phone.models import get_properly_wrapped_sync_log
 from casexml.apps.phone.restore_caching import RestorePayloadPathCache
 from casexml.apps.phone.xml import SYNC_XMLNS
@@ -20,6 +23,7 @@ from corehq.blobs import get_blob_db, CODES, NotFound
 from corehq.blobs.models import BlobMeta
 from corehq.util.metrics import metrics_counter
 from dimagi.utils.couch import CriticalSection
+from dimagi.utils.couch.cache.cache_core import get_redis_default_cache
 
 ITEMS_COMMENT_PREFIX = b'<!--items='
 ITESM_COMMENT_REGEX = re.compile(br'(<!--items=(\d+)-->)')
@@ -72,6 +76,87 @@ def get_or_cache_global_fixture(restore_state, cache_bucket_prefix, fixture_name
     return [data.replace(global_id, b_user_id)] if data else []
 
 
+def get_or_cache_shared_fixture(restore_state, cache_bucket_prefix, content_key, data_fn):
+    """
+    Get the fixture data for a fixture that is identical for all users
+    with the same inputs.
+
+    The serialized fixture is cached under a hash of `content_key`, so
+    all users and syncs producing the same key share one copy. Each
+    version is stored in the blob db under its own key, and the redis
+    cache points from the content hash to the current version. The
+    fixture must be generated with `GLOBAL_USER_ID` in place of the
+    restore user's id.
+
+    :param restore_state: Restore state object used to access features of the restore
+    :param cache_bucket_prefix: Fixture bucket prefix
+    :param content_key: JSON-serializable value that changes whenever
+    the content of the fixture would change (item ids and versions,
+    location ids and modification dates, etc.)
+    :param data_fn: Function to generate the XML fixture elements
+    :return: list containing byte string representation of the fixture
+    """
+    domain = restore_state.restore_user.domain
+    content_hash = hashlib.sha1(
+        json.dumps(content_key, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+    key = '{}/{}/{}'.format(cache_bucket_prefix, domain, content_hash)
+    metric_key = '{}/{}'.format(cache_bucket_prefix, domain)
+
+    data = None
+    if not restore_state.overwrite_cache:
+        data = _get_cached_fixture_by_key(key)
+        _record_datadog_metric('shared_cache_miss' if data is None else 'shared_cache_hit', metric_key)
+
+    if data is None:
+        with CriticalSection([key]):
+            if not restore_state.overwrite_cache:
+                # re-check cache to avoid re-computing it
+                data = _get_cached_fixture_by_key(key)
+            if data is None:
+                _record_datadog_metric('shared_generate', metric_key)
+                io_data = write_fixture_items_to_io(data_fn())
+                data = io_data.read()
+                io_data.seek(0)
+                # write each version under a new blob key and then point to
+                # it so concurrent readers never see a missing blob; the
+                # previous version is left to expire
+                blob_key = '{}/{}'.format(key, uuid4().hex)
+                get_blob_db().put(
+                    io_data,
+                    domain=domain,
+                    parent_id=domain,
+                    type_code=CODES.fixture,
+                    key=blob_key,
+                    timeout=SHARED_FIXTURE_CACHE_TIMEOUT,
+                )
+                get_redis_default_cache().set(
+                    _shared_fixture_cache_key(key),
+                    blob_key,
+                    timeout=SHARED_FIXTURE_CACHE_TIMEOUT * 60,
+                )
+
+    global_id = GLOBAL_USER_ID.encode('utf-8')
+    b_user_id = restore_state.restore_user.user_id.encode('utf-8')
+    return [data.replace(global_id, b_user_id)] if data else []
+
+
+def _shared_fixture_cache_key(key):
+    return 'shared-fixture-blob-key/' + key
+
+
+def _get_cached_fixture_by_key(key):
+    blob_key = get_redis_default_cache().get(_shared_fixture_cache_key(key))
+    if blob_key is None:
+        return None
+    try:
+        blob = get_blob_db().get(key=blob_key, type_code=CODES.fixture)
+    except NotFound:
+        return None
+    with blob:
+        return blob.read()
+
+
 def write_fixture_items_to_io(items):
     io = BytesIO()
     io.write(ITEMS_COMMENT_PREFIX)
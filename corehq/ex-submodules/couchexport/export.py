@@ -20,6 +20,8 @@ def get_writer(format, use_formatted_cells=False):
             Format.UNZIPPED_CSV: writers.UnzippedCsvExportWriter,
             Format.CDISC_ODM: writers.CdiscOdmExportWriter,
             Format.PYTHON_DICT: writers.PythonDictWriter,
+            Format.PARQUET: writers.ParquetExportWriter,
+            Format.ARROW: writers.ArrowExportWriter,
         }[format]()
     except KeyError:
         raise UnsupportedExportFormat("Unsupported export format: %s!" % format)
@@ -2,6 +2,7 @@ from codecs import BOM_UTF8
 from contextlib import closing
 import io
 import os
+import zipfile
 
 from django.test import SimpleTestCase
 from lxml import html, etree
@@ -12,6 +13,7 @@ from couchexport.models import Format
 from couchexport.writers import (
     MAX_XLS_COLUMNS,
     CsvFileWriter,
+    ParquetFileWriter,
     PythonDictWriter,
     XlsLengthException,
     ZippedExportWriter,
@@ -143,6 +145,55 @@ class Excel2003ExportWriterTests(SimpleTestCase):
         export_from_tables(tables, file_, format_)
 
 
+class ColumnarExportWriterTests(SimpleTestCase):
+    table = [
+        ['name', 'case_type', 'age'],
+        ['Alice', 'patient', 30],
+        ['Bob', b'patient', None],
+        ['Chloé', 'patient', 25],
+    ]
+
+    def _export(self, format_):
+        file_ = io.BytesIO()
+        export_from_tables([['Spam', self.table]], file_, format_)
+        file_.seek(0)
+        with zipfile.ZipFile(file_) as archive:
+            self.assertEqual(len(archive.namelist()), 1)
+            return io.BytesIO(archive.read(archive.namelist()[0]))
+
+    def test_parquet(self):
+        from pyarrow import parquet
+        table = parquet.read_table(self._export(Format.PARQUET))
+        self.assertEqual(table.column_names, ['name', 'case_type', 'age'])
+        self.assertEqual(table.to_pydict(), {
+            'name': ['Alice', 'Bob', 'Chloé'],
+            'case_type': ['patient', 'patient', 'patient'],
+            'age': ['30', '', '25'],
+        })
+
+    def test_parquet_dictionary_encoding(self):
+        from pyarrow import parquet
+        metadata = parquet.ParquetFile(self._export(Format.PARQUET)).metadata
+        case_type = metadata.row_group(0).column(1)
+        self.assertTrue(any('DICTIONARY' in encoding for encoding in case_type.encodings))
+
+    def test_parquet_row_groups(self):
+        from pyarrow import parquet
+        with patch.object(ParquetFileWriter, 'row_group_size', 2):
+            metadata = parquet.ParquetFile(self._export(Format.PARQUET)).metadata
+        self.assertEqual(metadata.num_row_groups, 2)
+        self.assertEqual(metadata.num_rows, 3)
+
+    def test_arrow(self):
+        import pyarrow
+        table = pyarrow.ipc.open_file(self._export(Format.ARROW)).read_all()
+        self.assertEqual(table.to_pydict(), {
+            'name': ['Alice', 'Bob', 'Chloé'],
+            'case_type': ['patient', 'patient', 'patient'],
+            'age': ['30', '', '25'],
+        })
+
+
 class HeaderNameTest(SimpleTestCase):
 
     def test_names_matching_case(self):
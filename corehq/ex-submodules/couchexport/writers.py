@@ -127,6 +127,91 @@ class CsvFileWriter(ExportFileWriter):
         self._file.write(buffer.getvalue().encode('utf-8'))
 
 
+class ColumnarFileWriter(ExportFileWriter):
+    """
+    Buffers the values of each column and writes them to a columnar file
+    ``row_group_size`` rows at a time. The first row is the headers.
+
+    All columns are strings, as in CSV exports.
+    """
+    row_group_size = 50000
+
+    def _open(self):
+        self._schema = None
+        self._columns = None
+        self._buffered_rows = 0
+        self._writer = None
+
+    def write_row(self, row):
+        if self._schema is None:
+            self._open_columns(row)
+            return
+        for column, value in zip(self._columns, row):
+            column.append(_get_columnar_value(value))
+        self._buffered_rows += 1
+        if self._buffered_rows >= self.row_group_size:
+            self._write_row_group()
+
+    def _open_columns(self, headers):
+        import pyarrow
+        self._schema = pyarrow.schema([
+            (_get_columnar_value(header), pyarrow.string()) for header in headers
+        ])
+        self._columns = [[] for header in headers]
+        # the file is written by path, self._file stays empty
+        self._writer = self._get_writer(self._path, self._schema)
+
+    def _get_writer(self, path, schema):
+        raise NotImplementedError
+
+    def _write_row_group(self):
+        import pyarrow
+        table = pyarrow.Table.from_arrays(
+            [pyarrow.array(column, pyarrow.string()) for column in self._columns],
+            schema=self._schema,
+        )
+        self._writer.write_table(table)
+        self._columns = [[] for column in self._columns]
+        self._buffered_rows = 0
+
+    def _end_file(self):
+        if self._writer is None:
+            return
+        if self._buffered_rows:
+            self._write_row_group()
+        self._writer.close()
+
+
+def _get_columnar_value(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return str(value)
+
+
+class ParquetFileWriter(ColumnarFileWriter):
+    """
+    Parquet with dictionary encoding, which stores each distinct value of a
+    row group once, e.g. for usernames and case types. Parquet falls back to
+    plain encoding for columns with too many distinct values.
+    """
+
+    def _get_writer(self, path, schema):
+        from pyarrow import parquet
+        return parquet.ParquetWriter(path, schema, compression='snappy', use_dictionary=True)
+
+
+class ArrowFileWriter(ColumnarFileWriter):
+    """
+    The Arrow IPC file format, a row group is a record batch
+    """
+
+    def _get_writer(self, path, schema):
+        import pyarrow
+        return pyarrow.ipc.new_file(path, schema)
+
+
 class PartialHtmlFileWriter(ExportFileWriter):
 
     def _write_from_template(self, context):
@@ -323,9 +408,10 @@ class ZippedExportWriter(OnDiskExportWriter):
     Writer that creates a zip file containing a csv for each table.
     """
     table_file_extension = ".csv"
+    zip_compression = zipfile.ZIP_DEFLATED
 
     def _write_final_result(self):
-        archive = zipfile.ZipFile(self.file, 'w', zipfile.ZIP_DEFLATED)
+        archive = zipfile.ZipFile(self.file, 'w', self.zip_compression)
         for index, name in self.table_names.items():
             if isinstance(name, bytes):
                 name = name.decode('utf-8')
@@ -346,6 +432,28 @@ class CsvExportWriter(ZippedExportWriter):
     format = Format.CSV
 
 
+class ParquetExportWriter(ZippedExportWriter):
+    """
+    Writer that creates a zip file containing a Parquet file for each table.
+    """
+    format = Format.PARQUET
+    writer_class = ParquetFileWriter
+    table_file_extension = ".parquet"
+    # Parquet files are already compressed
+    zip_compression = zipfile.ZIP_STORED
+    _write_row_force_to_bytes = False
+
+
+class ArrowExportWriter(ZippedExportWriter):
+    """
+    Writer that creates a zip file containing an Arrow IPC file for each table.
+    """
+    format = Format.ARROW
+    writer_class = ArrowFileWriter
+    table_file_extension = ".arrow"
+    _write_row_force_to_bytes = False
+
+
 class UnzippedCsvExportWriter(OnDiskExportWriter):
     """
     Serve the first table as a csv
@@ -45,3 +45,9 @@ class MultipartEmptyPayload(BadSubmissionRequest):
 class EmptyPayload(BadSubmissionRequest):
     def __init__(self):
         super().__init__('Post may not have an empty body\n')
+
+
+class BulkSubmissionTooLarge(BadSubmissionRequest):
+    def __init__(self, max_bytes):
+        super().__init__(
+            'Forms in a bulk submission may not be larger than {} bytes in total\n'.format(max_bytes))
@@ -1,15 +1,23 @@
 from django.utils.datastructures import MultiValueDictKeyError
 from couchforms.const import MAGIC_PROPERTY
 import logging
+import tarfile
+from io import BytesIO
 from datetime import datetime
 from django.conf import settings
 
-from couchforms.exceptions import MultipartFilenameError, MultipartEmptyPayload, EmptyPayload
+from couchforms.exceptions import (
+    BadSubmissionRequest,
+    BulkSubmissionTooLarge,
+    EmptyPayload,
+    MultipartEmptyPayload,
+    MultipartFilenameError,
+)
 from dimagi.utils.parsing import string_to_utc_datetime
 from dimagi.utils.web import get_ip, get_site_domain
 
 
-__all__ = ['get_path', 'get_instance_and_attachment',
+__all__ = ['get_path', 'get_instance_and_attachment', 'get_bulk_instances',
            'get_location', 'get_received_on', 'get_date_header',
            'get_submit_ip', 'get_last_sync_token', 'get_openrosa_headers']
 
@@ -54,6 +62,66 @@ def get_instance_and_attachment(request):
     return instance, attachments
 
 
+def get_bulk_instances(request, max_forms, max_bytes):
+    """Get form instances from a bulk submission request
+
+    The body is either multipart/form-data with one file per form or a
+    (optionally compressed) tar archive whose .xml members are forms.
+    Attachments are not supported.
+
+    The size of each form is checked before it is read, so a compressed
+    archive is never decompressed past ``max_bytes``.
+
+    :returns: List of `(name, instance)` tuples in submitted order.
+    """
+    if request.META['CONTENT_TYPE'].startswith('multipart/form-data'):
+        items = [
+            (item.name, item.size, item.read)
+            for key in request.FILES
+            for item in request.FILES.getlist(key)
+        ]
+        instances = _read_bulk_instances(items, max_forms, max_bytes)
+    else:
+        if not request.body:
+            raise EmptyPayload()
+        try:
+            with tarfile.open(fileobj=BytesIO(request.body), mode='r:*') as archive:
+                items = (
+                    (member.name, member.size, archive.extractfile(member).read)
+                    for member in archive
+                    # skip links, devices and directories
+                    if member.isreg() and member.name.endswith('.xml')
+                )
+                instances = _read_bulk_instances(items, max_forms, max_bytes)
+        except tarfile.TarError:
+            raise BadSubmissionRequest(
+                'Bulk submissions must be multipart/form-data or a tar archive of .xml files\n')
+    if not instances:
+        raise BadSubmissionRequest('Bulk submission contains no forms\n')
+    empty = [name for name, instance in instances if not instance]
+    if empty:
+        raise BadSubmissionRequest('Empty forms in bulk submission: {}\n'.format(', '.join(empty)))
+    return instances
+
+
+def _read_bulk_instances(items, max_forms, max_bytes):
+    """
+    :param items: Iterable of `(name, size, read)` tuples, where `read`
+    returns the content of the form.
+    """
+    instances = []
+    total_bytes = 0
+    for name, size, read in items:
+        if len(instances) == max_forms:
+            raise BadSubmissionRequest(
+                'Bulk submission may not contain more than {} forms\n'.format(max_forms))
+        total_bytes += size
+        if total_bytes > max_bytes:
+            raise BulkSubmissionTooLarge(max_bytes)
+        instances.append((name, read()))
+    return instances
+
+
 def get_location(request=None):
     # this is necessary, because www.commcarehq.org always uses https,
     # but is behind a proxy that won't necessarily look like https
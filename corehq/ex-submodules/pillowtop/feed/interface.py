@@ -1,3 +1,4 @@
+import copy
 from datetime import datetime
 from abc import ABCMeta, abstractmethod
 
@@ -92,6 +93,18 @@ class Change(object):
                 ) from err
         return self.document
 
+    def copy(self):
+        """
+        A copy of the change with its own document and metadata, so that it
+        can be processed independently of this one
+        """
+        change = copy.copy(self)
+        change._dict = dict(self._dict)
+        change.document = copy.deepcopy(self.document)
+        if self.metadata is not None:
+            change.metadata = ChangeMeta.wrap(copy.deepcopy(self.metadata.to_json()))
+        return change
+
     def should_fetch_document(self):
         return not self.document and self.document_store and not self._document_checked
 
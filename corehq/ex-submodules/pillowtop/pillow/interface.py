@@ -1,14 +1,17 @@
 from abc import ABCMeta, abstractproperty, abstractmethod
 from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 
 from django.conf import settings
+from django.db import connections
 from memoized import memoized
 
 import sys
 
 from sentry_sdk import configure_scope
 
+from corehq.sql_db.connections import connection_manager
 from corehq.util.metrics import metrics_counter, metrics_gauge
 from corehq.util.metrics.const import MPM_MAX
 from corehq.util.timer import TimingContext
@@ -16,7 +19,7 @@ from dimagi.utils.logging import notify_exception
 from kafka.common import TopicPartition
 from pillowtop.const import CHECKPOINT_MIN_WAIT
 from pillowtop.dao.exceptions import DocumentMissingError
-from pillowtop.utils import force_seq_int
+from pillowtop.utils import force_seq_int, prefetch_changes_docs
 from pillowtop.exceptions import PillowtopCheckpointReset
 from pillowtop.logger import pillow_logging
 
@@ -44,6 +47,31 @@ class PillowRuntimeContext(object):
         self.changes_seen = 0
 
 
+class AdaptiveChunkSize(object):
+    """
+    Size of the change chunks processed by batch processors.
+
+    Starts at `min_size` and doubles, up to `max_size`, while changes lag
+    by more than `target_lag` seconds and chunks take less than `target_time`
+    seconds to process. Halves, down to `min_size`, when chunks take longer
+    than that or the pillow has caught up.
+    """
+
+    def __init__(self, min_size, max_size, target_lag, target_time):
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.target_lag = target_lag
+        self.target_time = target_time
+        self.size = min_size
+
+    def update(self, change_lag, processing_time):
+        if processing_time > self.target_time or change_lag < self.target_lag:
+            self.size = max(self.min_size, self.size // 2)
+        else:
+            self.size = min(self.max_size, self.size * 2)
+        return self.size
+
+
 class PillowBase(metaclass=ABCMeta):
     """
     This defines the external pillowtop API. Everything else should be considered a specialization
@@ -54,6 +82,12 @@ class PillowBase(metaclass=ABCMeta):
     retry_errors = True
     # this will be the batch size for processors that support batch processing
     processor_chunk_size = 0
+    # the batch size grows up to this while the pillow is lagging, see AdaptiveChunkSize
+    max_processor_chunk_size = 0
+    # run batch processors concurrently on each chunk
+    parallel_batch_processors = False
+    # fetch the documents of each chunk once for all processors
+    prefetch_documents = False
 
     @abstractproperty
     def pillow_id(self):
@@ -132,6 +166,24 @@ class PillowBase(metaclass=ABCMeta):
         else:
             return self.processors
 
+    @property
+    @memoized
+    def chunk_size(self):
+        return AdaptiveChunkSize(
+            self.processor_chunk_size,
+            self.max_processor_chunk_size,
+            target_lag=settings.PILLOW_TARGET_CHANGE_LAG,
+            target_time=settings.PILLOW_TARGET_CHUNK_PROCESSING_TIME,
+        )
+
+    @property
+    @memoized
+    def _batch_processor_executor(self):
+        return ThreadPoolExecutor(
+            max_workers=len(self.batch_processors),
+            thread_name_prefix=self.get_name(),
+        )
+
     def process_changes(self, since, forever):
         """
         Process changes on all the pillow processors.
@@ -161,7 +213,7 @@ class PillowBase(metaclass=ABCMeta):
                         # Queue and process in chunks for both batch
                         #   and serial processors
                         changes_chunk.append(change)
-                        chunk_full = len(changes_chunk) == self.processor_chunk_size
+                        chunk_full = len(changes_chunk) >= self.chunk_size.size
                         time_elapsed = (datetime.utcnow() - last_process_time).seconds > min_wait_seconds
                         if chunk_full or time_elapsed:
                             last_process_time = datetime.utcnow()
@@ -193,45 +245,108 @@ class PillowBase(metaclass=ABCMeta):
 
             If there is an exception in chunked processing, falls back
             to serial processing.
+
+            With `parallel_batch_processors` the batch processors process
+            the chunk concurrently, each on its own copies of the changes,
+            and serial processors only start once all of them are done.
+
+            With `prefetch_documents`, pillows with more than one processor
+            fetch the documents of the chunk up front so that processors
+            share them.
         """
+        if not changes_chunk:
+            return
+
         processing_time = 0
+        changes_chunk = self._deduplicate_changes(changes_chunk)
+        chunk_timer = TimingContext()
+        with chunk_timer:
+            if self.prefetch_documents and len(self.processors) > 1:
+                processing_time += self._prefetch_documents(changes_chunk)
+            if self.parallel_batch_processors and len(self.batch_processors) > 1:
+                futures = [
+                    self._batch_processor_executor.submit(
+                        self._process_chunk_in_thread, processor, changes_chunk
+                    )
+                    for processor in self.batch_processors
+                ]
+                wait(futures)
+                processing_time += sum(future.result() for future in futures)
+            else:
+                for processor in self.batch_processors:
+                    processing_time += self._process_chunk_on_processor(processor, changes_chunk)
+            # process on serial_processors
+            for change in changes_chunk:
+                processing_time += self.process_with_error_handling(change)
+        self._record_datadog_metrics(changes_chunk, processing_time)
+        self._update_chunk_size(changes_chunk, chunk_timer.duration)
+
+    def _process_chunk_in_thread(self, processor, changes_chunk):
+        # processors modify changes (documents, attempt counts), so each one
+        # gets its own copies. The executor's threads outlive the chunk, so
+        # their database connections are closed when they are done with it.
+        try:
+            return self._process_chunk_on_processor(processor, [change.copy() for change in changes_chunk])
+        finally:
+            connections.close_all()
+            connection_manager.close_scoped_sessions()
+
+    def _prefetch_documents(self, changes_chunk):
+        timer = TimingContext()
+        with timer:
+            try:
+                prefetch_changes_docs(changes_chunk)
+            except Exception:
+                # processors fetch any documents that are still missing
+                pillow_logging.exception("[%s] Error prefetching documents", self.get_name())
+                metrics_counter('commcare.change_feed.prefetch_errors', tags={
+                    'pillow_name': self.get_name(),
+                })
+        metrics_counter('commcare.change_feed.prefetch_time.total', timer.duration, tags={
+            'pillow_name': self.get_name(),
+        })
+        return timer.duration
 
+    def _process_chunk_on_processor(self, processor, changes_chunk):
         def reprocess_serially(chunk, processor):
             for change in chunk:
                 self.process_with_error_handling(change, processor)
 
-        for processor in self.batch_processors:
-            if not changes_chunk:
-                return set(), 0
+        timer = TimingContext()
+        with timer:
+            try:
+                retry_changes, change_exceptions = processor.process_changes_chunk(changes_chunk)
+            except Exception as ex:
+                notify_exception(
+                    None,
+                    "{pillow_name} Error in processing changes chunk: {ex}".format(
+                        pillow_name=self.get_name(),
+                        ex=ex
+                    ),
+                    details={
+                        'change_ids': [c.id for c in changes_chunk]
+                    })
+                self._record_batch_exception_in_datadog(processor)
+                # fall back to processing one by one
+                reprocess_serially(changes_chunk, processor)
+            else:
+                # fall back to processing one by one for failed changes
+                for change, exception in change_exceptions:
+                    handle_pillow_error(self, change, exception)
+                reprocess_serially(retry_changes, processor)
+        return timer.duration
 
-            changes_chunk = self._deduplicate_changes(changes_chunk)
-            timer = TimingContext()
-            with timer:
-                try:
-                    retry_changes, change_exceptions = processor.process_changes_chunk(changes_chunk)
-                except Exception as ex:
-                    notify_exception(
-                        None,
-                        "{pillow_name} Error in processing changes chunk: {ex}".format(
-                            pillow_name=self.get_name(),
-                            ex=ex
-                        ),
-                        details={
-                            'change_ids': [c.id for c in changes_chunk]
-                        })
-                    self._record_batch_exception_in_datadog(processor)
-                    # fall back to processing one by one
-                    reprocess_serially(changes_chunk, processor)
-                else:
-                    # fall back to processing one by one for failed changes
-                    for change, exception in change_exceptions:
-                        handle_pillow_error(self, change, exception)
-                    reprocess_serially(retry_changes, processor)
-                processing_time += timer.duration
-        # process on serial_processors
-        for change in changes_chunk:
-            processing_time += self.process_with_error_handling(change)
-        self._record_datadog_metrics(changes_chunk, processing_time)
+    def _update_chunk_size(self, changes_chunk, processing_time):
+        if not changes_chunk:
+            return
+        metadata = changes_chunk[0].metadata
+        if metadata is None or self.chunk_size.max_size == self.chunk_size.min_size:
+            return
+        change_lag = (datetime.utcnow() - metadata.publish_timestamp).total_seconds()
+        chunk_size = self.chunk_size.update(change_lag, processing_time)
+        metrics_gauge('commcare.change_feed.processor_chunk_size', chunk_size, tags={
+            'pillow_name': self.get_name(),
+        }, multiprocess_mode=MPM_MAX)
 
     def process_with_error_handling(self, change, processor=None):
         # process given change on all serial processors or given processor.
@@ -418,11 +533,22 @@ class ConstructedPillow(PillowBase):
     """
 
     def __init__(self, name, checkpoint, change_feed, processor,
-                 change_processed_event_handler=None, processor_chunk_size=0):
+                 change_processed_event_handler=None, processor_chunk_size=0,
+                 max_processor_chunk_size=None, parallel_batch_processors=None,
+                 prefetch_documents=None):
         self._name = name
         self._checkpoint = checkpoint
         self._change_feed = change_feed
         self.processor_chunk_size = processor_chunk_size
+        if max_processor_chunk_size is None:
+            max_processor_chunk_size = settings.PILLOW_MAX_PROCESSOR_CHUNK_SIZE
+        self.max_processor_chunk_size = max_processor_chunk_size
+        if parallel_batch_processors is None:
+            parallel_batch_processors = settings.PILLOW_PARALLEL_BATCH_PROCESSORS
+        self.parallel_batch_processors = parallel_batch_processors
+        if prefetch_documents is None:
+            prefetch_documents = settings.PILLOW_PREFETCH_DOCUMENTS
+        self.prefetch_documents = prefetch_documents
         if isinstance(processor, list):
             self.processors = processor
         else:
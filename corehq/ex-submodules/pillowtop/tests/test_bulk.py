@@ -9,10 +9,18 @@ from casexml.apps.case.signals import case_post_save
 from corehq.util.es.interface import ElasticsearchInterface
 from pillowtop.es_utils import initialize_index_and_mapping
 from pillowtop.feed.interface import Change, ChangeMeta
-from pillowtop.pillow.interface import PillowBase
+from pillowtop.pillow.interface import (
+    AdaptiveChunkSize,
+    ConstructedPillow,
+    PillowBase,
+)
 from pillowtop.processors.elastic import BulkElasticProcessor
 from pillowtop.tests.utils import TEST_INDEX_INFO
-from pillowtop.utils import bulk_fetch_changes_docs, get_errors_with_ids
+from pillowtop.utils import (
+    bulk_fetch_changes_docs,
+    get_errors_with_ids,
+    prefetch_changes_docs,
+)
 
 from corehq.apps.es.tests.utils import es_test
 from corehq.elastic import get_es_new
@@ -52,6 +60,111 @@ class BulkTest(SimpleTestCase):
         ])
         self.assertEqual([(1, 'e1'), (2, 'e2')], errors)
 
+    def test_adaptive_chunk_size(self):
+        chunk_size = AdaptiveChunkSize(10, 50, target_lag=60, target_time=10)
+        # lagging and fast: grow up to the max size
+        self.assertEqual([chunk_size.update(120, 1) for i in range(4)], [20, 40, 50, 50])
+        # slow chunks shrink
+        self.assertEqual(chunk_size.update(120, 20), 25)
+        # caught up: back down to the configured size
+        self.assertEqual([chunk_size.update(5, 1) for i in range(3)], [12, 10, 10])
+
+    def test_prefetch_changes_docs(self):
+        doc_store = Mock()
+        doc_store.iter_documents.return_value = [{'_id': 'a'}, {'_id': 'b'}]
+        changes = [
+            Change(doc_id, 'seq', document_store=doc_store, metadata=ChangeMeta(
+                document_id=doc_id, data_source_type='test', data_source_name='test'))
+            for doc_id in ['a', 'b', 'missing']
+        ]
+        prefetch_changes_docs(changes)
+
+        doc_store.iter_documents.assert_called_once_with(['a', 'b', 'missing'])
+        self.assertEqual([change.document for change in changes], [{'_id': 'a'}, {'_id': 'b'}, None])
+        # processors reuse the prefetched documents
+        bad_changes, docs = bulk_fetch_changes_docs(changes[:2])
+        self.assertEqual(doc_store.iter_documents.call_count, 1)
+        self.assertEqual(docs, [{'_id': 'a'}, {'_id': 'b'}])
+
+    @patch('pillowtop.pillow.interface.metrics_counter')
+    def test_prefetch_errors(self, metrics_counter):
+        doc_store = Mock()
+        doc_store.iter_documents.side_effect = Exception('unavailable')
+        processor = Mock(supports_batch_processing=False)
+        pillow = ConstructedPillow(
+            'test-prefetch-pillow', Mock(), Mock(), [processor, processor], prefetch_documents=True,
+        )
+        changes = [Change('a', 'seq', document_store=doc_store, metadata=ChangeMeta(
+            document_id='a', data_source_type='test', data_source_name='test'))]
+        pillow._prefetch_documents(changes)
+        metrics_counter.assert_any_call('commcare.change_feed.prefetch_errors', tags={
+            'pillow_name': 'test-prefetch-pillow',
+        })
+
+    def test_parallel_batch_processors(self):
+        calls = []
+
+        def batch_processor(name):
+            processor = Mock(supports_batch_processing=True)
+
+            def process_changes_chunk(changes):
+                calls.append((name, [change.id for change in changes]))
+                return [], []
+            processor.process_changes_chunk.side_effect = process_changes_chunk
+            return processor
+
+        serial_processor = Mock(supports_batch_processing=False)
+        serial_processor.process_change.side_effect = lambda change: calls.append(('serial', change.id))
+        pillow = ConstructedPillow(
+            'test-parallel-pillow', Mock(), Mock(),
+            [batch_processor('es'), batch_processor('ucr'), serial_processor],
+            processor_chunk_size=10, parallel_batch_processors=True,
+        )
+        changes = [
+            Change(doc_id, 'seq', metadata=ChangeMeta(
+                document_id=doc_id, data_source_type='test', data_source_name='test'))
+            for doc_id in ['a', 'b', 'a']
+        ]
+        pillow._batch_process_with_error_handling(changes)
+
+        self.assertEqual(
+            sorted(calls[:2]),
+            [('es', ['b', 'a']), ('ucr', ['b', 'a'])],
+        )
+        # serial processors run once all batch processors are done
+        self.assertEqual(calls[2:], [('serial', 'b'), ('serial', 'a')])
+
+    def test_parallel_batch_processors_get_own_changes(self):
+        seen = {}
+
+        def batch_processor(name):
+            processor = Mock(supports_batch_processing=True)
+
+            def process_changes_chunk(changes):
+                for change in changes:
+                    change.document['processor'] = name
+                    change.increment_attempt_count()
+                seen[name] = changes
+                return [], []
+            processor.process_changes_chunk.side_effect = process_changes_chunk
+            return processor
+
+        pillow = ConstructedPillow(
+            'test-parallel-pillow', Mock(), Mock(),
+            [batch_processor('es'), batch_processor('ucr')],
+            processor_chunk_size=10, parallel_batch_processors=True,
+        )
+        change = Change('a', 'seq', document={'_id': 'a'}, metadata=ChangeMeta(
+            document_id='a', data_source_type='test', data_source_name='test'))
+        pillow._batch_process_with_error_handling([change])
+
+        self.assertEqual(seen['es'][0].document, {'_id': 'a', 'processor': 'es'})
+        self.assertEqual(seen['ucr'][0].document, {'_id': 'a', 'processor': 'ucr'})
+        self.assertEqual(seen['es'][0]['doc'], {'_id': 'a', 'processor': 'es'})
+        self.assertEqual(seen['es'][0].metadata.attempts, 1)
+        self.assertEqual(change.document, {'_id': 'a'})
+        self.assertEqual(change.metadata.attempts, 0)
+
 
 @use_sql_backend
 @es_test
@@ -329,7 +329,7 @@ def bulk_fetch_changes_docs(changes, domain=None):
     for _, _changes in changes_by_doctype.items():
         doc_store = _changes[0].document_store
         doc_ids_to_query = [change.id for change in _changes if change.should_fetch_document()]
-        new_docs = list(doc_store.iter_documents(doc_ids_to_query))
+        new_docs = list(doc_store.iter_documents(doc_ids_to_query)) if doc_ids_to_query else []
         docs_queried_prior = [change.document for change in _changes if change.document]
         docs.extend(new_docs + docs_queried_prior)
 
@@ -352,6 +352,29 @@ def bulk_fetch_changes_docs(changes, domain=None):
     return bad_changes, docs
 
 
+def prefetch_changes_docs(changes):
+    """Populate changes with their documents using one bulk lookup per
+    data source, so that processors sharing the changes don't each fetch them.
+
+    Changes whose documents are not found are left as they are for the
+    processors to handle.
+    """
+    changes_by_data_source = defaultdict(list)
+    for change in changes:
+        if change.metadata is not None and change.should_fetch_document():
+            changes_by_data_source[change.metadata.data_source_name].append(change)
+
+    for _changes in changes_by_data_source.values():
+        doc_store = _changes[0].document_store
+        docs_by_id = {
+            doc['_id']: doc
+            for doc in doc_store.iter_documents([change.id for change in _changes])
+        }
+        for change in _changes:
+            if change.id in docs_by_id:
+                change.set_document(docs_by_id[change.id])
+
+
 def get_errors_with_ids(es_action_errors):
     return [
         (item['_id'], item.get('error'))
@@ -1,6 +1,7 @@
 from couchdbkit.exceptions import ResourceNotFound
 from datetime import datetime
 
+from casexml.apps.case.const import CASE_INDEX_EXTENSION
 from casexml.apps.case.dbaccessors import (
     get_extension_case_ids,
     get_indexed_case_ids,
@@ -232,6 +233,28 @@ class CaseAccessorCouch(AbstractCaseAccessor):
     def get_case_ids_modified_with_owner_since(domain, owner_id, reference_date):
         return get_case_ids_modified_with_owner_since(domain, owner_id, reference_date)
 
+    @staticmethod
+    def get_case_ids_modified_since(domain, owner_ids, case_ids, reference_date):
+        modified_ids = {
+            case_id
+            for owner_id in owner_ids
+            for case_id in get_case_ids_modified_with_owner_since(domain, owner_id, reference_date)
+        }
+        modified_ids.update(
+            case_id for case_id, modified_on in get_last_modified_dates(domain, list(case_ids)).items()
+            if modified_on >= reference_date
+        )
+        return list(modified_ids)
+
+    @staticmethod
+    def get_modified_extension_indices_since(domain, referenced_ids, reference_date):
+        indices = get_all_reverse_indices_info(domain, list(referenced_ids), CASE_INDEX_EXTENSION)
+        modified_ids = {
+            case.case_id for case in iter_cases(list({index.case_id for index in indices}))
+            if not case.closed and not case.is_deleted and case.server_modified_on >= reference_date
+        }
+        return [(index.case_id, index.referenced_id) for index in indices if index.case_id in modified_ids]
+
     @staticmethod
     def get_extension_case_ids(domain, case_ids, include_closed=True):
         # include_closed ignored for couch
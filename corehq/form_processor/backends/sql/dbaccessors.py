@@ -1111,6 +1111,42 @@ class CaseAccessorSQL(AbstractCaseAccessor):
             results = fetchall_as_namedtuple(cursor)
             return [result.case_id for result in results]
 
+    @staticmethod
+    def get_case_ids_modified_since(domain, owner_ids, case_ids, reference_date):
+        # each database only gets the ids of its own cases
+        case_ids_by_db = dict(split_list_by_db_partition(case_ids))
+        modified_ids = set()
+        for db_name in get_db_aliases_for_partitioned_query():
+            db_case_ids = case_ids_by_db.get(db_name, [])
+            if not owner_ids and not db_case_ids:
+                continue
+            query = CommCareCaseSQL.objects.using(db_name).filter(
+                Q(owner_id__in=list(owner_ids)) | Q(case_id__in=db_case_ids),
+                domain=domain,
+                server_modified_on__gte=reference_date,
+            )
+            modified_ids.update(query.values_list('case_id', flat=True))
+        return list(modified_ids)
+
+    @staticmethod
+    def get_modified_extension_indices_since(domain, referenced_ids, reference_date):
+        if not referenced_ids:
+            return []
+        # indices are partitioned by the case that owns them, which can be
+        # in any database
+        indices = []
+        for db_name in get_db_aliases_for_partitioned_query():
+            query = CommCareCaseIndexSQL.objects.using(db_name).filter(
+                domain=domain,
+                referenced_id__in=list(referenced_ids),
+                relationship_id=CommCareCaseIndexSQL.EXTENSION,
+                case__server_modified_on__gte=reference_date,
+                case__closed=False,
+                case__deleted=False,
+            )
+            indices.extend(query.values_list('case_id', 'referenced_id'))
+        return indices
+
     @staticmethod
     def get_extension_case_ids(domain, case_ids, include_closed=True):
         """
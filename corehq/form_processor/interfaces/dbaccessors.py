@@ -319,6 +319,16 @@ class AbstractCaseAccessor(metaclass=ABCMeta):
     def get_case_ids_modified_with_owner_since(domain, owner_id, reference_date):
         raise NotImplementedError
 
+    @staticmethod
+    @abstractmethod
+    def get_case_ids_modified_since(domain, owner_ids, case_ids, reference_date):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def get_modified_extension_indices_since(domain, referenced_ids, reference_date):
+        raise NotImplementedError
+
     @staticmethod
     @abstractmethod
     def get_extension_case_ids(domain, case_ids, include_closed):
@@ -468,6 +478,21 @@ class CaseAccessors(object):
     def get_case_ids_modified_with_owner_since(self, owner_id, reference_date):
         return self.db_accessor.get_case_ids_modified_with_owner_since(self.domain, owner_id, reference_date)
 
+    def get_case_ids_modified_since(self, owner_ids, case_ids, reference_date):
+        """Get ids of cases modified since the given date that are owned
+        by one of the given owners or are one of the given cases, including
+        deleted cases
+        """
+        return self.db_accessor.get_case_ids_modified_since(self.domain, owner_ids, case_ids, reference_date)
+
+    def get_modified_extension_indices_since(self, referenced_ids, reference_date):
+        """Get extension indices pointing to the given cases from open cases
+        modified since the given date
+
+        :returns: List of two-tuples: `(case_id, referenced_id)`
+        """
+        return self.db_accessor.get_modified_extension_indices_since(self.domain, referenced_ids, reference_date)
+
     def get_extension_case_ids(self, case_ids):
         return self.db_accessor.get_extension_case_ids(self.domain, case_ids)
 
@@ -1,5 +1,6 @@
 import logging
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
+from datetime import datetime
 
 from ddtrace import tracer
 from django.db import IntegrityError
@@ -13,12 +14,13 @@ from django.urls import reverse
 from django.utils.translation import ugettext as _
 import sys
 
-from casexml.apps.case.xform import close_extension_cases
+from casexml.apps.case.xform import close_extension_cases, get_case_updates
 from casexml.apps.phone.restore_caching import AsyncRestoreTaskIdCache, RestorePayloadPathCache
 import couchforms
 from casexml.apps.case.exceptions import PhoneDateValueError, IllegalCaseId, UsesReferrals, InvalidCaseIndex, \
     CaseValueError
-from corehq.apps.receiverwrapper.rate_limiter import report_submission_usage
+from corehq.apps.change_feed.producer import producer
+from corehq.apps.receiverwrapper.rate_limiter import rate_limit_submission, report_submission_usage
 from corehq.const import OPENROSA_VERSION_3
 from corehq.middleware import OPENROSA_VERSION_HEADER
 from corehq.toggles import ASYNC_RESTORE, SUMOLOGIC_LOGS, NAMESPACE_OTHER
@@ -27,11 +29,17 @@ from corehq.apps.commtrack.exceptions import MissingProductId
 from corehq.apps.domain_migration_flags.api import any_migrations_in_progress
 from corehq.apps.users.models import CouchUser
 from corehq.apps.users.permissions import has_permission_to_view_report
-from corehq.form_processor.exceptions import CouchSaveAborted, PostSaveError, XFormSaveError
+from corehq.form_processor.exceptions import (
+    CouchSaveAborted,
+    PostSaveError,
+    XFormLockError,
+    XFormSaveError,
+)
 from corehq.form_processor.interfaces.dbaccessors import FormAccessors
 from corehq.form_processor.interfaces.processor import FormProcessorInterface
 from corehq.form_processor.parsers.form import process_xform_xml
 from corehq.form_processor.system_action import SYSTEM_ACTION_XMLNS, handle_system_action
+from corehq.form_processor.utils import convert_xform_to_json
 from corehq.form_processor.utils.metadata import scrub_meta
 from corehq.form_processor.submission_process_tracker import unfinished_submission
 from corehq.util.metrics.load_counters import form_load_counter
@@ -60,6 +68,9 @@ class FormProcessingResult(namedtuple('FormProcessingResult', 'response xform ca
         return self.cases[0]
 
 
+BulkFormResult = namedtuple('BulkFormResult', 'name response xform submission_type')
+
+
 class SubmissionPost(object):
 
     def __init__(self, instance=None, attachments=None, auth_context=None,
@@ -531,6 +542,196 @@ class SubmissionPost(object):
         return FormProcessingResult(response, device_log_form, [], [], 'device-log')
 
 
+class BulkSubmissionPost(object):
+    """Process many forms received in one request
+
+    Forms that touch the same cases (directly or through case indices)
+    are grouped and each group is processed with one case db cache: the
+    group's cases are locked and loaded once and stay cached between its
+    forms instead of being locked and loaded again for every form. Groups
+    are processed in order of their first form and forms keep their
+    submitted order within a group. If a form in a group is not processed
+    normally, cached cases may hold changes that were not saved, so the
+    rest of the group is processed one form at a time.
+
+    Kafka changes for all forms are published in one batch. Forms whose
+    changes could not be published get a saved `UnfinishedSubmissionStub`
+    so the submission reprocessing queue publishes them again.
+
+    Each form is still saved in its own transaction and gets its own
+    OpenRosa response. Each form is also rate limited on its own: once a
+    form is rate limited, it and the remaining forms get a 429 response.
+
+    :param instances: List of `(name, instance)` tuples.
+    :param submission_kwargs: Keyword arguments for `SubmissionPost`,
+    shared by all forms.
+    """
+
+    def __init__(self, instances, domain, **submission_kwargs):
+        self.instances = instances
+        self.domain = domain
+        self.submission_kwargs = submission_kwargs
+        self.interface = FormProcessorInterface(domain)
+        self.results = [None] * len(instances)
+        self.form_changes = {}
+        self.changes = None
+        self.rate_limited = False
+
+    def run(self):
+        """Process all forms
+
+        :returns: List of `BulkFormResult`, one per form in submitted order.
+        """
+        case_ids = [_get_form_case_ids(instance) for name, instance in self.instances]
+        with producer.batch() as changes:
+            self.changes = changes
+            for group in group_forms_by_case(case_ids):
+                self._process_group(group, case_ids)
+            failed = changes.flush()
+        if failed:
+            self._handle_publishing_errors(failed)
+        return self.results
+
+    def _process_group(self, group, case_ids):
+        remaining = list(group)
+        if len(group) > 1:
+            case_db = self.interface.casedb_cache(
+                domain=self.domain, lock=True, deleted_ok=True, load_src="bulk_submission",
+            )
+            with case_db:
+                try:
+                    # lock in a stable order to avoid deadlocks with other bulk submissions
+                    for case_id in sorted(set().union(*(case_ids[index] for index in group))):
+                        case_db.get(case_id)
+                except (IllegalCaseId, XFormLockError):
+                    pass  # let each form report its own error
+                else:
+                    while remaining:
+                        result = self._process_form(remaining.pop(0), case_db)
+                        if result.submission_type != 'normal':
+                            break
+        for index in remaining:
+            self._process_form(index)
+
+    def _process_form(self, index, case_db=None):
+        name, instance = self.instances[index]
+        if self.rate_limited or rate_limit_submission(self.domain):
+            self.rate_limited = True
+            response = HttpResponse("Too many submissions", status=429, content_type="text/plain")
+            self.results[index] = BulkFormResult(name, response, None, 'rate_limited')
+            return self.results[index]
+        first_change = len(self.changes.changes)
+        if case_db is not None:
+            del case_db.cached_xforms[:]
+        try:
+            result = SubmissionPost(
+                instance=instance,
+                domain=self.domain,
+                case_db=case_db,
+                **self.submission_kwargs
+            ).run()
+        except XFormLockError as err:
+            response = HttpResponse(
+                "XFormLockError: %s" % err, status=423, content_type="text/plain")
+            result = BulkFormResult(name, response, None, 'error')
+        except Exception:
+            notify_exception(get_request(), "Error processing form in bulk submission", {
+                'domain': self.domain,
+                'name': name,
+            })
+            response = HttpResponse(
+                "Error processing form, it should be submitted again",
+                status=500, content_type="text/plain")
+            result = BulkFormResult(name, response, None, 'error')
+        else:
+            result = BulkFormResult(name, result.response, result.xform, result.submission_type)
+        self.form_changes[index] = self.changes.changes[first_change:]
+        self.results[index] = result
+        return result
+
+    def _handle_publishing_errors(self, failed):
+        from couchforms.models import UnfinishedSubmissionStub
+        failed_ids = {id(change_meta) for change_meta in failed}
+        is_openrosa_version3 = (
+            (self.submission_kwargs.get('openrosa_headers') or {}).get(OPENROSA_VERSION_HEADER, '')
+            == OPENROSA_VERSION_3
+        )
+        for index, changes in self.form_changes.items():
+            if not any(id(change_meta) in failed_ids for change_meta, future in changes):
+                continue
+            result = self.results[index]
+            xform = result.xform
+            if xform is None:
+                continue
+            notify_submission_error(xform, 'Error publishing to Kafka')
+            if not getattr(xform, 'deprecated_form_id', None):
+                UnfinishedSubmissionStub.objects.get_or_create(
+                    xform_id=xform.form_id,
+                    defaults={
+                        'timestamp': datetime.utcnow(),
+                        'saved': True,
+                        'domain': xform.domain,
+                    },
+                )
+            if is_openrosa_version3:
+                response = SubmissionPost.get_v3_error_response(
+                    "Error performing post save operations",
+                    ResponseNature.POST_PROCESSING_FAILURE,
+                )
+                response['X-CommCareHQ-FormID'] = xform.form_id
+                self.results[index] = result._replace(response=response)
+
+
+def _get_form_case_ids(instance):
+    """Get ids of cases updated or indexed by the form instance"""
+    try:
+        updates = get_case_updates(convert_xform_to_json(instance))
+    except Exception:
+        # the form is processed (and its errors reported) on its own
+        return set()
+    case_ids = set()
+    for update in updates:
+        case_ids.add(update.id)
+        index_action = update.get_index_action()
+        if index_action:
+            case_ids.update(index.referenced_id for index in index_action.indices)
+    case_ids.discard(None)
+    case_ids.discard('')
+    return case_ids
+
+
+def group_forms_by_case(case_ids_by_form):
+    """Group forms that share cases
+
+    :param case_ids_by_form: List of case id sets, one per form.
+    :returns: List of lists of form indexes. Forms that share a case, or
+    are connected through other forms sharing cases, are in the same
+    group. Groups are ordered by their first form and form indexes are
+    ascending within each group.
+    """
+    parents = list(range(len(case_ids_by_form)))
+
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    first_form_by_case = {}
+    for index, case_ids in enumerate(case_ids_by_form):
+        for case_id in case_ids:
+            if case_id in first_form_by_case:
+                root, other = find(first_form_by_case[case_id]), find(index)
+                parents[max(root, other)] = min(root, other)
+            else:
+                first_form_by_case[case_id] = index
+
+    groups = OrderedDict()
+    for index in range(len(case_ids_by_form)):
+        groups.setdefault(find(index), []).append(index)
+    return list(groups.values())
+
+
 def _transform_instance_to_error(interface, exception, instance):
     error_message = '{}: {}'.format(type(exception).__name__, str(exception))
     return interface.xformerror_from_xform_instance(instance, error_message)
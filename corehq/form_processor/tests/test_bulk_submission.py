@@ -0,0 +1,137 @@
+import tarfile
+import uuid
+from datetime import datetime
+from io import BytesIO
+
+from django.template.loader import render_to_string
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from mock import patch
+
+from casexml.apps.case.mock import CaseBlock
+from couchforms.exceptions import BadSubmissionRequest, BulkSubmissionTooLarge
+from couchforms.getters import get_bulk_instances
+from couchforms.models import UnfinishedSubmissionStub
+from dimagi.utils.parsing import json_format_datetime
+
+from corehq.form_processor.interfaces.dbaccessors import CaseAccessors
+from corehq.form_processor.submission_post import (
+    BulkSubmissionPost,
+    group_forms_by_case,
+)
+from corehq.form_processor.tests.utils import FormProcessorTestUtils, use_sql_backend
+
+
+class GroupFormsByCaseTest(SimpleTestCase):
+
+    def test_independent_forms(self):
+        self.assertEqual(group_forms_by_case([{'a'}, {'b'}, set()]), [[0], [1], [2]])
+
+    def test_shared_case(self):
+        self.assertEqual(group_forms_by_case([{'a'}, {'b'}, {'a'}]), [[0, 2], [1]])
+
+    def test_transitive(self):
+        # form 3 joins the groups of forms 0 and 1
+        self.assertEqual(
+            group_forms_by_case([{'a'}, {'b'}, {'c'}, {'b', 'a'}, {'c', 'd'}]),
+            [[0, 1, 3], [2, 4]],
+        )
+
+
+class GetBulkInstancesTest(SimpleTestCase):
+
+    def _get_request(self, members):
+        body = BytesIO()
+        with tarfile.open(fileobj=body, mode='w:gz') as archive:
+            for name, content in members:
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                archive.addfile(info, BytesIO(content))
+            link = tarfile.TarInfo('link.xml')
+            link.type = tarfile.SYMTYPE
+            link.linkname = '/etc/passwd'
+            archive.addfile(link)
+        return RequestFactory().post('/', data=body.getvalue(), content_type='application/x-tar')
+
+    def test_tar_archive(self):
+        request = self._get_request([('a.xml', b'<a/>'), ('b.txt', b'b'), ('c.xml', b'<c/>')])
+        self.assertEqual(get_bulk_instances(request, 10, 100), [('a.xml', b'<a/>'), ('c.xml', b'<c/>')])
+
+    def test_too_many_forms(self):
+        request = self._get_request([('a.xml', b'<a/>'), ('b.xml', b'<b/>')])
+        with self.assertRaises(BadSubmissionRequest):
+            get_bulk_instances(request, 1, 100)
+
+    def test_too_large(self):
+        request = self._get_request([('a.xml', b'<a/>'), ('b.xml', b'<b>' + b'x' * 1000 + b'</b>')])
+        with self.assertRaises(BulkSubmissionTooLarge), \
+                patch.object(tarfile.ExFileObject, 'read') as read:
+            get_bulk_instances(request, 10, 100)
+        self.assertEqual(read.call_count, 1)
+
+
+@use_sql_backend
+class BulkSubmissionPostTest(TestCase):
+    domain = 'bulk-submission-test'
+
+    def tearDown(self):
+        FormProcessorTestUtils.delete_all_cases_forms_ledgers(self.domain)
+        UnfinishedSubmissionStub.objects.all().delete()
+        super(BulkSubmissionPostTest, self).tearDown()
+
+    def _get_form(self, **case_kwargs):
+        return render_to_string('hqcase/xml/case_block.xml', {
+            'xmlns': 'http://commcarehq.org/test/bulk',
+            'case_block': CaseBlock(**case_kwargs).as_text(),
+            'time': json_format_datetime(datetime.utcnow()),
+            'uid': uuid.uuid4().hex,
+            'username': 'bulk',
+            'user_id': 'bulk-user',
+            'device_id': 'bulk-test',
+        }).encode('utf-8')
+
+    def test_bulk_submission(self):
+        case_id, other_id = uuid.uuid4().hex, uuid.uuid4().hex
+        instances = [
+            ('create.xml', self._get_form(case_id=case_id, create=True, case_type='bulk')),
+            ('other.xml', self._get_form(case_id=other_id, create=True, case_type='bulk')),
+            ('update.xml', self._get_form(case_id=case_id, update={'prop': 'value'})),
+            ('close.xml', self._get_form(case_id=other_id, close=True)),
+        ]
+        results = BulkSubmissionPost(instances, self.domain).run()
+
+        self.assertEqual([r.name for r in results], [name for name, instance in instances])
+        self.assertEqual([r.submission_type for r in results], ['normal'] * 4)
+        self.assertEqual({r.response.status_code for r in results}, {201})
+
+        case, other = CaseAccessors(self.domain).get_cases([case_id, other_id], ordered=True)
+        self.assertEqual(case.get_case_property('prop'), 'value')
+        self.assertEqual(case.xform_ids, [results[0].xform.form_id, results[2].xform.form_id])
+        self.assertTrue(other.closed)
+        self.assertFalse(UnfinishedSubmissionStub.objects.filter(domain=self.domain).exists())
+
+    def test_error_form_in_group(self):
+        case_id = uuid.uuid4().hex
+        instances = [
+            ('create.xml', self._get_form(case_id=case_id, create=True, case_type='bulk')),
+            ('bad-index.xml', self._get_form(case_id=case_id, index={'parent': ('bulk', 'missing')})),
+            ('update.xml', self._get_form(case_id=case_id, update={'prop': 'value'})),
+        ]
+        results = BulkSubmissionPost(instances, self.domain).run()
+
+        self.assertEqual([r.submission_type for r in results], ['normal', 'error', 'normal'])
+        case = CaseAccessors(self.domain).get_case(case_id)
+        self.assertEqual(case.get_case_property('prop'), 'value')
+        self.assertEqual(case.xform_ids, [results[0].xform.form_id, results[2].xform.form_id])
+
+    @patch('corehq.form_processor.submission_post.rate_limit_submission', side_effect=[False, True])
+    def test_rate_limited_per_form(self, rate_limit_submission):
+        instances = [
+            ('{}.xml'.format(index), self._get_form(case_id=uuid.uuid4().hex, create=True, case_type='bulk'))
+            for index in range(3)
+        ]
+        results = BulkSubmissionPost(instances, self.domain).run()
+
+        self.assertEqual([r.submission_type for r in results], ['normal', 'rate_limited', 'rate_limited'])
+        self.assertEqual([r.response.status_code for r in results], [201, 429, 429])
+        self.assertEqual(rate_limit_submission.call_count, 2)
@@ -39,7 +39,7 @@ from corehq.apps.hqadmin.reports import (
     UserAuditReport,
     UserListReport,
 )
-from corehq.apps.hqadmin.views.system import GlobalThresholds
+from corehq.apps.hqadmin.views.system import GlobalThresholds, SlowestRestoresView
 from corehq.apps.hqwebapp.models import GaTracker
 from corehq.apps.hqwebapp.view_permissions import user_can_view_reports
 from corehq.apps.integration.views import (
@@ -2132,6 +2132,9 @@ class AdminTab(UITab):
                 {'title': GlobalThresholds.page_title,
                  'url': reverse(GlobalThresholds.urlname),
                  'icon': 'fa fa-fire'},
+                {'title': SlowestRestoresView.page_title,
+                 'url': reverse(SlowestRestoresView.urlname),
+                 'icon': 'fa fa-hourglass-half'},
             ]
             user_operations = [
                 {'title': _('Login as another user'),
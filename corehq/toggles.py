@@ -1799,6 +1799,189 @@ LIVEQUERY_READ_FROM_STANDBYS = DynamicallyPredictablyRandomToggle(
     """
 )
 
+SHARED_USER_FIXTURE_CACHE = StaticToggle(
+    'shared_user_fixture_cache',
+    'Share serialized user lookup table and location fixtures between users with identical fixture content',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+)
+
+LIVEQUERY_PREFETCH_CASES = StaticToggle(
+    'livequery_prefetch_cases',
+    'Fetch the next batch of cases from the database while the current batch is rendered in livequery restores',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+)
+
+RESTORE_GZIP_PAYLOAD = StaticToggle(
+    'restore_gzip_payload',
+    'Write restore payloads through gzip and serve them compressed to clients that accept it',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+)
+
+LIVEQUERY_INCREMENTAL_GRAPH = StaticToggle(
+    'livequery_incremental_graph',
+    'Save the livequery case graph for sync logs and only re-read changed cases on incremental syncs',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description="""
+    Saves a compact snapshot of each user's case graph (indices and
+    open/closed status) in the blob db for the sync log. Incremental
+    livequery syncs use it to avoid walking the full case graph in the
+    database.
+    """
+)
+
+BULK_FORM_SUBMISSION = StaticToggle(
+    'bulk_form_submission',
+    'Accept many forms in one request on the bulk submission endpoint',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description="""
+    Enables /a/<domain>/receiver/bulk/ for integrations and data
+    migrations. Forms are posted as a multipart body (one file per form) or
+    as a tar archive of .xml files, and a result is returned per form.
+    """
+)
+
+UCR_COMPILED_EXPRESSIONS = StaticToggle(
+    'ucr_compiled_expressions',
+    'Compile UCR data source filters and indicators into plain Python functions',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description="""
+    Evaluates data sources with closures built once per data source instead
+    of walking the expression spec tree for every document. Constant
+    sub-expressions are folded and repeated sub-expressions are evaluated
+    once per row.
+    """
+)
+
+UCR_BULK_RELATED_DOCS = StaticToggle(
+    'ucr_bulk_related_docs',
+    'Fetch documents used by UCR related_doc and get_subcases expressions in bulk',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description="""
+    When a chunk of documents is processed for data sources that look up
+    related documents, the related document IDs are collected for the whole
+    chunk first and fetched with one query per document type and hop.
+    """
+)
+
+UCR_PARTITIONED_REBUILD = StaticToggle(
+    'ucr_partitioned_rebuild',
+    'Rebuild UCR data sources in parallel tasks split by shard and ID range',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description="""
+    Splits data source rebuilds of SQL forms and cases by case type or
+    XMLNS, shard database and primary key range. Each part is built by its
+    own celery task that checkpoints its progress so that a resumed build
+    continues where each part left off.
+    """
+)
+
+UCR_SHADOW_TABLE_REBUILD = StaticToggle(
+    'ucr_shadow_table_rebuild',
+    'Rebuild UCR data sources into a new table that replaces the table when it is built',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description="""
+    Reports keep using the existing table while the data source is rebuilt
+    into an unlogged shadow table. When the build finishes the shadow table
+    is made durable, indexed and renamed to replace the old table.
+    """
+)
+
+UCR_REPORT_RESULT_CACHE = StaticToggle(
+    'ucr_report_result_cache',
+    'Cache UCR report query results until the data source changes',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description="""
+    Report data, total records and total rows are cached for a report's
+    columns, filters and filter values. Cached results are invalidated when
+    rows are saved to or deleted from the data source table and when the
+    table is rebuilt.
+    """
+)
+
+UCR_ROLLUP_TABLES = StaticToggle(
+    'ucr_rollup_tables',
+    'Query UCR reports from the rollup tables of their data source',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description="""
+    Reports that only filter and group by the columns of a rollup table
+    declared on their data source, and only aggregate its measures, are
+    queried from the rollup table instead of the data source table.
+    """
+)
+
+MOBILE_UCR_SHARED_RESULTS = StaticToggle(
+    'mobile_ucr_shared_results',
+    'Share mobile UCR report rows between users with the same filter values',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description="""
+    Report rows generated for a restore are cached and reused for other
+    users whose report filters resolve to the same values, until the sync
+    delay of the report passes or the data source changes. Concurrent
+    restores wait for the first one to run the query.
+    """
+)
+
+UCR_BULK_EVALUATION = StaticToggle(
+    'ucr_bulk_evaluation',
+    'Evaluate UCR data source rebuild chunks column by column',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description="""
+    While a data source is rebuilt, the values of a chunk of documents are
+    collected per column and each column's datatype conversion is applied in
+    one pass before the chunk is written. Requires UCR_COMPILED_EXPRESSIONS.
+    """
+)
+
+INCREMENTAL_SAVED_EXPORTS = StaticToggle(
+    'incremental_saved_exports',
+    'Rebuild daily saved exports from the weeks of documents that changed',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description="""
+    The rows of each week of documents of a daily saved form or case export
+    are saved. When the export is rebuilt only the weeks whose documents
+    changed (or that haven't been regenerated for a week) are exported from
+    ES again, the file is written from the saved rows of the other weeks.
+    """
+)
+
+COLUMNAR_EXPORT_FORMATS = StaticToggle(
+    'columnar_export_formats',
+    'Offer Parquet and Arrow as export file types',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description="""
+    Adds Parquet and Arrow (IPC file) to the file types of form and case
+    exports. Each table is written to a columnar file in a zip file, which
+    is faster to write and to load into pandas than CSV.
+    """
+)
+
+SHARED_SCROLL_EXPORTS = StaticToggle(
+    'shared_scroll_exports',
+    'Export bulk form and case exports from a single scroll of ES',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description="""
+    Bulk exports of several form exports, or of several case exports, read
+    each document from ES once and write it to every export it belongs to,
+    instead of querying ES once for each export.
+    """
+)
+
 ACCOUNTING_TESTING_TOOLS = StaticToggle(
     'accounting_testing_tools',
     'Enable Accounting Testing Tools',
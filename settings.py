@@ -960,6 +960,26 @@ HQ_PRIVATE_KEY = None
 
 KAFKA_BROKERS = ['localhost:9092']
 KAFKA_API_VERSION = None
+# Send changes to Kafka without waiting for each one to be acknowledged.
+# At most KAFKA_MAX_IN_FLIGHT_CHANGES unacknowledged changes are kept per
+# process; a send waits up to KAFKA_IN_FLIGHT_TIMEOUT seconds for room.
+# Changes that can't be sent are stored as UnpublishedChange and re-sent by
+# a periodic task.
+KAFKA_PIPELINED_PUBLISHING = False
+KAFKA_MAX_IN_FLIGHT_CHANGES = 1000
+KAFKA_IN_FLIGHT_TIMEOUT = 10
+KAFKA_PRODUCER_LINGER_MS = 5
+
+# Batch pillows grow their chunk size up to PILLOW_MAX_PROCESSOR_CHUNK_SIZE
+# while they lag by more than PILLOW_TARGET_CHANGE_LAG seconds and chunks are
+# processed within PILLOW_TARGET_CHUNK_PROCESSING_TIME seconds. 0 disables.
+PILLOW_MAX_PROCESSOR_CHUNK_SIZE = 0
+PILLOW_TARGET_CHANGE_LAG = 60
+PILLOW_TARGET_CHUNK_PROCESSING_TIME = 10
+# Run the batch processors of a pillow concurrently on each chunk
+PILLOW_PARALLEL_BATCH_PROCESSORS = False
+# Fetch the documents of each chunk once for all processors of a pillow
+PILLOW_PREFETCH_DOCUMENTS = False
 
 MOBILE_INTEGRATION_TEST_TOKEN = None
 